@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark the hot ``submissions`` queries as the table grows.
+
+Fills a scratch database with synthetic submissions in steps (by default up
+to 1M rows) and, at each size, times the queries the grader and the admin
+analytics run, with and without the indexes added by the schema migrations:
+
+* admin-key token usage over the last day (``Grader.get_admin_key``)
+* latest submissions for one unit/question
+* latest submissions for one client
+
+The synthetic data keeps the number of matching rows per query constant
+(one day holds the same number of submissions, each client and question has
+the same number of submissions), so indexed query time should stay flat
+while the unindexed time grows with the table.
+
+Usage::
+
+    python benchmarks/bench_submission_queries.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from llmgrader.services import migrations  # noqa: E402
+from llmgrader.services.grader import Grader  # noqa: E402
+
+# Submissions per synthetic day, per client and per question.
+ROWS_PER_DAY = 2000
+ROWS_PER_CLIENT = 40
+ROWS_PER_QTAG = 500
+
+QUERIES = {
+    "admin_tokens_last_day": (
+        "SELECT SUM(tokens_in + tokens_out) FROM submissions WHERE used_admin_key = 1 AND timestamp >= ?",
+        lambda end, n: ((end - timedelta(days=1)).isoformat(timespec="seconds"),),
+    ),
+    "unit_qtag_latest": (
+        "SELECT id, result FROM submissions WHERE unit_name = ? AND qtag = ? ORDER BY timestamp DESC LIMIT 20",
+        lambda end, n: ("unit3", f"q{random.randrange(max(1, n // ROWS_PER_QTAG // 10))}"),
+    ),
+    "client_latest": (
+        "SELECT id, result FROM submissions WHERE client_id = ? ORDER BY timestamp DESC LIMIT 20",
+        lambda end, n: (f"client{random.randrange(max(1, n // ROWS_PER_CLIENT))}",),
+    ),
+}
+
+
+def create_table(conn: sqlite3.Connection) -> None:
+    columns = ", ".join(f"{name} {col_type}" for name, col_type in Grader.DB_SCHEMA.items())
+    conn.execute(f"CREATE TABLE submissions (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns})")
+
+
+def fill(conn: sqlite3.Connection, start: int, stop: int, end: datetime, table: str = "submissions") -> None:
+    # Row i is i * (1 day / ROWS_PER_DAY) before `end`, so older rows are appended as the table grows.
+    step = timedelta(days=1) / ROWS_PER_DAY
+
+    def rows():
+        for i in range(start, stop):
+            qtag_group = i // ROWS_PER_QTAG
+            yield (
+                (end - i * step).isoformat(timespec="seconds"),
+                f"client{i // ROWS_PER_CLIENT}",
+                f"unit{qtag_group % 10}",
+                f"q{qtag_group // 10}",
+                "answer",
+                random.randint(200, 2000),
+                random.randint(50, 500),
+                int(i % 3 == 0),
+                random.choice(("pass", "fail")),
+            )
+
+    conn.executemany(
+        f"""
+        INSERT INTO {table} (
+            timestamp, client_id, unit_name, qtag, student_soln,
+            tokens_in, tokens_out, used_admin_key, result
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows(),
+    )
+    conn.commit()
+
+
+def time_query(conn: sqlite3.Connection, sql: str, make_params, end: datetime, n: int, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        params = make_params(end, n)
+        t0 = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time submissions queries with and without indexes.")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Comma-separated table sizes to measure (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=20, help="Runs per query (median is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s.strip())
+    random.seed(args.seed)
+    end = datetime(2026, 5, 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = sqlite3.connect(os.path.join(tmp, "plain.db"))
+        indexed = sqlite3.connect(os.path.join(tmp, "indexed.db"), isolation_level=None)
+        create_table(plain)
+        create_table(indexed)
+        migrations.migrate(indexed)
+        indexed.isolation_level = ""
+
+        print(f"{'rows':>10}  {'query':<24} {'no index (ms)':>14} {'indexed (ms)':>13}")
+        filled = 0
+        for size in sizes:
+            fill(plain, filled, size, end)
+            # Migrated databases store rows in submission_rows behind the submissions view.
+            fill(indexed, filled, size, end, table="submission_rows")
+            filled = size
+            indexed.execute("ANALYZE")
+            for name, (sql, make_params) in QUERIES.items():
+                plain_ms = time_query(plain, sql, make_params, end, size, args.repeats)
+                indexed_ms = time_query(indexed, sql, make_params, end, size, args.repeats)
+                print(f"{size:>10}  {name:<24} {plain_ms:>14.3f} {indexed_ms:>13.3f}")
+
+        plain.close()
+        indexed.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark loading a solution package with ``UnitParser.parse``.
+
+Builds a scratch package of ``--units`` unit files (by default 50 copies of
+``soln_repos/demo_unit.xml``) and times ``UnitParser.parse`` on it.  The
+first parse in the process also compiles the XSD schemas; later parses
+reuse them, so they are reported separately:
+
+* ``first parse`` -- the first load after the process starts
+* ``repeat parse`` -- median of ``--repeats`` further loads
+* ``snapshot`` -- median load from an up-to-date package snapshot
+  (see ``package_snapshot.py``)
+* ``1 changed`` -- median reload after editing one unit file, which
+  reparses only that unit
+
+Usage::
+
+    python benchmarks/bench_unit_parser.py --units 50 --repeats 5 [--workers 0]
+
+``--workers`` parses units across that many processes (0: one per CPU core).
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from llmgrader.services.package_snapshot import PackageSnapshot  # noqa: E402
+from llmgrader.services.unit_parser import UnitParser  # noqa: E402
+
+DEMO_UNIT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "soln_repos", "demo_unit.xml"))
+
+
+def build_package(pkg_dir: str, n_units: int) -> None:
+    with open(DEMO_UNIT, encoding="utf-8") as handle:
+        unit_xml = handle.read()
+
+    unit_entries = []
+    for i in range(n_units):
+        file_name = f"unit{i:03d}.xml"
+        with open(os.path.join(pkg_dir, file_name), "w", encoding="utf-8") as handle:
+            handle.write(unit_xml.replace('id="demo_unit"', f'id="unit{i:03d}"', 1))
+        unit_entries.append(
+            f"    <unit>\n"
+            f"      <name>Unit {i}</name>\n"
+            f"      <source>{file_name}</source>\n"
+            f"      <destination>{file_name}</destination>\n"
+            f"    </unit>\n"
+        )
+
+    with open(os.path.join(pkg_dir, "llmgrader_config.xml"), "w", encoding="utf-8") as handle:
+        handle.write(
+            "<llmgrader>\n"
+            "  <course>\n    <name>Benchmark Course</name>\n    <term>Fall 2026</term>\n  </course>\n"
+            "  <units>\n" + "".join(unit_entries) + "  </units>\n"
+            "</llmgrader>\n"
+        )
+
+
+def time_parse(parser: UnitParser, n_units: int) -> float:
+    t0 = time.perf_counter()
+    package = parser.parse()
+    elapsed = time.perf_counter() - t0
+    if package.validation_errors or len(package.units) != n_units:
+        raise SystemExit(f"Benchmark package failed to load: {package.validation_errors[:3]}")
+    return elapsed * 1000.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time UnitParser.parse on a synthetic solution package.")
+    parser.add_argument("--units", type=int, default=50, help="Number of unit files (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=5, help="Repeat parses (median is reported)")
+    parser.add_argument("--workers", type=int, default=1, help="Unit parsing processes (0: one per CPU core)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pkg_dir = os.path.join(tmp, "pkg")
+        scratch_dir = os.path.join(tmp, "scratch")
+        os.makedirs(pkg_dir)
+        os.makedirs(scratch_dir)
+        build_package(pkg_dir, args.units)
+
+        unit_parser = UnitParser(scratch_dir=scratch_dir, soln_pkg=pkg_dir, workers=args.workers)
+        first_ms = time_parse(unit_parser, args.units)
+        repeat_ms = statistics.median(time_parse(unit_parser, args.units) for _ in range(args.repeats))
+
+        snapshot = PackageSnapshot(os.path.join(tmp, "snapshots", "unit_package.json"))
+        snapshot_parser = UnitParser(scratch_dir=scratch_dir, soln_pkg=pkg_dir, snapshot=snapshot, workers=args.workers)
+        time_parse(snapshot_parser, args.units)
+        snapshot_ms = statistics.median(time_parse(snapshot_parser, args.units) for _ in range(args.repeats))
+
+        package = unit_parser.parse()
+        changed_samples = []
+        changed_path = os.path.join(pkg_dir, "unit000.xml")
+        for i in range(args.repeats):
+            with open(changed_path, "a", encoding="utf-8") as handle:
+                handle.write(f"<!-- edit {i} -->\n")
+            t0 = time.perf_counter()
+            package = unit_parser.parse(previous=package)
+            changed_samples.append((time.perf_counter() - t0) * 1000.0)
+        changed_ms = statistics.median(changed_samples)
+
+    print(f"{'units':>6}  {'first parse (ms)':>17} {'repeat parse (ms)':>18} {'per unit (ms)':>14} "
+          f"{'snapshot (ms)':>14} {'1 changed (ms)':>15}")
+    print(f"{args.units:>6}  {first_ms:>17.1f} {repeat_ms:>18.1f} {repeat_ms / args.units:>14.2f} "
+          f"{snapshot_ms:>14.1f} {changed_ms:>15.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,7 @@
 from flask import Flask
 from llmgrader.routes.api import APIController
 from llmgrader.services.grader import Grader
+from llmgrader.services.submission_writer import SubmissionWriter
 import os
 
 def create_app(
@@ -22,6 +23,9 @@ def create_app(
     grader = Grader(
         scratch_dir=scratch_dir,
         soln_pkg=soln_pkg)
+    # Log submissions in the background unless LLMGRADER_SUBMISSION_LOG=sync
+    if SubmissionWriter.mode_from_env() == "async":
+        grader.enable_submission_writer()
     controller = APIController(grader)
     controller.register(app)
 
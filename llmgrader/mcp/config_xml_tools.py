@@ -5,6 +5,7 @@ from pathlib import Path
 from xml.etree import ElementTree as ET
 
 from llmgrader.mcp.description_utils import (
+    make_attribute_description,
     make_element_description,
     make_text_content_description,
 )
@@ -279,6 +280,38 @@ def _unit_entry_structure() -> dict:
                 "units/combinatorics.xml",
             ),
             "destination": _destination_structure("Destination filename inside the package.", "combinatorics.xml"),
+            "grade_cache": _grade_cache_structure(),
+        },
+    )
+
+
+def _grade_cache_structure() -> dict:
+    return make_element_description(
+        "Optional. Reuse earlier LLM grades when the exact same answer is graded again "
+        "with the same model. Applies to every question of the unit unless <qtag> children "
+        "restrict it to specific questions.",
+        required=False,
+        multiple=False,
+        attributes={
+            "enabled": make_attribute_description(
+                "Set to false to turn the cache off without removing the element.",
+                required=False,
+                type="boolean",
+                example="true",
+            ),
+        },
+        children={
+            "qtag": make_element_description(
+                "Question tag whose grades may be cached.",
+                required=False,
+                multiple=True,
+                text_content=make_text_content_description(
+                    "Question qtag.",
+                    required=True,
+                    type="string",
+                    example="q1",
+                ),
+            ),
         },
     )
 
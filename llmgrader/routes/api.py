@@ -2,6 +2,8 @@ print("LOADING api.py FROM:", __file__)
 
 import os
 import json
+import base64
+import hashlib
 import secrets
 import re
 import threading
@@ -11,11 +13,19 @@ from functools import wraps
 from urllib.parse import urlencode
 from flask import Blueprint, request, jsonify
 from flask import render_template, session, Response, send_from_directory, redirect, url_for
+from flask import stream_with_context
 import sqlite3
 import csv
 import io
+import zlib
 from datetime import datetime, timezone
 import requests
+from llmgrader.services.analytics import AnalyticsGuard, QueryTimeout
+from llmgrader.services.archive import ARCHIVE_NAMES_RE
+from llmgrader.services.async_grader import AsyncGrader
+from llmgrader.services.compression import decompress_row
+from llmgrader.services.grade_jobs import GradeJobRunner, GradeJobStore
+from llmgrader.services.grade_scheduler import GradeScheduler
 
 
 def get_default_admin_prefs():
@@ -26,20 +36,61 @@ def get_default_admin_prefs():
         "tokenLimit": {
             "limit": 0,
             "period": "hour"
-        }
+        },
+        # [{"provider": "openai", "model": "gpt-4.1-mini", "rpm": 500, "tpm": 200000}]
+        "rateLimits": []
     }
 
 
 class APIController:
-    GRADE_JOB_TIMEOUT_GRACE_SECONDS = 15.0
+    GRADE_JOB_TIMEOUT_GRACE_SECONDS = GradeJobStore.DEFAULT_TIMEOUT_GRACE_SECONDS
+    GRADE_JOB_QUEUE_TIMEOUT_SECONDS = 120.0
     GRADE_JOB_RETENTION_SECONDS = 3600.0
+    GRADE_JOB_PRUNE_INTERVAL_SECONDS = 60.0
+    # Active jobs whose client stopped polling (or closed its event stream) are cancelled.
+    GRADE_JOB_ABANDON_SECONDS = GradeJobStore.DEFAULT_ABANDON_SECONDS
+    # How often an event stream re-reads its job when no local change was signalled
+    # (picks up changes made by llmgrader_worker processes).
+    GRADE_JOB_EVENTS_POLL_SECONDS = 1.0
+    GRADE_JOB_EVENTS_KEEPALIVE_SECONDS = 15.0
+    # An event stream ends after this long and the browser reconnects, so one
+    # stream never holds a web worker near gunicorn's default 30 s timeout.
+    GRADE_JOB_EVENTS_MAX_SECONDS = 20.0
     ACTIVE_GRADE_JOB_STATES = {"queued", "running"}
+    # Cached admin_users set is reloaded after this long (admins added or
+    # removed by another process); local changes invalidate it at once.
+    ADMIN_USERS_CACHE_SECONDS = 5.0
+    # Analytics (dbviewer) rows per page, and rows per streamed CSV chunk
+    DBVIEWER_PAGE_SIZE = 20
+    DBVIEWER_MAX_PAGE_SIZE = 500
+    CSV_CHUNK_ROWS = 1000
 
     def __init__(self, grader):
         self.grader = grader
-        self.grade_job_lock = threading.Lock()
-        self.grade_jobs = {}
-        self.active_grade_job_id = None
+        self.grade_job_store = GradeJobStore(grader.db_path)
+        self.grade_job_store.init_db()
+        # LLMGRADER_GRADE_ENGINE=async runs grading on an AsyncGrader event loop;
+        # LLMGRADER_GRADE_WORKERS is then the number of jobs in flight.
+        self.async_grader = AsyncGrader(grader) if GradeScheduler.engine_from_env() == "async" else None
+        self.grade_job_runner = GradeJobRunner(
+            grader,
+            self.grade_job_store,
+            async_grader=self.async_grader,
+            abandon_after=self.GRADE_JOB_ABANDON_SECONDS,
+        )
+        self.grade_queue_depth = GradeScheduler.max_queue_depth_from_env()
+        self.grade_scheduler = GradeScheduler(
+            self.claim_grade_job,
+            self.grade_job_runner.submit if self.async_grader else self.grade_job_runner.run,
+            max_workers=GradeScheduler.max_workers_from_env(),
+            asynchronous=self.async_grader is not None,
+        )
+        self.last_grade_job_prune_ts = 0.0
+        self._admin_emails_lock = threading.Lock()
+        self._admin_emails: frozenset[str] | None = None
+        self._admin_emails_loaded_at = 0.0
+        # Time and row limits of admin analytics queries
+        self.analytics_guard = AnalyticsGuard.from_env()
 
     @staticmethod
     def normalize_email(email: str | None) -> str:
@@ -56,8 +107,7 @@ class APIController:
         return self.auth_mode() == "dev-open"
 
     def ensure_auth_tables(self) -> None:
-        conn = sqlite3.connect(self.grader.db_path)
-        try:
+        with self.grader.db.connection() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -81,8 +131,6 @@ class APIController:
                 """
             )
             conn.commit()
-        finally:
-            conn.close()
 
         self.bootstrap_initial_admin()
 
@@ -93,8 +141,7 @@ class APIController:
         if not initial_admin_email:
             return
 
-        conn = sqlite3.connect(self.grader.db_path)
-        try:
+        with self.grader.db.connection() as conn:
             conn.execute(
                 """
                 INSERT OR IGNORE INTO admin_users (email, created_at, created_by)
@@ -103,8 +150,7 @@ class APIController:
                 (initial_admin_email, self.utc_now(), "bootstrap"),
             )
             conn.commit()
-        finally:
-            conn.close()
+        self.invalidate_admin_emails()
 
     def is_admin_email(self, email: str | None) -> bool:
         if self.is_dev_open_mode():
@@ -114,15 +160,24 @@ class APIController:
         if not normalized:
             return False
 
-        conn = sqlite3.connect(self.grader.db_path)
-        try:
-            row = conn.execute(
-                "SELECT 1 FROM admin_users WHERE email = ?",
-                (normalized,),
-            ).fetchone()
-            return bool(row)
-        finally:
-            conn.close()
+        return normalized in self.admin_emails()
+
+    def admin_emails(self) -> frozenset[str]:
+        """
+        Emails in admin_users, cached for ADMIN_USERS_CACHE_SECONDS.
+        """
+        with self._admin_emails_lock:
+            now = time.monotonic()
+            if self._admin_emails is None or now - self._admin_emails_loaded_at >= self.ADMIN_USERS_CACHE_SECONDS:
+                with self.grader.db.connection() as conn:
+                    rows = conn.execute("SELECT email FROM admin_users").fetchall()
+                self._admin_emails = frozenset(row[0] for row in rows)
+                self._admin_emails_loaded_at = now
+            return self._admin_emails
+
+    def invalidate_admin_emails(self) -> None:
+        with self._admin_emails_lock:
+            self._admin_emails = None
 
     def current_user(self) -> dict | None:
         email = self.normalize_email(session.get("user_email"))
@@ -150,8 +205,7 @@ class APIController:
 
     def upsert_user(self, email: str, google_sub: str, name: str, picture_url: str | None) -> None:
         now = self.utc_now()
-        conn = sqlite3.connect(self.grader.db_path)
-        try:
+        with self.grader.db.connection() as conn:
             conn.execute(
                 """
                 INSERT INTO users (email, google_sub, name, picture_url, created_at, last_login_at)
@@ -165,8 +219,6 @@ class APIController:
                 (email, google_sub, name, picture_url, now, now),
             )
             conn.commit()
-        finally:
-            conn.close()
 
     def get_auth_status(self) -> dict:
         user = self.current_user()
@@ -201,9 +253,95 @@ class APIController:
         )
         return forbidden.search(lowered) is None
 
+    def attach_archive_if_queried(self, conn, sql_query: str) -> None:
+        """
+        Make ``archived_submissions`` / ``all_submissions`` available to
+        analytics queries that use them (see ``archive.py``).
+        """
+        if ARCHIVE_NAMES_RE.search(sql_query or ""):
+            self.grader.archive.attach(conn)
+
+    @staticmethod
+    def make_page_token(sql_query: str, offset: int) -> str:
+        """
+        Opaque dbviewer page token: the row offset, bound to the query text.
+        """
+        payload = {"q": hashlib.sha256(sql_query.encode("utf-8")).hexdigest()[:16], "o": int(offset)}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
     @staticmethod
-    def sanitize_filename_component(value: str) -> str:
-        return re.sub(r"[^A-Za-z0-9_.-]", "_", value or "")
+    def parse_page_token(sql_query: str, token) -> int:
+        if not token:
+            return 0
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(str(token).encode("ascii")))
+            offset = int(payload["o"])
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("Invalid page token") from None
+        if payload.get("q") != hashlib.sha256(sql_query.encode("utf-8")).hexdigest()[:16] or offset < 0:
+            raise ValueError("Page token does not match this query; run it again")
+        return offset
+
+    def iter_csv(self, sql_query: str, *, use_gzip: bool = False):
+        """
+        Yield the CSV of an analytics query in chunks of ``CSV_CHUNK_ROWS``
+        rows (gzip-compressed bytes if ``use_gzip``).  The first chunk holds
+        the header.  The query runs on the read-only connection under the
+        analytics time and row limits (``analytics.py``).
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if use_gzip else None
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        def take() -> str | bytes:
+            text = output.getvalue()
+            output.seek(0)
+            output.truncate()
+            if compressor is None:
+                return text
+            return compressor.compress(text.encode("utf-8"))
+
+        max_rows = self.analytics_guard.max_rows
+        with self.grader.db.connection(read_only=True) as conn:
+            self.attach_archive_if_queried(conn, sql_query)
+            with self.analytics_guard.guard(conn) as budget:
+                cursor = conn.execute(sql_query)
+                try:
+                    writer.writerow([desc[0] for desc in cursor.description] if cursor.description else [])
+                    yield take()
+                    written = 0
+                    while written < max_rows:
+                        # The time limit applies to producing each chunk, so a long
+                        # export is bounded by the row cap instead.
+                        budget.restart()
+                        try:
+                            rows = cursor.fetchmany(min(self.CSV_CHUNK_ROWS, max_rows - written))
+                        except sqlite3.OperationalError:
+                            if not budget.exceeded:
+                                raise
+                            # Too late for an error status: end the file with a note.
+                            message = str(QueryTimeout(budget.elapsed(), budget.seconds))
+                            print(f"[dbviewer] Export stopped: {message}")
+                            writer.writerow([f"# {message}"])
+                            yield take()
+                            break
+                        if not rows:
+                            break
+                        written += len(rows)
+                        # Decode compressed text
+                        writer.writerows(decompress_row(row) for row in rows)
+                        chunk = take()
+                        if chunk:
+                            yield chunk
+                    else:
+                        budget.restart()
+                        if cursor.fetchone() is not None:
+                            writer.writerow([f"# Export truncated at {max_rows} rows (LLMGRADER_ANALYTICS_MAX_ROWS)"])
+                            yield take()
+                finally:
+                    cursor.close()
+        if compressor is not None:
+            yield compressor.flush()
 
     @staticmethod
     def parse_timeout_seconds(raw_timeout) -> float:
@@ -213,45 +351,6 @@ class APIController:
             timeout_value = 20.0
         return max(1.0, timeout_value)
 
-    def write_grade_input_debug(self, *, unit: str, qtag: str, question_dict: dict, student_soln: str,
-                                part_label: str, model: str, tools: list, solution_images: list) -> None:
-        safe_unit = self.sanitize_filename_component(unit)
-        safe_qtag = self.sanitize_filename_component(qtag)
-        fn = os.path.join(
-            self.grader.scratch_dir,
-            f"grade_input_{safe_unit}_{safe_qtag}.txt"
-        )
-
-        with open(fn, "w", encoding="utf-8") as f:
-            f.write(f"Unit: {unit}\n")
-            f.write(f"Qtag: {qtag}\n\n")
-
-            f.write("=== Reference Problem (HTML) ===\n")
-            f.write(question_dict.get("question_text", "") + "\n\n")
-
-            f.write("=== Reference Solution (HTML) ===\n")
-            f.write(question_dict.get("solution", "") + "\n\n")
-
-            f.write("=== Grading Notes ===\n")
-            f.write(question_dict.get("grading_notes", "") + "\n\n")
-
-            f.write("=== Student Solution ===\n")
-            f.write(student_soln + "\n")
-
-            f.write("\n=== Grading Part Label ===\n")
-            f.write(part_label + "\n")
-
-            f.write("\n=== Model ===\n")
-            f.write(model + "\n")
-
-            f.write("\n=== Tools ===\n")
-            f.write(json.dumps(tools) + "\n")
-
-            f.write("\n=== Solution Images ===\n")
-            f.write(f"{len(solution_images)} image(s) attached\n")
-
-        print(f"Sent grader input {fn}")
-
     def serialize_grade_job(self, job: dict, *, include_result: bool = False) -> dict:
         payload = {
             "job_id": job["job_id"],
@@ -269,120 +368,93 @@ class APIController:
             started_ts = job.get("started_at_ts") or job.get("created_at_ts")
             if started_ts is not None:
                 payload["elapsed_seconds"] = max(0, int(time.time() - started_ts))
+        if job["status"] == "queued":
+            payload["queue_position"] = self.grade_job_store.queue_position(job["job_id"])
+            rate_limited_until_ts = job.get("rate_limited_until_ts")
+            if rate_limited_until_ts is not None and rate_limited_until_ts > time.time():
+                payload["rate_limited"] = True
+                payload["rate_limit_wait_seconds"] = max(1, int(rate_limited_until_ts - time.time() + 0.999))
+                payload["message"] = "Waiting for rate limit."
+        if job.get("coalesced_count"):
+            payload["coalesced_count"] = job["coalesced_count"]
         if job.get("error"):
             payload["error"] = job["error"]
         if include_result and job.get("result"):
             payload.update(job["result"])
         return payload
 
-    def mark_job_timed_out_locked(self, job: dict, *, message: str) -> None:
-        job["status"] = "timed_out"
-        job["message"] = message
-        job["error"] = message
-        job["finished_at"] = self.utc_now()
-        job["finished_at_ts"] = time.time()
-        if self.active_grade_job_id == job["job_id"]:
-            self.active_grade_job_id = None
-
-    def expire_active_job_if_stale_locked(self) -> None:
-        if not self.active_grade_job_id:
-            return
-
-        job = self.grade_jobs.get(self.active_grade_job_id)
-        if not job:
-            self.active_grade_job_id = None
-            return
-
-        if job["status"] not in self.ACTIVE_GRADE_JOB_STATES:
-            self.active_grade_job_id = None
-            return
-
-        deadline_ts = job.get("deadline_ts")
-        if deadline_ts is not None and time.time() > deadline_ts:
-            self.mark_job_timed_out_locked(job, message="Grading job timed out before completion.")
-
-    def prune_old_grade_jobs_locked(self) -> None:
-        cutoff_ts = time.time() - self.GRADE_JOB_RETENTION_SECONDS
-        removable_job_ids = []
-        for job_id, job in self.grade_jobs.items():
-            if job_id == self.active_grade_job_id:
-                continue
-            if job["status"] in self.ACTIVE_GRADE_JOB_STATES:
-                continue
-            finished_ts = job.get("finished_at_ts")
-            if finished_ts is None or finished_ts < cutoff_ts:
-                removable_job_ids.append(job_id)
-
-        for job_id in removable_job_ids:
-            self.grade_jobs.pop(job_id, None)
-
-    def run_grade_job(self, job_id: str) -> None:
-        with self.grade_job_lock:
-            job = self.grade_jobs.get(job_id)
-            if not job or job["status"] != "queued":
-                return
-            job["status"] = "running"
-            job["message"] = "Grading in progress."
-            job["started_at"] = self.utc_now()
-            job["started_at_ts"] = time.time()
-
-        try:
-            self.write_grade_input_debug(
-                unit=job["unit"],
-                qtag=job["qtag"],
-                question_dict=job["question_dict"],
-                student_soln=job["student_soln"],
-                part_label=job["part_label"],
-                model=job["model"],
-                tools=job["tools"],
-                solution_images=job["solution_images"],
-            )
+    def claim_grade_job(self, worker_id: str) -> dict | None:
+        return self.grade_job_store.claim_next_job(
+            worker_id,
+            timeout_grace=self.GRADE_JOB_TIMEOUT_GRACE_SECONDS,
+            rate_limiter=self.grader.rate_limiter,
+        )
 
-            grade_result = self.grader.grade(
-                question_dict=job["question_dict"],
-                student_soln=job["student_soln"],
-                part_label=job["part_label"],
-                unit_name=job["unit"],
-                qtag=job["qtag"],
-                model=job["model"],
-                provider=job["provider"],
-                api_key=job["api_key"],
-                timeout=job["timeout"],
-                solution_images=job["solution_images"],
-                session_id=job["session_id"],
-            )
-        except Exception as exc:
-            with self.grade_job_lock:
-                current = self.grade_jobs.get(job_id)
-                if not current:
-                    return
-                if current["status"] == "timed_out":
-                    return
-                current["status"] = "error"
-                current["message"] = "Grading job failed."
-                current["error"] = str(exc)
-                current["finished_at"] = self.utc_now()
-                current["finished_at_ts"] = time.time()
-                if self.active_grade_job_id == job_id:
-                    self.active_grade_job_id = None
-            return
+    def expire_and_prune_grade_jobs(self) -> None:
+        self.grade_job_store.expire_stale_jobs(abandon_after=self.GRADE_JOB_ABANDON_SECONDS)
+        now_ts = time.time()
+        if now_ts - self.last_grade_job_prune_ts >= self.GRADE_JOB_PRUNE_INTERVAL_SECONDS:
+            self.last_grade_job_prune_ts = now_ts
+            self.grade_job_store.prune_finished_jobs(self.GRADE_JOB_RETENTION_SECONDS)
 
-        with self.grade_job_lock:
-            current = self.grade_jobs.get(job_id)
-            if not current:
+    @staticmethod
+    def format_sse_event(event: str, payload: dict, event_id: str | None = None) -> str:
+        id_line = f"id: {event_id}\n" if event_id else ""
+        return f"{id_line}event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def grade_job_events(self, job: dict, last_event_id: str | None = None):
+        """
+        Yield Server-Sent Events for a grading job until it leaves the active
+        states, or for at most ``GRADE_JOB_EVENTS_MAX_SECONDS``.
+
+        A ``status`` event is sent whenever the serialized job changes (state,
+        queue position or final result).  Between changes only a keepalive
+        comment is sent now and then, so idle streams cost no database writes.
+
+        When the time limit ends the stream, the browser reconnects with the
+        id of the last event it received (``last_event_id``); the status is
+        only sent again if it changed in between.
+        """
+        job_id = job["job_id"]
+        store = self.grade_job_store
+        version = store.change_version()
+        last_event = last_event_id
+        last_sent_ts = 0.0
+        last_touch_ts = 0.0
+        stream_end_ts = time.time() + self.GRADE_JOB_EVENTS_MAX_SECONDS
+
+        yield f"retry: {int(self.GRADE_JOB_EVENTS_POLL_SECONDS * 1000)}\n\n"
+        while True:
+            payload = self.serialize_grade_job(job, include_result=(job["status"] == "done"))
+            # elapsed_seconds ticks every second; the client keeps its own timer.
+            state = {key: value for key, value in payload.items() if key != "elapsed_seconds"}
+            event_id = hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+            now_ts = time.time()
+            if event_id != last_event:
+                last_event = event_id
+                last_sent_ts = now_ts
+                yield self.format_sse_event("status", payload, event_id)
+            elif now_ts - last_sent_ts >= self.GRADE_JOB_EVENTS_KEEPALIVE_SECONDS:
+                last_sent_ts = now_ts
+                yield ": keepalive\n\n"
+
+            if job["status"] not in self.ACTIVE_GRADE_JOB_STATES:
                 return
-            if current["status"] == "timed_out":
+            if now_ts >= stream_end_ts:
+                # The browser reconnects after the retry delay.
                 return
-            if time.time() > current.get("deadline_ts", float("inf")):
-                self.mark_job_timed_out_locked(current, message="Grading job timed out before completion.")
+            # An open stream counts as a client still waiting for the job.
+            if now_ts - last_touch_ts >= store.TOUCH_INTERVAL_SECONDS:
+                last_touch_ts = now_ts
+                store.touch_job(job_id)
+
+            version = store.wait_for_change(version, self.GRADE_JOB_EVENTS_POLL_SECONDS)
+            deadline_ts = job.get("deadline_ts")
+            if deadline_ts is not None and time.time() > deadline_ts:
+                self.expire_and_prune_grade_jobs()
+            job = store.get_job(job_id)
+            if job is None:
                 return
-            current["status"] = "done"
-            current["message"] = "Grading complete."
-            current["result"] = grade_result
-            current["finished_at"] = self.utc_now()
-            current["finished_at_ts"] = time.time()
-            if self.active_grade_job_id == job_id:
-                self.active_grade_job_id = None
 
     def require_authenticated_user(self, f):
         @wraps(f)
@@ -394,17 +466,11 @@ class APIController:
     
     def read_admin_hf_token(self) -> str | None:
         """Returns the admin HF token from persistent storage, or None if missing."""
-        path = self.grader.get_admin_pref_path()
-        if not os.path.exists(path):
-            return None
-
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                token = data.get("adminHfToken", "").strip()
-                return token if token else None
-        except Exception:
+        data = self.grader.stored_admin_preferences()
+        if data is None:
             return None
+        token = str(data.get("adminHfToken") or "").strip()
+        return token if token else None
 
     def require_admin(self, f):
         @wraps(f)
@@ -552,11 +618,13 @@ class APIController:
 
         @bp.get("/units")
         def units():
-            units_order = getattr(self.grader, 'units_order', None)
-            payload = units_order if units_order else [{"type": "unit", "name": k} for k in self.grader.units.keys()]
+            # One reference, so an upload swapping the package cannot mix versions
+            unit_package = self.grader.unit_package
+            units_order = unit_package.units_order
+            payload = units_order if units_order else [{"type": "unit", "name": k} for k in unit_package.units.keys()]
             return jsonify({
                 "items": payload,
-                "validation_alert": getattr(self.grader, 'unit_validation_alert', None),
+                "validation_alert": unit_package.validation_alert,
             })
 
         STUDENT_EXCLUDED_FIELDS = {"solution", "solution_images", "grading_notes"}
@@ -566,7 +634,8 @@ class APIController:
 
         @bp.get("/unit/<unit_name>")
         def unit(unit_name):
-            units = self.grader.units
+            unit_package = self.grader.unit_package
+            units = unit_package.units
 
             if unit_name not in units:
                 return jsonify({"error": "Unknown unit"}), 404
@@ -574,7 +643,7 @@ class APIController:
             u = units[unit_name]   # dict keyed by qtag
             sanitized = {qtag: _strip_solution_fields(q) for qtag, q in u.items()}
 
-            meta = self.grader.unit_metadata.get(unit_name, {})
+            meta = unit_package.unit_metadata.get(unit_name, {})
             return jsonify({
                 "unit": unit_name,
                 "qtags": list(u.keys()),
@@ -627,78 +696,124 @@ class APIController:
 
             qdata = u[qtag]
             tools = qdata.get("tools", [])
-            with self.grade_job_lock:
-                self.expire_active_job_if_stale_locked()
-                self.prune_old_grade_jobs_locked()
-
-                active_job = self.grade_jobs.get(self.active_grade_job_id) if self.active_grade_job_id else None
-                if active_job and active_job["status"] in self.ACTIVE_GRADE_JOB_STATES:
-                    payload = self.serialize_grade_job(active_job, include_result=False)
-                    payload["status"] = "already_running"
-                    payload["message"] = "A grading job is already in progress for this app instance."
-                    return jsonify(payload), 409
-
-                now_ts = time.time()
-                job_id = secrets.token_hex(12)
-                job = {
-                    "job_id": job_id,
-                    "status": "queued",
-                    "message": "Grading job queued.",
-                    "created_at": self.utc_now(),
-                    "created_at_ts": now_ts,
-                    "started_at": None,
-                    "started_at_ts": None,
-                    "finished_at": None,
-                    "finished_at_ts": None,
-                    "deadline_ts": now_ts + timeout_seconds + self.GRADE_JOB_TIMEOUT_GRACE_SECONDS,
-                    "error": None,
-                    "result": None,
-                    "unit": unit,
-                    "qtag": qtag,
-                    "part_label": part_label,
-                    "student_soln": student_soln,
-                    "question_dict": qdata,
-                    "model": model,
-                    "provider": provider,
-                    "api_key": api_key,
-                    "timeout": timeout_seconds,
-                    "solution_images": solution_images,
-                    "session_id": session_id,
-                    "tools": tools,
-                }
-                self.grade_jobs[job_id] = job
-                self.active_grade_job_id = job_id
+            self.expire_and_prune_grade_jobs()
+
+            now_ts = time.time()
+            job = {
+                "job_id": secrets.token_hex(12),
+                "message": "Grading job queued.",
+                "created_at": self.utc_now(),
+                "created_at_ts": now_ts,
+                "deadline_ts": now_ts + self.GRADE_JOB_QUEUE_TIMEOUT_SECONDS,
+                "unit": unit,
+                "qtag": qtag,
+                "part_label": part_label,
+                "student_soln": student_soln,
+                "question_dict": qdata,
+                "model": model,
+                "provider": provider,
+                "api_key": api_key,
+                "timeout": timeout_seconds,
+                "solution_images": solution_images,
+                "session_id": session_id,
+                "tools": tools,
+                "estimated_tokens": self.grader.estimate_request_tokens(
+                    qdata, student_soln, part_label, solution_images
+                ),
+            }
 
-            worker = threading.Thread(target=self.run_grade_job, args=(job_id,), daemon=True)
-            worker.start()
+            # Identical requests attach to the active job (single flight); otherwise
+            # one active job per student session, and sessions share the worker pool.
+            outcome, stored_job = self.grade_job_store.enqueue_job(
+                job,
+                max_queue_depth=self.grade_queue_depth,
+            )
+            if outcome == "coalesced":
+                payload = self.serialize_grade_job(stored_job, include_result=False)
+                payload["coalesced"] = True
+                return jsonify(payload), 202
+            if outcome == "already_running":
+                payload = self.serialize_grade_job(stored_job, include_result=False)
+                payload["status"] = "already_running"
+                payload["message"] = "A grading job is already in progress for this session."
+                return jsonify(payload), 409
+            if outcome == "queue_full":
+                return jsonify({
+                    "status": "queue_full",
+                    "error": "The grading queue is full. Please try again in a minute.",
+                }), 503
 
-            return jsonify(self.serialize_grade_job(job, include_result=False)), 202
+            self.grade_job_runner.start_watchdog()
+            self.grade_scheduler.notify()
+            return jsonify(self.serialize_grade_job(stored_job, include_result=False)), 202
 
         @bp.get("/grade/jobs/<job_id>")
         def grade_job_status(job_id):
-            with self.grade_job_lock:
-                self.expire_active_job_if_stale_locked()
-                self.prune_old_grade_jobs_locked()
-                job = self.grade_jobs.get(job_id)
-                if not job:
-                    return jsonify({"error": f"Unknown grading job '{job_id}'"}), 404
-
-                if job["status"] in self.ACTIVE_GRADE_JOB_STATES:
-                    deadline_ts = job.get("deadline_ts")
-                    if deadline_ts is not None and time.time() > deadline_ts:
-                        self.mark_job_timed_out_locked(job, message="Grading job timed out before completion.")
+            self.expire_and_prune_grade_jobs()
+            job = self.grade_job_store.get_job(job_id)
+            if not job:
+                return jsonify({"error": f"Unknown grading job '{job_id}'"}), 404
 
-                payload = self.serialize_grade_job(job, include_result=(job["status"] == "done"))
+            if job["status"] in self.ACTIVE_GRADE_JOB_STATES:
+                self.grade_job_store.touch_job(job_id)
+            payload = self.serialize_grade_job(job, include_result=(job["status"] == "done"))
+            return jsonify(payload)
 
+        @bp.delete("/grade/jobs/<job_id>")
+        def cancel_grade_job(job_id):
+            job = self.grade_job_store.get_job(job_id)
+            if not job:
+                return jsonify({"error": f"Unknown grading job '{job_id}'"}), 404
+            # A student leaves the job; it is only cancelled once nobody else
+            # waits for it.  Admins may cancel any job.
+            outcome = self.grade_job_store.cancel_job(
+                job_id,
+                session.get("session_id"),
+                message="Grading job cancelled by the student.",
+                force=self.is_admin_email(session.get("user_email")),
+            )
+            if outcome == "not_requester":
+                return jsonify({"error": "You can only cancel your own grading jobs."}), 403
+            if outcome == "not_active":
+                payload = self.serialize_grade_job(job, include_result=(job["status"] == "done"))
+                payload["error"] = "The grading job has already finished."
+                return jsonify(payload), 409
+            if outcome == "cancelled":
+                # Abort the job now if it runs in this process; jobs in other
+                # processes are stopped by their runner's watchdog.
+                self.grade_job_runner.cancel(job_id)
+                self.grade_scheduler.notify()
+
+            payload = self.serialize_grade_job(self.grade_job_store.get_job(job_id), include_result=False)
+            if outcome == "detached":
+                # Identical requests from other students still wait for this job.
+                payload["detached"] = True
             return jsonify(payload)
 
+        @bp.get("/grade/jobs/<job_id>/events")
+        def grade_job_events(job_id):
+            job = self.grade_job_store.get_job(job_id)
+            if not job:
+                return jsonify({"error": f"Unknown grading job '{job_id}'"}), 404
+
+            return Response(
+                stream_with_context(self.grade_job_events(job, request.headers.get("Last-Event-ID"))),
+                mimetype="text/event-stream",
+                headers={
+                    "Cache-Control": "no-cache",
+                    # Stop reverse proxies from buffering the stream.
+                    "X-Accel-Buffering": "no",
+                },
+            )
+
         @bp.post("/reload")
         def reload_units():
             print("In /reload endpoint")
-            self.grader.load_unit_pkg()
+            changes = self.grader.load_unit_pkg()
             return jsonify({
                 "status": "ok",
                 "validation_alert": getattr(self.grader, 'unit_validation_alert', None),
+                "changes": changes,
             })
 
         @bp.get("/pkg_assets/<path:filename>")
@@ -717,16 +832,9 @@ class APIController:
         @bp.get("/api/admin/preferences")
         @self.require_admin
         def get_admin_preferences():
-            pref_path = self.grader.get_admin_pref_path()
             defaults = get_default_admin_prefs()
-
-            if not os.path.exists(pref_path):
-                return jsonify(defaults)
-
-            try:
-                with open(pref_path, "r", encoding="utf-8") as f:
-                    config = json.load(f)
-            except (OSError, json.JSONDecodeError):
+            config = self.grader.stored_admin_preferences()
+            if config is None:
                 return jsonify(defaults)
 
             merged = {**defaults, **config}
@@ -742,20 +850,49 @@ class APIController:
             defaults = get_default_admin_prefs()
             merged = {**defaults, **data}
 
-            pref_path = self.grader.get_admin_pref_path()
             try:
-                with open(pref_path, "w", encoding="utf-8") as f:
-                    json.dump(merged, f, indent=2)
+                self.grader.save_admin_preferences(merged)
             except OSError as e:
                 return jsonify({"error": str(e)}), 500
 
             return jsonify({"status": "ok"})
 
+        @bp.post("/api/admin/archive")
+        @self.require_admin
+        def archive_submissions():
+            data = request.get_json(silent=True) or {}
+            try:
+                summary = self.grader.archive.archive(
+                    before=(data.get("before") or "").strip() or None,
+                    term=(data.get("term") or "").strip() or None,
+                    dry_run=bool(data.get("dry_run")),
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except RuntimeError as e:
+                return jsonify({"error": str(e)}), 500
+            return jsonify(summary)
+
+        @bp.get("/api/admin/grading/stats")
+        @self.require_admin
+        def grading_stats():
+            stats = {
+                "scheduler": self.grade_scheduler.stats(),
+                "queue_depth": self.grade_job_store.queue_depth(),
+                "llm_clients": self.grader.llm_clients.stats(),
+                "grade_cache": self.grader.grade_cache.stats(),
+                "rate_limits": self.grader.rate_limiter.stats(),
+            }
+            if self.grader.submission_writer is not None:
+                stats["submission_writer"] = self.grader.submission_writer.stats()
+            if self.async_grader is not None:
+                stats["async_llm_clients"] = self.async_grader.llm_clients.stats()
+            return jsonify(stats)
+
         @bp.get("/api/admin/users")
         @self.require_admin
         def list_admin_users():
-            conn = sqlite3.connect(self.grader.db_path)
-            try:
+            with self.grader.db.connection() as conn:
                 rows = conn.execute(
                     """
                     SELECT a.email, a.created_at, a.created_by, u.name
@@ -764,8 +901,6 @@ class APIController:
                     ORDER BY a.email
                     """
                 ).fetchall()
-            finally:
-                conn.close()
 
             admins = [
                 {
@@ -788,8 +923,7 @@ class APIController:
 
             actor = self.current_user()
             actor_email = self.normalize_email(actor.get("email")) if actor else "admin"
-            conn = sqlite3.connect(self.grader.db_path)
-            try:
+            with self.grader.db.connection() as conn:
                 conn.execute(
                     """
                     INSERT OR IGNORE INTO admin_users (email, created_at, created_by)
@@ -798,8 +932,7 @@ class APIController:
                     (email, self.utc_now(), actor_email),
                 )
                 conn.commit()
-            finally:
-                conn.close()
+            self.invalidate_admin_emails()
 
             return jsonify({"status": "ok"})
 
@@ -810,8 +943,7 @@ class APIController:
             if not target_email:
                 return jsonify({"error": "invalid email"}), 400
 
-            conn = sqlite3.connect(self.grader.db_path)
-            try:
+            with self.grader.db.connection() as conn:
                 cur = conn.cursor()
                 count_row = cur.execute("SELECT COUNT(*) FROM admin_users").fetchone()
                 admin_count = count_row[0] if count_row else 0
@@ -827,8 +959,7 @@ class APIController:
 
                 cur.execute("DELETE FROM admin_users WHERE email = ?", (target_email,))
                 conn.commit()
-            finally:
-                conn.close()
+            self.invalidate_admin_emails()
 
             return jsonify({"status": "ok"})
 
@@ -851,14 +982,24 @@ class APIController:
                 return jsonify(payload), status_code
 
             return jsonify(result)
+
+        @app.route("/admin/upload/<upload_id>", methods=["GET"])
+        @self.require_admin
+        def upload_status(upload_id):
+            status = self.grader.get_package_upload(upload_id)
+            if status is None:
+                return jsonify({"error": f"Unknown upload '{upload_id}'"}), 404
+            return jsonify(status)
         
         @app.route("/admin/dbviewer", methods=["POST"])
         @self.require_admin
         def dbviewer_api():
             """
             JSON API for Analytics view.
-            Accepts: { "sql_query": "SELECT ..." }
-            Returns: { "columns": [...], "rows": [...], "error": null }
+            Accepts: { "sql_query": "SELECT ...", "page_size": 20, "page_token": null, "explain": false }
+            Returns: { "columns": [...], "rows": [...], "next_page_token": str | null,
+                       "truncated": bool, "elapsed_ms": int, "error": null }
+            With "explain": true, returns the query plan ("plan", "warnings") without running it.
             """
 
             data = request.get_json(silent=True) or {}
@@ -868,26 +1009,80 @@ class APIController:
                 return jsonify({
                     "columns": [],
                     "rows": [],
+                    "next_page_token": None,
                     "error": "Please enter a SQL query"
                 })
             if not self.is_safe_analytics_sql(sql_query):
                 return jsonify({
                     "columns": [],
                     "rows": [],
+                    "next_page_token": None,
                     "error": "Only read-only SELECT queries are allowed"
                 })
 
             try:
-                conn = sqlite3.connect(self.grader.db_path)
-                cursor = conn.cursor()
-                cursor.execute(sql_query)
+                page_size = int(data.get("page_size") or self.DBVIEWER_PAGE_SIZE)
+            except (TypeError, ValueError):
+                page_size = self.DBVIEWER_PAGE_SIZE
+            page_size = min(max(1, page_size), self.DBVIEWER_MAX_PAGE_SIZE)
+            try:
+                offset = self.parse_page_token(sql_query, data.get("page_token"))
+            except ValueError as e:
+                return jsonify({
+                    "columns": [],
+                    "rows": [],
+                    "next_page_token": None,
+                    "error": str(e)
+                })
 
-                # Column names
-                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            # Rows beyond the analytics row cap are not served.
+            max_rows = self.analytics_guard.max_rows
+            page_size = max(0, min(page_size, max_rows - offset))
 
-                # First 20 rows
-                rows = cursor.fetchmany(20)
-                conn.close()
+            try:
+                with self.grader.db.connection(read_only=True) as conn:
+                    self.attach_archive_if_queried(conn, sql_query)
+                    with self.analytics_guard.guard(conn) as budget:
+                        if data.get("explain"):
+                            # Plan preview only; the query is not run.
+                            preview = self.analytics_guard.explain(conn, sql_query)
+                            return jsonify({
+                                "columns": [],
+                                "rows": [],
+                                "next_page_token": None,
+                                "plan": preview["plan"],
+                                "warnings": preview["warnings"],
+                                "elapsed_ms": round(budget.elapsed() * 1000),
+                                "error": None
+                            })
+
+                        cursor = conn.execute(sql_query)
+
+                        # Column names
+                        columns = [desc[0] for desc in cursor.description] if cursor.description else []
+
+                        # Step over earlier pages without decoding them
+                        skipped = 0
+                        while skipped < offset:
+                            chunk = cursor.fetchmany(min(self.CSV_CHUNK_ROWS, offset - skipped))
+                            if not chunk:
+                                break
+                            skipped += len(chunk)
+
+                        # One row past the page tells whether there is a next page.
+                        # Compressed text is decoded for display.
+                        rows = [decompress_row(row) for row in cursor.fetchmany(page_size + 1)]
+                        # Finish the statement so it does not pin a WAL snapshot
+                        cursor.close()
+
+                next_page_token = None
+                truncated = False
+                if len(rows) > page_size:
+                    rows = rows[:page_size]
+                    if offset + page_size < max_rows:
+                        next_page_token = self.make_page_token(sql_query, offset + page_size)
+                    else:
+                        truncated = True
 
                 # Timestamp formatting
                 if "timestamp" in columns:
@@ -909,13 +1104,27 @@ class APIController:
                 return jsonify({
                     "columns": columns,
                     "rows": rows,
+                    "next_page_token": next_page_token,
+                    "truncated": truncated,
+                    "max_rows": max_rows,
+                    "elapsed_ms": round(budget.elapsed() * 1000),
                     "error": None
                 })
 
+            except QueryTimeout as e:
+                print(f"[dbviewer] {e}: {sql_query[:200]}")
+                return jsonify({
+                    "columns": [],
+                    "rows": [],
+                    "next_page_token": None,
+                    "elapsed_ms": round(e.elapsed * 1000),
+                    "error": str(e)
+                })
             except Exception as e:
                 return jsonify({
                     "columns": [],
                     "rows": [],
+                    "next_page_token": None,
                     "error": f"SQL Error: {str(e)}"
                 })
 
@@ -926,6 +1135,9 @@ class APIController:
         def dbviewer_download():
             """
             Download CSV of the last SQL query results.
+
+            Rows are streamed from the cursor in chunks, so memory use does not
+            grow with the result.  ``?gzip=1`` sends ``submissions.csv.gz``.
             """
             sql_query = session.get("last_sql")
             
@@ -933,40 +1145,29 @@ class APIController:
                 return {"error": "No query in session"}, 400
             if not self.is_safe_analytics_sql(sql_query):
                 return {"error": "Only read-only SELECT queries are allowed"}, 400
-            
+
+            use_gzip = request.args.get("gzip", "").strip().lower() in {"1", "true", "yes"}
+            chunks = self.iter_csv(sql_query, use_gzip=use_gzip)
             try:
-                conn = sqlite3.connect(self.grader.db_path)
-                cursor = conn.cursor()
-                cursor.execute(sql_query)
-                
-                # Get column names
-                columns = [desc[0] for desc in cursor.description] if cursor.description else []
-                
-                # Get all rows
-                rows = cursor.fetchall()
-                conn.close()
-                
-                # Generate CSV
-                output = io.StringIO()
-                writer = csv.writer(output)
-                
-                # Write header
-                writer.writerow(columns)
-                
-                # Write data rows
-                writer.writerows(rows)
-                
-                # Create response
-                csv_data = output.getvalue()
-                output.close()
-                
-                response = Response(csv_data, mimetype="text/csv")
-                response.headers["Content-Disposition"] = "attachment; filename=submissions.csv"
-                return response
-                
+                # Run the query before the response starts, so SQL errors still
+                # return an error status.
+                first_chunk = next(chunks)
             except Exception as e:
+                chunks.close()
                 return {"error": f"Download Error: {str(e)}"}, 500
 
+            def body():
+                yield first_chunk
+                yield from chunks
+
+            if use_gzip:
+                response = Response(stream_with_context(body()), mimetype="application/gzip")
+                response.headers["Content-Disposition"] = "attachment; filename=submissions.csv.gz"
+            else:
+                response = Response(stream_with_context(body()), mimetype="text/csv")
+                response.headers["Content-Disposition"] = "attachment; filename=submissions.csv"
+            return response
+
         @app.route("/admin/submission/<int:sub_id>")
         @self.require_admin
         def submission_detail(sub_id):
@@ -974,19 +1175,15 @@ class APIController:
             Display detailed view of a single submission.
             """
             try:
-                conn = sqlite3.connect(self.grader.db_path)
-                conn.row_factory = sqlite3.Row  # Enable column access by name
-                cursor = conn.cursor()
-                
-                cursor.execute("SELECT * FROM submissions WHERE id = ?", (sub_id,))
-                row = cursor.fetchone()
-                conn.close()
+                # sqlite3.Row enables column access by name
+                with self.grader.db.connection(row_factory=sqlite3.Row) as conn:
+                    row = conn.execute("SELECT * FROM submissions WHERE id = ?", (sub_id,)).fetchone()
                 
                 if not row:
                     return {"error": f"Submission {sub_id} not found"}, 404
                 
-                # Convert row to dictionary
-                row_dict = dict(row)
+                # Convert row to dictionary, decoding compressed text
+                row_dict = decompress_row(dict(row))
 
                 # Parse solution image paths before formatting
                 raw_image_paths_json = row_dict.get("solution_image_paths_json")
@@ -6,7 +6,7 @@ Creates a solution package for the LLM Grader by collecting unit XML files
 specified in a configuration file.
 
 Usage:
-    python create_soln_pkg.py --config llmgrader_config.xml
+    python create_soln_pkg.py --config llmgrader_config.xml [--workers 0]
 """
 
 import os
@@ -59,6 +59,12 @@ def main():
         default='llmgrader_config.xml',
         help='Path to the llmgrader_config.xml file'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Processes used to validate unit files (0 = one per CPU core)'
+    )
     args = parser.parse_args()
 
     config_path = Path(args.config)
@@ -68,7 +74,10 @@ def main():
         print(f"Error: Config file not found: {config_path}")
         return 1
 
-    validation_errors = UnitParser.validate_course_package_config(str(config_path.resolve()))
+    validation_errors = UnitParser.validate_course_package_config(
+        str(config_path.resolve()),
+        workers=args.workers,
+    )
     if validation_errors:
         print("Validation errors found in course package source files:")
         print()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+
+from llmgrader.services import migrations
+from llmgrader.services.archive import SubmissionArchive
+from llmgrader.services.db import get_database
+
+
+def default_storage_path() -> str:
+    # Same rule as Grader.get_storage_path
+    return os.environ.get("LLMGRADER_STORAGE_PATH") or os.path.join(os.getcwd(), "local_data")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Move old submissions from llmgrader.db into compressed Parquet files "
+            "partitioned by term and unit under <storage>/archive/submissions, then "
+            "VACUUM the database. Archived rows stay queryable in Analytics as "
+            "archived_submissions and all_submissions."
+        )
+    )
+    parser.add_argument("--before", help="Archive submissions before this date (YYYY-MM-DD).")
+    parser.add_argument("--term", help="Archive submissions from this term, e.g. 2026-spring (spring, summer or fall).")
+    parser.add_argument(
+        "--storage-path",
+        default=default_storage_path(),
+        help="Storage root holding db/llmgrader.db (default: LLMGRADER_STORAGE_PATH or ./local_data).",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many rows each partition would get.")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM after deleting archived rows.")
+    args = parser.parse_args()
+
+    db_path = os.path.join(args.storage_path, "db", "llmgrader.db")
+    if not os.path.exists(db_path):
+        parser.error(f"No database at {db_path}")
+    with get_database(db_path).connection(autocommit=True) as conn:
+        migrations.migrate(conn)
+
+    archive = SubmissionArchive(db_path, os.path.join(args.storage_path, "archive", "submissions"))
+    try:
+        summary = archive.archive(
+            before=args.before,
+            term=args.term,
+            dry_run=args.dry_run,
+            vacuum=not args.no_vacuum,
+        )
+    except (ValueError, RuntimeError) as exc:
+        parser.error(str(exc))
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -21,6 +21,20 @@ ENV_VARS = [
     EnvVarSpec("LLMGRADER_STORAGE_PATH"),
     EnvVarSpec("LLMGRADER_PRIVATE_KEY", sensitive=True),
     EnvVarSpec("LLMGRADER_PUBLIC_KEY"),
+    EnvVarSpec("LLMGRADER_GRADE_WORKERS"),
+    EnvVarSpec("LLMGRADER_GRADE_QUEUE_DEPTH"),
+    EnvVarSpec("LLMGRADER_GRADE_ENGINE"),
+    EnvVarSpec("LLMGRADER_LLM_MAX_CONNECTIONS"),
+    EnvVarSpec("LLMGRADER_GRADE_CACHE_TTL_HOURS"),
+    EnvVarSpec("LLMGRADER_GRADE_CACHE_MAX_ENTRIES"),
+    EnvVarSpec("LLMGRADER_LLM_MAX_ATTEMPTS"),
+    EnvVarSpec("LLMGRADER_LLM_HEDGE"),
+    EnvVarSpec("LLMGRADER_SUBMISSION_LOG"),
+    EnvVarSpec("LLMGRADER_COMPRESS_COLUMNS"),
+    EnvVarSpec("LLMGRADER_COMPRESSION"),
+    EnvVarSpec("LLMGRADER_ANALYTICS_TIMEOUT_SECONDS"),
+    EnvVarSpec("LLMGRADER_ANALYTICS_MAX_ROWS"),
+    EnvVarSpec("LLMGRADER_PARSE_WORKERS"),
 ]
 
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import time
+
+from llmgrader.services.async_grader import AsyncGrader
+from llmgrader.services.grade_jobs import GradeJobRunner, GradeJobStore
+from llmgrader.services.grade_scheduler import GradeScheduler
+from llmgrader.services.grader import Grader
+from llmgrader.services.submission_writer import SubmissionWriter
+
+
+def build_worker(*, workers: int, scratch_dir: str, soln_pkg: str | None, poll_interval: float,
+                 engine: str = "thread") -> GradeScheduler:
+    grader = Grader(scratch_dir=scratch_dir, soln_pkg=soln_pkg)
+    if SubmissionWriter.mode_from_env() == "async":
+        grader.enable_submission_writer()
+    store = GradeJobStore(grader.db_path)
+    store.init_db()
+    async_grader = AsyncGrader(grader) if engine == "async" else None
+    runner = GradeJobRunner(grader, store, async_grader=async_grader)
+
+    # Stops local jobs cancelled through the web app or abandoned by their client.
+    runner.start_watchdog()
+
+    def claim_job(worker_id: str) -> dict | None:
+        store.expire_stale_jobs(abandon_after=runner.abandon_after)
+        return store.claim_next_job(worker_id, rate_limiter=grader.rate_limiter)
+
+    return GradeScheduler(
+        claim_job,
+        runner.submit if async_grader else runner.run,
+        max_workers=workers,
+        poll_interval=poll_interval,
+        asynchronous=async_grader is not None,
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run grading worker threads that claim jobs from the grade_jobs table in "
+            "llmgrader.db. Start the web app with LLMGRADER_GRADE_WORKERS=0 to serve "
+            "all grading from worker processes."
+        )
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(1, GradeScheduler.max_workers_from_env()),
+        help="Number of grading jobs this process runs at the same time (can be in the hundreds with --engine async).",
+    )
+    parser.add_argument(
+        "--scratch_dir",
+        type=str,
+        default=os.path.join(os.getcwd(), f"scratch_worker_{os.getpid()}"),
+        help="Scratch directory for this worker (must differ from the web app's).",
+    )
+    parser.add_argument(
+        "--soln_pkg",
+        type=str,
+        default=None,
+        help="Path to solution package (if testing locally).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=GradeScheduler.ENGINES,
+        default=GradeScheduler.engine_from_env(),
+        help=(
+            "'thread' runs one grading job per worker thread; 'async' runs up to "
+            "--workers jobs concurrently on a single asyncio event loop."
+        ),
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=GradeScheduler.DEFAULT_POLL_INTERVAL,
+        help="Seconds between queue checks while idle.",
+    )
+    args = parser.parse_args()
+
+    scheduler = build_worker(
+        workers=max(1, args.workers),
+        scratch_dir=args.scratch_dir,
+        soln_pkg=args.soln_pkg,
+        poll_interval=args.poll_interval,
+        engine=args.engine,
+    )
+    scheduler.start()
+    print(f"[llmgrader_worker] Started {scheduler.max_workers} grading worker(s) ({args.engine} engine).")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("[llmgrader_worker] Shutting down after running jobs finish...")
+        scheduler.shutdown()
+        scheduler.join()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,150 @@
+import time
+
+from llmgrader.services.db import get_database
+
+
+class AdminUsageLedger:
+    """
+    Running totals of tokens graded on the admin (community) OpenAI key.
+
+    Every submission graded with the admin key adds its tokens to a
+    per-minute and a per-hour bucket in ``admin_token_usage``, so the
+    community token-limit check sums a few dozen bucket rows instead of
+    scanning ``submissions``.  Per-hour limits are checked against minute
+    buckets and longer periods against hour buckets; the oldest bucket
+    counts in full, so the check errs on the strict side by at most one
+    bucket.
+
+    Before a request is sent, its estimated tokens are reserved in
+    ``admin_token_reservations`` within the same transaction as the check,
+    so concurrent grades cannot all pass the check and overshoot the limit
+    together.  The reservation is released when the submission is logged;
+    reservations left by crashed requests expire.
+
+    The tables are created by schema migration 3 (``migrations.py``).
+    """
+
+    # Keep minute buckets for the per-hour check and hour buckets for per-month.
+    MINUTE_RETENTION_SECONDS = 2 * 3600
+    HOUR_RETENTION_SECONDS = 32 * 86400
+    # Lifetime of a reservation whose grade never finished.
+    DEFAULT_RESERVATION_TTL_SECONDS = 600.0
+    PRUNE_INTERVAL_SECONDS = 300.0
+
+    PERIOD_SECONDS = {
+        "per_hour": 3600,
+        "per_day": 86400,
+        "per_week": 7 * 86400,
+        "per_month": 30 * 86400,
+    }
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._last_prune_ts = 0.0
+
+    def _connect(self):
+        return get_database(self.db_path).connection(autocommit=True)
+
+    @staticmethod
+    def bucket_seconds_for(window_seconds: float) -> int:
+        return 60 if window_seconds <= 3600 else 3600
+
+    @staticmethod
+    def _used_tokens(conn, window_seconds: float, now_ts: float) -> int:
+        bucket_seconds = AdminUsageLedger.bucket_seconds_for(window_seconds)
+        first_bucket = int((now_ts - window_seconds) // bucket_seconds) * bucket_seconds
+        row = conn.execute(
+            """
+            SELECT COALESCE(SUM(tokens), 0) FROM admin_token_usage
+            WHERE bucket_seconds = ? AND bucket_start_ts >= ?
+            """,
+            (bucket_seconds, first_bucket),
+        ).fetchone()
+        return row[0]
+
+    @staticmethod
+    def _reserved_tokens(conn, now_ts: float) -> int:
+        row = conn.execute(
+            "SELECT COALESCE(SUM(tokens), 0) FROM admin_token_reservations WHERE expires_at_ts > ?",
+            (now_ts,),
+        ).fetchone()
+        return row[0]
+
+    def usage(self, window_seconds: float, *, now_ts: float | None = None) -> dict:
+        """
+        Return ``{"used", "reserved"}`` token totals for the window ending now.
+        """
+        now_ts = time.time() if now_ts is None else now_ts
+        with self._connect() as conn:
+            return {
+                "used": self._used_tokens(conn, window_seconds, now_ts),
+                "reserved": self._reserved_tokens(conn, now_ts),
+            }
+
+    def reserve(self, reservation_id: str, tokens: int, *, limit: int, window_seconds: float,
+                ttl: float = DEFAULT_RESERVATION_TTL_SECONDS, now_ts: float | None = None) -> bool:
+        """
+        Reserve ``tokens`` if used plus reserved tokens stay within ``limit``.
+
+        Returns False, reserving nothing, when the limit would be exceeded.
+        """
+        now_ts = time.time() if now_ts is None else now_ts
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                committed = self._used_tokens(conn, window_seconds, now_ts) + self._reserved_tokens(conn, now_ts)
+                if committed >= limit or committed + tokens > limit:
+                    conn.execute("ROLLBACK")
+                    return False
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO admin_token_reservations (reservation_id, tokens, expires_at_ts)
+                    VALUES (?, ?, ?)
+                    """,
+                    (reservation_id, int(tokens), now_ts + ttl),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def record(self, conn, tokens: int, *, reservation_id: str | None = None,
+               now_ts: float | None = None) -> None:
+        """
+        Add a finished grade's tokens to the buckets and release its reservation.
+
+        Runs on the caller's connection so it commits together with the
+        submission row.
+        """
+        now_ts = time.time() if now_ts is None else now_ts
+        if reservation_id:
+            conn.execute("DELETE FROM admin_token_reservations WHERE reservation_id = ?", (reservation_id,))
+        if tokens:
+            for bucket_seconds in (60, 3600):
+                conn.execute(
+                    """
+                    INSERT INTO admin_token_usage (bucket_seconds, bucket_start_ts, tokens)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (bucket_seconds, bucket_start_ts) DO UPDATE SET tokens = tokens + excluded.tokens
+                    """,
+                    (bucket_seconds, int(now_ts // bucket_seconds) * bucket_seconds, int(tokens)),
+                )
+        if now_ts - self._last_prune_ts >= self.PRUNE_INTERVAL_SECONDS:
+            self._last_prune_ts = now_ts
+            self._prune(conn, now_ts)
+
+    def release(self, reservation_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM admin_token_reservations WHERE reservation_id = ?", (reservation_id,))
+
+    def _prune(self, conn, now_ts: float) -> None:
+        conn.execute(
+            """
+            DELETE FROM admin_token_usage
+            WHERE (bucket_seconds = 60 AND bucket_start_ts < ?)
+               OR (bucket_seconds = 3600 AND bucket_start_ts < ?)
+            """,
+            (now_ts - self.MINUTE_RETENTION_SECONDS, now_ts - self.HOUR_RETENTION_SECONDS),
+        )
+        conn.execute("DELETE FROM admin_token_reservations WHERE expires_at_ts <= ?", (now_ts,))
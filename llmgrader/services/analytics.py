@@ -0,0 +1,189 @@
+"""
+Guarded execution of admin analytics SQL (the dbviewer and CSV export).
+
+Queries run on the database's read-only connection (``mode=ro``), so even
+a query that slips past ``APIController.is_safe_analytics_sql`` cannot
+modify ``llmgrader.db``.  While a query runs, a SQLite progress handler
+checks its time budget and interrupts it once the budget is spent, so one
+careless cross join cannot hold a Flask worker (or the database) for long.
+Results are capped at ``max_rows``.  An authorizer limits queries to the
+submissions tables and views (``ANALYTICS_TABLES``), so other tables such
+as ``grade_jobs`` or ``users`` cannot be read.
+
+``LLMGRADER_ANALYTICS_TIMEOUT_SECONDS`` (default 10) and
+``LLMGRADER_ANALYTICS_MAX_ROWS`` (default 100000) configure the limits.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+
+class QueryTimeout(Exception):
+    """
+    An analytics query ran past its time budget and was interrupted.
+    """
+
+    def __init__(self, elapsed: float, budget: float):
+        self.elapsed = elapsed
+        self.budget = budget
+        super().__init__(f"Query cancelled after {elapsed:.1f} s (time limit {budget:g} s)")
+
+
+class QueryNotAllowed(sqlite3.DatabaseError):
+    """
+    An analytics query tried to read a table outside ``ANALYTICS_TABLES``.
+    """
+
+    def __init__(self, table: str):
+        self.table = table
+        super().__init__(
+            f"Analytics queries may only read the submissions tables and views, not '{table}'"
+        )
+
+
+# Tables and views analytics queries may read: the ``submissions`` view,
+# the tables behind it and the archive views (see ``archive.py``).
+ANALYTICS_TABLES = frozenset({
+    "submissions",
+    "submission_rows",
+    "blobs",
+    "archived_submissions",
+    "all_submissions",
+})
+
+SCHEMA_TABLES = frozenset({"sqlite_master", "sqlite_schema", "sqlite_temp_master", "sqlite_temp_schema"})
+
+
+class QueryBudget:
+    """
+    Time budget of one analytics query; see :meth:`AnalyticsGuard.guard`.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds
+        self.exceeded = False
+
+    def restart(self) -> None:
+        """
+        Give the query a fresh budget, e.g. before each chunk of a streamed export.
+        """
+        self.deadline = time.monotonic() + self.seconds
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def check(self) -> int:
+        # Progress handler: a non-zero return interrupts the statement.
+        if time.monotonic() >= self.deadline:
+            self.exceeded = True
+            return 1
+        return 0
+
+
+class AnalyticsGuard:
+    """
+    Time and row limits for analytics queries.
+
+    Parameters
+    ----------
+    timeout_seconds: float
+        Time budget of a query.
+    max_rows: int
+        Most rows a query may return (across all pages, or in one export).
+    """
+
+    DEFAULT_TIMEOUT_SECONDS = 10.0
+    DEFAULT_MAX_ROWS = 100000
+    # SQLite VM instructions between time checks
+    PROGRESS_INTERVAL = 10000
+
+    def __init__(self, *, timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS, max_rows: int = DEFAULT_MAX_ROWS):
+        self.timeout_seconds = max(0.1, float(timeout_seconds))
+        self.max_rows = max(1, int(max_rows))
+
+    @classmethod
+    def from_env(cls) -> "AnalyticsGuard":
+        """
+        Build a guard using ``LLMGRADER_ANALYTICS_TIMEOUT_SECONDS`` and
+        ``LLMGRADER_ANALYTICS_MAX_ROWS``.
+        """
+        try:
+            timeout_seconds = float(os.environ.get("LLMGRADER_ANALYTICS_TIMEOUT_SECONDS") or cls.DEFAULT_TIMEOUT_SECONDS)
+        except ValueError:
+            timeout_seconds = cls.DEFAULT_TIMEOUT_SECONDS
+        try:
+            max_rows = int(os.environ.get("LLMGRADER_ANALYTICS_MAX_ROWS") or cls.DEFAULT_MAX_ROWS)
+        except ValueError:
+            max_rows = cls.DEFAULT_MAX_ROWS
+        return cls(timeout_seconds=timeout_seconds, max_rows=max_rows)
+
+    @contextmanager
+    def guard(self, conn: sqlite3.Connection):
+        """
+        Interrupt statements on ``conn`` once the time budget is spent.
+
+        Reading a table outside ``ANALYTICS_TABLES`` is denied.
+
+        Yields the :class:`QueryBudget`; an interrupted statement surfaces
+        as :class:`QueryTimeout` and a denied read as :class:`QueryNotAllowed`.
+        """
+        budget = QueryBudget(self.timeout_seconds)
+        denied = []
+        # SQLite reports some reads without a database name (``COUNT(*)``,
+        # recursive CTEs), so those are told apart by name.
+        schema_names = {
+            row[0].lower()
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master UNION SELECT name FROM sqlite_temp_master"
+            )
+        } | SCHEMA_TABLES
+
+        def authorize(action, arg1, arg2, db_name, source):
+            if action == sqlite3.SQLITE_READ:
+                name = (arg1 or "").lower()
+                if name not in ANALYTICS_TABLES and (db_name is not None or name in schema_names):
+                    denied.append(arg1)
+                    return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+
+        conn.set_progress_handler(budget.check, self.PROGRESS_INTERVAL)
+        conn.set_authorizer(authorize)
+        try:
+            yield budget
+        except sqlite3.DatabaseError as exc:
+            if budget.exceeded:
+                raise QueryTimeout(budget.elapsed(), budget.seconds) from exc
+            if denied:
+                raise QueryNotAllowed(denied[0]) from exc
+            raise
+        finally:
+            conn.set_authorizer(None)
+            conn.set_progress_handler(None, 0)
+
+    @staticmethod
+    def explain(conn: sqlite3.Connection, sql_query: str) -> dict:
+        """
+        ``EXPLAIN QUERY PLAN`` of a query, without running it.
+
+        Returns
+        -------
+        dict
+            ``{"plan": [str, ...], "warnings": [str, ...]}``; a warning is
+            added for every full table scan.
+        """
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_query}")]
+        warnings = []
+        for detail in plan:
+            # "SCAN t [USING ... INDEX i]" reads every row of t (or of its index);
+            # "SEARCH t USING INDEX ..." reads only matching rows.
+            match = re.match(r"^SCAN (?!CONSTANT ROW)([^\s(]+)", detail)
+            if match:
+                warnings.append(f"Full scan of {match.group(1)}: the query reads every row")
+        return {"plan": plan, "warnings": warnings}
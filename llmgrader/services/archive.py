@@ -0,0 +1,280 @@
+"""
+Archival of old submissions into compressed Parquet partitions.
+
+:meth:`SubmissionArchive.archive` moves submissions older than a cutoff
+date, or from a finished term, out of ``llmgrader.db`` into Parquet files
+partitioned by term and unit::
+
+    <LLMGRADER_STORAGE_PATH>/archive/submissions/term=2026-spring/unit=unit1/part-<run>-<n>.parquet
+
+and then deletes the rows (and blobs no longer referenced) from the live
+database and runs ``VACUUM`` so the file shrinks.  Text columns are written
+decoded (see ``compression.py``); Parquet compresses them with zstd.
+
+Analytics queries can read archived rows through two names that are
+created on demand on the query's connection by :meth:`SubmissionArchive.attach`:
+
+* ``archived_submissions`` -- every archived row, with the columns of
+  ``submissions``;
+* ``all_submissions`` -- ``submissions UNION ALL archived_submissions``.
+
+Writing and reading archives requires ``pyarrow`` (``pip install
+llmgrader[archive]``).  Run from the command line with ``llmgrader_archive``
+or from **Admin → Archive Submissions…**.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import date
+
+from llmgrader.services.blob_store import SUBMISSION_BLOB_COLUMNS, hash_column
+from llmgrader.services.compression import decompress_row
+from llmgrader.services.db import get_database
+from llmgrader.services.migrations import table_columns
+
+try:
+    import pyarrow
+except ImportError:  # optional
+    pyarrow = None
+
+# First month of each academic term
+TERM_START_MONTHS = (("spring", 1), ("summer", 6), ("fall", 8))
+
+_TERM_RE = re.compile(r"^(\d{4})-(spring|summer|fall)$")
+
+# Query text that needs the archive attached
+ARCHIVE_NAMES_RE = re.compile(r"\b(archived_submissions|all_submissions)\b", re.IGNORECASE)
+
+
+def term_for(timestamp: str | None) -> str:
+    """
+    Term of an ISO timestamp, e.g. ``2026-fall``; ``unknown`` if it cannot be parsed.
+    """
+    match = re.match(r"^(\d{4})-(\d{2})", timestamp or "")
+    if not match:
+        return "unknown"
+    year, month = int(match.group(1)), int(match.group(2))
+    name = "spring"
+    for term_name, start_month in TERM_START_MONTHS:
+        if month >= start_month:
+            name = term_name
+    return f"{year}-{name}"
+
+
+def term_range(term: str) -> tuple[str, str]:
+    """
+    ``[start, end)`` dates of a term such as ``2026-fall``.
+    """
+    match = _TERM_RE.match((term or "").strip().lower())
+    if not match:
+        raise ValueError(f"Invalid term {term!r}; expected e.g. 2026-fall (spring, summer or fall)")
+    year, name = int(match.group(1)), match.group(2)
+    names = [term_name for term_name, _ in TERM_START_MONTHS]
+    index = names.index(name)
+    start = date(year, TERM_START_MONTHS[index][1], 1)
+    if index + 1 < len(TERM_START_MONTHS):
+        end = date(year, TERM_START_MONTHS[index + 1][1], 1)
+    else:
+        end = date(year + 1, TERM_START_MONTHS[0][1], 1)
+    return start.isoformat(), end.isoformat()
+
+
+def _partition_value(value) -> str:
+    text = str(value) if value not in (None, "") else "unknown"
+    return re.sub(r"[^A-Za-z0-9._-]", "_", text)
+
+
+def require_pyarrow() -> None:
+    if pyarrow is None:
+        raise RuntimeError("Submission archives require pyarrow (pip install llmgrader[archive])")
+
+
+class SubmissionArchive:
+    """
+    Parquet archive of submissions for one database.
+
+    Parameters
+    ----------
+    db_path: str
+        Path to ``llmgrader.db``.
+    archive_dir: str
+        Root directory of the Parquet partitions.
+    """
+
+    BATCH_SIZE = 5000
+
+    def __init__(self, db_path: str, archive_dir: str):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self._attached = threading.local()
+        self._lock = threading.Lock()
+
+    def partition_files(self) -> list[str]:
+        return sorted(glob.glob(os.path.join(self.archive_dir, "term=*", "unit=*", "*.parquet")))
+
+    @staticmethod
+    def _selection(before: str | None, term: str | None) -> tuple[str, list]:
+        conditions = []
+        params = []
+        if before:
+            try:
+                cutoff = date.fromisoformat(str(before).strip()[:10]).isoformat()
+            except ValueError:
+                raise ValueError(f"Invalid cutoff date {before!r}; expected YYYY-MM-DD") from None
+            conditions.append("timestamp < ?")
+            params.append(cutoff)
+        if term:
+            start, end = term_range(term)
+            conditions.append("timestamp >= ? AND timestamp < ?")
+            params.extend([start, end])
+        if not conditions:
+            raise ValueError("Give a cutoff date or a term to archive")
+        return " AND ".join(conditions), params
+
+    def archive(self, *, before: str | None = None, term: str | None = None,
+                dry_run: bool = False, vacuum: bool = True) -> dict:
+        """
+        Move matching submissions into Parquet partitions.
+
+        Parameters
+        ----------
+        before: str | None
+            Archive submissions with a timestamp before this date (YYYY-MM-DD).
+        term: str | None
+            Archive submissions from this term (e.g. ``2026-spring``).
+            With ``before`` as well, both conditions apply.
+        dry_run: bool
+            Only count the rows per partition.
+        vacuum: bool
+            Run ``VACUUM`` after deleting the archived rows.
+
+        Returns
+        -------
+        dict
+            ``{"rows", "partitions": [{"term", "unit", "rows", "files"}], "dry_run", "vacuumed"}``
+        """
+        where, params = self._selection(before, term)
+        if not dry_run:
+            require_pyarrow()
+        database = get_database(self.db_path)
+
+        # One archive run at a time in this process; rows are deleted only
+        # after every partition file has been written.
+        with self._lock:
+            with database.connection() as conn:
+                max_id = conn.execute(f"SELECT MAX(id) FROM submissions WHERE {where}", params).fetchone()[0]
+            summary = {"rows": 0, "partitions": [], "dry_run": dry_run, "vacuumed": False}
+            if max_id is None:
+                return summary
+
+            partitions: dict[tuple[str, str], dict] = {}
+            run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            last_id = 0
+            batch_no = 0
+            while True:
+                with database.connection() as conn:
+                    cursor = conn.execute(
+                        f"SELECT * FROM submissions WHERE {where} AND id > ? AND id <= ? ORDER BY id LIMIT ?",
+                        [*params, last_id, max_id, self.BATCH_SIZE],
+                    )
+                    columns = [desc[0] for desc in cursor.description]
+                    rows = [decompress_row(row) for row in cursor.fetchall()]
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                batch_no += 1
+
+                ts_idx = columns.index("timestamp")
+                unit_idx = columns.index("unit_name")
+                groups: dict[tuple[str, str], list] = {}
+                for row in rows:
+                    key = (term_for(row[ts_idx]), _partition_value(row[unit_idx]))
+                    groups.setdefault(key, []).append(row)
+
+                for (row_term, unit), group in groups.items():
+                    partition = partitions.setdefault(
+                        (row_term, unit), {"term": row_term, "unit": unit, "rows": 0, "files": []}
+                    )
+                    partition["rows"] += len(group)
+                    summary["rows"] += len(group)
+                    if not dry_run:
+                        partition["files"].append(self._write_partition(row_term, unit, columns, group,
+                                                                        f"part-{run_id}-{batch_no:05d}"))
+
+            summary["partitions"] = sorted(partitions.values(), key=lambda p: (p["term"], p["unit"]))
+            if dry_run:
+                return summary
+
+            self._delete_archived(where, params, max_id)
+            if vacuum:
+                with database.connection(autocommit=True) as conn:
+                    conn.execute("VACUUM")
+                summary["vacuumed"] = True
+        print(f"[archive] Archived {summary['rows']} submissions into {len(summary['partitions'])} partitions")
+        return summary
+
+    def _write_partition(self, term: str, unit: str, columns: list[str], rows: list, name: str) -> str:
+        import pandas as pd
+
+        directory = os.path.join(self.archive_dir, f"term={term}", f"unit={unit}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.parquet")
+        tmp_path = path + ".tmp"
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        frame.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+        os.replace(tmp_path, path)
+        return path
+
+    def _delete_archived(self, where: str, params: list, max_id: int) -> None:
+        hash_columns = [hash_column(name) for name in SUBMISSION_BLOB_COLUMNS]
+        referenced = " UNION ".join(
+            f"SELECT {column} FROM submission_rows WHERE {column} IS NOT NULL" for column in hash_columns
+        )
+        with get_database(self.db_path).connection() as conn:
+            conn.execute(
+                f"DELETE FROM submission_rows WHERE id IN (SELECT id FROM submissions WHERE {where} AND id <= ?)",
+                [*params, max_id],
+            )
+            conn.execute(f"DELETE FROM blobs WHERE hash NOT IN ({referenced})")
+
+    def attach(self, conn) -> None:
+        """
+        Create ``temp.archived_submissions`` and ``temp.all_submissions`` on
+        ``conn``, reloading the archive only when its files have changed.
+        """
+        files = self.partition_files()
+        stamp = tuple((path, os.path.getmtime(path)) for path in files)
+        attached = getattr(self._attached, "state", None)
+        if attached == (id(conn), stamp) and conn.execute(
+            "SELECT 1 FROM temp.sqlite_master WHERE name = 'archived_submissions'"
+        ).fetchone():
+            return
+        if files:
+            require_pyarrow()
+
+        columns = table_columns(conn, "submissions")
+        conn.execute("DROP VIEW IF EXISTS temp.all_submissions")
+        conn.execute("DROP TABLE IF EXISTS temp.archived_submissions")
+        conn.execute(f"CREATE TEMP TABLE archived_submissions ({', '.join(columns)})")
+        if files:
+            import pandas as pd
+
+            insert_sql = (
+                f"INSERT INTO temp.archived_submissions ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})"
+            )
+            for path in files:
+                frame = pd.read_parquet(path, engine="pyarrow").reindex(columns=columns)
+                frame = frame.astype(object).where(frame.notna(), None)
+                conn.executemany(insert_sql, frame.itertuples(index=False, name=None))
+        conn.execute(
+            "CREATE TEMP VIEW all_submissions AS "
+            "SELECT * FROM main.submissions UNION ALL SELECT * FROM temp.archived_submissions"
+        )
+        self._attached.state = (id(conn), stamp)
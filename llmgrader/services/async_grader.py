@@ -0,0 +1,266 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+
+import httpx
+from openai import AsyncOpenAI
+
+from llmgrader.services.grader import Grader, log_std
+from llmgrader.services.llm_clients import LLMClientRegistry
+
+
+class AsyncGrader:
+    """
+    Asyncio grading engine that shares one event loop and one HTTP
+    connection pool across all grading calls.
+
+    ``grade_async`` takes the same inputs as ``Grader.grade`` and returns the
+    same result.  It reuses ``Grader.prepare_grade`` and ``Grader.finish_grade``,
+    so prompts, admin-key handling and submission logging are identical.
+    Only the LLM call differs: OpenAI requests go through ``AsyncOpenAI`` and
+    Hugging Face requests through ``httpx.AsyncClient``, both on a shared
+    keep-alive pool, so a single process can have hundreds of LLM requests in
+    flight without a thread per request.
+
+    The event loop runs on a daemon thread.  Synchronous code (e.g. the grade
+    job scheduler) hands work to it with ``submit``.
+
+    Parameters
+    ----------
+    grader: Grader
+        Grader that owns the units, the database and the scratch directory.
+    max_connections: int | None
+        Size of the shared HTTP connection pool.  Defaults to
+        ``LLMGRADER_LLM_MAX_CONNECTIONS`` or 200.
+    http_client: httpx.AsyncClient | None
+        Pre-built client, mainly for tests.
+    """
+
+    DEFAULT_MAX_CONNECTIONS = 200
+
+    def __init__(self, grader: Grader, *, max_connections: int | None = None,
+                 http_client: httpx.AsyncClient | None = None):
+        self.grader = grader
+        if max_connections is None:
+            try:
+                max_connections = int(os.environ.get("LLMGRADER_LLM_MAX_CONNECTIONS") or self.DEFAULT_MAX_CONNECTIONS)
+            except ValueError:
+                max_connections = self.DEFAULT_MAX_CONNECTIONS
+        self.max_connections = max(1, max_connections)
+        self._http_client = http_client
+        # AsyncOpenAI clients per API key, all on the shared httpx pool.  The
+        # pool outlives them, so evicted clients are simply dropped.
+        self.llm_clients = LLMClientRegistry(
+            {"openai": self._make_openai_client},
+            close_client=None,
+        )
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Event loop and connection pool
+    # ------------------------------------------------------------------
+    def start(self) -> asyncio.AbstractEventLoop:
+        """
+        Start the background event loop if needed and return it.
+        """
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run_loop, name="async-grader-loop", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro) -> Future:
+        """
+        Schedule a coroutine on the grading loop from any thread.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def grade(self, **kwargs) -> dict:
+        """
+        Blocking wrapper around ``grade_async`` for synchronous callers.
+        """
+        return self.submit(self.grade_async(**kwargs)).result()
+
+    def close(self) -> None:
+        """
+        Close the connection pool and stop the event loop.
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        self.llm_clients.clear()
+        if self._http_client is not None:
+            asyncio.run_coroutine_threadsafe(self._http_client.aclose(), loop).result(timeout=5)
+            self._http_client = None
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        # Created lazily on the loop thread; httpx clients are bound to one loop.
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=None,
+            )
+        return self._http_client
+
+    def _make_openai_client(self, api_key: str) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=api_key, http_client=self._get_http_client())
+
+    # ------------------------------------------------------------------
+    # LLM calls
+    # ------------------------------------------------------------------
+    async def call_llm(self, provider, model, api_key, task, timeout, tools=None,
+                       solution_images=None, ref_solution_images=None):
+        """
+        Async counterpart of the callers built by ``Grader._make_llm_caller``.
+
+        Returns ``(GraderRawResult, input_tokens, output_tokens, tool_call_summary)``.
+        """
+        if provider == "openai":
+            request_kwargs = self.grader.build_openai_request(
+                model, task, timeout,
+                tools=tools,
+                solution_images=solution_images,
+                ref_solution_images=ref_solution_images,
+            )
+            with self.llm_clients.lease("openai", api_key) as client:
+                resp = await client.responses.create(**request_kwargs)
+            return self.grader.parse_openai_response(resp)
+
+        elif provider == "hf":
+            url, headers, payload = self.grader.build_hf_request(
+                model, api_key, task,
+                solution_images=solution_images,
+                ref_solution_images=ref_solution_images,
+            )
+            resp = await self._get_http_client().post(url, headers=headers, json=payload, timeout=timeout)
+            resp.raise_for_status()
+            return self.grader.parse_hf_response(resp.json())
+
+        else:
+            raise ValueError(f"Unknown provider '{provider}'")
+
+    async def grade_async(
+            self,
+            question_dict: dict,
+            student_soln: str,
+            part_label: str = "all",
+            unit_name: str = "",
+            qtag: str = "",
+            provider: str = "openai",
+            model: str = "gpt-4.1-mini",
+            api_key: str | None = None,
+            timeout: float = 20.,
+            solution_images: list[str] | None = None,
+            session_id: str | None = None,
+            deadline_ts: float | None = None) -> dict:
+        """
+        Grade a student's solution; see ``Grader.grade`` for the parameters.
+
+        The blocking steps before and after the LLM call (admin-key lookup,
+        saving images, logging the submission) run in the loop's default
+        thread pool so they never stall other in-flight requests.
+
+        Cancelling the task (see ``GradeJobRunner.cancel``) aborts the LLM
+        requests and logs the submission as ``cancelled``.
+        """
+        grader = self.grader
+        ctx = await asyncio.to_thread(
+            grader.prepare_grade,
+            question_dict,
+            student_soln,
+            part_label=part_label,
+            unit_name=unit_name,
+            qtag=qtag,
+            provider=provider,
+            model=model,
+            api_key=api_key,
+            timeout=timeout,
+            solution_images=solution_images,
+            session_id=session_id,
+        )
+        if ctx["early_grade"] is not None:
+            return ctx["early_grade"]
+        try:
+            if ctx["cached_grade"] is not None:
+                log_std("Grade cache hit; skipping LLM call.")
+                return await asyncio.to_thread(
+                    grader.finish_grade,
+                    ctx,
+                    ctx["cached_grade"]["grade"],
+                    tool_call_summary=ctx["cached_grade"]["tool_call_summary"],
+                    cache_hit=True,
+                )
+
+            tokens_in = 0
+            tokens_out = 0
+            timed_out = False
+            tool_call_summary = None
+
+            if provider not in ("openai", "hf"):
+                grade = {
+                    "result": "error",
+                    "full_explanation": f"Failed to initialize LLM client: Unknown provider '{provider}'",
+                    "feedback": "Initialization failed."
+                }
+                return await asyncio.to_thread(grader.finish_grade, ctx, grade)
+
+            log_std(f'Calling {provider} for grading...')
+            try:
+                llm_call = await grader.make_llm_call_policy(ctx, deadline_ts).call_async(
+                    lambda attempt_timeout: self.call_llm(
+                        provider, model, ctx["api_key"], ctx["task"], attempt_timeout,
+                        tools=ctx["tools"],
+                        solution_images=ctx["solution_images"],
+                        ref_solution_images=ctx["ref_solution_images"],
+                    )
+                )
+            except asyncio.CancelledError:
+                # The job was cancelled: the in-flight HTTP requests are already
+                # aborted, only the submission is left to log.
+                log_std("Grading job cancelled; aborted the LLM call.")
+                await asyncio.to_thread(grader.finish_grade, ctx, grader.cancelled_grade(), cancelled=True)
+                raise
+            if llm_call.error is None:
+                response, tokens_in, tokens_out, tool_call_summary = llm_call.value
+                grade = response.model_dump()
+                log_std(f"Received response from {provider} (attempt {llm_call.winning_attempt} of {llm_call.attempts}).")
+            else:
+                grade, timed_out = grader.llm_failure_grade(
+                    provider, llm_call.error, timeout, model=model, retry_after=llm_call.retry_after
+                )
+
+            return await asyncio.to_thread(
+                grader.finish_grade,
+                ctx,
+                grade,
+                tokens_in=tokens_in,
+                tokens_out=tokens_out,
+                timed_out=timed_out,
+                tool_call_summary=tool_call_summary,
+                attempts=llm_call.attempts,
+                winning_attempt=llm_call.winning_attempt,
+            )
+        finally:
+            # Covers an exception, or a cancel that arrives before the
+            # submission is logged.
+            await asyncio.to_thread(grader.release_admin_reservation, ctx)
@@ -0,0 +1,76 @@
+"""
+Content-addressed storage for large text that repeats across submissions.
+
+The question text, reference solution, grading notes and prompt of a
+question are identical for every student who submits it.  Since schema
+migration 4, submissions are stored in ``submission_rows``, which keeps the
+SHA-256 hash of these columns (``<column>_hash``).  Each distinct text is
+stored once in ``blobs``.  The ``submissions`` view joins them back, so
+``SELECT`` queries against ``submissions`` (the dbviewer, CSV export,
+submission detail page, ad hoc analytics) see the same columns as before.
+
+Writes go to ``submission_rows`` through :func:`put_blobs`; the view
+cannot be inserted into.  Blob content may be compressed; see
+``compression.py`` for reading it back.
+"""
+
+import hashlib
+import sqlite3
+
+# submissions columns stored in blobs, in DB_SCHEMA order
+SUBMISSION_BLOB_COLUMNS = ("question_text", "ref_soln", "grading_notes", "raw_prompt")
+
+
+def content_hash(text: str | None) -> str | None:
+    if text is None:
+        return None
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+def hash_column(name: str) -> str:
+    return f"{name}_hash"
+
+
+def put_blobs(conn: sqlite3.Connection, texts, stored=None) -> list[str | None]:
+    """
+    Store each text once and return their hashes (None for None).
+
+    ``stored`` optionally gives the value to store for each text (e.g. its
+    compressed form, see ``compression.py``); the hash is always of the text.
+    """
+    texts = list(texts)
+    stored = texts if stored is None else list(stored)
+    hashes = [content_hash(text) for text in texts]
+    conn.executemany(
+        "INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)",
+        [
+            (digest, value if isinstance(value, bytes) else str(value))
+            for digest, value in zip(hashes, stored)
+            if digest is not None
+        ],
+    )
+    return hashes
+
+
+def submissions_view_sql(row_columns: list[str]) -> str:
+    """
+    ``CREATE VIEW submissions`` over ``submission_rows`` with the given
+    physical columns; ``<column>_hash`` columns are replaced by the text.
+    """
+    blob_hash_columns = {hash_column(name): name for name in SUBMISSION_BLOB_COLUMNS}
+    select_columns = []
+    joins = []
+    for column in row_columns:
+        name = blob_hash_columns.get(column)
+        if name is None:
+            select_columns.append(f"r.{column}")
+        else:
+            alias = f"b_{name}"
+            select_columns.append(f"{alias}.content AS {name}")
+            joins.append(f"LEFT JOIN blobs {alias} ON {alias}.hash = r.{column}")
+    return (
+        "CREATE VIEW submissions AS SELECT "
+        + ", ".join(select_columns)
+        + " FROM submission_rows r "
+        + " ".join(joins)
+    )
@@ -0,0 +1,164 @@
+"""
+Optional compression of large free-text submission columns.
+
+Columns listed in ``LLMGRADER_COMPRESS_COLUMNS`` (comma-separated, e.g.
+``raw_prompt,full_explanation,student_soln,feedback``) are stored as BLOBs
+that start with a format marker naming the codec.  ``LLMGRADER_COMPRESSION``
+selects ``zlib`` (default, standard library) or ``zstd`` (requires the
+``zstandard`` package, ``pip install llmgrader[zstd]``).  Values shorter
+than :attr:`ColumnCompressor.MIN_SIZE` bytes are stored as plain text.
+
+Stored values are self-describing: plain TEXT is returned as-is, so a
+database may mix compressed and uncompressed rows, and changing the
+configuration never makes old rows unreadable.  Readers call
+:func:`decompress` (or :func:`decompress_row`) only on values they display
+or export.  In SQL, every connection from ``db.py`` has the helper
+functions registered by :func:`register_sql_functions`::
+
+    SELECT id, llmgrader_text(feedback) FROM submissions
+    WHERE llmgrader_text(student_soln) LIKE '%always_ff%'
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+# Marker prefixes of compressed values, by codec
+MARKERS = {
+    "zlib": b"LZ1\x00",
+    "zstd": b"LS1\x00",
+}
+
+# Columns that may be compressed (free text that is never filtered by index)
+COMPRESSIBLE_COLUMNS = (
+    "question_text",
+    "ref_soln",
+    "grading_notes",
+    "student_soln",
+    "raw_prompt",
+    "full_explanation",
+    "feedback",
+)
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed value found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def is_compressed(value) -> bool:
+    return isinstance(value, bytes) and any(value.startswith(marker) for marker in MARKERS.values())
+
+
+def decompress(value):
+    """
+    Return the text of a stored value; values without a marker are returned unchanged.
+    """
+    if not isinstance(value, bytes):
+        return value
+    for codec, marker in MARKERS.items():
+        if value.startswith(marker):
+            return _decompress(codec, value[len(marker):]).decode("utf-8")
+    return value
+
+
+def decompress_row(row):
+    """
+    Decompress every value of a result row (tuple or dict).
+    """
+    if isinstance(row, dict):
+        return {key: decompress(value) for key, value in row.items()}
+    return tuple(decompress(value) for value in row)
+
+
+def register_sql_functions(conn: sqlite3.Connection) -> None:
+    """
+    Register ``llmgrader_text(x)`` (stored value as text) and
+    ``llmgrader_is_compressed(x)`` on a connection.
+    """
+    conn.create_function("llmgrader_text", 1, decompress, deterministic=True)
+    conn.create_function("llmgrader_is_compressed", 1, lambda value: int(is_compressed(value)), deterministic=True)
+
+
+class ColumnCompressor:
+    """
+    Compresses the configured submission columns before they are stored.
+
+    Parameters
+    ----------
+    columns: tuple[str, ...]
+        Columns to compress (a subset of ``COMPRESSIBLE_COLUMNS``).
+    codec: str
+        ``zlib`` or ``zstd``.
+    """
+
+    MIN_SIZE = 256
+
+    def __init__(self, columns=(), codec: str = "zlib"):
+        if codec not in MARKERS:
+            raise ValueError(f"Unknown compression codec {codec!r}")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        unknown = set(columns) - set(COMPRESSIBLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Columns cannot be compressed: {', '.join(sorted(unknown))}")
+        self.columns = frozenset(columns)
+        self.codec = codec
+
+    @classmethod
+    def from_env(cls) -> "ColumnCompressor":
+        """
+        Build a compressor from ``LLMGRADER_COMPRESS_COLUMNS`` and
+        ``LLMGRADER_COMPRESSION``.  Invalid settings disable compression
+        (or fall back to zlib) with a warning rather than stopping the app.
+        """
+        raw_columns = (os.environ.get("LLMGRADER_COMPRESS_COLUMNS") or "").strip().lower()
+        columns = [] if raw_columns in ("", "none") else [c.strip() for c in raw_columns.split(",") if c.strip()]
+        unknown = [c for c in columns if c not in COMPRESSIBLE_COLUMNS]
+        if unknown:
+            print(f"[compression] Ignoring columns that cannot be compressed: {', '.join(unknown)}")
+            columns = [c for c in columns if c in COMPRESSIBLE_COLUMNS]
+
+        codec = (os.environ.get("LLMGRADER_COMPRESSION") or "zlib").strip().lower()
+        if codec not in MARKERS or (codec == "zstd" and zstandard is None):
+            print(f"[compression] Compression {codec!r} is unavailable; using zlib")
+            codec = "zlib"
+        return cls(columns, codec)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.columns)
+
+    def compress(self, column: str, value):
+        """
+        Value to store for ``column``: compressed if the column is configured,
+        the text is long enough and compression actually saves space.
+        """
+        if column not in self.columns or not isinstance(value, str):
+            return value
+        data = value.encode("utf-8")
+        if len(data) < self.MIN_SIZE:
+            return value
+        packed = MARKERS[self.codec] + _compress(self.codec, data)
+        return packed if len(packed) < len(data) else value
+
+    def compress_record(self, record: dict) -> dict:
+        if not self.columns:
+            return record
+        return {key: self.compress(key, value) for key, value in record.items()}
@@ -0,0 +1,151 @@
+"""
+Shared access to the grader's SQLite database (``llmgrader.db``).
+
+Every module that reads or writes the database goes through a
+:class:`Database`, which keeps one persistent connection per thread
+instead of opening a new connection for each query.  Connections are
+opened with:
+
+* ``journal_mode=WAL`` so that readers (the dbviewer, analytics) never
+  block grade inserts and vice versa,
+* ``synchronous=NORMAL``, which is durable across application crashes
+  in WAL mode and avoids an fsync on every commit,
+* ``busy_timeout`` so that concurrent writers wait for the lock instead of
+  failing with ``database is locked``,
+* the SQL helpers for compressed columns (``compression.py``).
+
+Because a connection lives as long as its thread, ``sqlite3``'s per-connection
+statement cache keeps hot statements (e.g. the submissions INSERT) prepared
+across calls, as long as callers reuse the same SQL string.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from typing import Iterator
+
+from llmgrader.services.compression import register_sql_functions
+
+
+class Database:
+    """
+    Per-thread persistent connections to one SQLite database file.
+
+    Use :meth:`connection` as a context manager::
+
+        with get_database(db_path).connection() as conn:
+            conn.execute("INSERT INTO ...", params)
+
+    The transaction is committed when the block exits normally and rolled
+    back if it raises.  Nested blocks on the same thread share the
+    connection; only the outermost block commits.
+    """
+
+    BUSY_TIMEOUT_MS = 30000
+    # Prepared statements kept per connection (sqlite3 default is 128).
+    CACHED_STATEMENTS = 256
+
+    def __init__(self, db_path: str, *, busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._read_only_local = threading.local()
+
+    def _open(self, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            # mode=ro refuses writes to the database file; TEMP tables still work.
+            target = f"file:{urllib.parse.quote(os.path.abspath(self.db_path))}?mode=ro"
+        else:
+            target = self.db_path
+        conn = sqlite3.connect(
+            target,
+            timeout=self.busy_timeout_ms / 1000.0,
+            cached_statements=self.CACHED_STATEMENTS,
+            uri=read_only,
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if not read_only:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        # llmgrader_text() etc. for compressed submission columns
+        register_sql_functions(conn)
+        return conn
+
+    def _thread_connection(self, read_only: bool = False) -> sqlite3.Connection:
+        local = self._read_only_local if read_only else self._local
+        # A connection inherited across fork() (e.g. gunicorn --preload) must not be reused.
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            local.conn = self._open(read_only)
+            local.pid = os.getpid()
+            local.depth = 0
+        return local.conn
+
+    @contextmanager
+    def connection(self, *, row_factory=None, autocommit: bool = False,
+                   read_only: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        Check out this thread's connection.
+
+        Parameters
+        ----------
+        row_factory : callable, optional
+            Row factory for the block, e.g. ``sqlite3.Row``.
+        autocommit : bool
+            Run statements in autocommit mode (``isolation_level=None``) so
+            the caller can manage transactions with explicit ``BEGIN
+            IMMEDIATE`` / ``COMMIT``.  Ignored for nested blocks, which
+            always use the outer block's mode.
+        read_only : bool
+            Use this thread's separate read-only connection (``mode=ro``),
+            e.g. for admin analytics queries.
+        """
+        conn = self._thread_connection(read_only)
+        local = self._read_only_local if read_only else self._local
+        outermost = local.depth == 0
+        previous_row_factory = conn.row_factory
+        conn.row_factory = row_factory
+        if outermost:
+            conn.isolation_level = None if autocommit else ""
+        local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            if outermost and conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if outermost and conn.in_transaction:
+                conn.commit()
+        finally:
+            local.depth -= 1
+            conn.row_factory = previous_row_factory
+
+    def close(self) -> None:
+        """
+        Close the calling thread's connections, if it has any.
+        """
+        for local in (self._local, self._read_only_local):
+            conn = getattr(local, "conn", None)
+            if conn is not None:
+                local.conn = None
+                conn.close()
+
+
+_databases: dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path: str) -> Database:
+    """
+    Return the process-wide :class:`Database` for ``db_path``.
+    """
+    key = os.path.abspath(db_path)
+    with _databases_lock:
+        database = _databases.get(key)
+        if database is None:
+            database = _databases[key] = Database(db_path)
+        return database
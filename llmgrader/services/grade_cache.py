@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from llmgrader.services.db import get_database
+
+
+class GradeCache:
+    """
+    Content-addressed cache of raw LLM grades stored in ``llmgrader.db``.
+
+    The key is a SHA-256 hash of everything that determines the LLM output:
+    the final prompt from ``build_task_prompt`` (question, reference solution,
+    grading notes, rubrics, part and student answer), the provider and model,
+    the enabled tools and the hashes of all attached images.  A hit therefore
+    means the LLM would have been sent exactly the same request.
+
+    Only successful grades are stored.  The raw LLM result is cached rather
+    than the post-processed grade, so post-processing always runs with the
+    current code.  Entries expire after ``ttl_seconds`` and the least
+    recently used entries are evicted beyond ``max_entries``.
+
+    Caching is opt-in per unit or question via ``<grade_cache>`` in
+    ``llmgrader_config.xml``; see ``UnitParser``.
+
+    Parameters
+    ----------
+    db_path: str
+        Path to the SQLite database file.
+    ttl_seconds: float
+        Lifetime of a cache entry.
+    max_entries: int
+        Maximum number of entries kept.
+    """
+
+    DEFAULT_TTL_HOURS = 24.0 * 7
+    DEFAULT_MAX_ENTRIES = 20000
+
+    # Bump to invalidate all entries when the key contents change.
+    KEY_VERSION = 1
+
+    def __init__(self, db_path: str, *, ttl_seconds: float = DEFAULT_TTL_HOURS * 3600,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_env(cls, db_path: str) -> "GradeCache":
+        """
+        Build a cache using ``LLMGRADER_GRADE_CACHE_TTL_HOURS`` and
+        ``LLMGRADER_GRADE_CACHE_MAX_ENTRIES``.
+        """
+        try:
+            ttl_hours = float(os.environ.get("LLMGRADER_GRADE_CACHE_TTL_HOURS") or cls.DEFAULT_TTL_HOURS)
+        except ValueError:
+            ttl_hours = cls.DEFAULT_TTL_HOURS
+        try:
+            max_entries = int(os.environ.get("LLMGRADER_GRADE_CACHE_MAX_ENTRIES") or cls.DEFAULT_MAX_ENTRIES)
+        except ValueError:
+            max_entries = cls.DEFAULT_MAX_ENTRIES
+        return cls(db_path, ttl_seconds=max(0.0, ttl_hours) * 3600, max_entries=max_entries)
+
+    def _connect(self):
+        return get_database(self.db_path).connection()
+
+    def init_db(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS grade_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    raw_grade_json TEXT NOT NULL,
+                    tool_call_summary TEXT,
+                    tokens_in INTEGER,
+                    tokens_out INTEGER,
+                    hit_count INTEGER NOT NULL DEFAULT 0,
+                    created_at_ts REAL NOT NULL,
+                    expires_at_ts REAL NOT NULL,
+                    last_used_at_ts REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_grade_cache_expires ON grade_cache (expires_at_ts)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_grade_cache_last_used ON grade_cache (last_used_at_ts)"
+            )
+            conn.commit()
+
+    @classmethod
+    def make_key(cls, *, task: str, provider: str, model: str, tools: list | None,
+                 image_uris: list[str] | None) -> str:
+        image_hashes = [
+            hashlib.sha256(uri.encode("utf-8")).hexdigest()
+            for uri in (image_uris or [])
+        ]
+        material = json.dumps(
+            {
+                "v": cls.KEY_VERSION,
+                "prompt": task,
+                "provider": provider,
+                "model": model,
+                "tools": sorted(tools or []),
+                "images": image_hashes,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> dict | None:
+        """
+        Return ``{"grade", "tool_call_summary"}`` for a live entry, or None.
+        """
+        now_ts = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT raw_grade_json, tool_call_summary FROM grade_cache
+                WHERE cache_key = ? AND expires_at_ts > ?
+                """,
+                (cache_key, now_ts),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE grade_cache SET hit_count = hit_count + 1, last_used_at_ts = ? WHERE cache_key = ?",
+                    (now_ts, cache_key),
+                )
+                conn.commit()
+
+        with self._stats_lock:
+            if row is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        if row is None:
+            return None
+        return {"grade": json.loads(row[0]), "tool_call_summary": row[1]}
+
+    def put(self, cache_key: str, *, model: str, grade: dict, tool_call_summary: str | None,
+            tokens_in: int, tokens_out: int) -> None:
+        now_ts = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO grade_cache (
+                    cache_key, model, raw_grade_json, tool_call_summary, tokens_in, tokens_out,
+                    hit_count, created_at_ts, expires_at_ts, last_used_at_ts
+                )
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+                """,
+                (
+                    cache_key,
+                    model,
+                    json.dumps(grade),
+                    tool_call_summary,
+                    tokens_in,
+                    tokens_out,
+                    now_ts,
+                    now_ts + self.ttl_seconds,
+                    now_ts,
+                ),
+            )
+            self._evict(conn, now_ts)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now_ts: float) -> None:
+        conn.execute("DELETE FROM grade_cache WHERE expires_at_ts <= ?", (now_ts,))
+        excess = conn.execute("SELECT COUNT(*) FROM grade_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                """
+                DELETE FROM grade_cache WHERE cache_key IN (
+                    SELECT cache_key FROM grade_cache ORDER BY last_used_at_ts ASC LIMIT ?
+                )
+                """,
+                (excess,),
+            )
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM grade_cache").fetchone()[0]
+        with self._stats_lock:
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
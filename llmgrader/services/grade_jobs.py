@@ -0,0 +1,993 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Callable
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from llmgrader.services.db import get_database
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class GradeJobStore:
+    """
+    SQLite-backed queue of grading jobs.
+
+    The ``grade_jobs`` table lives in ``llmgrader.db`` and is shared by every
+    web and worker process that points at the same storage path.  Web
+    processes enqueue jobs and read their status; worker processes claim
+    queued jobs atomically and write back the result.
+
+    Every state change made through this store bumps an in-process change
+    counter so that status streams can wake up immediately (see
+    ``wait_for_change``).  Changes made by other processes are only seen
+    the next time a reader checks the database.
+
+    A job's API key is stored encrypted with a key derived from
+    ``secret_key`` and dropped when the job finishes; job dicts carry the
+    encrypted value, which ``GradeJobRunner`` opens with ``open_api_key``.
+    Every web and worker process sharing the database needs the same secret.
+
+    Queued jobs never reach ``Grader.grade``, so nothing logs their
+    submission when they are cancelled or abandoned.  ``on_queued_cancelled``
+    is called with such a job (its request still attached) and the
+    requesters that were waiting on it; ``GradeJobRunner`` sets it to log a
+    ``cancelled`` submission for each of them.
+
+    Parameters
+    ----------
+    db_path: str
+        Path to the SQLite database file.
+    secret_key: str | None
+        Secret the API keys are encrypted with; defaults to
+        ``LLMGRADER_SECRET_KEY``.
+    """
+
+    ACTIVE_STATES = ("queued", "running")
+
+    # Extra time a running job gets on top of its LLM timeout.
+    DEFAULT_TIMEOUT_GRACE_SECONDS = 15.0
+
+    # Active jobs nobody has asked about for this long are cancelled.
+    DEFAULT_ABANDON_SECONDS = 60.0
+    # Minimum interval between last-seen writes for one job.
+    TOUCH_INTERVAL_SECONDS = 5.0
+
+    # Fields of a job request that are stored as JSON while the job is active.
+    REQUEST_FIELDS = ("question_dict", "student_soln", "solution_images", "tools")
+
+    ADDED_COLUMNS = {
+        "fingerprint": "TEXT",
+        "coalesced_count": "INTEGER NOT NULL DEFAULT 0",
+        "estimated_tokens": "INTEGER",
+        "rate_limited_until_ts": "REAL",
+        "last_seen_at_ts": "REAL",
+    }
+
+    def __init__(self, db_path: str, secret_key: str | None = None):
+        self.db_path = db_path
+        # Same fallback as the Flask session secret (see app.py).
+        secret = secret_key or os.environ.get("LLMGRADER_SECRET_KEY") or "llmgrader-dev-secret-key"
+        digest = hashlib.sha256(b"llmgrader-grade-job-api-key:" + secret.encode("utf-8")).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(digest))
+        self._change_condition = threading.Condition()
+        self._change_version = 0
+        self.on_queued_cancelled: Callable[[dict, list[str]], None] | None = None
+
+    def change_version(self) -> int:
+        with self._change_condition:
+            return self._change_version
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """
+        Block until a job changed after ``version`` or ``timeout`` elapses.
+
+        Returns the current change version, which callers pass back in on
+        the next call.
+        """
+        with self._change_condition:
+            self._change_condition.wait_for(lambda: self._change_version != version, timeout)
+            return self._change_version
+
+    def _notify_change(self) -> None:
+        with self._change_condition:
+            self._change_version += 1
+            self._change_condition.notify_all()
+
+    def _queued_cancelled(self, cancelled: list[tuple[dict, list[str]]]) -> None:
+        if self.on_queued_cancelled is None:
+            return
+        for job, requesters in cancelled:
+            self.on_queued_cancelled(job, requesters)
+
+    def seal_api_key(self, api_key: str | None) -> str | None:
+        if not api_key:
+            return None
+        return self._fernet.encrypt(api_key.encode("utf-8")).decode("ascii")
+
+    def open_api_key(self, sealed: str | None) -> str | None:
+        """
+        Decrypt an API key stored by ``enqueue_job``.
+        """
+        if not sealed:
+            return None
+        try:
+            return self._fernet.decrypt(sealed.encode("ascii")).decode("utf-8")
+        except InvalidToken:
+            raise ValueError(
+                "The job's API key could not be decrypted; every web and worker "
+                "process must use the same LLMGRADER_SECRET_KEY."
+            ) from None
+
+    def _connect(self):
+        # Autocommit mode so that claims can use an explicit BEGIN IMMEDIATE.
+        return get_database(self.db_path).connection(row_factory=sqlite3.Row, autocommit=True)
+
+    def init_db(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS grade_jobs (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL UNIQUE,
+                    status TEXT NOT NULL,
+                    message TEXT,
+                    error TEXT,
+                    session_id TEXT,
+                    unit TEXT,
+                    qtag TEXT,
+                    part_label TEXT,
+                    provider TEXT,
+                    model TEXT,
+                    timeout REAL,
+                    api_key TEXT,
+                    request_json TEXT,
+                    result_json TEXT,
+                    worker_id TEXT,
+                    created_at TEXT,
+                    created_at_ts REAL,
+                    started_at TEXT,
+                    started_at_ts REAL,
+                    finished_at TEXT,
+                    finished_at_ts REAL,
+                    deadline_ts REAL,
+                    fingerprint TEXT,
+                    coalesced_count INTEGER NOT NULL DEFAULT 0,
+                    estimated_tokens INTEGER,
+                    rate_limited_until_ts REAL,
+                    last_seen_at_ts REAL
+                )
+                """
+            )
+            # Columns added after the table was first released
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(grade_jobs)")}
+            for col_name, col_type in self.ADDED_COLUMNS.items():
+                if col_name not in columns:
+                    conn.execute(f"ALTER TABLE grade_jobs ADD COLUMN {col_name} {col_type}")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_grade_jobs_status_seq ON grade_jobs (status, seq)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_grade_jobs_session ON grade_jobs (session_id, status)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_grade_jobs_fingerprint ON grade_jobs (fingerprint, status)"
+            )
+            # Every request attached to a job: its owner and the requests
+            # coalesced onto it, one row per session.
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS grade_job_requesters (
+                    job_id TEXT NOT NULL,
+                    requester TEXT NOT NULL,
+                    attached_at_ts REAL,
+                    PRIMARY KEY (job_id, requester)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_grade_job_requesters_requester ON grade_job_requesters (requester)"
+            )
+
+    def _row_to_job(self, row: sqlite3.Row | None) -> dict | None:
+        if row is None:
+            return None
+        job = {key: row[key] for key in row.keys()}
+        request_json = job.pop("request_json", None)
+        request_data = json.loads(request_json) if request_json else {}
+        for field_name in self.REQUEST_FIELDS:
+            job[field_name] = request_data.get(field_name)
+        result_json = job.pop("result_json", None)
+        job["result"] = json.loads(result_json) if result_json else None
+        return job
+
+    @staticmethod
+    def make_fingerprint(job: dict) -> str:
+        """
+        Hash of everything that determines a job's grade.
+
+        Two jobs with the same fingerprint would send the same LLM request,
+        so a second one can wait for the first instead.  The API key is part
+        of the fingerprint so one user's key never pays for another's job.
+        """
+        def digest(value) -> str:
+            return hashlib.sha256((value or "").encode("utf-8")).hexdigest()
+
+        material = json.dumps(
+            {
+                "unit": job.get("unit"),
+                "qtag": job.get("qtag"),
+                "part_label": job.get("part_label"),
+                "student_soln": job.get("student_soln"),
+                "model": job.get("model"),
+                "provider": job.get("provider"),
+                "api_key": digest(job.get("api_key")),
+                "solution_images": [digest(uri) for uri in (job.get("solution_images") or [])],
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def requester_for(job: dict) -> str:
+        """
+        Requester key of a job request: its session, or the job itself for
+        requests without a session.
+        """
+        return job.get("session_id") or job["job_id"]
+
+    def enqueue_job(self, job: dict, *, max_queue_depth: int | None = None,
+                    coalesce: bool = True) -> tuple[str, dict | None]:
+        """
+        Insert a new queued job, or attach to an identical active one.
+
+        The per-session limit, coalescing and the queue depth are checked in
+        the same transaction as the insert, so concurrent web processes
+        cannot both pass the checks.  A session counts as active while it
+        owns an active job or is attached to one.
+
+        Returns
+        -------
+        tuple[str, dict | None]
+            ``("queued", job)`` on success; ``("coalesced", active_job)`` if an
+            identical job (same fingerprint) is already queued or running, in
+            which case the session is recorded as one of its requesters and no
+            new job is created (``coalesced_count`` counts the sessions
+            attached besides the owner, so a resubmit from an attached
+            session does not change it); ``("already_running", active_job)``
+            if the session already has a different active job; or
+            ``("queue_full", None)``.
+        """
+        request_data = {field_name: job.get(field_name) for field_name in self.REQUEST_FIELDS}
+        fingerprint = self.make_fingerprint(job)
+        session_id = job.get("session_id")
+        requester = self.requester_for(job)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                active_row = None
+                if session_id:
+                    active_row = conn.execute(
+                        """
+                        SELECT * FROM grade_jobs
+                        WHERE status IN ('queued', 'running')
+                          AND (session_id = ?
+                               OR job_id IN (SELECT job_id FROM grade_job_requesters WHERE requester = ?))
+                        ORDER BY seq LIMIT 1
+                        """,
+                        (session_id, session_id),
+                    ).fetchone()
+
+                twin_row = None
+                if coalesce:
+                    twin_row = conn.execute(
+                        """
+                        SELECT job_id, session_id FROM grade_jobs
+                        WHERE fingerprint = ? AND status IN ('queued', 'running')
+                        ORDER BY seq LIMIT 1
+                        """,
+                        (fingerprint,),
+                    ).fetchone()
+
+                if twin_row is not None and (active_row is None or active_row["job_id"] == twin_row["job_id"]):
+                    now_ts = time.time()
+                    attached = 0
+                    if requester != twin_row["session_id"]:
+                        attached = conn.execute(
+                            """
+                            INSERT OR IGNORE INTO grade_job_requesters (job_id, requester, attached_at_ts)
+                            VALUES (?, ?, ?)
+                            """,
+                            (twin_row["job_id"], requester, now_ts),
+                        ).rowcount
+                    conn.execute(
+                        """
+                        UPDATE grade_jobs SET coalesced_count = coalesced_count + ?, last_seen_at_ts = ?
+                        WHERE job_id = ?
+                        """,
+                        (attached, now_ts, twin_row["job_id"]),
+                    )
+                    twin = conn.execute(
+                        "SELECT * FROM grade_jobs WHERE job_id = ?", (twin_row["job_id"],)
+                    ).fetchone()
+                    conn.execute("COMMIT")
+                    self._notify_change()
+                    return "coalesced", self._row_to_job(twin)
+
+                if active_row is not None:
+                    conn.execute("ROLLBACK")
+                    return "already_running", self._row_to_job(active_row)
+
+                if max_queue_depth is not None:
+                    queued_count = conn.execute(
+                        "SELECT COUNT(*) FROM grade_jobs WHERE status = 'queued'"
+                    ).fetchone()[0]
+                    if queued_count >= max_queue_depth:
+                        conn.execute("ROLLBACK")
+                        return "queue_full", None
+
+                conn.execute(
+                    """
+                    INSERT INTO grade_jobs (
+                        job_id, status, message, session_id, unit, qtag, part_label,
+                        provider, model, timeout, api_key, request_json,
+                        created_at, created_at_ts, deadline_ts, fingerprint, estimated_tokens,
+                        last_seen_at_ts
+                    )
+                    VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        job["job_id"],
+                        job.get("message") or "Grading job queued.",
+                        session_id,
+                        job.get("unit"),
+                        job.get("qtag"),
+                        job.get("part_label"),
+                        job.get("provider"),
+                        job.get("model"),
+                        job.get("timeout"),
+                        self.seal_api_key(job.get("api_key")),
+                        json.dumps(request_data),
+                        job.get("created_at") or _utc_now(),
+                        job.get("created_at_ts") or time.time(),
+                        job.get("deadline_ts"),
+                        fingerprint,
+                        job.get("estimated_tokens"),
+                        time.time(),
+                    ),
+                )
+                conn.execute(
+                    "INSERT INTO grade_job_requesters (job_id, requester, attached_at_ts) VALUES (?, ?, ?)",
+                    (job["job_id"], requester, time.time()),
+                )
+                row = conn.execute("SELECT * FROM grade_jobs WHERE job_id = ?", (job["job_id"],)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._notify_change()
+            return "queued", self._row_to_job(row)
+
+    def requesters(self, job_id: str) -> list[str]:
+        """
+        Requesters attached to a job, in the order they attached.
+        """
+        with self._connect() as conn:
+            return [
+                row["requester"] for row in conn.execute(
+                    "SELECT requester FROM grade_job_requesters WHERE job_id = ? ORDER BY attached_at_ts, rowid",
+                    (job_id,),
+                )
+            ]
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM grade_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return self._row_to_job(row)
+
+    def queue_depth(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM grade_jobs WHERE status = 'queued'").fetchone()[0]
+
+    def queue_position(self, job_id: str) -> int | None:
+        """
+        Return the 1-based FIFO position of a queued job, or None if it is not queued.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT COUNT(*) FROM grade_jobs
+                WHERE status = 'queued'
+                  AND seq <= (SELECT seq FROM grade_jobs WHERE job_id = ? AND status = 'queued')
+                """,
+                (job_id,),
+            ).fetchone()
+            position = row[0] if row else 0
+            return position or None
+
+    def touch_job(self, job_id: str) -> None:
+        """
+        Record that a client is still following an active job.
+        """
+        now_ts = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE grade_jobs SET last_seen_at_ts = ?
+                WHERE job_id = ? AND status IN ('queued', 'running')
+                  AND (last_seen_at_ts IS NULL OR last_seen_at_ts < ?)
+                """,
+                (now_ts, job_id, now_ts - self.TOUCH_INTERVAL_SECONDS),
+            )
+
+    def cancel_job(self, job_id: str, requester: str | None = None, *,
+                   message: str = "Grading job cancelled.", force: bool = False) -> str:
+        """
+        Detach ``requester`` (a session) from a queued or running job.
+
+        The job is cancelled once no other requester is attached to it.  If
+        the job's owner leaves while other students still wait for it, the
+        job is handed to the earliest of them, so the owner's session is free
+        to start another job.  With ``force`` (an admin) the job is cancelled
+        outright even for a caller who is not attached to it.
+
+        Returns
+        -------
+        str
+            ``"cancelled"``, ``"detached"``, ``"not_requester"``,
+            ``"not_active"`` or ``"unknown"``.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT status, session_id FROM grade_jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                if row is None or row["status"] not in self.ACTIVE_STATES:
+                    conn.execute("ROLLBACK")
+                    return "unknown" if row is None else "not_active"
+
+                owner = row["session_id"] or job_id
+                attached = requester is not None and conn.execute(
+                    "DELETE FROM grade_job_requesters WHERE job_id = ? AND requester = ?", (job_id, requester)
+                ).rowcount > 0
+                attached = attached or (requester is not None and requester == owner)
+                others = [
+                    other["requester"] for other in conn.execute(
+                        """
+                        SELECT requester FROM grade_job_requesters WHERE job_id = ?
+                        ORDER BY attached_at_ts, rowid
+                        """,
+                        (job_id,),
+                    )
+                ]
+                if requester != owner and owner not in others:
+                    # Jobs enqueued before requesters were recorded
+                    others.insert(0, owner)
+
+                if not attached and not force:
+                    conn.execute("ROLLBACK")
+                    return "not_requester"
+                cancelled = []
+                if others and attached:
+                    new_owner = owner if requester != owner else others[0]
+                    conn.execute(
+                        "UPDATE grade_jobs SET session_id = ?, coalesced_count = ? WHERE job_id = ?",
+                        (new_owner, len(others) - 1, job_id),
+                    )
+                    outcome = "detached"
+                else:
+                    if row["status"] == "queued":
+                        job = self._row_to_job(
+                            conn.execute("SELECT * FROM grade_jobs WHERE job_id = ?", (job_id,)).fetchone()
+                        )
+                        cancelled.append((job, others + ([requester] if attached else [])))
+                    conn.execute(
+                        """
+                        UPDATE grade_jobs
+                        SET status = 'cancelled', message = ?, error = ?, finished_at = ?, finished_at_ts = ?,
+                            api_key = NULL, request_json = NULL
+                        WHERE job_id = ?
+                        """,
+                        (message, message, _utc_now(), time.time(), job_id),
+                    )
+                    outcome = "cancelled"
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._notify_change()
+        self._queued_cancelled(cancelled)
+        return outcome
+
+    def inactive_job_ids(self, job_ids) -> set[str]:
+        """
+        Return the ids among ``job_ids`` that are no longer running
+        (finished, cancelled, timed out or pruned).
+        """
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        with self._connect() as conn:
+            placeholders = ", ".join("?" for _ in job_ids)
+            running = {
+                row["job_id"] for row in conn.execute(
+                    f"SELECT job_id FROM grade_jobs WHERE status = 'running' AND job_id IN ({placeholders})",
+                    job_ids,
+                )
+            }
+        return set(job_ids) - running
+
+    def claim_next_job(self, worker_id: str, *, timeout_grace: float = DEFAULT_TIMEOUT_GRACE_SECONDS,
+                       rate_limiter=None) -> dict | None:
+        """
+        Atomically move the oldest queued job to ``running`` and return it.
+
+        The running deadline is ``now + job timeout + timeout_grace``.
+        With a ``RateLimiter``, jobs whose ``(provider, model)`` bucket has
+        no budget stay queued (their ``rate_limited_until_ts`` is set) and
+        the oldest job of another bucket is claimed instead.  Returns None
+        when no queued job can start.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if rate_limiter is None:
+                    rows = conn.execute(
+                        "SELECT job_id, timeout FROM grade_jobs WHERE status = 'queued' ORDER BY seq LIMIT 1"
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        """
+                        SELECT job_id, timeout, provider, model, estimated_tokens, rate_limited_until_ts
+                        FROM grade_jobs WHERE status = 'queued' ORDER BY seq
+                        """
+                    ).fetchall()
+
+                now_ts = time.time()
+                row = None
+                blocked = {}
+                limited = False
+                for candidate in rows:
+                    if rate_limiter is None:
+                        row = candidate
+                        break
+                    bucket = rate_limiter.bucket_for(candidate["provider"], candidate["model"])
+                    if bucket not in blocked:
+                        wait = rate_limiter.try_acquire(
+                            conn, *bucket, candidate["estimated_tokens"], now_ts=now_ts
+                        )
+                        if wait == 0.0:
+                            row = candidate
+                            break
+                        blocked[bucket] = wait
+                    until_ts = now_ts + blocked[bucket]
+                    if candidate["rate_limited_until_ts"] is None or abs(candidate["rate_limited_until_ts"] - until_ts) >= 1.0:
+                        conn.execute(
+                            "UPDATE grade_jobs SET rate_limited_until_ts = ? WHERE job_id = ?",
+                            (until_ts, candidate["job_id"]),
+                        )
+                        limited = True
+
+                if row is None:
+                    conn.execute("COMMIT")
+                    if limited:
+                        self._notify_change()
+                    return None
+
+                conn.execute(
+                    """
+                    UPDATE grade_jobs
+                    SET status = 'running', message = 'Grading in progress.', worker_id = ?,
+                        started_at = ?, started_at_ts = ?, deadline_ts = ?, rate_limited_until_ts = NULL
+                    WHERE job_id = ? AND status = 'queued'
+                    """,
+                    (
+                        worker_id,
+                        _utc_now(),
+                        now_ts,
+                        now_ts + float(row["timeout"] or 0.0) + timeout_grace,
+                        row["job_id"],
+                    ),
+                )
+                claimed = conn.execute("SELECT * FROM grade_jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._notify_change()
+            return self._row_to_job(claimed)
+
+    def finish_job(
+        self,
+        job_id: str,
+        *,
+        status: str,
+        message: str,
+        result: dict | None = None,
+        error: str | None = None,
+    ) -> bool:
+        """
+        Record the outcome of a running job.
+
+        The API key and the request payload are dropped once the job is
+        finished; the graded submission itself is logged in ``submissions``.
+        Returns False if the job is no longer running (e.g. it already timed out).
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE grade_jobs
+                SET status = ?, message = ?, error = ?, result_json = ?,
+                    finished_at = ?, finished_at_ts = ?, api_key = NULL, request_json = NULL
+                WHERE job_id = ? AND status = 'running'
+                """,
+                (
+                    status,
+                    message,
+                    error,
+                    json.dumps(result) if result is not None else None,
+                    _utc_now(),
+                    time.time(),
+                    job_id,
+                ),
+            )
+            finished = cursor.rowcount > 0
+        if finished:
+            self._notify_change()
+        return finished
+
+    def expire_stale_jobs(self, *, abandon_after: float | None = None) -> int:
+        """
+        Mark active jobs whose deadline has passed as ``timed_out``.
+
+        With ``abandon_after``, active jobs whose clients have not checked
+        on them for that many seconds are ``cancelled`` as well; abandoned
+        queued jobs are passed to ``on_queued_cancelled``.
+        """
+        now_ts = time.time()
+        now = _utc_now()
+        with self._connect() as conn:
+            queued = conn.execute(
+                """
+                UPDATE grade_jobs
+                SET status = 'timed_out', message = ?, error = ?, finished_at = ?, finished_at_ts = ?,
+                    api_key = NULL, request_json = NULL
+                WHERE status = 'queued' AND deadline_ts IS NOT NULL AND deadline_ts < ?
+                """,
+                (
+                    "Grading job timed out waiting in the queue.",
+                    "Grading job timed out waiting in the queue.",
+                    now,
+                    now_ts,
+                    now_ts,
+                ),
+            ).rowcount
+            running = conn.execute(
+                """
+                UPDATE grade_jobs
+                SET status = 'timed_out', message = ?, error = ?, finished_at = ?, finished_at_ts = ?,
+                    api_key = NULL, request_json = NULL
+                WHERE status = 'running' AND deadline_ts IS NOT NULL AND deadline_ts < ?
+                """,
+                (
+                    "Grading job timed out before completion.",
+                    "Grading job timed out before completion.",
+                    now,
+                    now_ts,
+                    now_ts,
+                ),
+            ).rowcount
+            abandoned = 0
+            cancelled = []
+            if abandon_after is not None:
+                message = "Grading job cancelled: the client stopped checking its status."
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for row in conn.execute(
+                        """
+                        SELECT * FROM grade_jobs
+                        WHERE status = 'queued' AND COALESCE(last_seen_at_ts, created_at_ts) < ?
+                        """,
+                        (now_ts - abandon_after,),
+                    ).fetchall():
+                        job = self._row_to_job(row)
+                        requesters = [
+                            other["requester"] for other in conn.execute(
+                                """
+                                SELECT requester FROM grade_job_requesters WHERE job_id = ?
+                                ORDER BY attached_at_ts, rowid
+                                """,
+                                (job["job_id"],),
+                            )
+                        ]
+                        cancelled.append((job, requesters))
+                    abandoned = conn.execute(
+                        """
+                        UPDATE grade_jobs
+                        SET status = 'cancelled', message = ?, error = ?, finished_at = ?, finished_at_ts = ?,
+                            api_key = NULL, request_json = NULL
+                        WHERE status IN ('queued', 'running')
+                          AND COALESCE(last_seen_at_ts, created_at_ts) < ?
+                        """,
+                        (message, message, now, now_ts, now_ts - abandon_after),
+                    ).rowcount
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        if queued or running or abandoned:
+            self._notify_change()
+        self._queued_cancelled(cancelled)
+        return queued + running + abandoned
+
+    def prune_finished_jobs(self, retention_seconds: float) -> int:
+        cutoff_ts = time.time() - retention_seconds
+        with self._connect() as conn:
+            pruned = conn.execute(
+                """
+                DELETE FROM grade_jobs
+                WHERE status NOT IN ('queued', 'running')
+                  AND (finished_at_ts IS NULL OR finished_at_ts < ?)
+                """,
+                (cutoff_ts,),
+            ).rowcount
+            if pruned:
+                conn.execute(
+                    "DELETE FROM grade_job_requesters WHERE job_id NOT IN (SELECT job_id FROM grade_jobs)"
+                )
+            return pruned
+
+
+class GradeJobRunner:
+    """
+    Executes claimed grading jobs with a Grader and stores their outcome.
+
+    Used both by the worker threads embedded in the web app and by the
+    standalone ``llmgrader_worker`` process.  ``run`` grades on the calling
+    worker thread and returns when the job finishes or is cancelled;
+    ``submit`` hands the job to an ``AsyncGrader`` event loop and returns
+    immediately.
+
+    ``cancel`` stops a job running in this process and aborts its in-flight
+    HTTP requests: the asyncio engine cancels the grading task, the thread
+    engine sets the job's cancel event and ``Grader.grade`` aborts the job's
+    requests on the pooled connections (see ``AbortScope``).  ``start_watchdog``
+    cancels local jobs that were cancelled, timed out or abandoned in the
+    shared store, e.g. by another process.
+    """
+
+    WATCHDOG_INTERVAL_SECONDS = 1.0
+
+    def __init__(self, grader, store: GradeJobStore, async_grader=None, *,
+                 abandon_after: float | None = GradeJobStore.DEFAULT_ABANDON_SECONDS):
+        self.grader = grader
+        self.store = store
+        self.async_grader = async_grader
+        self.abandon_after = abandon_after
+        self._active_lock = threading.Lock()
+        # job_id -> cancel callback for jobs running in this process
+        self._active: dict[str, Callable[[], None]] = {}
+        self._watchdog: threading.Thread | None = None
+        self._watchdog_stop = threading.Event()
+        store.on_queued_cancelled = self.log_cancelled_requests
+
+    def _register(self, job_id: str, cancel: Callable[[], None]) -> None:
+        with self._active_lock:
+            self._active[job_id] = cancel
+
+    def _unregister(self, job_id: str) -> None:
+        with self._active_lock:
+            self._active.pop(job_id, None)
+
+    def active_job_ids(self) -> list[str]:
+        with self._active_lock:
+            return list(self._active)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Stop a job running in this process.  Returns False if it is not running here.
+        """
+        with self._active_lock:
+            cancel = self._active.pop(job_id, None)
+        if cancel is None:
+            return False
+        cancel()
+        return True
+
+    def check_cancelled(self) -> int:
+        """
+        Cancel local jobs that are no longer running in the store.
+        """
+        self.store.expire_stale_jobs(abandon_after=self.abandon_after)
+        stopped = self.store.inactive_job_ids(self.active_job_ids())
+        for job_id in stopped:
+            if self.cancel(job_id):
+                print(f"[GradeJobRunner] Stopped grading job {job_id}: no longer running in the job store.")
+        return len(stopped)
+
+    def start_watchdog(self, interval: float = WATCHDOG_INTERVAL_SECONDS) -> None:
+        if self._watchdog is not None:
+            return
+
+        def loop():
+            while not self._watchdog_stop.wait(interval):
+                try:
+                    self.check_cancelled()
+                except Exception as exc:
+                    print(f"[GradeJobRunner] Watchdog check failed: {exc}")
+
+        self._watchdog = threading.Thread(target=loop, name="grade-job-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop_watchdog(self) -> None:
+        self._watchdog_stop.set()
+
+    @staticmethod
+    def sanitize_filename_component(value: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", value or "")
+
+    def write_grade_input_debug(self, *, unit: str, qtag: str, question_dict: dict, student_soln: str,
+                                part_label: str, model: str, tools: list, solution_images: list) -> None:
+        safe_unit = self.sanitize_filename_component(unit)
+        safe_qtag = self.sanitize_filename_component(qtag)
+        fn = os.path.join(
+            self.grader.scratch_dir,
+            f"grade_input_{safe_unit}_{safe_qtag}.txt"
+        )
+
+        with open(fn, "w", encoding="utf-8") as f:
+            f.write(f"Unit: {unit}\n")
+            f.write(f"Qtag: {qtag}\n\n")
+
+            f.write("=== Reference Problem (HTML) ===\n")
+            f.write(question_dict.get("question_text", "") + "\n\n")
+
+            f.write("=== Reference Solution (HTML) ===\n")
+            f.write(question_dict.get("solution", "") + "\n\n")
+
+            f.write("=== Grading Notes ===\n")
+            f.write(question_dict.get("grading_notes", "") + "\n\n")
+
+            f.write("=== Student Solution ===\n")
+            f.write(student_soln + "\n")
+
+            f.write("\n=== Grading Part Label ===\n")
+            f.write(part_label + "\n")
+
+            f.write("\n=== Model ===\n")
+            f.write(model + "\n")
+
+            f.write("\n=== Tools ===\n")
+            f.write(json.dumps(tools) + "\n")
+
+            f.write("\n=== Solution Images ===\n")
+            f.write(f"{len(solution_images)} image(s) attached\n")
+
+        print(f"Sent grader input {fn}")
+
+    def write_job_debug(self, job: dict) -> None:
+        self.write_grade_input_debug(
+            unit=job["unit"],
+            qtag=job["qtag"],
+            question_dict=job["question_dict"],
+            student_soln=job["student_soln"],
+            part_label=job["part_label"],
+            model=job["model"],
+            tools=job["tools"] or [],
+            solution_images=job["solution_images"] or [],
+        )
+
+    def grade_kwargs(self, job: dict) -> dict:
+        return {
+            "question_dict": job["question_dict"],
+            "student_soln": job["student_soln"],
+            "part_label": job["part_label"],
+            "unit_name": job["unit"],
+            "qtag": job["qtag"],
+            "model": job["model"],
+            "provider": job["provider"],
+            "api_key": self.store.open_api_key(job["api_key"]),
+            "timeout": job["timeout"],
+            "solution_images": job["solution_images"] or [],
+            "session_id": job["session_id"],
+            "deadline_ts": job.get("deadline_ts"),
+        }
+
+    def record_outcome(self, job: dict, grade_result: dict | None, exc: Exception | None = None) -> None:
+        job_id = job["job_id"]
+        if exc is not None:
+            self.store.finish_job(job_id, status="error", message="Grading job failed.", error=str(exc))
+            return
+
+        deadline_ts = job.get("deadline_ts")
+        if deadline_ts is not None and time.time() > deadline_ts:
+            message = "Grading job timed out before completion."
+            self.store.finish_job(job_id, status="timed_out", message=message, error=message)
+            return
+
+        if self.store.finish_job(job_id, status="done", message="Grading complete.", result=grade_result):
+            self.log_coalesced_requests(job, grade_result)
+
+    def log_coalesced_requests(self, job: dict, grade_result: dict | None) -> None:
+        """
+        Log a submission for every other session that waited on this job;
+        the job's own submission was logged while grading.
+        """
+        graded_for = self.store.requester_for(job)
+        session_ids = [requester for requester in self.store.requesters(job["job_id"]) if requester != graded_for]
+        if not session_ids or not grade_result:
+            return
+        try:
+            self.grader.log_coalesced_grade(grade_result, session_ids, **self.grade_kwargs(job))
+        except Exception as exc:
+            print(f"[GradeJobRunner] Failed to log coalesced submissions for job {job['job_id']}: {exc}")
+
+    def log_cancelled_requests(self, job: dict, requesters: list[str]) -> None:
+        """
+        Log a ``cancelled`` submission for the owner of a queued job that was
+        cancelled or abandoned, and for every session that waited on it.
+        """
+        graded_for = self.store.requester_for(job)
+        session_ids = [job["session_id"]] + [
+            requester for requester in dict.fromkeys(requesters) if requester != graded_for
+        ]
+        try:
+            self.grader.log_cancelled_grade(session_ids, **self.grade_kwargs(job))
+        except Exception as exc:
+            print(f"[GradeJobRunner] Failed to log cancelled submissions for job {job['job_id']}: {exc}")
+
+    def _grade_and_record(self, job: dict, cancel_event: threading.Event) -> None:
+        try:
+            self.write_job_debug(job)
+            grade_result = self.grader.grade(**self.grade_kwargs(job), cancel_event=cancel_event)
+        except Exception as exc:
+            self.record_outcome(job, None, exc)
+            return
+        self.record_outcome(job, grade_result)
+
+    def run(self, job: dict) -> None:
+        """
+        Grade a job on the calling thread.  After ``cancel`` it returns as
+        soon as ``Grader.grade`` has aborted the request and logged the
+        cancelled submission.
+        """
+        job_id = job["job_id"]
+        cancel_event = threading.Event()
+        self._register(job_id, cancel_event.set)
+        try:
+            self._grade_and_record(job, cancel_event)
+        finally:
+            self._unregister(job_id)
+
+    def submit(self, job: dict) -> Future:
+        """
+        Start a job on the ``AsyncGrader`` loop and return its future.
+
+        Cancelling the future cancels the grading task.
+        """
+        job_id = job["job_id"]
+        future = self.async_grader.submit(self._run_async(job))
+        self._register(job_id, future.cancel)
+        future.add_done_callback(lambda _: self._unregister(job_id))
+        return future
+
+    async def _run_async(self, job: dict) -> None:
+        try:
+            await asyncio.to_thread(self.write_job_debug, job)
+            grade_result = await self.async_grader.grade_async(**self.grade_kwargs(job))
+        except Exception as exc:
+            await asyncio.to_thread(self.record_outcome, job, None, exc)
+            return
+        await asyncio.to_thread(self.record_outcome, job, grade_result)
@@ -0,0 +1,209 @@
+import os
+import socket
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+
+def _env_int(name: str, default: int, *, minimum: int = 0) -> int:
+    raw_value = (os.environ.get(name) or "").strip()
+    if not raw_value:
+        return default
+    try:
+        return max(minimum, int(raw_value))
+    except ValueError:
+        return default
+
+
+class GradeScheduler:
+    """
+    Bounded pool of worker threads that pull grading jobs from a shared queue.
+
+    The queue itself lives outside the scheduler (see ``GradeJobStore``), so
+    workers in several processes can serve the same queue.  Each worker calls
+    ``claim_job`` to atomically take the oldest queued job and hands it to
+    ``run_job``.  When the queue is empty the workers sleep until ``notify``
+    is called by a local producer or until ``poll_interval`` elapses, which
+    picks up jobs enqueued by other processes.
+
+    Parameters
+    ----------
+    claim_job: Callable[[str], dict | None]
+        Called with a worker id; returns the claimed job or None.
+    run_job: Callable[[dict], None]
+        Called on a worker thread with the claimed job.
+    max_workers: int
+        Number of worker threads.  Zero disables local workers, e.g. for a
+        web process that relies on separate ``llmgrader_worker`` processes.
+    poll_interval: float
+        Seconds an idle worker waits before checking the queue again.
+    asynchronous: bool
+        If True, ``run_job`` returns a ``concurrent.futures.Future`` instead of
+        blocking (e.g. a job running on the ``AsyncGrader`` event loop).  A
+        single dispatcher thread then keeps up to ``max_workers`` jobs in flight.
+    """
+
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_MAX_QUEUE_DEPTH = 100
+    DEFAULT_POLL_INTERVAL = 1.0
+    ENGINES = ("thread", "async")
+
+    def __init__(
+        self,
+        claim_job: Callable[[str], dict | None],
+        run_job: Callable[[dict], None | Future],
+        *,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        asynchronous: bool = False,
+    ):
+        self.claim_job = claim_job
+        self.run_job = run_job
+        self.max_workers = max(0, int(max_workers))
+        self.poll_interval = poll_interval
+        self.asynchronous = asynchronous
+
+        self._condition = threading.Condition()
+        self._pending_notifications = 0
+        self._running = 0
+        self._workers: list[threading.Thread] = []
+        self._shutdown = False
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def max_workers_from_env() -> int:
+        return _env_int("LLMGRADER_GRADE_WORKERS", GradeScheduler.DEFAULT_MAX_WORKERS)
+
+    @staticmethod
+    def max_queue_depth_from_env() -> int:
+        return _env_int("LLMGRADER_GRADE_QUEUE_DEPTH", GradeScheduler.DEFAULT_MAX_QUEUE_DEPTH)
+
+    @staticmethod
+    def engine_from_env() -> str:
+        """
+        Grading engine from ``LLMGRADER_GRADE_ENGINE``: ``thread`` (default) or ``async``.
+        """
+        engine = (os.environ.get("LLMGRADER_GRADE_ENGINE") or "").strip().lower()
+        return engine if engine in GradeScheduler.ENGINES else "thread"
+
+    def start(self) -> None:
+        """
+        Start the worker threads.  Safe to call more than once.
+        """
+        with self._condition:
+            if self._shutdown:
+                return
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            thread_count = min(1, self.max_workers) if self.asynchronous else self.max_workers
+            while len(self._workers) < thread_count:
+                worker = threading.Thread(
+                    target=self._dispatch_loop if self.asynchronous else self._worker_loop,
+                    name=f"grade-worker-{len(self._workers) + 1}",
+                    daemon=True,
+                )
+                self._workers.append(worker)
+                worker.start()
+
+    def notify(self) -> None:
+        """
+        Wake an idle worker because a job was just enqueued.
+
+        Workers are started lazily on the first notification so that app
+        instances which never grade do not keep idle threads around.
+        """
+        self.start()
+        with self._condition:
+            self._pending_notifications += 1
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "max_workers": self.max_workers,
+                "running": self._running,
+            }
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers after their current job.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+
+    def join(self, timeout: float | None = None) -> None:
+        for worker in list(self._workers):
+            worker.join(timeout)
+
+    def _wait_for_work(self) -> bool:
+        with self._condition:
+            if self._pending_notifications == 0 and not self._shutdown:
+                self._condition.wait(self.poll_interval)
+            self._pending_notifications = max(0, self._pending_notifications - 1)
+            return not self._shutdown
+
+    def _worker_loop(self) -> None:
+        worker_id = f"{self._worker_prefix}:{threading.current_thread().name}"
+        while True:
+            with self._condition:
+                if self._shutdown:
+                    return
+
+            try:
+                job = self.claim_job(worker_id)
+            except Exception as exc:
+                print(f"[GradeScheduler] Failed to claim a grading job: {exc}")
+                job = None
+
+            if job is None:
+                if not self._wait_for_work():
+                    return
+                continue
+
+            with self._condition:
+                self._running += 1
+            try:
+                self.run_job(job)
+            except Exception as exc:
+                print(f"[GradeScheduler] Job {job.get('job_id')} raised an unexpected error: {exc}")
+            finally:
+                with self._condition:
+                    self._running -= 1
+
+    def _job_finished(self, future: Future) -> None:
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+    def _dispatch_loop(self) -> None:
+        worker_id = f"{self._worker_prefix}:{threading.current_thread().name}"
+        while True:
+            with self._condition:
+                # Wait for a free in-flight slot before claiming another job.
+                self._condition.wait_for(
+                    lambda: self._shutdown or self._running < self.max_workers
+                )
+                if self._shutdown:
+                    return
+
+            try:
+                job = self.claim_job(worker_id)
+            except Exception as exc:
+                print(f"[GradeScheduler] Failed to claim a grading job: {exc}")
+                job = None
+
+            if job is None:
+                if not self._wait_for_work():
+                    return
+                continue
+
+            with self._condition:
+                self._running += 1
+            try:
+                future = self.run_job(job)
+            except Exception as exc:
+                print(f"[GradeScheduler] Job {job.get('job_id')} raised an unexpected error: {exc}")
+                with self._condition:
+                    self._running -= 1
+                continue
+            future.add_done_callback(self._job_finished)
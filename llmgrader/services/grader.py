@@ -1,3 +1,4 @@
+import asyncio
 import textwrap
 import os
 import shutil
@@ -10,14 +11,17 @@ from openai import OpenAI, APITimeoutError
 import zipfile
 import re
 import sqlite3
+import copy
+import dataclasses
+import threading
 import time
+import math
 import base64
 import uuid
 from datetime import datetime
 from concurrent.futures import TimeoutError as ThreadTimeoutError
 from openai import APITimeoutError
 
-from concurrent.futures import ThreadPoolExecutor
 
 from typing import Union, Literal
 from llmgrader.services.parselatex import parse_latex_soln
@@ -29,7 +33,22 @@ from pydantic import ValidationError, ConfigDict, model_validator
 import sys
 from datetime import datetime, timezone
 from llmgrader.services.prompt import PromptBuilder
-from llmgrader.services.unit_parser import UnitParser
+from llmgrader.services.llm_clients import AbortScope, LLMClientRegistry, make_http_client
+from llmgrader.services import migrations
+from llmgrader.services.admin_usage import AdminUsageLedger
+from llmgrader.services.archive import SubmissionArchive
+from llmgrader.services.blob_store import SUBMISSION_BLOB_COLUMNS, hash_column, put_blobs
+from llmgrader.services.compression import ColumnCompressor
+from llmgrader.services.db import get_database
+from llmgrader.services.grade_cache import GradeCache
+from llmgrader.services.rate_limiter import RateLimiter
+from llmgrader.services.submission_writer import SubmissionWriter
+from llmgrader.services.llm_retry import (
+    GradeCancelled, LatencyTracker, LLMCaller, LLMClientInitError, MalformedLLMResponse, RetryPolicy,
+)
+from llmgrader.services.package_snapshot import PackageSnapshot
+from llmgrader.services.package_versions import PackageVersions
+from llmgrader.services.unit_parser import UnitPackageData, UnitParser, diff_units
 
 def _ts():
     # timezone-aware UTC timestamp with millisecond precision
@@ -203,9 +222,43 @@ def normalize_json_response_text(text: str) -> str:
     return normalized
 
 
+def _unit_package_field(name: str) -> property:
+    # Grader attribute backed by a field of the current UnitPackageData.
+    # Assigning it swaps in a copy of the package with that field replaced.
+    def getter(self):
+        return getattr(self.unit_package, name)
+
+    def setter(self, value):
+        self.unit_package = dataclasses.replace(self.unit_package, **{name: value})
+
+    return property(getter, setter)
+
+
 class Grader:
     SUPPORTED_TOOLS = ["web_search"]
 
+    # The loaded solution package.  Request handlers and grading read these
+    # through the single ``unit_package`` reference, so a reload or upload
+    # replaces all of them at once.
+    soln_pkg = _unit_package_field("soln_pkg_path")
+    units = _unit_package_field("units")
+    unit_metadata = _unit_package_field("unit_metadata")
+    units_order = _unit_package_field("units_order")
+    units_list = _unit_package_field("units_list")
+    xml_path_list = _unit_package_field("xml_path_list")
+    unit_validation_errors = _unit_package_field("validation_errors")
+    unit_validation_alert = _unit_package_field("validation_alert")
+
+    # Finished package uploads whose status is kept for polling
+    MAX_PACKAGE_UPLOADS = 20
+
+    # Seconds to wait for an LLM call beyond its SDK timeout before giving up.
+    LLM_EXTRA_TIMEOUT_SECONDS = 5.0
+
+    # How long cached admin preferences are trusted before the file's mtime is
+    # checked again (picks up edits made by other processes).
+    ADMIN_PREFS_CACHE_SECONDS = 5.0
+
     # Database schema definition for submissions table
     DB_SCHEMA = {
         "timestamp": "TEXT NOT NULL",
@@ -237,6 +290,10 @@ class Grader:
         "result_parts_json": "TEXT",
         "tools_json": "TEXT",
         "solution_image_paths_json": "TEXT",
+        "cache_hit": "INTEGER",
+        "llm_attempts": "INTEGER",
+        "llm_winning_attempt": "INTEGER",
+        "coalesced": "INTEGER",
     }
 
     # Formats for displaying DB fields.
@@ -258,6 +315,10 @@ class Grader:
         "tokens_out": "text",
         "tools_json": "text",
         "client_id": "text",
+        "cache_hit": "bool",
+        "llm_attempts": "text",
+        "llm_winning_attempt": "text",
+        "coalesced": "bool",
     }
 
     
@@ -276,31 +337,73 @@ class Grader:
             Path to a solution package (if testing locally).
         """
         self.scratch_dir = scratch_dir
-        self.soln_pkg = soln_pkg
+
+        # Uploaded package versions (see package_versions.py); the current
+        # version is loaded unless a package path is given
+        self.package_versions = PackageVersions(self.get_package_versions_path())
+        self.unit_package = self.empty_unit_package(soln_pkg or self.package_versions.current())
+        # Serializes reloads and uploads; readers never wait on it
+        self._package_lock = threading.Lock()
+        self._uploads_lock = threading.Lock()
+        self.package_uploads = {}
 
         # Get the database path
         self.db_path = self.get_db_path()
+        self.db = get_database(self.db_path)
 
         # Initialize field format
         Grader.initialize_field_format()
 
-        # Initialize the database first, then apply any missing-column migrations.
+        # Initialize the database first, then apply any pending migrations.
         # init_db uses CREATE TABLE IF NOT EXISTS, so it is safe on both new and
-        # existing databases. temp_modify_db must run after so it can find the
+        # existing databases. migrate_db must run after so it can find the
         # table when the DB is brand-new.
         self.init_db()
-        self.temp_modify_db()
-
-        # Initialize units dictionary
-        self.units = {}
-        self.unit_metadata = {}
-        self.units_order = []
-        self.units_list = []
-        self.xml_path_list = []
-        self.unit_validation_errors = []
-        self.unit_validation_alert = None
+        self.migrate_db()
+
+        # Optional compression of free-text submission columns (LLMGRADER_COMPRESS_COLUMNS)
+        self.compressor = ColumnCompressor.from_env()
+
+        # Parquet archive of old submissions (see archive.py)
+        self.archive = SubmissionArchive(self.db_path, self.get_archive_path())
+
+        # Running totals of admin-key tokens for the community token limit
+        self.admin_usage = AdminUsageLedger(self.db_path)
+
+        # Opt-in cache of LLM grades (enabled per unit/question in llmgrader_config.xml)
+        self.grade_cache = GradeCache.from_env(self.db_path)
+        self.grade_cache.init_db()
+
+        # RPM/TPM budgets per (provider, model), shared by all grading workers
+        self.rate_limiter = RateLimiter(
+            self.db_path,
+            load_limits=lambda: self.load_admin_preferences().get("rateLimits", []),
+        )
+        self.rate_limiter.init_db()
+
+        # Recent LLM latencies, used to time hedged requests
+        self.llm_latency = LatencyTracker()
+
+        # Parsed admin-config.json, see load_admin_preferences
+        self._admin_prefs_lock = threading.Lock()
+        self._admin_prefs = None
+        self._admin_prefs_stamp = None
+        self._admin_prefs_checked_at = None
+
+        # Background submission logging; off unless enable_submission_writer is called
+        self.submission_writer = None
+
         self.prompt_builder = PromptBuilder()
 
+        # Parsed package saved after each parse, reused while the files are unchanged
+        self.package_snapshot = PackageSnapshot(self.get_snapshot_path())
+
+        # Reused LLM clients so grades share keep-alive connections
+        self.llm_clients = LLMClientRegistry({
+            "openai": self.make_openai_client,
+            "hf": self.make_hf_session,
+        })
+
         # Remove old scratch directory if it exists
         if os.path.exists(self.scratch_dir):
             shutil.rmtree(self.scratch_dir)
@@ -312,62 +415,25 @@ class Grader:
         self.load_unit_pkg() 
 
        
-    def temp_modify_db(self):
-        """
-        Modify the database schema to add new JSON columns for points and max_points
-        if they do not already exist. This supports older databases without requiring
-        users to run a migration script. Safe to remove once all users have updated.
-        """
-        import sqlite3
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Get existing columns
-        cursor.execute("PRAGMA table_info(submissions);")
-        columns = [row[1] for row in cursor.fetchall()]
-
-        new_columns = {
-            "required": "INTEGER",
-            "partial_credit": "INTEGER",
-            "max_point_parts_json": "TEXT",
-            "point_parts_json": "TEXT",
-            "result_parts_json": "TEXT",
-            "tools_json": "TEXT",
-            "solution_image_paths_json": "TEXT",
-            "points": "REAL",
-            "max_points": "REAL",
-            "client_id": "TEXT",
-        }
-
-        # Add each column if missing
-        for col_name, col_type in new_columns.items():
-            if col_name not in columns:
-                cursor.execute(
-                    f"ALTER TABLE submissions ADD COLUMN {col_name} {col_type} DEFAULT NULL;"
-                )
-                conn.commit()
-
-        # Privacy scrub: erase any stored user emails from older schema
-        if "user_email" in columns:
-            cursor.execute("UPDATE submissions SET user_email = NULL WHERE user_email IS NOT NULL;")
-            conn.commit()
-
-        conn.close()
-
+    def migrate_db(self):
+        """
+        Apply pending numbered schema migrations (see ``migrations.py``).
+        Each migration runs once per database, tracked by ``PRAGMA user_version``.
+        """
+        with self.db.connection(autocommit=True) as conn:
+            migrations.migrate(conn)
 
     def init_db(self):
         """
         Initialize the SQLite database for storing submission data.
-        Creates the submissions table if it does not already exist.
+        Creates the submissions table if it does not already exist; migration 4
+        then converts it to the ``submission_rows`` table and ``submissions`` view.
         
         The schema is defined by the DB_SCHEMA class attribute, ensuring
         a single canonical definition of the database structure.
         
         This function is idempotent and safe to call multiple times.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Build column definitions from DB_SCHEMA
         column_defs = ["id INTEGER PRIMARY KEY AUTOINCREMENT"]
         for col_name, col_type in self.DB_SCHEMA.items():
@@ -381,9 +447,8 @@ class Grader:
             )
         '''
         
-        cursor.execute(create_table_sql)
-        conn.commit()
-        conn.close()
+        with self.db.connection() as conn:
+            conn.execute(create_table_sql)
 
     def insert_submission(self, **kwargs):
         """
@@ -397,7 +462,9 @@ class Grader:
         **kwargs : dict
             Keyword arguments matching column names in DB_SCHEMA.
             Any columns not provided will default to None.
-            Extra keywords not in DB_SCHEMA are silently ignored.
+            Extra keywords not in DB_SCHEMA are silently ignored, except
+            ``admin_reservation_id``: admin-key submissions add their tokens to
+            the admin usage ledger and release that reservation.
         
         Examples
         --------
@@ -410,26 +477,52 @@ class Grader:
             model="gpt-4.1-mini"
         )
         """
-        # Build record dictionary from DB_SCHEMA columns
-        record = {}
-        for col_name in self.DB_SCHEMA.keys():
-            record[col_name] = kwargs.get(col_name)
-        
-        # Construct dynamic INSERT statement
-        columns = ", ".join(self.DB_SCHEMA.keys())
-        placeholders = ", ".join(f":{col}" for col in self.DB_SCHEMA.keys())
-        
-        insert_sql = f'''
-            INSERT INTO submissions ({columns})
-            VALUES ({placeholders})
-        '''
-        
-        # Execute the insert
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(insert_sql, record)
-        conn.commit()
-        conn.close()
+        self.insert_submissions([kwargs])
+
+    def enable_submission_writer(self, **kwargs) -> SubmissionWriter:
+        """
+        Log submissions through a background ``SubmissionWriter`` from now on.
+        Keyword arguments are passed to ``SubmissionWriter``.
+        """
+        if self.submission_writer is None:
+            self.submission_writer = SubmissionWriter(self.insert_submissions, **kwargs)
+        return self.submission_writer
+
+    def insert_submissions(self, records: list[dict]) -> None:
+        """
+        Insert several submission records in one transaction.
+
+        Each record takes the same keywords as ``insert_submission``.
+        """
+        # Construct dynamic INSERT statement.  The SQL text is identical on
+        # every call, so the thread's connection reuses its prepared statement.
+        # The submissions view cannot be inserted into: rows go to
+        # submission_rows, with repeated text columns stored as blob hashes.
+        row_columns = [
+            hash_column(col) if col in SUBMISSION_BLOB_COLUMNS else col
+            for col in self.DB_SCHEMA.keys()
+        ]
+        columns = ", ".join(row_columns)
+        placeholders = ", ".join(f":{col}" for col in row_columns)
+        insert_sql = f"INSERT INTO submission_rows ({columns}) VALUES ({placeholders})"
+
+        with self.db.connection() as conn:
+            for kwargs in records:
+                # Build record dictionary from DB_SCHEMA columns
+                record = {col_name: kwargs.get(col_name) for col_name in self.DB_SCHEMA.keys()}
+                texts = [record.pop(col) for col in SUBMISSION_BLOB_COLUMNS]
+                hashes = put_blobs(conn, texts, [
+                    self.compressor.compress(col, text) for col, text in zip(SUBMISSION_BLOB_COLUMNS, texts)
+                ])
+                record = self.compressor.compress_record(record)
+                record.update(zip(map(hash_column, SUBMISSION_BLOB_COLUMNS), hashes))
+                conn.execute(insert_sql, record)
+                if kwargs.get("used_admin_key"):
+                    self.admin_usage.record(
+                        conn,
+                        (kwargs.get("tokens_in") or 0) + (kwargs.get("tokens_out") or 0),
+                        reservation_id=kwargs.get("admin_reservation_id"),
+                    )
 
     def _apply_format(self, fmt: str, value):
         """
@@ -498,106 +591,152 @@ class Grader:
         return formatted
 
 
+    @staticmethod
+    def empty_unit_package(soln_pkg_path: str | None) -> UnitPackageData:
+        return UnitPackageData(
+            units={},
+            units_order=[],
+            units_list=[],
+            xml_path_list=[],
+            soln_pkg_path=soln_pkg_path,
+            validation_errors=[],
+            validation_alert=None,
+        )
+
+    def make_unit_parser(self, soln_pkg: str | None) -> UnitParser:
+        return UnitParser(
+            scratch_dir=self.scratch_dir,
+            soln_pkg=soln_pkg,
+            supported_tools=self.SUPPORTED_TOOLS,
+            snapshot=self.package_snapshot,
+            workers=UnitParser.workers_from_env(),
+        )
+
     def save_uploaded_file(self, file_storage):
         """
-        Save an uploaded solution package ZIP, extract it into self.soln_pkg,
-        and reload units.
-        """
+        Save an uploaded solution package ZIP and load it in the background
+        (see stage_package).  Students keep getting the current package
+        until the new one has loaded.
 
-        # ---------------------------------------------------------
-        # 1. Save uploaded ZIP into scratch
-        # ---------------------------------------------------------
-        save_path = os.path.join(self.scratch_dir, file_storage.filename)
+        Returns ``({"status": "staging", "upload_id": ...}, 202)``; poll
+        get_package_upload for the outcome.
+        """
+        upload_id = uuid.uuid4().hex
+        save_path = os.path.join(self.scratch_dir, f"upload-{upload_id}.zip")
         file_storage.save(save_path)
-        print(f"[Upload] Saved uploaded file to {save_path}")
-
-        # ---------------------------------------------------------
-        # 2. Resolve solution package directory
-        # ---------------------------------------------------------
-        soln_pkg_path = self.soln_pkg
-        if soln_pkg_path is None:
-            return {"error": "Internal error: soln_pkg_path not set"}, 500
+        print(f"[Upload] Saved uploaded file {file_storage.filename} to {save_path}")
 
-        print(f"[Upload] Using solution package path: {soln_pkg_path}")
-
-        # ---------------------------------------------------------
-        # 3. Clear existing package directory
-        # ---------------------------------------------------------
-        def remove_readonly(func, path, excinfo):
-            os.chmod(path, 0o666)
-            func(path)
-
-        shutil.rmtree(soln_pkg_path, onexc=remove_readonly)
-        os.makedirs(soln_pkg_path, exist_ok=True)
-
-        # ---------------------------------------------------------
-        # 4. Extract ZIP into soln_pkg_path
-        # ---------------------------------------------------------
-        try:
-            with zipfile.ZipFile(save_path, "r") as z:
-                z.extractall(soln_pkg_path)
-            print(f"[Upload] Extracted ZIP into {soln_pkg_path}")
-        except zipfile.BadZipFile:
+        if not zipfile.is_zipfile(save_path):
             print("[Upload] Invalid ZIP file")
+            os.remove(save_path)
             return {"error": "Uploaded file is not a valid zip file."}, 400
-        except Exception as e:
-            print(f"[Upload] Unexpected error while extracting ZIP: {e}")
-            return {"error": "Failed to extract ZIP file."}, 500
 
-        # ---------------------------------------------------------
-        # 5. Reload units from the extracted package
-        # ---------------------------------------------------------
+        status = {"upload_id": upload_id, "status": "staging"}
+        with self._uploads_lock:
+            self.package_uploads[upload_id] = status
+            while len(self.package_uploads) > self.MAX_PACKAGE_UPLOADS:
+                self.package_uploads.pop(next(iter(self.package_uploads)))
+
+        threading.Thread(
+            target=self._run_package_upload,
+            args=(upload_id, save_path),
+            name=f"llmgrader-upload-{upload_id[:8]}",
+            daemon=True,
+        ).start()
+        return dict(status), 202
+
+    def _run_package_upload(self, upload_id: str, zip_path: str) -> None:
         try:
-            self.load_unit_pkg()
-            print("[Upload] Unit package loaded successfully")
+            result = self.stage_package(zip_path)
         except Exception as e:
             print(f"[Upload] Failed to load unit package: {e}")
-            return {"error": f"Failed to load units: {e}"}, 400
+            result = {"status": "error", "error": f"Failed to load units: {e}"}
+        finally:
+            try:
+                os.remove(zip_path)
+            except OSError:
+                pass
+        with self._uploads_lock:
+            self.package_uploads[upload_id] = {"upload_id": upload_id, **result}
+
+    def get_package_upload(self, upload_id: str) -> dict | None:
+        with self._uploads_lock:
+            status = self.package_uploads.get(upload_id)
+            return dict(status) if status is not None else None
+
+    def stage_package(self, zip_path: str) -> dict:
+        """
+        Extract a package ZIP into a new version directory, parse it there,
+        and switch to it if it has valid units.
 
-        # ---------------------------------------------------------
-        # 6. Verify units loaded
-        # ---------------------------------------------------------
-        if not self.units:
-            print("[Upload] No units found after loading")
-            error_message = self.unit_validation_alert or "No valid units found. Check llmgrader_config.xml."
-            return {"error": error_message}, 400
+        The switch is a single assignment of ``unit_package``; the previous
+        version's directory is kept (see PackageVersions.prune).
+
+        Returns ``{"status": "ok", "validation_alert", "changes"}`` or
+        ``{"status": "error", "error"}``.
+        """
+        with self._package_lock:
+            try:
+                version_path = self.package_versions.stage(zip_path)
+            except zipfile.BadZipFile:
+                print("[Upload] Invalid ZIP file")
+                return {"status": "error", "error": "Uploaded file is not a valid zip file."}
+            except Exception as e:
+                print(f"[Upload] Unexpected error while extracting ZIP: {e}")
+                return {"status": "error", "error": "Failed to extract ZIP file."}
+            print(f"[Upload] Extracted ZIP into {version_path}")
+
+            old_package = self.unit_package
+            unit_package = self.make_unit_parser(version_path).parse(previous=old_package)
+
+            if not unit_package.units:
+                print("[Upload] No units found after loading; keeping the current package")
+                self.package_versions.discard(version_path)
+                error_message = unit_package.validation_alert or "No valid units found. Check llmgrader_config.xml."
+                return {"status": "error", "error": error_message}
+
+            self.unit_package = unit_package
+            self.package_versions.activate(version_path)
+            removed = self.package_versions.prune(keep=[version_path, old_package.soln_pkg_path])
 
-        print(f"[Upload] Loaded {len(self.units)} unit(s): {list(self.units.keys())}")
+        print(f"[Upload] Loaded {len(unit_package.units)} unit(s) from {version_path}: {list(unit_package.units.keys())}")
+        if removed:
+            print(f"[Upload] Removed old package versions: {removed}")
 
         return {
             "status": "ok",
-            "validation_alert": self.unit_validation_alert,
+            "validation_alert": unit_package.validation_alert,
+            "changes": diff_units(old_package.units, unit_package.units),
         }
 
-    def load_unit_pkg(self):
-        parser = UnitParser(
-            scratch_dir=self.scratch_dir,
-            soln_pkg=self.soln_pkg,
-            supported_tools=self.SUPPORTED_TOOLS,
+    def load_unit_pkg(self) -> dict:
+        """
+        (Re)load units from the current solution package.  Units whose files
+        are unchanged since the last load are not parsed again.
+
+        Returns the questions added, changed and removed by the load
+        (see ``diff_units``).
+        """
+        with self._package_lock:
+            old_package = self.unit_package
+            unit_package = self.make_unit_parser(self.soln_pkg).parse(previous=old_package)
+
+            if unit_package is None:
+                # Defensive: treat as empty package
+                unit_package = self.empty_unit_package(self.soln_pkg)
+                unit_package.validation_errors = ["Unit package could not be loaded (None returned)"]
+                unit_package.validation_alert = "Unit package could not be loaded."
+
+            self.unit_package = unit_package
+
+        changes = diff_units(old_package.units, unit_package.units)
+        counts = {kind: sum(len(qtags) for qtags in changes[kind].values()) for kind in changes}
+        print(
+            f"[Units] Loaded {len(unit_package.units)} unit(s): {counts['added']} question(s) added, "
+            f"{counts['changed']} changed, {counts['removed']} removed"
         )
-        unit_package = parser.parse()
-
-        if unit_package is None:
-            # Defensive: treat as empty package
-            self.soln_pkg = self.soln_pkg or None
-            self.units = {}
-            self.unit_metadata = {}
-            self.units_order = []
-            self.units_list = []
-            self.xml_path_list = []
-            self.unit_validation_errors = ["Unit package could not be loaded (None returned)"]
-            self.unit_validation_alert = "Unit package could not be loaded."
-            return
-
-        self.soln_pkg = unit_package.soln_pkg_path
-        self.units = unit_package.units
-        self.unit_metadata = unit_package.unit_metadata
-        self.units_order = unit_package.units_order
-        self.units_list = unit_package.units_list
-        self.xml_path_list = unit_package.xml_path_list
-        self.unit_validation_errors = unit_package.validation_errors
-        self.unit_validation_alert = unit_package.validation_alert
-    
+        return changes
+
     def build_task_prompt(
         self,
         question_dict: dict,
@@ -630,6 +769,28 @@ class Grader:
         """
         return self.prompt_builder.build_task_prompt(question_dict, student_soln, part_label)
 
+    def estimate_request_tokens(
+        self,
+        question_dict: dict,
+        student_soln: str,
+        part_label: str = "all",
+        solution_images: list[str] | None = None,
+    ) -> int:
+        """
+        Estimate the tokens a grading request will consume, for rate limiting.
+
+        The estimate is based on the prompt from ``build_task_prompt`` plus
+        an allowance per attached image and for the model's reply.
+        """
+        try:
+            task, _ = self.build_task_prompt(question_dict, student_soln, part_label)
+        except Exception as e:
+            log_error(f"Could not build prompt for token estimate: {e}")
+            task = (question_dict.get("question_text", "") + question_dict.get("solution", "")
+                    + question_dict.get("grading_notes", "") + (student_soln or ""))
+        image_count = len(solution_images or []) + len(question_dict.get("solution_images") or [])
+        return self.rate_limiter.estimate_tokens(task, image_count)
+
     def grade_post_process(
         self,
         raw_grade: dict,
@@ -1057,7 +1218,159 @@ class Grader:
         )
 
 
-    def _make_llm_caller(self, provider, model, api_key, task, timeout, tools=None, solution_images=None, ref_solution_images=None):
+    # Connections kept open per Hugging Face session
+    HF_POOL_MAXSIZE = 32
+
+    @staticmethod
+    def make_openai_client(api_key: str) -> OpenAI:
+        """
+        Create an OpenAI client whose requests a grading job can abort
+        (see ``AbortScope``).
+        """
+        # LLMCaller retries; SDK retries would hide attempts from it.
+        return OpenAI(api_key=api_key, http_client=make_http_client(), max_retries=0)
+
+    @staticmethod
+    def make_hf_session(api_key: str):
+        """
+        Create an HTTP client with a keep-alive pool for the HF router.
+        """
+        return make_http_client(
+            max_connections=Grader.HF_POOL_MAXSIZE,
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+
+    @staticmethod
+    def _task_hint_with_images(task: str, ref_images: list, student_images: list) -> str:
+        task_hint = task
+        if ref_images:
+            task_hint += "\n\n--- REFERENCE SOLUTION IMAGES ---\nSee reference solution images below."
+        if student_images:
+            task_hint += "\n\n--- STUDENT SOLUTION IMAGES ---\nSee attached student images below."
+        return task_hint
+
+    def build_openai_request(self, model, task, timeout, tools=None, solution_images=None, ref_solution_images=None) -> dict:
+        """
+        Build the keyword arguments for an OpenAI ``responses.create`` call.
+
+        Shared by the thread-based caller below and by ``AsyncGrader``.
+        """
+        student_images = solution_images or []
+        ref_images = ref_solution_images or []
+        requested_tools = [tool for tool in (tools or []) if tool in self.SUPPORTED_TOOLS]
+
+        # Responses API expects top-level input items to be messages, not raw content parts.
+        if ref_images or student_images:
+            message_content = [{"type": "input_text", "text": self._task_hint_with_images(task, ref_images, student_images)}]
+            for data_uri in ref_images:
+                message_content.append({"type": "input_image", "image_url": data_uri})
+            for data_uri in student_images:
+                message_content.append({"type": "input_image", "image_url": data_uri})
+            openai_input = [{"role": "user", "content": message_content}]
+        else:
+            openai_input = task
+
+        request_kwargs = {
+            "model": model,
+            "input": openai_input,
+            "temperature": 1 if model.startswith("gpt-5-mini") else 0,
+            "timeout": timeout,
+        }
+
+        if "web_search" in requested_tools:
+            request_kwargs["tools"] = [{"type": "web_search"}]
+        else:
+            request_kwargs["text"] = {
+                "format": {
+                    "type": "json_object"
+                }
+            }
+        return request_kwargs
+
+    @staticmethod
+    def parse_openai_response(resp):
+        """
+        Parse an OpenAI Responses API result into
+        ``(GraderRawResult, input_tokens, output_tokens, tool_call_summary)``.
+        """
+        response_text = resp.output_text or ""
+        if not response_text.strip():
+            raise MalformedLLMResponse("OpenAI response did not contain output_text.")
+
+        normalized_response_text = normalize_json_response_text(response_text)
+
+        try:
+            parsed = GraderRawResult.model_validate_json(normalized_response_text)
+        except ValidationError as exc:
+            raise MalformedLLMResponse(f"Failed to parse OpenAI JSON response: {exc}") from exc
+
+        tool_call_summary = summarize_tool_calls(resp)
+
+        # Get the total tokens used (input + output)
+        if resp.usage is not None:
+            inputs_tokens = resp.usage.input_tokens
+            output_tokens = resp.usage.output_tokens
+        else:
+            inputs_tokens = 0
+            output_tokens = 0
+        return parsed, inputs_tokens, output_tokens, tool_call_summary
+
+    def build_hf_request(self, model, api_key, task, solution_images=None, ref_solution_images=None) -> tuple[str, dict, dict]:
+        """
+        Build ``(url, headers, payload)`` for a Hugging Face router chat completion.
+        """
+        student_images = solution_images or []
+        ref_images = ref_solution_images or []
+        hf_model = model.replace("hf:", "")
+        url = f"https://router.huggingface.co/models/{hf_model}/v1/chat/completions"
+        headers = {"Authorization": f"Bearer {api_key}"}
+
+        # Build message content: multimodal list when any images are present
+        if ref_images or student_images:
+            message_content = [{"type": "text", "text": self._task_hint_with_images(task, ref_images, student_images)}]
+            for data_uri in ref_images:
+                message_content.append({
+                    "type": "image_url",
+                    "image_url": {"url": data_uri}
+                })
+            for data_uri in student_images:
+                message_content.append({
+                    "type": "image_url",
+                    "image_url": {"url": data_uri}
+                })
+        else:
+            message_content = task
+
+        payload = {
+            "model": hf_model,
+            "messages": [
+                {"role": "user", "content": message_content}
+            ],
+            "temperature": 0,
+        }
+        return url, headers, payload
+
+    @staticmethod
+    def parse_hf_response(data: dict):
+        # Extract assistant message
+        try:
+            text = data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as exc:
+            raise MalformedLLMResponse(f"Hugging Face response has no message content: {exc}") from exc
+
+        # Set tokens to 0 now since HF API does not provide then
+        input_tokens = 0
+        output_tokens = 0
+
+        # Parse using your existing GradeResult model
+        try:
+            parsed = GraderRawResult.model_validate_json(normalize_json_response_text(text or ""))
+        except ValidationError as exc:
+            raise MalformedLLMResponse(f"Failed to parse Hugging Face JSON response: {exc}") from exc
+        return parsed, input_tokens, output_tokens, None
+
+    def _make_llm_caller(self, provider, model, api_key, task, timeout, tools=None, solution_images=None,
+                         ref_solution_images=None):
         """
         Creates a function that calls the specified LLM provider with the given parameters.
         
@@ -1092,131 +1405,48 @@ class Grader:
                 input_tokens, output_tokens: int
                     Number of tokens used in the API call (input & output)
         """
-        student_images = solution_images or []
-        ref_images = ref_solution_images or []
-
         if provider == "openai":
-            client = OpenAI(api_key=api_key)
-            requested_tools = [tool for tool in (tools or []) if tool in self.SUPPORTED_TOOLS]
-
-            # Responses API expects top-level input items to be messages, not raw content parts.
-            if ref_images or student_images:
-                task_hint = task
-                if ref_images:
-                    task_hint += "\n\n--- REFERENCE SOLUTION IMAGES ---\nSee reference solution images below."
-                if student_images:
-                    task_hint += "\n\n--- STUDENT SOLUTION IMAGES ---\nSee attached student images below."
-                message_content = [{"type": "input_text", "text": task_hint}]
-                for data_uri in ref_images:
-                    message_content.append({"type": "input_image", "image_url": data_uri})
-                for data_uri in student_images:
-                    message_content.append({"type": "input_image", "image_url": data_uri})
-                openai_input = [{"role": "user", "content": message_content}]
-            else:
-                openai_input = task
+            request_kwargs = self.build_openai_request(
+                model, task, timeout,
+                tools=tools,
+                solution_images=solution_images,
+                ref_solution_images=ref_solution_images,
+            )
 
             def call_openai():
-                request_kwargs = {
-                    "model": model,
-                    "input": openai_input,
-                    "temperature": 1 if model.startswith("gpt-5-mini") else 0,
-                    "timeout": timeout,
-                }
-
-                if "web_search" in requested_tools:
-                    request_kwargs["tools"] = [{"type": "web_search"}]
-                else:
-                    request_kwargs["text"] = {
-                        "format": {
-                            "type": "json_object"
-                        }
-                    }
-
-                resp = client.responses.create(**request_kwargs)
-
-                response_text = resp.output_text or ""
-                if not response_text.strip():
-                    raise ValueError("OpenAI response did not contain output_text.")
-
-                normalized_response_text = normalize_json_response_text(response_text)
-
-                try:
-                    parsed = GraderRawResult.model_validate_json(normalized_response_text)
-                except ValidationError as exc:
-                    raise ValueError(f"Failed to parse OpenAI JSON response: {exc}") from exc
-
-                tool_call_summary = summarize_tool_calls(resp)
-
-                # Get the total tokens used (input + output)
-                if resp.usage is not None:
-                    inputs_tokens = resp.usage.input_tokens
-                    output_tokens = resp.usage.output_tokens
-                else:
-                    inputs_tokens = 0
-                    output_tokens = 0
-                return parsed, inputs_tokens, output_tokens, tool_call_summary
+                with self.llm_clients.lease("openai", api_key) as client:
+                    resp = client.responses.create(**request_kwargs)
+                return self.parse_openai_response(resp)
             
             return call_openai
 
         elif provider == "hf":
-            import requests
-            hf_model = model.replace("hf:", "")
-            url = f"https://router.huggingface.co/models/{hf_model}/v1/chat/completions"
-            headers = {"Authorization": f"Bearer {api_key}"}
-
-            # Build message content: multimodal list when any images are present
-            if ref_images or student_images:
-                task_hint = task
-                if ref_images:
-                    task_hint += "\n\n--- REFERENCE SOLUTION IMAGES ---\nSee reference solution images below."
-                if student_images:
-                    task_hint += "\n\n--- STUDENT SOLUTION IMAGES ---\nSee attached student images below."
-                message_content = [{"type": "text", "text": task_hint}]
-                for data_uri in ref_images:
-                    message_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": data_uri}
-                    })
-                for data_uri in student_images:
-                    message_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": data_uri}
-                    })
-            else:
-                message_content = task
+            url, headers, payload = self.build_hf_request(
+                model, api_key, task,
+                solution_images=solution_images,
+                ref_solution_images=ref_solution_images,
+            )
 
             def call_hf():
-                payload = {
-                    "model": hf_model,
-                    "messages": [
-                        {"role": "user", "content": message_content}
-                    ],
-                    "temperature": 0,
-                }
-
-                resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
+                with self.llm_clients.lease("hf", api_key) as session:
+                    resp = session.post(url, headers=headers, json=payload, timeout=timeout)
                 resp.raise_for_status()
-                data = resp.json()
-
-                # Extract assistant message
-                text = data["choices"][0]["message"]["content"]
-
-                # Set tokens to 0 now since HF API does not provide then
-                input_tokens = 0
-                output_tokens = 0
-
-                # Parse using your existing GradeResult model
-                return GraderRawResult.model_validate_json(normalize_json_response_text(text)), input_tokens, output_tokens, None
+                return self.parse_hf_response(resp.json())
 
             return call_hf
 
         else:
             raise ValueError(f"Unknown provider '{provider}'")
         
-    def get_admin_key(self, model: str) -> tuple[str | None, str | None]:
+    def get_admin_key(self, model: str, *, estimated_tokens: int = 0,
+                      reservation_id: str | None = None) -> tuple[str | None, str | None]:
         """
         Determine whether the admin key may be used for this grading request.
 
+        With a token limit, ``estimated_tokens`` are reserved under
+        ``reservation_id`` until the submission is logged (see
+        ``AdminUsageLedger``).
+
         Returns:
             (admin_key_or_none, reason_message_or_none)
 
@@ -1248,52 +1478,21 @@ class Grader:
         token_limit = limit_info.get("limit", 0)
         period = limit_info.get("period", "unlimited")
 
-        # Compute cutoff timestamp based on period
-        from datetime import datetime, timedelta
-
-        now = datetime.now(timezone.utc)
-        cutoff = None
-
-        if period == "per_hour":
-            cutoff = now - timedelta(hours=1)
-            reset_period = "hour"
-        elif period == "per_day":
-            cutoff = now - timedelta(days=1)
-            reset_period = "day"
-        elif period == "per_week":
-            cutoff = now - timedelta(weeks=1)
-            reset_period = "week"
-        elif period == "per_month":
-            cutoff = now - timedelta(days=30)
-            reset_period = "month"
-        elif period == "unlimited":
-            cutoff = None
-
-        # If there is no cutoff, we can skip the DB query and token counting
-        if cutoff is None:
+        window_seconds = AdminUsageLedger.PERIOD_SECONDS.get(period)
+        reset_period = period.removeprefix("per_")
+
+        # No window (unlimited): skip token accounting
+        if window_seconds is None:
             return admin_key, None
 
-        
-        # Query DB for token usage in the window
-        import sqlite3
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cutoff_str = cutoff.isoformat(timespec="seconds")
-        sql = """
-            SELECT SUM(tokens_in + tokens_out)
-            FROM submissions
-            WHERE used_admin_key = 1
-            AND timestamp >= ?
-        """
-        params = (cutoff_str,)
-        print(f"Executing DB query:\n{sql}\nWith params: {params}")
-        cursor.execute(sql, params)
-        total_tokens = cursor.fetchone()[0] or 0
-        conn.close()
-
-        # 4. Compare to token limit
-        if total_tokens >= token_limit:
+        # 4. Compare the ledger's usage plus in-flight reservations to the limit,
+        # reserving this request's estimate in the same transaction.
+        if not self.admin_usage.reserve(
+            reservation_id or uuid.uuid4().hex,
+            estimated_tokens,
+            limit=token_limit,
+            window_seconds=window_seconds,
+        ):
             return None, (
                 f"The community usage has exceeded the free token limit for this {reset_period}. "
                 "Please add your OpenAI API key to continue."
@@ -1322,7 +1521,9 @@ class Grader:
             api_key: str | None = None,
             timeout: float = 20.,
             solution_images: list[str] | None = None,
-            session_id: str | None = None) -> GradeResult:
+            session_id: str | None = None,
+            deadline_ts: float | None = None,
+            cancel_event: threading.Event | None = None) -> GradeResult:
         """
         Grades a student's solution using the OpenAI API.
         
@@ -1351,6 +1552,13 @@ class Grader:
             by the student alongside their solution.
         session_id: str | None
             Optional 8-character hex session UUID for analytics (no PII).
+        deadline_ts: float | None
+            Wall-clock time by which all LLM attempts (retries and hedged
+            requests) must finish, e.g. the grading job's deadline.
+        cancel_event: threading.Event | None
+            Set by the job runner when the job is cancelled.  The in-flight
+            LLM request is aborted, no further attempts start and the
+            submission is logged as ``cancelled``.
 
         Returns
         -------
@@ -1358,174 +1566,487 @@ class Grader:
             The grading dictionary result containing 'result', 'full_explanation', and 'feedback'.
             Note the pydantic GradeResult model is converted to a dict before returning.
         """
-        question_text = str(question_dict.get("question_text", ""))
-        solution = str(question_dict.get("solution", ""))
-        grading_notes = str(question_dict.get("grading_notes", ""))
-        required = question_dict.get("required", True) is not False
-        partial_credit = question_dict.get("partial_credit", False) is True
+        ctx = self.prepare_grade(
+            question_dict,
+            student_soln,
+            part_label=part_label,
+            unit_name=unit_name,
+            qtag=qtag,
+            provider=provider,
+            model=model,
+            api_key=api_key,
+            timeout=timeout,
+            solution_images=solution_images,
+            session_id=session_id,
+        )
+        if ctx["early_grade"] is not None:
+            return ctx["early_grade"]
+        try:
+            if ctx["cached_grade"] is not None:
+                log_std("Grade cache hit; skipping LLM call.")
+                return self.finish_grade(
+                    ctx,
+                    ctx["cached_grade"]["grade"],
+                    tool_call_summary=ctx["cached_grade"]["tool_call_summary"],
+                    cache_hit=True,
+                )
+
+            tokens_in = 0
+            tokens_out = 0
+            timed_out = False
+            tool_call_summary = None
+
+            log_std(f'Calling {provider} for grading...')
+
+            def make_request(attempt_timeout):
+                try:
+                    call_llm = self._make_llm_caller(
+                        provider, model, ctx["api_key"], ctx["task"], attempt_timeout,
+                        tools=ctx["tools"],
+                        solution_images=solution_images or [],
+                        ref_solution_images=question_dict.get("solution_images", []),
+                    )
+                except Exception as exc:
+                    raise LLMClientInitError(str(exc)) from exc
+                if abort_scope is None:
+                    return call_llm()
+                with abort_scope.active():
+                    return call_llm()
+
+            # A cancellable job's requests are aborted as soon as the call
+            # returns: this ends a request still in flight after a cancel, a
+            # timeout or a losing hedge, leaving the pooled connections of
+            # other jobs alone.
+            abort_scope = AbortScope() if cancel_event is not None else None
+            try:
+                llm_call = self.make_llm_call_policy(ctx, deadline_ts, cancel_event=cancel_event).call(make_request)
+            finally:
+                if abort_scope is not None:
+                    abort_scope.abort()
+            attempts, winning_attempt = llm_call.attempts, llm_call.winning_attempt
+            if isinstance(llm_call.error, GradeCancelled):
+                log_std("Grading job cancelled; discarding the LLM call.")
+                return self.finish_grade(ctx, self.cancelled_grade(), attempts=attempts, cancelled=True)
+            if llm_call.error is None:
+                response, tokens_in, tokens_out, tool_call_summary = llm_call.value
+                grade = response.model_dump()
+                log_std(f"Received response from {provider} (attempt {winning_attempt} of {attempts}).")
+            elif isinstance(llm_call.error, LLMClientInitError):
+                # Nothing was sent to the provider.
+                attempts = 0
+                grade = {
+                    "result": "error",
+                    "full_explanation": f"Failed to initialize LLM client: {llm_call.error}",
+                    "feedback": "Initialization failed."
+                }
+            else:
+                grade, timed_out = self.llm_failure_grade(
+                    provider, llm_call.error, timeout, model=model, retry_after=llm_call.retry_after
+                )
+
+            return self.finish_grade(
+                ctx,
+                grade,
+                tokens_in=tokens_in,
+                tokens_out=tokens_out,
+                timed_out=timed_out,
+                tool_call_summary=tool_call_summary,
+                attempts=attempts,
+                winning_attempt=winning_attempt,
+            )
+        finally:
+            # A logged submission releases the reservation; this covers a
+            # grade that raised before logging one.
+            self.release_admin_reservation(ctx)
+
+    @staticmethod
+    def cancelled_grade() -> dict:
+        message = "Grading was cancelled before the grader answered."
+        return {"result": "cancelled", "full_explanation": message, "feedback": message}
+
+    def make_llm_call_policy(self, ctx: dict, deadline_ts: float | None = None, *,
+                             cancel_event: threading.Event | None = None) -> LLMCaller:
+        """
+        Build the retry/hedging runner for one grade.
+
+        Without a job deadline the whole sequence gets the same budget a
+        single call had (``timeout + LLM_EXTRA_TIMEOUT_SECONDS``).  Retries
+        and hedged requests draw from the shared rate limiter, and 429
+        responses pause the ``(provider, model)`` bucket.
+        """
+        provider = ctx["provider"]
+        model = ctx["model"]
+        timeout = ctx["timeout"]
+        if deadline_ts is None:
+            deadline_ts = time.time() + timeout + self.LLM_EXTRA_TIMEOUT_SECONDS
+        tokens = self.rate_limiter.estimate_tokens(
+            ctx["task"], len(ctx["solution_images"]) + len(ctx["ref_solution_images"] or [])
+        )
+        return LLMCaller(
+            RetryPolicy.from_env(provider),
+            timeout=timeout,
+            deadline_ts=deadline_ts,
+            extra_timeout=self.LLM_EXTRA_TIMEOUT_SECONDS,
+            latency=self.llm_latency,
+            latency_key=(provider, model),
+            on_failure=lambda exc: self.rate_limiter.note_failure(provider, model, exc),
+            acquire_budget=lambda: self.rate_limiter.acquire(provider, model, tokens),
+            cancel_event=cancel_event,
+        )
+
+    def grade_context(
+            self,
+            question_dict: dict,
+            student_soln: str,
+            *,
+            part_label: str = "all",
+            unit_name: str = "",
+            qtag: str = "",
+            provider: str = "openai",
+            model: str = "gpt-4.1-mini",
+            api_key: str | None = None,
+            timeout: float = 20.,
+            solution_images: list[str] | None = None,
+            session_id: str | None = None) -> dict:
+        """
+        Build the grading context for a request: the prompt and every field
+        that is logged with the submission.  No API key is resolved.
+        """
         tools = question_dict.get("tools", [])
         parts = question_dict.get("parts", [])
-        rubrics = question_dict.get("rubrics", {})
-        rubric_total = question_dict.get("rubric_total")
-        part_labels = [part.get("part_label", "all") for part in parts]
-        max_points = [part.get("points", 0) for part in parts]
+        partial_credit = question_dict.get("partial_credit", False) is True
         if not qtag:
             qtag = str(question_dict.get("qtag", ""))
 
-        grade = None
-        tokens_in = 0
-        tokens_out = 0
-        timed_out = False
-        tool_call_summary = None
-        used_admin_key = False
-        t0 = time.time()
-
         task, max_points_part = self.build_task_prompt(
             question_dict,
             student_soln,
             part_label=part_label,
         )
 
+        return {
+            "t0": time.time(),
+            "question_text": str(question_dict.get("question_text", "")),
+            "solution": str(question_dict.get("solution", "")),
+            "grading_notes": str(question_dict.get("grading_notes", "")),
+            "required": question_dict.get("required", True) is not False,
+            "partial_credit": partial_credit,
+            "tools": tools,
+            "rubrics": question_dict.get("rubrics", {}),
+            "rubric_total": question_dict.get("rubric_total"),
+            "part_labels": [part.get("part_label", "all") for part in parts],
+            "ref_solution_images": question_dict.get("solution_images", []),
+            "student_soln": student_soln,
+            "part_label": part_label,
+            "unit_name": unit_name,
+            "qtag": qtag,
+            "provider": provider,
+            "model": model,
+            "api_key": api_key,
+            "used_admin_key": False,
+            "timeout": timeout,
+            "solution_images": solution_images or [],
+            "session_id": session_id,
+            "task": task,
+            "max_points_part": max_points_part,
+            "early_grade": None,
+            "cache_key": None,
+            "cached_grade": None,
+            "admin_reservation_id": None,
+            "submission_logged": False,
+        }
+
+    def prepare_grade(
+            self,
+            question_dict: dict,
+            student_soln: str,
+            *,
+            part_label: str = "all",
+            unit_name: str = "",
+            qtag: str = "",
+            provider: str = "openai",
+            model: str = "gpt-4.1-mini",
+            api_key: str | None = None,
+            timeout: float = 20.,
+            solution_images: list[str] | None = None,
+            session_id: str | None = None) -> dict:
+        """
+        Everything ``grade`` does before the LLM call.
+
+        Builds the prompt, looks up the grade cache and, on a miss, resolves
+        the API key (falling back to the admin key).  Shared with ``AsyncGrader`` so both engines grade identically.
+
+        Returns
+        -------
+        dict
+            Grading context passed to ``finish_grade``.  If ``early_grade`` is
+            not None, grading stops here and that result is returned without
+            calling the LLM or logging a submission.  If ``cached_grade`` is
+            not None, the question has the grade cache enabled and an identical
+            request was graded before; the caller skips the LLM and passes it
+            to ``finish_grade`` with ``cache_hit=True``.
+        """
+        ctx = self.grade_context(
+            question_dict,
+            student_soln,
+            part_label=part_label,
+            unit_name=unit_name,
+            qtag=qtag,
+            provider=provider,
+            model=model,
+            api_key=api_key,
+            timeout=timeout,
+            solution_images=solution_images,
+            session_id=session_id,
+        )
+        task = ctx["task"]
+        partial_credit = ctx["partial_credit"]
+        tools = ctx["tools"]
+
+        if question_dict.get("grade_cache"):
+            ctx["cache_key"] = GradeCache.make_key(
+                task=task,
+                provider=provider,
+                model=model,
+                tools=tools,
+                image_uris=list(ctx["ref_solution_images"] or []) + ctx["solution_images"],
+            )
+            ctx["cached_grade"] = self.grade_cache.get(ctx["cache_key"])
+            if ctx["cached_grade"] is not None:
+                # A cache hit sends no LLM request, so it needs no API key
+                # and draws nothing from the admin budget.
+                return ctx
+
         if provider == "openai" and not api_key:
-            admin_key, reason = self.get_admin_key(model)
+            ctx["admin_reservation_id"] = uuid.uuid4().hex
+            admin_key, reason = self.get_admin_key(
+                model,
+                estimated_tokens=self.rate_limiter.estimate_tokens(
+                    task, len(ctx["ref_solution_images"] or []) + len(ctx["solution_images"])
+                ),
+                reservation_id=ctx["admin_reservation_id"],
+            )
             if admin_key is None:
                 token = self.api_key_walkthrough()
-                return self.grade_post_process(
+                ctx["early_grade"] = self.grade_post_process(
                     {
                         "result": "error",
                         "full_explanation": token,
                         "feedback": reason or "",
                     },
                     partial_credit=partial_credit,
-                    max_points_part=max_points_part,
-                    part_labels=part_labels,
+                    max_points_part=ctx["max_points_part"],
+                    part_labels=ctx["part_labels"],
                     part_label=part_label,
-                    rubrics=rubrics,
-                    rubric_total=rubric_total,
+                    rubrics=ctx["rubrics"],
+                    rubric_total=ctx["rubric_total"],
                     tools=tools,
                 ).model_dump()
-            api_key = admin_key
-            used_admin_key = True
+                return ctx
+            ctx["api_key"] = admin_key
+            ctx["used_admin_key"] = True
 
-        # Only attempt API call if no error yet
-        if grade is None:
-            log_std(f'Calling {provider} for grading...')
-            
-            # Create the API call function
-            try:
-                call_llm = self._make_llm_caller(
-                    provider, model, api_key, task, timeout,
-                    tools=tools,
-                    solution_images=solution_images or [],
-                    ref_solution_images=question_dict.get("solution_images", []),
-                )
-            except Exception as e:
-                grade = {
-                    "result": "error",
-                    "full_explanation": f"Failed to initialize LLM client: {e}",
-                    "feedback": "Initialization failed."
-                }
+        return ctx
 
-        if grade is None:
+    def llm_failure_grade(self, provider: str, exc: Exception, timeout: float,
+                          model: str | None = None, retry_after: float | None = None) -> tuple[dict, bool]:
+        """
+        Convert an exception raised while waiting for the LLM into an error grade.
 
-            executor = ThreadPoolExecutor(max_workers=1)
-            future = executor.submit(call_llm)
-            
-            try:
-                additional_timeout = 5.0  # seconds
-                total_timeout = timeout + additional_timeout
-                
-                # Get the result with timeout
-                response, tokens_in, tokens_out, tool_call_summary = future.result(timeout=total_timeout)
-                grade = response.model_dump()
-                log_std(f"Received response from {provider}.")
-
-            except ThreadTimeoutError:
-                # Thread timed out
-                timed_out = True
-                log_error(f"Thread timed out after {total_timeout} seconds.")
-                explanation = (
-                    f"{provider} API did not respond within {total_timeout} seconds. "
-                    f"(timeout={timeout}, extra={additional_timeout})."
-                )
-                grade = {
-                    "result": "error",
-                    "full_explanation": explanation,
-                    "feedback": f"{provider} server not responding in time. Try again."
-                }
+        ``retry_after`` is the wait the rate limiter recorded for a rate-limit
+        response (``LLMCallResult.retry_after``); the failure was already
+        noted when the request failed, so it is not noted again here.
 
-            except APITimeoutError:
-                timed_out = True
-                log_error(f"{provider} API call timed out at the SDK level.")
-                # SDK-level timeout
-                explanation = (
-                    f"{provider} API responded with a timeout after {timeout} seconds."
-                )
-                grade = {
-                    "result": "error",
-                    "full_explanation": explanation,
-                    "feedback": "The grading request took too long to process."
-                }
-            
-            except Exception as e:
-                log_error(f"{provider} API call failed: {str(e)}")
-                grade = {
-                    'result': 'error', 
-                    'full_explanation': f'{provider} API call failed: {str(e)}', 
-                    'feedback': f'There was an error while trying to grade the solution using {provider}.'}
-            finally:
-                # IMPORTANT: do NOT overwrite grade here
-                executor.shutdown(wait=False, cancel_futures=True)
+        Returns
+        -------
+        tuple[dict, bool]
+            The raw grade dictionary and whether the failure was a timeout.
+        """
+        total_timeout = timeout + self.LLM_EXTRA_TIMEOUT_SECONDS
+        if isinstance(exc, (ThreadTimeoutError, asyncio.TimeoutError)):
+            # The call did not return within timeout + extra
+            log_error(f"Thread timed out after {total_timeout} seconds.")
+            explanation = (
+                f"{provider} API did not respond within {total_timeout} seconds. "
+                f"(timeout={timeout}, extra={self.LLM_EXTRA_TIMEOUT_SECONDS})."
+            )
+            return {
+                "result": "error",
+                "full_explanation": explanation,
+                "feedback": f"{provider} server not responding in time. Try again."
+            }, True
+
+        if isinstance(exc, APITimeoutError):
+            log_error(f"{provider} API call timed out at the SDK level.")
+            # SDK-level timeout
+            explanation = (
+                f"{provider} API responded with a timeout after {timeout} seconds."
+            )
+            return {
+                "result": "error",
+                "full_explanation": explanation,
+                "feedback": "The grading request took too long to process."
+            }, True
+
+        if retry_after is not None:
+            log_error(f"{provider} rate limit reached for {model}; retry after {retry_after:.1f}s.")
+            return {
+                "result": "error",
+                "full_explanation": f"{provider} API rate limit reached: {str(exc)}",
+                "feedback": (
+                    "The grading service is busy right now. "
+                    f"Please try again in about {max(1, math.ceil(retry_after))} seconds."
+                ),
+            }, False
 
-        grade = self.grade_post_process(
-            grade,
-            partial_credit=partial_credit,
-            max_points_part=max_points_part,
-            part_labels=part_labels,
-            part_label=part_label,
-            rubrics=rubrics,
-            rubric_total=rubric_total,
-            tools=tools,
-            tool_call_summary=tool_call_summary,
-        ).model_dump()
+        log_error(f"{provider} API call failed: {str(exc)}")
+        return {
+            'result': 'error', 
+            'full_explanation': f'{provider} API call failed: {str(exc)}', 
+            'feedback': f'There was an error while trying to grade the solution using {provider}.'}, False
+
+    def finish_grade(
+            self,
+            ctx: dict,
+            grade: dict,
+            *,
+            tokens_in: int = 0,
+            tokens_out: int = 0,
+            timed_out: bool = False,
+            tool_call_summary: str | None = None,
+            cache_hit: bool = False,
+            attempts: int = 0,
+            winning_attempt: int | None = None,
+            cancelled: bool = False) -> dict:
+        """
+        Everything ``grade`` does after the LLM call: post-process the raw
+        grade, save the response and images, and log the submission.
+
+        Successful LLM grades for cache-enabled questions are stored in the
+        grade cache.  Cache hits are logged with ``cache_hit=1`` and zero tokens.
+        Requests that waited on another student's identical grading job are
+        logged with ``coalesced=1`` (and ``cache_hit=0``) and zero tokens;
+        see ``log_coalesced_grade``.
+        ``attempts`` and ``winning_attempt`` record how many LLM requests were
+        sent (retries and hedges included) and which one produced the grade.
+        A ``cancelled`` grade is only logged, with ``result = 'cancelled'``.
+
+        With a ``submission_writer`` (see ``enable_submission_writer``), saving
+        the response and images and inserting the row happen in the
+        background, so the grade is returned as soon as it is post-processed.
+        """
+        if not cancelled:
+            if (
+                ctx.get("cache_key")
+                and not cache_hit
+                and not timed_out
+                and grade.get("result") != "error"
+            ):
+                try:
+                    self.grade_cache.put(
+                        ctx["cache_key"],
+                        model=ctx["model"],
+                        grade=grade,
+                        tool_call_summary=tool_call_summary,
+                        tokens_in=tokens_in,
+                        tokens_out=tokens_out,
+                    )
+                except sqlite3.Error as exc:
+                    log_error(f"Failed to store grade in cache: {exc}")
+
+            grade = self.grade_post_process(
+                grade,
+                partial_credit=ctx["partial_credit"],
+                max_points_part=ctx["max_points_part"],
+                part_labels=ctx["part_labels"],
+                part_label=ctx["part_label"],
+                rubrics=ctx["rubrics"],
+                rubric_total=ctx["rubric_total"],
+                tools=ctx["tools"],
+                tool_call_summary=tool_call_summary,
+            ).model_dump()
 
         # ---------------------------------------------------------
-        # 4. Save raw response to scratch/resp.json
-        # ---------------------------------------------------------
-        resp_path = os.path.join(self.scratch_dir, "resp.json")
-        with open(resp_path, "w", encoding="utf-8") as f:
-            f.write(json.dumps(grade, indent=2))
-        
-        # ---------------------------------------------------------
-        # 5. Persist student solution images to storage_path/soln_images/
+        # 4. Log submission to database (ALWAYS happens)
         # ---------------------------------------------------------
-        saved_image_paths = self.save_solution_images(solution_images or [])
+        self.log_submission(
+            ctx,
+            grade,
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            timed_out=timed_out,
+            cache_hit=cache_hit,
+            attempts=attempts,
+            winning_attempt=winning_attempt,
+            cancelled=cancelled,
+        )
+        return grade
 
-        # ---------------------------------------------------------
-        # 6. Log submission to database (ALWAYS happens)
-        # ---------------------------------------------------------
+    def log_coalesced_grade(self, grade: dict, session_ids: list[str], **grade_kwargs) -> None:
+        """
+        Log a submission for each request that was coalesced onto a finished
+        grading job (see ``GradeJobStore.enqueue_job``).
+
+        ``grade`` is the job's post-processed result and ``grade_kwargs`` the
+        job's ``grade`` arguments.  No LLM request was sent for these rows:
+        they are logged with ``coalesced=1`` and zero tokens.
+        """
+        grade_kwargs.pop("deadline_ts", None)
+        ctx = self.grade_context(**grade_kwargs)
+        for session_id in session_ids:
+            self.log_submission({**ctx, "session_id": session_id}, grade, coalesced=True)
+
+    def log_cancelled_grade(self, session_ids: list, **grade_kwargs) -> None:
+        """
+        Log a ``cancelled`` submission with zero tokens for each request of a
+        grading job that was cancelled before it started (see
+        ``GradeJobStore.on_queued_cancelled``).
+        """
+        grade_kwargs.pop("deadline_ts", None)
+        ctx = self.grade_context(**grade_kwargs)
+        for session_id in session_ids:
+            self.log_submission({**ctx, "session_id": session_id}, self.cancelled_grade(), cancelled=True)
+
+    def log_submission(
+            self,
+            ctx: dict,
+            grade: dict,
+            *,
+            tokens_in: int = 0,
+            tokens_out: int = 0,
+            timed_out: bool = False,
+            cache_hit: bool = False,
+            attempts: int = 0,
+            winning_attempt: int | None = None,
+            cancelled: bool = False,
+            coalesced: bool = False) -> None:
+        """
+        Save the response and images of a post-processed grade and log its
+        submission row; see ``finish_grade``.
+        """
         t1 = time.time()
-        latency_ms = int((t1 - t0) * 1000)
+        latency_ms = int((t1 - ctx["t0"]) * 1000)
         point_parts = grade.get("point_parts")
         max_point_parts = grade.get("max_point_parts")
         result_parts = grade.get("result_parts")
-        self.insert_submission(
+        tools = ctx["tools"]
+        record = dict(
             timestamp=datetime.now(timezone.utc).isoformat(),
-            client_id=session_id,
-            question_text=question_text,
-            ref_soln=solution,
-            grading_notes=grading_notes,
-            student_soln=student_soln,
-            part_label=part_label,
-            unit_name=unit_name,
-            qtag=qtag,
-            required=required,
-            partial_credit=partial_credit,
+            client_id=ctx["session_id"],
+            question_text=ctx["question_text"],
+            ref_soln=ctx["solution"],
+            grading_notes=ctx["grading_notes"],
+            student_soln=ctx["student_soln"],
+            part_label=ctx["part_label"],
+            unit_name=ctx["unit_name"],
+            qtag=ctx["qtag"],
+            required=ctx["required"],
+            partial_credit=ctx["partial_credit"],
             tools_json=json.dumps(tools if tools is not None else []),
-            model=model,
-            timeout=timeout,
+            model=ctx["model"],
+            timeout=ctx["timeout"],
             latency_ms=latency_ms,
-            raw_prompt=task,
+            raw_prompt=ctx["task"],
             result=grade.get("result", "error"),
             full_explanation=grade.get("full_explanation", ""),
             feedback=grade.get("feedback", ""),
@@ -1537,11 +2058,48 @@ class Grader:
             tokens_in = tokens_in,
             tokens_out = tokens_out,
             timed_out=1 if timed_out else 0,
-            used_admin_key=used_admin_key,
-            solution_image_paths_json=json.dumps(saved_image_paths) if saved_image_paths else None,
+            used_admin_key=ctx["used_admin_key"],
+            cache_hit=1 if cache_hit else 0,
+            coalesced=1 if coalesced else 0,
+            llm_attempts=attempts,
+            llm_winning_attempt=winning_attempt,
+            admin_reservation_id=ctx.get("admin_reservation_id"),
         )
-        
-        return grade
+
+        def save_files(record):
+            if cancelled:
+                return
+            # Save raw response to scratch/resp.json
+            resp_path = os.path.join(self.scratch_dir, "resp.json")
+            with open(resp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(grade, indent=2))
+
+            # Persist student solution images to storage_path/soln_images/
+            saved_image_paths = self.save_solution_images(ctx["solution_images"])
+            if saved_image_paths:
+                record["solution_image_paths_json"] = json.dumps(saved_image_paths)
+
+        if self.submission_writer is not None:
+            # Files and the INSERT happen on the writer thread; the grade is returned now.
+            self.submission_writer.submit(record, save_files)
+        else:
+            save_files(record)
+            self.insert_submission(**record)
+        ctx["submission_logged"] = True
+
+    def release_admin_reservation(self, ctx: dict) -> None:
+        """
+        Release the admin-key token reservation of a grade that ended without
+        logging a submission (an exception, or a cancelled async task).
+
+        A logged admin-key submission releases it itself (see
+        ``insert_submissions``).
+        """
+        if ctx.get("admin_reservation_id") and not ctx.get("submission_logged"):
+            try:
+                self.admin_usage.release(ctx["admin_reservation_id"])
+            except sqlite3.Error as exc:
+                log_error(f"Failed to release admin token reservation: {exc}")
         
     
     def load_solution_file(self, text):
@@ -1595,6 +2153,27 @@ class Grader:
         print("Using database path:", db_path)
         return db_path
 
+    def get_archive_path(self) -> str:
+        """
+        Returns the root directory of archived submission partitions.
+        The directory is created when the first partition is written.
+        """
+        return os.path.join(self.get_storage_path(), "archive", "submissions")
+
+    def get_snapshot_path(self) -> str:
+        """
+        Returns the path of the parsed solution package snapshot.
+        The directory is created when the first snapshot is written.
+        """
+        return os.path.join(self.get_storage_path(), "snapshots", "unit_package.json")
+
+    def get_package_versions_path(self) -> str:
+        """
+        Returns the directory of uploaded solution package versions.
+        The directory is created by the first upload.
+        """
+        return os.path.join(self.get_storage_path(), "soln_pkg_versions")
+
     def get_admin_pref_path(self) -> str:
         """
         Returns the full path to the admin preferences JSON file.
@@ -1674,36 +2253,87 @@ class Grader:
 
         return saved_paths
 
-    def load_admin_preferences(self) -> dict:
-        """
-        Load admin preferences from the JSON file at get_admin_pref_path().
-
-        Returns the stored dict on success, or a default dict if the file
-        does not exist or contains malformed JSON.
-        """
-        defaults = {
+    @staticmethod
+    def default_admin_preferences() -> dict:
+        return {
             "openaiApiKey": "",
             "hfToken": "",
             "allowedModels": [],
             "tokenLimit": {
                 "limit": 0,
                 "period": "unlimited"
-            }
+            },
+            "rateLimits": []
         }
 
-        path = self.get_admin_pref_path()
-        if not os.path.exists(path):
-            return defaults
+    def stored_admin_preferences(self) -> dict | None:
+        """
+        Return the preferences stored in admin-config.json, or None if the
+        file does not exist or contains malformed JSON.
 
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                prefs = json.load(f)
-                return prefs
-        except (json.JSONDecodeError, OSError):
-            return defaults
-            
+        The parsed file is cached in memory.  Within ADMIN_PREFS_CACHE_SECONDS
+        no disk access happens at all; after that the file's mtime and size
+        are compared and it is only re-read if it changed.  Returns a copy,
+        so callers may modify the result.
+        """
+        now = time.monotonic()
+        with self._admin_prefs_lock:
+            if (
+                self._admin_prefs_checked_at is not None
+                and now - self._admin_prefs_checked_at < self.ADMIN_PREFS_CACHE_SECONDS
+            ):
+                return copy.deepcopy(self._admin_prefs)
+
+            path = self.get_admin_pref_path()
+            try:
+                st = os.stat(path)
+                stamp = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamp = None
+
+            if stamp != self._admin_prefs_stamp or self._admin_prefs_checked_at is None:
+                prefs = None
+                if stamp is not None:
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            prefs = json.load(f)
+                    except (json.JSONDecodeError, OSError):
+                        prefs = None
+                self._admin_prefs = prefs if isinstance(prefs, dict) else None
+                self._admin_prefs_stamp = stamp
+            self._admin_prefs_checked_at = now
+            return copy.deepcopy(self._admin_prefs)
+
+    def load_admin_preferences(self) -> dict:
+        """
+        Load admin preferences from the JSON file at get_admin_pref_path().
+
+        Returns the stored dict on success, or a default dict if the file
+        does not exist or contains malformed JSON.  Served from memory; see
+        stored_admin_preferences.
+        """
+        prefs = self.stored_admin_preferences()
+        return prefs if prefs is not None else self.default_admin_preferences()
+
+    def save_admin_preferences(self, prefs: dict) -> None:
+        """
+        Write admin preferences and update the in-memory copy.
+
+        The file is replaced atomically, so other processes never read a
+        partly written file.  Raises OSError if it cannot be written.
+        """
+        path = self.get_admin_pref_path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self._admin_prefs_lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(prefs, f, indent=2)
+            os.replace(tmp_path, path)
+            st = os.stat(path)
+            self._admin_prefs = copy.deepcopy(prefs)
+            self._admin_prefs_stamp = (st.st_mtime_ns, st.st_size)
+            self._admin_prefs_checked_at = time.monotonic()
+        self.rate_limiter.invalidate()
 
-    
     @staticmethod
     def initialize_field_format():
         # 1. Validate FIELD_FORMAT keys are real DB fields
@@ -0,0 +1,417 @@
+import hashlib
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable
+
+import httpcore
+import httpx
+
+
+def _close_client(client: Any) -> None:
+    close = getattr(client, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception as exc:
+            print(f"[LLMClientRegistry] Failed to close client: {exc}")
+
+
+class _Entry:
+    __slots__ = ("client", "last_used", "leases", "evicted")
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.leases = 0
+        self.evicted = False
+
+
+class LLMClientRegistry:
+    """
+    Thread-safe LRU pool of LLM clients keyed by provider and API key.
+
+    Building an SDK client (and its connection pool) for every grade forces
+    a new TCP + TLS handshake per request.  The registry keeps one client per
+    ``(provider, sha256(api_key))`` so keep-alive connections are reused
+    across grades.  Only the key hash is used for lookup; the raw key lives
+    only inside the client object.
+
+    Clients are handed out with ``lease``.  Idle clients are evicted when
+    they have not been used for ``idle_timeout`` seconds or when more than
+    ``max_clients`` are cached (least recently used first).  A client that
+    is evicted while leased is closed when its last lease ends.
+
+    Parameters
+    ----------
+    factories: dict[str, Callable[[str], Any]]
+        Provider name -> function building a client for an API key.
+    max_clients: int
+        Maximum number of cached clients.
+    idle_timeout: float
+        Seconds after which an unused client is evicted.
+    close_client: Callable[[Any], None] | None
+        Called on evicted clients; defaults to calling ``client.close()``.
+    """
+
+    DEFAULT_MAX_CLIENTS = 64
+    DEFAULT_IDLE_TIMEOUT_SECONDS = 900.0
+
+    def __init__(
+        self,
+        factories: dict[str, Callable[[str], Any]],
+        *,
+        max_clients: int = DEFAULT_MAX_CLIENTS,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT_SECONDS,
+        close_client: Callable[[Any], None] | None = _close_client,
+    ):
+        self.factories = dict(factories)
+        self.max_clients = max(1, int(max_clients))
+        self.idle_timeout = idle_timeout
+        self.close_client = close_client
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key_for(provider: str, api_key: str | None) -> tuple[str, str]:
+        digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+        return provider, digest
+
+    @contextmanager
+    def lease(self, provider: str, api_key: str | None):
+        """
+        Borrow the pooled client for ``(provider, api_key)``, creating it on a miss.
+        """
+        entry = self._acquire(provider, api_key)
+        try:
+            yield entry.client
+        finally:
+            self._release(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "clients": len(self._entries),
+                "max_clients": self.max_clients,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+            }
+
+    def clear(self) -> None:
+        """
+        Evict every client, e.g. on shutdown.
+        """
+        with self._lock:
+            to_close = [self._evict_locked(key) for key in list(self._entries)]
+        self._close_all(to_close)
+
+    def _acquire(self, provider: str, api_key: str | None) -> _Entry:
+        factory = self.factories.get(provider)
+        if factory is None:
+            raise ValueError(f"Unknown provider '{provider}'")
+
+        key = self.key_for(provider, api_key)
+        with self._lock:
+            to_close = self._evict_idle_locked()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._hits += 1
+                self._entries.move_to_end(key)
+            else:
+                self._misses += 1
+                # Build under the lock so concurrent misses for the same key
+                # do not create duplicate connection pools.  Client
+                # construction does not do network I/O.
+                entry = _Entry(factory(api_key))
+                self._entries[key] = entry
+                while len(self._entries) > self.max_clients:
+                    oldest_key = next(iter(self._entries))
+                    to_close.append(self._evict_locked(oldest_key))
+            entry.leases += 1
+            entry.last_used = time.monotonic()
+        self._close_all(to_close)
+        return entry
+
+    def _release(self, entry: _Entry) -> None:
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            close_now = entry.evicted and entry.leases == 0
+        if close_now:
+            self._close_all([entry])
+
+    def _evict_idle_locked(self) -> list:
+        now = time.monotonic()
+        expired = [
+            key for key, entry in self._entries.items()
+            if entry.leases == 0 and now - entry.last_used > self.idle_timeout
+        ]
+        return [self._evict_locked(key) for key in expired]
+
+    def _evict_locked(self, key) -> _Entry | None:
+        """
+        Drop a cached client; returns it if it should be closed right away.
+        Leased clients are closed by their last ``_release`` instead.
+        """
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        self._evictions += 1
+        return entry if entry.leases == 0 else None
+
+    def _close_all(self, entries: list) -> None:
+        if self.close_client is None:
+            return
+        for entry in entries:
+            if entry is not None:
+                self.close_client(entry.client)
+
+
+@lru_cache(maxsize=1)
+def _default_ssl_context() -> ssl.SSLContext:
+    # Loading the CA bundle takes a few milliseconds; the context is thread-safe.
+    return httpx.create_ssl_context()
+
+
+# The AbortScope active on the current thread, if any.
+_local = threading.local()
+
+
+class AbortScope:
+    """
+    The in-flight LLM requests of one grading job.
+
+    Requests sent inside ``active()`` over an ``AbortableTransport`` claim
+    the pooled connection they are using.  ``abort`` shuts down just those
+    connections, from any thread: a request blocked waiting for the provider
+    fails at once, while other jobs' requests on the same pool carry on.
+    A request started after ``abort`` fails before it is sent.
+
+    Closing a client would not help here: it neither wakes a thread blocked
+    in ``recv`` nor leaves the pool usable for other jobs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams: dict[int, set] = {}
+        self.aborted = False
+
+    @contextmanager
+    def active(self):
+        """
+        Attribute the requests made by the current thread to this scope.
+        """
+        previous = getattr(_local, "scope", None)
+        _local.scope = self
+        try:
+            yield self
+        finally:
+            _local.scope = previous
+            owner = (self, threading.get_ident())
+            with self._lock:
+                streams = self._streams.pop(owner[1], ())
+            # The responses are read; the connections go back to other jobs.
+            for stream in streams:
+                stream._disown(owner)
+
+    def abort(self) -> None:
+        with self._lock:
+            self.aborted = True
+            streams = [stream for group in self._streams.values() for stream in group]
+        for stream in streams:
+            stream._shutdown_if_owned_by(self)
+
+    def _track(self, stream: "_AbortableStream") -> bool:
+        with self._lock:
+            if self.aborted:
+                return False
+            self._streams.setdefault(threading.get_ident(), set()).add(stream)
+            return True
+
+
+def _active_scope() -> AbortScope | None:
+    return getattr(_local, "scope", None)
+
+
+class _AbortableStream(httpcore.NetworkStream):
+    """
+    Pooled connection that records which ``AbortScope`` is using it.
+    """
+
+    def __init__(self, stream: httpcore.NetworkStream):
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._owner: tuple[AbortScope, int] | None = None
+
+    def _claim(self, error: type[Exception]) -> None:
+        scope = _active_scope()
+        with self._lock:
+            self._owner = None if scope is None else (scope, threading.get_ident())
+        if scope is not None and not scope._track(self):
+            self._shutdown()
+            raise error("Request aborted.")
+
+    def _disown(self, owner: tuple[AbortScope, int]) -> None:
+        with self._lock:
+            if self._owner == owner:
+                self._owner = None
+
+    def _shutdown_if_owned_by(self, scope: AbortScope) -> None:
+        with self._lock:
+            if self._owner is not None and self._owner[0] is scope:
+                self._shutdown()
+
+    def _shutdown(self) -> None:
+        sock = self._stream.get_extra_info("socket")
+        try:
+            # Closing a socket does not wake a thread blocked reading it; shutdown does.
+            sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+    def read(self, max_bytes: int, timeout: float | None = None) -> bytes:
+        self._claim(httpcore.ReadError)
+        return self._stream.read(max_bytes, timeout)
+
+    def write(self, buffer: bytes, timeout: float | None = None) -> None:
+        self._claim(httpcore.WriteError)
+        self._stream.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(self, ssl_context: ssl.SSLContext, server_hostname: str | None = None,
+                  timeout: float | None = None) -> httpcore.NetworkStream:
+        return _AbortableStream(self._stream.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info: str) -> Any:
+        return self._stream.get_extra_info(info)
+
+
+class _AbortableBackend(httpcore.NetworkBackend):
+    def __init__(self):
+        self._backend = httpcore.SyncBackend()
+
+    @staticmethod
+    def _check_scope() -> None:
+        scope = _active_scope()
+        if scope is not None and scope.aborted:
+            raise httpcore.ConnectError("Request aborted.")
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self._check_scope()
+        return _AbortableStream(self._backend.connect_tcp(host, port, timeout, local_address, socket_options))
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        self._check_scope()
+        return _AbortableStream(self._backend.connect_unix_socket(path, timeout, socket_options))
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+# httpcore exceptions and the httpx exceptions they surface as, most specific first.
+_HTTPCORE_EXCEPTIONS = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+
+
+@contextmanager
+def _map_httpcore_exceptions():
+    try:
+        yield
+    except Exception as exc:
+        for core_exc, httpx_exc in _HTTPCORE_EXCEPTIONS:
+            if isinstance(exc, core_exc):
+                raise httpx_exc(str(exc)) from exc
+        raise
+
+
+class _ResponseStream(httpx.SyncByteStream):
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __iter__(self):
+        with _map_httpcore_exceptions():
+            for part in self._stream:
+                yield part
+
+    def close(self) -> None:
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+
+
+class AbortableTransport(httpx.BaseTransport):
+    """
+    Keep-alive connection pool whose requests can be aborted per grading
+    job (see ``AbortScope``).
+
+    Built on httpcore's public ``ConnectionPool`` with a network backend that
+    tracks which scope uses each connection.  Proxy environment variables are
+    not applied.
+    """
+
+    def __init__(self, *, max_connections: int = 10, max_keepalive_connections: int | None = None,
+                 keepalive_expiry: float = 5.0):
+        self._pool = httpcore.ConnectionPool(
+            ssl_context=_default_ssl_context(),
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+            network_backend=_AbortableBackend(),
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _map_httpcore_exceptions():
+            core_response = self._pool.handle_request(core_request)
+        return httpx.Response(
+            status_code=core_response.status,
+            headers=core_response.headers,
+            stream=_ResponseStream(core_response.stream),
+            extensions=core_response.extensions,
+        )
+
+    def close(self) -> None:
+        self._pool.close()
+
+
+def make_http_client(*, max_connections: int = 10, **kwargs) -> httpx.Client:
+    """
+    ``httpx.Client`` on an ``AbortableTransport``, for the pooled LLM clients.
+    """
+    return httpx.Client(transport=AbortableTransport(max_connections=max_connections), **kwargs)
@@ -0,0 +1,439 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as ThreadTimeoutError
+from concurrent.futures import wait as wait_futures
+from typing import Any, Awaitable, Callable
+
+import httpx
+import requests
+from openai import APIConnectionError, APITimeoutError
+
+
+# HTTP statuses worth another attempt: timeouts, conflicts, rate limits and
+# server-side failures.
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class MalformedLLMResponse(ValueError):
+    """
+    The LLM answered, but not with a valid grading JSON object.
+    """
+
+
+class LLMClientInitError(Exception):
+    """
+    The LLM request or client could not be built; nothing was sent.
+    """
+
+
+class GradeCancelled(Exception):
+    """
+    The grading job was cancelled while its LLM request was in flight.
+    """
+
+
+class RetryPolicy:
+    """
+    Retry and hedging settings for one LLM provider.
+
+    Transient failures (HTTP 408/409/429/5xx, dropped connections) and, if
+    ``retry_malformed`` is set, responses that are not valid grading JSON
+    are retried up to ``max_attempts`` requests in total.  Retries wait a
+    jittered exponential backoff (and at least the provider's
+    ``Retry-After``).  Timeouts are not retried; hedging covers slow calls.
+
+    With ``hedge`` enabled, a second identical request is sent if the first
+    has not answered after the provider's recent p95 latency; whichever
+    answers first wins and the other is cancelled.
+
+    Settings come from ``LLMGRADER_LLM_MAX_ATTEMPTS`` and
+    ``LLMGRADER_LLM_HEDGE``; a ``_<PROVIDER>`` suffix (e.g.
+    ``LLMGRADER_LLM_MAX_ATTEMPTS_HF``) overrides them for one provider.
+
+    Parameters
+    ----------
+    max_attempts: int
+        Maximum number of requests per grade, including retries and hedges.
+    base_delay: float
+        Backoff before the first retry, doubled for each further retry.
+    max_delay: float
+        Upper bound on the backoff.
+    retry_malformed: bool
+        Whether to retry responses that fail JSON validation.
+    hedge: bool
+        Whether to send a hedged second request.
+    hedge_min_delay: float
+        Never hedge earlier than this many seconds.
+    """
+
+    DEFAULT_MAX_ATTEMPTS = 3
+    DEFAULT_BASE_DELAY_SECONDS = 0.5
+    DEFAULT_MAX_DELAY_SECONDS = 8.0
+    DEFAULT_HEDGE_MIN_DELAY_SECONDS = 1.0
+    # Do not start an attempt with less time than this left before the deadline.
+    MIN_ATTEMPT_SECONDS = 2.0
+
+    def __init__(self, *, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 base_delay: float = DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay: float = DEFAULT_MAX_DELAY_SECONDS,
+                 retry_malformed: bool = True,
+                 hedge: bool = False,
+                 hedge_min_delay: float = DEFAULT_HEDGE_MIN_DELAY_SECONDS):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self.retry_malformed = retry_malformed
+        self.hedge = hedge
+        self.hedge_min_delay = max(0.0, hedge_min_delay)
+
+    @classmethod
+    def from_env(cls, provider: str | None) -> "RetryPolicy":
+        suffix = f"_{provider.upper()}" if provider else ""
+
+        def read(name: str) -> str | None:
+            return os.environ.get(f"LLMGRADER_LLM_{name}{suffix}") or os.environ.get(f"LLMGRADER_LLM_{name}")
+
+        try:
+            max_attempts = int(read("MAX_ATTEMPTS") or cls.DEFAULT_MAX_ATTEMPTS)
+        except ValueError:
+            max_attempts = cls.DEFAULT_MAX_ATTEMPTS
+        hedge = (read("HEDGE") or "").strip().lower() in ("1", "true", "yes", "on")
+        return cls(max_attempts=max_attempts, hedge=hedge)
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, MalformedLLMResponse):
+            return self.retry_malformed
+        if isinstance(exc, (ThreadTimeoutError, asyncio.TimeoutError, APITimeoutError,
+                            httpx.TimeoutException, requests.Timeout)):
+            return False
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+        if status is None:
+            status = getattr(exc, "status_code", None)
+        if status is not None:
+            return status in RETRYABLE_STATUS_CODES
+        return isinstance(exc, (APIConnectionError, httpx.TransportError, requests.ConnectionError))
+
+    def backoff(self, retry_number: int, retry_after: float | None = None) -> float:
+        """
+        Full-jitter exponential backoff before retry ``retry_number`` (1-based).
+        """
+        cap = min(self.max_delay, self.base_delay * (2 ** (retry_number - 1)))
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful LLM call latencies per ``(provider, model)``,
+    used to pick the hedging delay.
+    """
+
+    WINDOW = 200
+    MIN_SAMPLES = 20
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: dict[tuple[str, str], deque] = {}
+
+    def record(self, key: tuple[str, str], seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.WINDOW)).append(seconds)
+
+    def quantile(self, key: tuple[str, str], q: float) -> float | None:
+        """
+        Return the ``q`` quantile, or None until ``MIN_SAMPLES`` calls were seen.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class LLMCallResult:
+    """
+    Outcome of ``LLMCaller.call``: either ``value`` or the last ``error``,
+    plus how many requests were sent and which one won (1-based).
+    ``retry_after`` is the wait ``on_failure`` returned for the last failure
+    (e.g. a rate limit), or None.
+    """
+
+    __slots__ = ("value", "error", "attempts", "winning_attempt", "retry_after")
+
+    def __init__(self, value: Any = None, error: BaseException | None = None,
+                 attempts: int = 0, winning_attempt: int | None = None,
+                 retry_after: float | None = None):
+        self.value = value
+        self.error = error
+        self.attempts = attempts
+        self.winning_attempt = winning_attempt
+        self.retry_after = retry_after
+
+
+class LLMCaller:
+    """
+    Runs one LLM request with retries and optional hedging inside a deadline.
+
+    Parameters
+    ----------
+    policy: RetryPolicy
+        Retry and hedging settings.
+    timeout: float
+        Per-request timeout.
+    deadline_ts: float
+        Wall-clock time by which the whole sequence must finish.
+    extra_timeout: float
+        Slack allowed on top of a request's own timeout before giving up on it.
+    latency: LatencyTracker | None
+        Latency history for the hedging delay; successful calls are recorded.
+    latency_key: tuple[str, str]
+        ``(provider, model)`` key into ``latency``.
+    on_failure: Callable[[BaseException], float | None] | None
+        Called once with each failed request; may return a provider-requested
+        wait in seconds.
+    acquire_budget: Callable[[], float] | None
+        Called before each retry or hedge; returns the rate-limit wait, or 0
+        once it has reserved budget for the request.  Retries wait and call
+        it again until it returns 0; hedges are skipped instead.
+    cancel_event: threading.Event | None
+        Set to abandon the call (thread engine); the asyncio engine is
+        cancelled through its task instead.
+    """
+
+    HEDGE_QUANTILE = 0.95
+    # How often the thread engine checks ``cancel_event`` while waiting.
+    CANCEL_POLL_SECONDS = 0.2
+
+    def __init__(self, policy: RetryPolicy, *, timeout: float, deadline_ts: float, extra_timeout: float,
+                 latency: LatencyTracker | None = None, latency_key: tuple[str, str] = ("", ""),
+                 on_failure: Callable[[BaseException], float | None] | None = None,
+                 acquire_budget: Callable[[], float] | None = None,
+                 cancel_event: threading.Event | None = None):
+        self.policy = policy
+        self.timeout = timeout
+        self.deadline_ts = deadline_ts
+        self.extra_timeout = extra_timeout
+        self.latency = latency
+        self.latency_key = latency_key
+        self.on_failure = on_failure
+        self.acquire_budget = acquire_budget
+        self.cancel_event = cancel_event
+        self._retry_after: float | None = None
+
+    # ------------------------------------------------------------------
+    # Shared decisions
+    # ------------------------------------------------------------------
+    def _attempt_timeout(self, first: bool) -> float | None:
+        remaining = self.deadline_ts - time.time() - self.extra_timeout
+        if remaining < self.policy.MIN_ATTEMPT_SECONDS:
+            # The first request always goes out, as it did before retries existed.
+            return min(self.timeout, self.policy.MIN_ATTEMPT_SECONDS) if first else None
+        return min(self.timeout, remaining)
+
+    def _hedge_delay(self, attempts: int) -> float | None:
+        if not self.policy.hedge or attempts >= self.policy.max_attempts or self.latency is None:
+            return None
+        p95 = self.latency.quantile(self.latency_key, self.HEDGE_QUANTILE)
+        if p95 is None:
+            return None
+        return max(self.policy.hedge_min_delay, p95)
+
+    def _may_hedge(self) -> bool:
+        if self.deadline_ts - time.time() - self.extra_timeout < self.policy.MIN_ATTEMPT_SECONDS:
+            return False
+        return self.acquire_budget is None or self.acquire_budget() == 0.0
+
+    def _note_failure(self, exc: BaseException) -> None:
+        self._retry_after = self.on_failure(exc) if self.on_failure is not None else None
+
+    def _fits_deadline(self, delay: float) -> bool:
+        return time.time() + delay + self.policy.MIN_ATTEMPT_SECONDS + self.extra_timeout <= self.deadline_ts
+
+    def _retry_delay(self, exc: BaseException, attempts: int) -> float | None:
+        """
+        Backoff before retrying after ``exc``, or None to give up.
+        """
+        if attempts >= self.policy.max_attempts or not self.policy.is_retryable(exc):
+            return None
+        delay = self.policy.backoff(attempts, self._retry_after)
+        return delay if self._fits_deadline(delay) else None
+
+    def _budget_wait(self) -> float | None:
+        """
+        0 once a retry may start (budget reserved), the rate-limit wait
+        before asking again, or None if that wait would pass the deadline.
+        """
+        if self.acquire_budget is None:
+            return 0.0
+        wait = self.acquire_budget()
+        if wait == 0.0:
+            return 0.0
+        return wait if self._fits_deadline(wait) else None
+
+    def _result(self, value: Any = None, error: BaseException | None = None, attempts: int = 0,
+                winning_attempt: int | None = None) -> LLMCallResult:
+        return LLMCallResult(value, error, attempts, winning_attempt,
+                             retry_after=self._retry_after if error is not None else None)
+
+    def _record_latency(self, started: float) -> None:
+        if self.latency is not None:
+            self.latency.record(self.latency_key, time.time() - started)
+
+    # ------------------------------------------------------------------
+    # Thread engine
+    # ------------------------------------------------------------------
+    def _cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _wait_threads(self, futures, timeout: float, return_when=FIRST_COMPLETED) -> set:
+        """
+        ``concurrent.futures.wait`` that raises ``GradeCancelled`` as soon as
+        ``cancel_event`` is set.
+        """
+        give_up_at = time.time() + max(0.0, timeout)
+        while True:
+            remaining = give_up_at - time.time()
+            step = remaining if self.cancel_event is None else min(remaining, self.CANCEL_POLL_SECONDS)
+            done, _ = wait_futures(futures, timeout=max(0.0, step), return_when=return_when)
+            if done:
+                return done
+            if self._cancelled():
+                raise GradeCancelled()
+            if remaining <= 0:
+                return done
+
+    def call(self, make_request: Callable[[float], Any]) -> LLMCallResult:
+        """
+        Run ``make_request(attempt_timeout)`` on worker threads.
+
+        A losing hedged request, a timed-out one, or any request once
+        ``cancel_event`` is set, is abandoned: no further attempts start and
+        its result is discarded.  Closing its connection is up to the caller
+        (``Grader.grade`` aborts the job's HTTP client when this returns).
+        """
+        executor = ThreadPoolExecutor(max_workers=2 if self.policy.hedge else 1)
+        attempts = 0
+        last_exc = None
+        running = {}
+        try:
+            while True:
+                if self._cancelled():
+                    raise GradeCancelled()
+                attempt_timeout = self._attempt_timeout(first=attempts == 0)
+                if attempt_timeout is None:
+                    return self._result(error=last_exc, attempts=attempts)
+                attempts += 1
+                started = time.time()
+                running = {executor.submit(make_request, attempt_timeout): attempts}
+                give_up_at = started + attempt_timeout + self.extra_timeout
+
+                hedge_delay = self._hedge_delay(attempts)
+                if hedge_delay is not None:
+                    done = self._wait_threads(running, min(hedge_delay, give_up_at - time.time()))
+                    if not done and self._may_hedge():
+                        attempts += 1
+                        hedge_timeout = min(attempt_timeout, give_up_at - time.time() - self.extra_timeout)
+                        running[executor.submit(make_request, max(0.1, hedge_timeout))] = attempts
+
+                last_exc = None
+                while running:
+                    done = self._wait_threads(running, give_up_at - time.time())
+                    if not done:
+                        break
+                    for future in done:
+                        number = running.pop(future)
+                        exc = future.exception()
+                        if exc is None:
+                            self._record_latency(started)
+                            return self._result(future.result(), attempts=attempts, winning_attempt=number)
+                        self._note_failure(exc)
+                        last_exc = exc
+
+                if running:
+                    return self._result(error=ThreadTimeoutError(), attempts=attempts)
+
+                # Back off, then wait until the rate limiter has budget for the retry.
+                delay = self._retry_delay(last_exc, attempts)
+                while delay is not None:
+                    if self.cancel_event is not None:
+                        self.cancel_event.wait(delay)
+                    else:
+                        time.sleep(delay)
+                    if self._cancelled():
+                        raise GradeCancelled()
+                    delay = self._budget_wait()
+                    if delay == 0.0:
+                        break
+                if delay is None:
+                    return self._result(error=last_exc, attempts=attempts)
+        except GradeCancelled as exc:
+            return self._result(error=exc, attempts=attempts)
+        finally:
+            for loser in running:
+                loser.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------------
+    # Asyncio engine
+    # ------------------------------------------------------------------
+    async def call_async(self, make_request: Callable[[float], Awaitable[Any]]) -> LLMCallResult:
+        """
+        Async counterpart of ``call``; losing requests are cancelled.
+        """
+        attempts = 0
+        last_exc = None
+        while True:
+            attempt_timeout = self._attempt_timeout(first=attempts == 0)
+            if attempt_timeout is None:
+                return self._result(error=last_exc, attempts=attempts)
+            attempts += 1
+            started = time.time()
+            running = {asyncio.ensure_future(make_request(attempt_timeout)): attempts}
+            give_up_at = started + attempt_timeout + self.extra_timeout
+
+            try:
+                hedge_delay = self._hedge_delay(attempts)
+                if hedge_delay is not None:
+                    done, _ = await asyncio.wait(running, timeout=min(hedge_delay, give_up_at - time.time()))
+                    if not done and await asyncio.to_thread(self._may_hedge):
+                        attempts += 1
+                        hedge_timeout = min(attempt_timeout, give_up_at - time.time() - self.extra_timeout)
+                        running[asyncio.ensure_future(make_request(max(0.1, hedge_timeout)))] = attempts
+
+                last_exc = None
+                while running:
+                    done, _ = await asyncio.wait(running, timeout=max(0.0, give_up_at - time.time()),
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        break
+                    for task in done:
+                        number = running.pop(task)
+                        exc = task.exception()
+                        if exc is None:
+                            self._record_latency(started)
+                            return self._result(task.result(), attempts=attempts, winning_attempt=number)
+                        await asyncio.to_thread(self._note_failure, exc)
+                        last_exc = exc
+
+                if running:
+                    return self._result(error=asyncio.TimeoutError(), attempts=attempts)
+            finally:
+                for task in running:
+                    task.cancel()
+
+            delay = self._retry_delay(last_exc, attempts)
+            while delay is not None:
+                await asyncio.sleep(delay)
+                delay = await asyncio.to_thread(self._budget_wait)
+                if delay == 0.0:
+                    break
+            if delay is None:
+                return self._result(error=last_exc, attempts=attempts)
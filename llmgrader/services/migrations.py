@@ -0,0 +1,276 @@
+"""
+Numbered schema migrations for ``llmgrader.db``.
+
+The schema version is stored in ``PRAGMA user_version``.  On startup
+:func:`migrate` applies, in order, every migration newer than that version.
+Each migration runs in its own transaction together with the version bump,
+so it runs exactly once even when several processes (gunicorn workers,
+``llmgrader_worker``) start against the same database.
+
+The ``submissions`` table itself is created by ``Grader.init_db`` from
+``Grader.DB_SCHEMA``, so a new database already has every current column.
+Migrations bring older databases up to date and add indexes.  To change the
+schema, append a migration with the next version number; never edit or
+renumber a migration that has shipped.
+
+Since migration 4, ``submissions`` is a view over ``submission_rows`` and
+``blobs`` (see ``blob_store.py``).  A migration that adds a submissions
+column must add it to ``submission_rows`` and then call
+:func:`recreate_submissions_view`.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Callable, NamedTuple
+
+from llmgrader.services.blob_store import (
+    SUBMISSION_BLOB_COLUMNS,
+    content_hash,
+    hash_column,
+    submissions_view_sql,
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+    # Run VACUUM after the migration commits to return freed pages to the OS.
+    vacuum: bool = False
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column_if_missing(conn: sqlite3.Connection, table: str, name: str, col_type: str) -> None:
+    """
+    Add a column unless it exists, e.g. because a new database was created
+    from the current ``DB_SCHEMA``.
+    """
+    if name not in table_columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type} DEFAULT NULL")
+
+
+def _submissions_baseline_columns(conn: sqlite3.Connection) -> None:
+    # Bring any older submissions table up to the schema as of the first
+    # migration (replaces Grader.temp_modify_db), then repeat its privacy
+    # scrub of stored emails.
+    for name, col_type in (
+        ("client_id", "TEXT"),
+        ("unit_name", "TEXT"),
+        ("qtag", "TEXT"),
+        ("part_label", "TEXT"),
+        ("required", "INTEGER"),
+        ("partial_credit", "INTEGER"),
+        ("question_text", "TEXT"),
+        ("ref_soln", "TEXT"),
+        ("grading_notes", "TEXT"),
+        ("student_soln", "TEXT"),
+        ("model", "TEXT"),
+        ("timeout", "REAL"),
+        ("latency_ms", "INTEGER"),
+        ("timed_out", "INTEGER"),
+        ("tokens_in", "INTEGER"),
+        ("tokens_out", "INTEGER"),
+        ("used_admin_key", "INTEGER"),
+        ("raw_prompt", "TEXT"),
+        ("result", "TEXT"),
+        ("full_explanation", "TEXT"),
+        ("feedback", "TEXT"),
+        ("point_parts_json", "TEXT"),
+        ("max_point_parts_json", "TEXT"),
+        ("points", "REAL"),
+        ("max_points", "REAL"),
+        ("result_parts_json", "TEXT"),
+        ("tools_json", "TEXT"),
+        ("solution_image_paths_json", "TEXT"),
+        ("cache_hit", "INTEGER"),
+        ("llm_attempts", "INTEGER"),
+        ("llm_winning_attempt", "INTEGER"),
+    ):
+        add_column_if_missing(conn, "submissions", name, col_type)
+
+    if "user_email" in table_columns(conn, "submissions"):
+        conn.execute("UPDATE submissions SET user_email = NULL WHERE user_email IS NOT NULL")
+
+
+def _submissions_indexes(conn: sqlite3.Connection, table: str = "submissions") -> None:
+    # Admin-key token usage: WHERE used_admin_key = 1 AND timestamp >= ?
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_submissions_admin_key_ts ON {table} (used_admin_key, timestamp)"
+    )
+    # Per-unit / per-question analytics, newest first
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_submissions_unit_qtag_ts ON {table} (unit_name, qtag, timestamp)"
+    )
+    # Per-session lookups
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_submissions_client_ts ON {table} (client_id, timestamp)"
+    )
+
+
+def _admin_token_ledger(conn: sqlite3.Connection) -> None:
+    # See AdminUsageLedger: per-minute and per-hour admin-key token totals,
+    # plus tokens reserved by grades still in flight.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS admin_token_usage (
+            bucket_seconds INTEGER NOT NULL,
+            bucket_start_ts INTEGER NOT NULL,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_seconds, bucket_start_ts)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS admin_token_reservations (
+            reservation_id TEXT PRIMARY KEY,
+            tokens INTEGER NOT NULL,
+            expires_at_ts REAL NOT NULL
+        )
+        """
+    )
+    # Backfill the buckets from the last month of admin-key submissions.
+    for bucket_seconds, history_seconds in ((60, 2 * 3600), (3600, 32 * 86400)):
+        conn.execute(
+            """
+            INSERT INTO admin_token_usage (bucket_seconds, bucket_start_ts, tokens)
+            SELECT ?, bucket_start_ts, SUM(tokens)
+            FROM (
+                SELECT CAST(strftime('%s', substr(timestamp, 1, 19)) AS INTEGER) / ? * ? AS bucket_start_ts,
+                       COALESCE(tokens_in, 0) + COALESCE(tokens_out, 0) AS tokens
+                FROM submissions
+                WHERE used_admin_key = 1 AND timestamp >= strftime('%Y-%m-%dT%H:%M:%S', 'now', ?)
+            )
+            WHERE bucket_start_ts IS NOT NULL
+            GROUP BY bucket_start_ts
+            """,
+            (bucket_seconds, bucket_seconds, bucket_seconds, f"-{history_seconds} seconds"),
+        )
+
+
+def recreate_submissions_view(conn: sqlite3.Connection) -> None:
+    conn.execute("DROP VIEW IF EXISTS submissions")
+    conn.execute(submissions_view_sql(table_columns(conn, "submission_rows")))
+
+
+def _submissions_blobs(conn: sqlite3.Connection) -> None:
+    # Move the repeated question text, reference solution, grading notes and
+    # prompt into content-addressed blobs.  submission_rows keeps every other
+    # column (and the ids) of the old table in the same order.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            content TEXT NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    conn.create_function("llmgrader_content_hash", 1, content_hash, deterministic=True)
+    try:
+        column_types = {
+            row[1]: (row[2] or "") + (" NOT NULL" if row[3] else "")
+            for row in conn.execute("PRAGMA table_info(submissions)")
+        }
+        old_columns = [name for name in column_types if name != "id"]
+        row_defs = ["id INTEGER PRIMARY KEY AUTOINCREMENT"]
+        row_columns = []
+        select_exprs = []
+        for name in old_columns:
+            if name in SUBMISSION_BLOB_COLUMNS:
+                row_defs.append(f"{hash_column(name)} TEXT")
+                row_columns.append(hash_column(name))
+                select_exprs.append(f"llmgrader_content_hash({name})")
+            else:
+                row_defs.append(f"{name} {column_types[name]}".rstrip())
+                row_columns.append(name)
+                select_exprs.append(name)
+        conn.execute(f"CREATE TABLE submission_rows ({', '.join(row_defs)})")
+
+        for name in SUBMISSION_BLOB_COLUMNS:
+            if name in column_types:
+                conn.execute(
+                    f"""
+                    INSERT OR IGNORE INTO blobs (hash, content)
+                    SELECT llmgrader_content_hash({name}), {name} FROM submissions WHERE {name} IS NOT NULL
+                    """
+                )
+        conn.execute(
+            f"INSERT INTO submission_rows (id, {', '.join(row_columns)}) "
+            f"SELECT id, {', '.join(select_exprs)} FROM submissions ORDER BY id"
+        )
+    finally:
+        conn.create_function("llmgrader_content_hash", 1, None)
+
+    # Keep AUTOINCREMENT from reusing ids of deleted submissions.
+    conn.execute(
+        """
+        UPDATE sqlite_sequence
+        SET seq = COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'submissions'), seq)
+        WHERE name = 'submission_rows'
+        """
+    )
+    conn.execute("DROP TABLE submissions")
+    _submissions_indexes(conn, "submission_rows")
+    recreate_submissions_view(conn)
+
+
+def _submissions_coalesced(conn: sqlite3.Connection) -> None:
+    # Rows logged for requests that waited on another student's identical
+    # grading job; until now they were logged as grade-cache hits.
+    add_column_if_missing(conn, "submission_rows", "coalesced", "INTEGER")
+    recreate_submissions_view(conn)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "baseline submissions columns", _submissions_baseline_columns),
+    Migration(2, "index submissions by admin key, unit/question and client", _submissions_indexes),
+    Migration(3, "admin token usage ledger", _admin_token_ledger),
+    Migration(4, "store repeated submission text in content-addressed blobs", _submissions_blobs, vacuum=True),
+    Migration(5, "mark submissions coalesced onto another grading job", _submissions_coalesced),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, migrations: list[Migration] | None = None) -> list[int]:
+    """
+    Apply pending migrations.
+
+    ``conn`` must be in autocommit mode (``isolation_level=None``) so that
+    each migration can run in an explicit ``BEGIN IMMEDIATE`` transaction.
+
+    Returns
+    -------
+    list[int]
+        Versions applied by this call (empty if the database was current).
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    applied = []
+    for migration in migrations:
+        if schema_version(conn) >= migration.version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the lock.
+            if schema_version(conn) >= migration.version:
+                conn.execute("ROLLBACK")
+                continue
+            migration.apply(conn)
+            conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"[migrations] Applied migration {migration.version}: {migration.description}")
+        applied.append(migration.version)
+        if migration.vacuum:
+            conn.execute("VACUUM")
+    return applied
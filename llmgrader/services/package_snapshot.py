@@ -0,0 +1,202 @@
+"""
+Snapshot of the parsed solution package, so startup can skip parsing.
+
+``UnitParser.parse`` validates every unit against the XSD schemas, parses
+rubrics and base64-encodes solution images.  On a cold start this delays
+the first request by seconds.  After a parse, :meth:`PackageSnapshot.save`
+writes the resulting ``UnitPackageData`` to::
+
+    <LLMGRADER_STORAGE_PATH>/snapshots/unit_package.json
+
+together with a manifest of the files the parse read: path, size, mtime
+and SHA-256 of every XML file and image under the package directory.  The
+next parse loads the snapshot instead when the manifest still matches.
+Files whose size and mtime are unchanged are not re-hashed.  A file whose
+mtime changed but whose content did not (e.g. after re-extracting the same
+ZIP) still matches by hash.
+
+The snapshot is also keyed by :data:`SNAPSHOT_VERSION`, a fingerprint of
+the parser source and schemas, the package path and the parser options,
+so a deploy that changes the parser discards old snapshots.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+from functools import lru_cache
+from importlib import resources
+
+# Bump when the snapshot file layout changes
+SNAPSHOT_VERSION = 1
+
+# Files under the package directory that a parse can read
+MANIFEST_SUFFIXES = (".xml", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def parser_fingerprint() -> str:
+    """
+    SHA-256 over the unit parser source and its XSD schemas.
+    """
+    from llmgrader.services import unit_parser
+
+    digest = hashlib.sha256()
+    digest.update(file_sha256(unit_parser.__file__).encode("ascii"))
+    for schema_name in ("llmgrader_config.xsd", "unit.xsd"):
+        digest.update(file_sha256(str(resources.files("llmgrader.schemas").joinpath(schema_name))).encode("ascii"))
+    return digest.hexdigest()
+
+
+def build_manifest(soln_pkg_path: str, previous: dict | None = None) -> dict[str, list]:
+    """
+    Manifest of a package directory: ``{relative_path: [size, mtime_ns, sha256]}``.
+
+    The hash is taken from ``previous`` for files whose size and mtime
+    are unchanged.
+    """
+    previous = previous or {}
+    manifest: dict[str, list] = {}
+    for dirpath, dirnames, filenames in os.walk(soln_pkg_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(MANIFEST_SUFFIXES):
+                continue
+            path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(path, soln_pkg_path).replace(os.sep, "/")
+            try:
+                stat = os.stat(path)
+                known = previous.get(rel_path)
+                if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                    sha256 = known[2]
+                else:
+                    sha256 = file_sha256(path)
+            except OSError:
+                continue
+            manifest[rel_path] = [stat.st_size, stat.st_mtime_ns, sha256]
+    return manifest
+
+
+def source_hashes(soln_pkg_path: str, paths: list[str], manifest: dict[str, list] | None = None) -> dict:
+    """
+    ``{relative_path: sha256}`` of files of a package, None for missing files.
+
+    ``paths`` may be absolute or relative to ``soln_pkg_path``; hashes are
+    taken from ``manifest`` when it lists the file.
+    """
+    manifest = manifest or {}
+    hashes = {}
+    for path in paths:
+        full_path = os.path.normpath(os.path.join(soln_pkg_path, path))
+        rel_path = os.path.relpath(full_path, soln_pkg_path).replace(os.sep, "/")
+        if rel_path in manifest:
+            hashes[rel_path] = manifest[rel_path][2]
+        elif os.path.isfile(full_path):
+            hashes[rel_path] = file_sha256(full_path)
+        else:
+            hashes[rel_path] = None
+    return hashes
+
+
+def _same_content(manifest: dict[str, list], stored: dict[str, list]) -> bool:
+    if manifest.keys() != stored.keys():
+        return False
+    return all(manifest[path][2] == stored[path][2] for path in manifest)
+
+
+class PackageSnapshot:
+    """
+    Snapshot file of one parsed solution package.
+
+    Parameters
+    ----------
+    snapshot_path: str
+        Path of the snapshot file; its directory is created on save.
+    """
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = snapshot_path
+
+    @staticmethod
+    def make_key(soln_pkg_path: str, supported_tools: list[str]) -> dict:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "parser": parser_fingerprint(),
+            "soln_pkg_path": os.path.abspath(soln_pkg_path),
+            "supported_tools": sorted(supported_tools),
+        }
+
+    def _read(self) -> dict | None:
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as handle:
+                snapshot = json.load(handle)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            print(f"[Snapshot] Ignoring unreadable snapshot {self.snapshot_path}: {exc}")
+            return None
+        return snapshot if isinstance(snapshot, dict) else None
+
+    def load(self, soln_pkg_path: str, supported_tools: list[str]) -> tuple[dict | None, dict[str, list], bool]:
+        """
+        Load the snapshot taken of this package with these options.
+
+        Returns
+        -------
+        tuple
+            ``(package_fields, manifest, up_to_date)``: the
+            ``UnitPackageData`` fields (None without a usable snapshot), the
+            current manifest to pass to :meth:`save` after parsing, and
+            whether the snapshot was taken of the current files.  A stale
+            snapshot still tells which units are unchanged.
+        """
+        snapshot = self._read()
+        stored = {}
+        if snapshot and snapshot.get("key") == self.make_key(soln_pkg_path, supported_tools):
+            stored = snapshot.get("manifest") or {}
+
+        manifest = build_manifest(soln_pkg_path, stored)
+        if not stored or not isinstance(snapshot.get("package"), dict):
+            return None, manifest, False
+        if not _same_content(manifest, stored):
+            return snapshot["package"], manifest, False
+
+        if manifest != stored:
+            # Same content with new mtimes: record them so the files are not hashed again.
+            self._write({**snapshot, "manifest": manifest})
+        return snapshot["package"], manifest, True
+
+    def save(self, package, manifest: dict[str, list], supported_tools: list[str]) -> None:
+        """
+        Write ``package`` (a ``UnitPackageData``) with the manifest taken
+        before it was parsed.
+        """
+        self._write({
+            "key": self.make_key(package.soln_pkg_path, supported_tools),
+            "manifest": manifest,
+            "package": dataclasses.asdict(package),
+        })
+
+    def _write(self, snapshot: dict) -> None:
+        tmp_path = f"{self.snapshot_path}.tmp{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(snapshot, handle)
+            os.replace(tmp_path, self.snapshot_path)
+        except (OSError, TypeError, ValueError) as exc:
+            print(f"[Snapshot] Could not write {self.snapshot_path}: {exc}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
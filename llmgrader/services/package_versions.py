@@ -0,0 +1,115 @@
+"""
+Versioned directories of uploaded solution packages.
+
+Each upload is extracted into a new directory::
+
+    <LLMGRADER_STORAGE_PATH>/soln_pkg_versions/<version>/
+
+and parsed there while the grader keeps serving the current package.  Only
+when the new version loads does the grader switch to it, and then the file
+``soln_pkg_versions/CURRENT`` is updated to name it, so a restart loads the
+same version.  The directory being served is never modified, so
+``/pkg_assets`` and open unit pages never see a half-extracted package.
+
+The previous version is kept after a switch, so pages rendered from it can
+still load their assets; older versions are removed by :meth:`prune`.
+
+Deployments that predate versioning keep their package in
+``<LLMGRADER_STORAGE_PATH>/soln_pkg`` until the next upload.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import shutil
+from datetime import datetime
+import zipfile
+
+CURRENT_FILE = "CURRENT"
+
+
+class PackageVersions:
+    """
+    Directory of solution package versions.
+
+    Parameters
+    ----------
+    root: str
+        Directory that holds one subdirectory per version and the
+        ``CURRENT`` pointer.  Created on the first upload.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def version_path(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def versions(self) -> list[str]:
+        """
+        Version names, oldest first.
+        """
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if os.path.isdir(self.version_path(name)))
+
+    def current(self) -> str | None:
+        """
+        Path of the current version, or None before the first upload.
+        """
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding="utf-8") as handle:
+                version = handle.read().strip()
+        except FileNotFoundError:
+            return None
+        if not version or not os.path.isdir(self.version_path(version)):
+            return None
+        return self.version_path(version)
+
+    def stage(self, zip_path: str) -> str:
+        """
+        Extract a package ZIP into a new version directory and return its path.
+
+        Raises ``zipfile.BadZipFile`` if ``zip_path`` is not a ZIP file.
+        """
+        # Names sort by upload time; the suffix keeps simultaneous uploads apart.
+        version = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{secrets.token_hex(3)}"
+        path = self.version_path(version)
+        os.makedirs(path)
+        try:
+            with zipfile.ZipFile(zip_path, "r") as z:
+                z.extractall(path)
+        except Exception:
+            self.discard(path)
+            raise
+        return path
+
+    def activate(self, path: str) -> None:
+        """
+        Record ``path`` (a staged version) as the current version.
+        """
+        pointer = os.path.join(self.root, CURRENT_FILE)
+        tmp_path = f"{pointer}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(os.path.basename(path))
+        os.replace(tmp_path, pointer)
+
+    def discard(self, path: str) -> None:
+        shutil.rmtree(path, ignore_errors=True)
+
+    def prune(self, keep: list[str | None]) -> list[str]:
+        """
+        Remove every version except the current one and those in ``keep``
+        (paths; None entries are ignored).  Returns the removed version names.
+        """
+        kept = {os.path.basename(path) for path in [*keep, self.current()] if path}
+        removed = []
+        for version in self.versions():
+            if version in kept:
+                continue
+            self.discard(self.version_path(version))
+            removed.append(version)
+        return removed
@@ -0,0 +1,345 @@
+import email.utils
+import math
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from llmgrader.services.db import get_database
+
+
+DEFAULT_PROVIDER = "openai"
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """
+    Parse a rate-limit reset value such as ``"1.5"``, ``"20ms"``, ``"6m0s"`` or ``"1h2m3.5s"``.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts or "".join(num + unit for num, unit in parts) != value:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(num) * scale[unit] for num, unit in parts)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for LLM requests, shared by every grading worker.
+
+    Each ``(provider, model)`` has two buckets, one for requests per minute
+    (RPM) and one for tokens per minute (TPM), sized by the ``rateLimits``
+    entry in the admin preferences::
+
+        "rateLimits": [{"provider": "openai", "model": "gpt-4.1-mini",
+                        "rpm": 500, "tpm": 200000}]
+
+    A zero or missing limit means that dimension is not limited.  Bucket
+    levels live in the ``rate_limit_buckets`` table of ``llmgrader.db``, so
+    all web and worker processes draw from the same budget.  ``try_acquire``
+    runs inside the caller's transaction; ``GradeJobStore.claim_next_job``
+    uses it to leave jobs queued until their bucket has budget.
+
+    When a provider answers with HTTP 429 the ``Retry-After`` and
+    ``x-ratelimit-reset-*`` headers block the bucket until the provider's
+    own reset time, whether or not limits are configured for that model.
+
+    Parameters
+    ----------
+    db_path: str
+        Path to the SQLite database file.
+    load_limits: Callable[[], list[dict]] | None
+        Returns the configured limits, e.g. the ``rateLimits`` admin preference.
+    """
+
+    # Rough prompt size estimate; OpenAI counts about four characters per token.
+    CHARS_PER_TOKEN = 4
+    # Budget charged per attached image and for the model's reply.
+    IMAGE_TOKENS = 1000
+    OUTPUT_TOKENS = 1000
+    # Wait applied after a 429 that carries no usable headers.
+    DEFAULT_RETRY_AFTER_SECONDS = 5.0
+    LIMITS_CACHE_SECONDS = 5.0
+
+    def __init__(self, db_path: str, load_limits: Callable[[], list[dict]] | None = None):
+        self.db_path = db_path
+        self.load_limits = load_limits
+        self._limits_lock = threading.Lock()
+        self._limits: dict[tuple[str, str], tuple[int, int]] = {}
+        self._limits_loaded_at = None
+
+    def _connect(self):
+        return get_database(self.db_path).connection(autocommit=True)
+
+    def init_db(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    requests_available REAL NOT NULL,
+                    tokens_available REAL NOT NULL,
+                    updated_at_ts REAL NOT NULL,
+                    blocked_until_ts REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (provider, model)
+                )
+                """
+            )
+
+    # ------------------------------------------------------------------
+    # Configuration
+    # ------------------------------------------------------------------
+    @staticmethod
+    def bucket_for(provider: str | None, model: str | None) -> tuple[str, str]:
+        return provider or DEFAULT_PROVIDER, model or ""
+
+    def limits(self) -> dict[tuple[str, str], tuple[int, int]]:
+        """
+        Return ``{(provider, model): (rpm, tpm)}``, re-read every few seconds.
+        """
+        with self._limits_lock:
+            now = time.monotonic()
+            if self._limits_loaded_at is not None and now - self._limits_loaded_at < self.LIMITS_CACHE_SECONDS:
+                return self._limits
+            entries = []
+            if self.load_limits is not None:
+                try:
+                    entries = self.load_limits() or []
+                except Exception as exc:
+                    print(f"[RateLimiter] Failed to load rate limits: {exc}")
+            limits = {}
+            for entry in entries:
+                if not isinstance(entry, dict) or not entry.get("model"):
+                    continue
+                try:
+                    rpm = max(0, int(entry.get("rpm") or 0))
+                    tpm = max(0, int(entry.get("tpm") or 0))
+                except (TypeError, ValueError):
+                    continue
+                if rpm or tpm:
+                    limits[self.bucket_for(entry.get("provider"), entry["model"])] = (rpm, tpm)
+            self._limits = limits
+            self._limits_loaded_at = now
+            return limits
+
+    def invalidate(self) -> None:
+        """
+        Force the limits to be re-read, e.g. after the admin preferences change.
+        """
+        with self._limits_lock:
+            self._limits_loaded_at = None
+
+    @classmethod
+    def estimate_tokens(cls, task: str, image_count: int = 0) -> int:
+        """
+        Estimate the TPM cost of a request from its prompt text.
+        """
+        prompt_tokens = math.ceil(len(task or "") / cls.CHARS_PER_TOKEN)
+        return prompt_tokens + image_count * cls.IMAGE_TOKENS + cls.OUTPUT_TOKENS
+
+    # ------------------------------------------------------------------
+    # Buckets
+    # ------------------------------------------------------------------
+    def try_acquire(self, conn: sqlite3.Connection, provider: str | None, model: str | None,
+                    tokens: int | None, *, now_ts: float | None = None) -> float:
+        """
+        Take one request and ``tokens`` from the bucket if both are available.
+
+        Must be called inside a write transaction on ``conn``.  Returns 0.0
+        when the budget was taken, otherwise the number of seconds until it
+        will be available (nothing is taken in that case).
+        """
+        now_ts = time.time() if now_ts is None else now_ts
+        provider, model = self.bucket_for(provider, model)
+        rpm, tpm = self.limits().get((provider, model), (0, 0))
+
+        row = conn.execute(
+            """
+            SELECT requests_available, tokens_available, updated_at_ts, blocked_until_ts
+            FROM rate_limit_buckets WHERE provider = ? AND model = ?
+            """,
+            (provider, model),
+        ).fetchone()
+        if row is None:
+            if not (rpm or tpm):
+                return 0.0
+            requests_available, tokens_available, blocked_until_ts = float(rpm), float(tpm), 0.0
+        else:
+            requests_available, tokens_available, updated_at_ts, blocked_until_ts = row
+            elapsed = max(0.0, now_ts - updated_at_ts)
+            requests_available = min(rpm, requests_available + elapsed * rpm / 60.0)
+            tokens_available = min(tpm, tokens_available + elapsed * tpm / 60.0)
+
+        wait = max(0.0, blocked_until_ts - now_ts)
+        if rpm and requests_available < 1:
+            wait = max(wait, (1 - requests_available) * 60.0 / rpm)
+        # A request larger than the whole bucket waits for a full bucket
+        # instead of forever.
+        cost = min(float(tokens or self.OUTPUT_TOKENS), tpm) if tpm else 0.0
+        if tpm and tokens_available < cost:
+            wait = max(wait, (cost - tokens_available) * 60.0 / tpm)
+
+        if wait == 0.0:
+            requests_available -= 1 if rpm else 0
+            tokens_available -= cost
+
+        conn.execute(
+            """
+            INSERT INTO rate_limit_buckets (
+                provider, model, requests_available, tokens_available, updated_at_ts, blocked_until_ts
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (provider, model) DO UPDATE SET
+                requests_available = excluded.requests_available,
+                tokens_available = excluded.tokens_available,
+                updated_at_ts = excluded.updated_at_ts
+            """,
+            (provider, model, requests_available, tokens_available, now_ts, blocked_until_ts),
+        )
+        return wait
+
+    def acquire(self, provider: str | None, model: str | None, tokens: int | None) -> float:
+        """
+        Standalone ``try_acquire`` in its own transaction.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                wait = self.try_acquire(conn, provider, model, tokens)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return wait
+
+    def block(self, provider: str | None, model: str | None, seconds: float) -> None:
+        """
+        Hold every request for the bucket for at least ``seconds``.
+        """
+        provider, model = self.bucket_for(provider, model)
+        now_ts = time.time()
+        rpm, tpm = self.limits().get((provider, model), (0, 0))
+        with self._connect() as conn:
+            # The provider says the budget is spent, so empty our buckets too.
+            conn.execute(
+                """
+                INSERT INTO rate_limit_buckets (
+                    provider, model, requests_available, tokens_available, updated_at_ts, blocked_until_ts
+                )
+                VALUES (?, ?, 0, 0, ?, ?)
+                ON CONFLICT (provider, model) DO UPDATE SET
+                    requests_available = 0,
+                    tokens_available = 0,
+                    updated_at_ts = excluded.updated_at_ts,
+                    blocked_until_ts = MAX(blocked_until_ts, excluded.blocked_until_ts)
+                """,
+                (provider, model, now_ts, now_ts + max(0.0, seconds)),
+            )
+        if not (rpm or tpm):
+            print(f"[RateLimiter] {provider}/{model} rate limited by the provider for {seconds:.1f}s "
+                  "(no rateLimits entry configured for this model).")
+
+    # ------------------------------------------------------------------
+    # Provider feedback
+    # ------------------------------------------------------------------
+    @classmethod
+    def retry_after_from_headers(cls, headers) -> float | None:
+        """
+        Seconds to wait according to ``Retry-After`` or OpenAI-style
+        ``x-ratelimit-reset-*`` response headers, or None if absent.
+        """
+        if not headers:
+            return None
+        retry_after_ms = _parse_duration(headers.get("retry-after-ms"))
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000.0
+
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            seconds = _parse_duration(retry_after)
+            if seconds is not None:
+                return seconds
+            try:
+                when = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                when = None
+            if when is not None:
+                return max(0.0, when.timestamp() - time.time())
+
+        resets = []
+        for kind in ("requests", "tokens"):
+            reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if reset is not None and remaining is not None and str(remaining).strip() == "0":
+                resets.append(reset)
+        if not resets:
+            # Both resets without remaining counts: wait for the later one.
+            resets = [
+                value for value in (
+                    _parse_duration(headers.get("x-ratelimit-reset-requests")),
+                    _parse_duration(headers.get("x-ratelimit-reset-tokens")),
+                ) if value is not None
+            ]
+        return max(resets) if resets else None
+
+    def note_failure(self, provider: str | None, model: str | None, exc: Exception) -> float | None:
+        """
+        Block the bucket if ``exc`` is an HTTP 429 from the provider.
+
+        Works with OpenAI SDK errors, ``httpx.HTTPStatusError`` and
+        ``requests.HTTPError``, which all carry the response.  Returns the
+        wait in seconds, or None if the failure was not a rate limit.
+        """
+        response = getattr(exc, "response", None)
+        if getattr(response, "status_code", None) != 429:
+            return None
+        retry_after = self.retry_after_from_headers(getattr(response, "headers", None))
+        if retry_after is None:
+            retry_after = self.DEFAULT_RETRY_AFTER_SECONDS
+        self.block(provider, model, retry_after)
+        return retry_after
+
+    def stats(self) -> list[dict]:
+        now_ts = time.time()
+        limits = self.limits()
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT provider, model, requests_available, tokens_available, updated_at_ts, blocked_until_ts
+                FROM rate_limit_buckets ORDER BY provider, model
+                """
+            ).fetchall()
+        seen = {}
+        for provider, model, requests_available, tokens_available, updated_at_ts, blocked_until_ts in rows:
+            rpm, tpm = limits.get((provider, model), (0, 0))
+            elapsed = max(0.0, now_ts - updated_at_ts)
+            seen[(provider, model)] = {
+                "provider": provider,
+                "model": model,
+                "rpm": rpm,
+                "tpm": tpm,
+                "requests_available": int(min(rpm, requests_available + elapsed * rpm / 60.0)) if rpm else None,
+                "tokens_available": int(min(tpm, tokens_available + elapsed * tpm / 60.0)) if tpm else None,
+                "blocked_seconds": round(max(0.0, blocked_until_ts - now_ts), 1),
+            }
+        for (provider, model), (rpm, tpm) in limits.items():
+            seen.setdefault((provider, model), {
+                "provider": provider,
+                "model": model,
+                "rpm": rpm,
+                "tpm": tpm,
+                "requests_available": rpm or None,
+                "tokens_available": tpm or None,
+                "blocked_seconds": 0.0,
+            })
+        return list(seen.values())
@@ -0,0 +1,187 @@
+import atexit
+import os
+import queue
+import threading
+from typing import Callable
+
+
+class SubmissionWriter:
+    """
+    Write-behind sink for submission logging.
+
+    ``Grader.finish_grade`` hands each finished grade to ``submit`` and
+    returns the grade immediately.  A single writer thread drains a bounded
+    queue: for every entry it runs the entry's ``prepare`` step (saving
+    ``resp.json`` and the student's images), then inserts up to
+    ``batch_size`` records in one transaction via ``write_batch``.
+
+    When the queue is full, ``submit`` does the work on the calling thread
+    instead of dropping the submission.  ``flush`` waits until everything
+    queued so far is written; ``close`` (also run at interpreter exit)
+    flushes and stops the thread.  Submissions still queued when the process
+    is killed are lost.
+
+    Parameters
+    ----------
+    write_batch: Callable[[list[dict]], None]
+        Inserts a list of submission records in one transaction.
+    max_queue: int
+        Maximum number of queued submissions.
+    batch_size: int
+        Maximum records per transaction.
+    """
+
+    DEFAULT_MAX_QUEUE = 10000
+    DEFAULT_BATCH_SIZE = 200
+    MODES = ("async", "sync")
+
+    def __init__(self, write_batch: Callable[[list[dict]], None], *,
+                 max_queue: int = DEFAULT_MAX_QUEUE, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.write_batch = write_batch
+        self.batch_size = max(1, int(batch_size))
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self._written = 0
+        self._failed = 0
+        self._inline = 0
+        atexit.register(self.close)
+
+    @staticmethod
+    def mode_from_env() -> str:
+        """
+        Submission logging mode from ``LLMGRADER_SUBMISSION_LOG``: ``async`` (default) or ``sync``.
+        """
+        mode = (os.environ.get("LLMGRADER_SUBMISSION_LOG") or "").strip().lower()
+        return mode if mode in SubmissionWriter.MODES else "async"
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="submission-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, record: dict, prepare: Callable[[dict], None] | None = None) -> None:
+        """
+        Queue a submission record.  ``prepare(record)`` runs on the writer
+        thread just before the insert and may fill in fields (e.g. image paths).
+        """
+        entry = (record, prepare)
+        if not self._closed:
+            self._start()
+            try:
+                self._queue.put_nowait(entry)
+                return
+            except queue.Full:
+                pass
+        # Queue full or writer closed: write on the caller's thread.
+        with self._lock:
+            self._inline += 1
+        self._write([entry])
+
+    def backlog(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backlog": self.backlog(),
+                "written": self._written,
+                "failed": self._failed,
+                "written_inline": self._inline,
+            }
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Wait until every submission queued so far has been written.
+        Returns False on timeout.
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put((None, done.set), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float | None = 30.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put((None, None))
+            self._thread.join(timeout)
+
+    def _write(self, entries: list) -> None:
+        records = []
+        for record, prepare in entries:
+            if prepare is not None:
+                try:
+                    prepare(record)
+                except Exception as exc:
+                    print(f"[SubmissionWriter] Failed to prepare submission: {exc}")
+            records.append(record)
+        if not records:
+            return
+        try:
+            self.write_batch(records)
+        except Exception as exc:
+            # Retry one at a time so a single bad record does not lose the batch.
+            print(f"[SubmissionWriter] Batch insert of {len(records)} submissions failed: {exc}")
+            for record in records:
+                try:
+                    self.write_batch([record])
+                except Exception as record_exc:
+                    with self._lock:
+                        self._failed += 1
+                    print(f"[SubmissionWriter] Dropped submission: {record_exc}")
+                else:
+                    with self._lock:
+                        self._written += 1
+            return
+        with self._lock:
+            self._written += len(records)
+
+    def _run(self) -> None:
+        while True:
+            entries = [self._queue.get()]
+            # Take whatever else is already queued, up to one batch.
+            while len(entries) < self.batch_size:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            markers = []
+            batch = []
+            for record, callback in entries:
+                if record is None:
+                    # Flush marker (callback set) or shutdown marker (None).
+                    if callback is None:
+                        stop = True
+                    else:
+                        markers.append(callback)
+                else:
+                    batch.append((record, callback))
+            try:
+                self._write(batch)
+            finally:
+                for marker in markers:
+                    marker()
+            if stop:
+                # Write anything queued behind the shutdown marker.
+                remaining = []
+                while True:
+                    try:
+                        record, callback = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is not None:
+                        remaining.append((record, callback))
+                    elif callback is not None:
+                        callback()
+                self._write(remaining)
+                return
@@ -1,12 +1,17 @@
 import base64
+import io
 import mimetypes
+import multiprocessing
 import os
 import re
 import tempfile
 import textwrap
+import threading
 import xml.etree.ElementTree as ET
 import xml.parsers.expat as expat
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass, field
 from datetime import datetime
 from importlib import resources
@@ -14,6 +19,8 @@ from pathlib import Path, PurePosixPath
 
 import xmlschema
 
+from llmgrader.services.package_snapshot import PackageSnapshot, source_hashes
+
 
 def strip_code_block_leading_newlines(html_text: str) -> str:
     def strip_newlines_match(match):
@@ -34,6 +41,31 @@ def clean_cdata(text: str) -> str:
     return strip_code_block_leading_newlines(text)
 
 
+def diff_units(old_units: dict, new_units: dict) -> dict:
+    """
+    Questions added, changed and removed between two ``units`` dicts, as
+    ``{"added": {unit_name: [qtag, ...]}, "changed": {...}, "removed": {...}}``.
+    Units without such questions are left out.
+    """
+    diff: dict[str, dict[str, list[str]]] = {"added": {}, "changed": {}, "removed": {}}
+    unit_names = list(new_units) + [name for name in old_units if name not in new_units]
+    for unit_name in unit_names:
+        old_questions = old_units.get(unit_name) or {}
+        new_questions = new_units.get(unit_name) or {}
+        qtags = {
+            "added": [qtag for qtag in new_questions if qtag not in old_questions],
+            "changed": [
+                qtag for qtag in new_questions
+                if qtag in old_questions and new_questions[qtag] != old_questions[qtag]
+            ],
+            "removed": [qtag for qtag in old_questions if qtag not in new_questions],
+        }
+        for kind, kind_qtags in qtags.items():
+            if kind_qtags:
+                diff[kind][unit_name] = kind_qtags
+    return diff
+
+
 @dataclass
 class UnitPackageData:
     units: dict
@@ -44,19 +76,35 @@ class UnitPackageData:
     validation_errors: list[str]
     validation_alert: str | None
     unit_metadata: dict = field(default_factory=dict)
+    # Per unit destination: name, hashes of the files it was parsed from, and
+    # its outcome; used to reparse only changed units (see UnitParser.parse)
+    unit_sources: dict = field(default_factory=dict)
 
 
 class UnitParser:
+    # Validation error of a parse that failed unexpectedly (not cached in snapshots)
+    PARSE_EXCEPTION_PREFIX = "Exception during unit parsing"
+
+    # Compiled XSD schemas, shared by every parser in the process
+    _schema_cache: dict[str, xmlschema.XMLSchema] = {}
+    _schema_cache_lock = threading.Lock()
+
     def __init__(
         self,
         *,
         scratch_dir: str,
         soln_pkg: str | None = None,
         supported_tools: list[str] | None = None,
+        snapshot: PackageSnapshot | None = None,
+        workers: int = 1,
     ):
         self.scratch_dir = scratch_dir
         self.soln_pkg = soln_pkg
         self.supported_tools = supported_tools or []
+        # Optional snapshot of the last parse, see package_snapshot.py
+        self.snapshot = snapshot
+        # Processes that validate and parse units; 0 means one per CPU core
+        self.workers = parse_worker_count(workers)
 
     def _empty_package(self, soln_pkg_path: str) -> UnitPackageData:
         return UnitPackageData(
@@ -75,7 +123,14 @@ class UnitParser:
 
     @classmethod
     def _load_schema(cls, schema_name: str) -> xmlschema.XMLSchema:
-        return xmlschema.XMLSchema(cls._schema_path(schema_name))
+        schema = cls._schema_cache.get(schema_name)
+        if schema is None:
+            with cls._schema_cache_lock:
+                schema = cls._schema_cache.get(schema_name)
+                if schema is None:
+                    schema = xmlschema.XMLSchema(cls._schema_path(schema_name))
+                    cls._schema_cache[schema_name] = schema
+        return schema
 
     @staticmethod
     def _path_with_optional_indices(stack: list[tuple[str, int]]) -> str:
@@ -88,7 +143,7 @@ class UnitParser:
         return "/" + "/".join(parts)
 
     @classmethod
-    def _build_xml_line_lookup(cls, xml_path: str) -> dict[str, int]:
+    def _build_xml_line_lookup(cls, xml_path: str, xml_data: bytes | None = None) -> dict[str, int]:
         line_lookup: dict[str, int] = {}
         ambiguous_paths: set[str] = set()
         stack: list[tuple[str, int]] = []
@@ -130,15 +185,20 @@ class UnitParser:
         parser.StartElementHandler = start_element
         parser.EndElementHandler = end_element
 
-        with open(xml_path, "rb") as handle:
-            parser.Parse(handle.read(), True)
+        if xml_data is None:
+            with open(xml_path, "rb") as handle:
+                xml_data = handle.read()
+        parser.Parse(xml_data, True)
 
         return line_lookup
 
     @staticmethod
-    def _format_schema_errors(xml_path: str, errors) -> list[str]:
+    def _format_schema_errors(xml_path: str, errors, xml_data: bytes | None = None) -> list[str]:
+        if not errors:
+            return []
+
         try:
-            line_lookup = UnitParser._build_xml_line_lookup(xml_path)
+            line_lookup = UnitParser._build_xml_line_lookup(xml_path, xml_data)
         except Exception:
             line_lookup = {}
 
@@ -167,19 +227,36 @@ class UnitParser:
         )
 
     @classmethod
-    def validate_config_file(cls, config_path: str) -> list[str]:
-        schema = cls._load_schema("llmgrader_config.xsd")
-        return cls._format_schema_errors(config_path, list(schema.iter_errors(config_path)))
+    def _load_xml(cls, xml_path: str, schema_name: str) -> tuple[ET.Element | None, list[str]]:
+        """
+        Read and parse an XML file once and validate the resulting tree
+        against ``schema_name``.  Returns ``(root, schema_errors)``; ``root``
+        is ``None`` if the file is not well-formed XML.
+        """
+        with open(xml_path, "rb") as handle:
+            xml_data = handle.read()
+
+        try:
+            root = ET.fromstring(xml_data)
+        except ET.ParseError as exc:
+            return None, [f"{xml_path}: /: Failed to parse XML: {exc}"]
+
+        schema = cls._load_schema(schema_name)
+        return root, cls._format_schema_errors(xml_path, list(schema.iter_errors(root)), xml_data)
 
     @classmethod
-    def validate_unit_file(cls, unit_path: str) -> list[str]:
-        schema = cls._load_schema("unit.xsd")
-        schema_errors = cls._format_schema_errors(unit_path, list(schema.iter_errors(unit_path)))
+    def validate_config_file(cls, config_path: str) -> list[str]:
+        return cls._load_xml(config_path, "llmgrader_config.xsd")[1]
 
-        try:
-            root = ET.parse(unit_path).getroot()
-        except Exception as exc:
-            return [f"{unit_path}: /: Failed to parse XML: {exc}"]
+    @classmethod
+    def _load_unit_file(cls, unit_path: str) -> tuple[ET.Element | None, list[str]]:
+        """
+        Load a unit file for :meth:`parse`: the parsed root and all schema,
+        authoring and semantic errors, from a single read of the file.
+        """
+        root, schema_errors = cls._load_xml(unit_path, "unit.xsd")
+        if root is None:
+            return None, schema_errors
 
         authoring_errors, _ = cls._validate_unit_authoring_conventions(
             root,
@@ -187,9 +264,13 @@ class UnitParser:
             workspace_root=None,
         )
         if schema_errors:
-            return schema_errors + authoring_errors
+            return root, schema_errors + authoring_errors
 
-        return cls._validate_unit_semantics(unit_path, root) + authoring_errors
+        return root, cls._validate_unit_semantics(unit_path, root) + authoring_errors
+
+    @classmethod
+    def validate_unit_file(cls, unit_path: str) -> list[str]:
+        return cls._load_unit_file(unit_path)[1]
 
     @classmethod
     def validate_unit_text(cls, unit_xml: str, *, workspace_root: str | None = None) -> dict:
@@ -577,23 +658,25 @@ class UnitParser:
         return warnings
 
     @classmethod
-    def validate_course_package_config(cls, config_path: str) -> list[str]:
+    def validate_course_package_config(cls, config_path: str, *, workers: int = 1) -> list[str]:
+        """
+        Validate llmgrader_config.xml and every unit and asset it references.
+        ``workers`` > 1 validates units across that many processes; 0 uses
+        one process per CPU core.
+        """
         config_path = os.path.abspath(config_path)
-        validation_errors = cls.validate_config_file(config_path)
+        workers = parse_worker_count(workers)
+        config_root, validation_errors = cls._load_xml(config_path, "llmgrader_config.xsd")
         if validation_errors:
             return validation_errors
 
-        try:
-            config_root = ET.parse(config_path).getroot()
-        except Exception as exc:
-            return [f"{config_path}: /: Failed to parse XML: {exc}"]
-
         units_elem = config_root.find("units")
         if units_elem is None:
             return [f"{config_path}: /llmgrader: Missing <units> section."]
 
         config_dir = os.path.dirname(config_path)
-        collected_errors: list[str] = []
+        # Errors in config order: a list of errors, or the path of a unit file to validate
+        unit_checks: list[list[str] | str] = []
         for unit_elem in units_elem.findall("unit"):
             unit_name = unit_elem.findtext("name") or "(unnamed unit)"
             source_path = unit_elem.findtext("source")
@@ -603,17 +686,23 @@ class UnitParser:
                 if destination_path:
                     source_path = destination_path
                 else:
-                    collected_errors.append(
+                    unit_checks.append([
                         f"{config_path}: /llmgrader/units: Unit '{unit_name}' is missing both <source> and <destination>."
-                    )
+                    ])
                     continue
 
             xml_path = os.path.abspath(os.path.join(config_dir, source_path))
             if not os.path.exists(xml_path):
-                collected_errors.append(f"{xml_path}: /: File referenced by unit '{unit_name}' does not exist.")
+                unit_checks.append([f"{xml_path}: /: File referenced by unit '{unit_name}' does not exist."])
                 continue
 
-            collected_errors.extend(cls.validate_unit_file(xml_path))
+            unit_checks.append(xml_path)
+
+        unit_paths = [check for check in unit_checks if isinstance(check, str)]
+        unit_errors = iter(cls._run_unit_jobs(_validate_unit_job, unit_paths, workers))
+        collected_errors: list[str] = []
+        for check in unit_checks:
+            collected_errors.extend(next(unit_errors) if isinstance(check, str) else check)
 
         assets_elem = config_root.find("assets")
         if assets_elem is None:
@@ -940,7 +1029,13 @@ class UnitParser:
         return groups
 
     @staticmethod
-    def _extract_solution_images(solution_html: str, soln_pkg_path: str, xml_path: str, log) -> list[str]:
+    def _extract_solution_images(
+        solution_html: str,
+        soln_pkg_path: str,
+        xml_path: str,
+        log,
+        referenced: list[str] | None = None,
+    ) -> list[str]:
         """Extract images from solution HTML and return them as base64 data URIs.
 
         Handles three kinds of ``src`` values found in ``<img>`` tags:
@@ -952,7 +1047,8 @@ class UnitParser:
           ``xml_path``.
 
         Files that cannot be found are skipped with a warning logged to
-        ``log``.
+        ``log``.  The resolved path of every referenced file, found or not,
+        is appended to ``referenced``.
         """
         _MIME_MAP = {
             ".png": "image/png",
@@ -982,6 +1078,8 @@ class UnitParser:
                 file_path = os.path.join(xml_dir, src)
 
             file_path = os.path.normpath(file_path)
+            if referenced is not None:
+                referenced.append(file_path)
 
             if not os.path.isfile(file_path):
                 log.write(f"Warning: solution image not found, skipping: {file_path}\n")
@@ -999,8 +1097,343 @@ class UnitParser:
 
         return data_uris
 
-    def parse(self) -> UnitPackageData:
+    @staticmethod
+    def _parse_grade_cache(unit_elem) -> set[str] | None | bool:
+        """
+        Read the optional ``<grade_cache>`` element of a config ``<unit>``.
+
+        Returns False when caching is off, None when it is on for every
+        question of the unit, or the set of qtags listed in ``<qtag>`` children.
+        """
+        cache_elem = unit_elem.find("grade_cache")
+        if cache_elem is None:
+            return False
+        if (cache_elem.get("enabled") or "true").strip().lower() in {"false", "0"}:
+            return False
+        qtags = {(qtag_elem.text or "").strip() for qtag_elem in cache_elem.findall("qtag")}
+        qtags.discard("")
+        return qtags or None
+
+    def _parse_unit(
+        self,
+        name: str,
+        xml_path: str,
+        soln_pkg_path: str,
+        grade_cache_config: dict,
+        log,
+        image_paths: list[str],
+    ) -> tuple[dict | None, dict | None, list[str]]:
+        """
+        Validate and parse one unit file.
+
+        Returns ``(questions, metadata, validation_errors)``; ``questions``
+        is None if the unit is not loaded.  Paths of the solution images
+        the unit references are appended to ``image_paths``.
+        """
+        validation_errors: list[str] = []
+
+        log.write(f"Processing unit: {name}\n")
+        log.write(f"  XML file: {xml_path}\n")
+
+        if not os.path.exists(xml_path):
+            error = f"{xml_path}: /: File does not exist."
+            validation_errors.append(error)
+            log.write(f"Validation error: {error}\n")
+            return None, None, validation_errors
+
+        root, unit_validation_errors = self._load_unit_file(xml_path)
+        if unit_validation_errors:
+            validation_errors.extend(unit_validation_errors)
+            log.write(f"Skipping unit {name}: XML schema validation failed.\n")
+            for error in unit_validation_errors:
+                log.write(f"Validation error: {error}\n")
+            return None, None, validation_errors
+
+        digitalsign_elem = root.find("digitalsign")
+        digitalsign = (
+            digitalsign_elem is not None
+            and (digitalsign_elem.text or "").strip().lower() == "true"
+        )
+        metadata = {"digitalsign": digitalsign}
+
+        unit_dict = {}
+
+        for question in root.findall("question"):
+            qtag = question.get("qtag")
+            if not qtag:
+                log.write(f"Skipping question in unit {name}: missing qtag attribute\n")
+                continue
+
+            preferred_model = question.get("preferred_model", "")
+
+            question_text_elem = question.find("question_text")
+            question_text = clean_cdata(question_text_elem.text if question_text_elem is not None else "")
+
+            solution_elem = question.find("solution")
+            solution = clean_cdata(solution_elem.text if solution_elem is not None else "")
+            solution_images = self._extract_solution_images(
+                solution, soln_pkg_path, xml_path, log, image_paths
+            )
+
+            grading_notes_elem = question.find("grading_notes")
+            grading_notes = clean_cdata(grading_notes_elem.text if grading_notes_elem is not None else "")
+
+            required_elem = question.find("required")
+            if required_elem is None:
+                required_elem = question.find("grade")
+            if required_elem is not None and required_elem.text:
+                required = required_elem.text.strip().lower() == "true"
+            else:
+                required = True
+
+            partial_credit_elem = question.find("partial_credit")
+            if partial_credit_elem is not None and partial_credit_elem.text:
+                partial_credit = partial_credit_elem.text.strip().lower() == "true"
+            else:
+                partial_credit = False
+
+            tools = []
+            for tool_elem in question.findall("tool"):
+                if tool_elem.text is None:
+                    continue
+                tool_name = tool_elem.text.strip()
+                if not tool_name:
+                    continue
+                if tool_name not in self.supported_tools:
+                    log.write(
+                        f"Warning: question {qtag} in unit {name} requested unsupported tool '{tool_name}'; ignoring.\n"
+                    )
+                    continue
+                tools.append(tool_name)
+
+            rubrics = {}
+            rubric_groups = []
+            rubrics_elem = question.find("rubrics")
+            if rubrics_elem is not None:
+                for child in rubrics_elem:
+                    if child.tag not in {"item", "group"}:
+                        self._log_question_warning(
+                            log,
+                            name,
+                            qtag,
+                            f"has unexpected element <{child.tag}> inside <rubrics>; ignoring it.",
+                        )
+
+                for rubric_item in rubrics_elem.findall("item"):
+                    item_id, rubric_data = self._parse_rubric_item(
+                        rubric_item,
+                        partial_credit=partial_credit,
+                        unit_name=name,
+                        qtag=qtag,
+                        log=log,
+                    )
+                    if item_id is None or rubric_data is None:
+                        continue
+                    rubrics[item_id] = rubric_data
+
+                rubric_groups = self._parse_rubric_groups(
+                    rubrics_elem,
+                    set(rubrics.keys()),
+                    unit_name=name,
+                    qtag=qtag,
+                    log=log,
+                )
+
+            rubric_total = self._parse_rubric_total(
+                question,
+                partial_credit=partial_credit,
+                has_rubrics=bool(rubrics),
+                unit_name=name,
+                qtag=qtag,
+                log=log,
+            )
+
+            parts = []
+            parts_elem = question.find("parts")
+            if parts_elem is not None:
+                for part in parts_elem.findall("part"):
+                    part_id = part.get("id")
+                    part_label_elem = part.find("part_label")
+                    points_elem = part.find("points")
+
+                    if part_label_elem is not None and part_label_elem.text:
+                        part_label = part_label_elem.text.strip()
+                    elif part_id:
+                        part_label = part_id
+                    else:
+                        part_label = "all"
+
+                    if points_elem is not None and points_elem.text:
+                        try:
+                            points = float(points_elem.text.strip())
+                        except ValueError:
+                            points = 0.0
+                    elif part.get("points"):
+                        try:
+                            points = float(part.get("points"))
+                        except ValueError:
+                            points = 0.0
+                    else:
+                        points = 0.0
+
+                    parts.append({"part_label": part_label, "points": points})
+
+            question_dict = {
+                "qtag": qtag,
+                "question_text": question_text,
+                "solution": solution,
+                "solution_images": solution_images,
+                "grading_notes": grading_notes,
+                "parts": parts,
+                "required": required,
+                "partial_credit": partial_credit,
+                "tools": tools,
+                "rubrics": rubrics,
+                "rubric_total": rubric_total,
+                "rubric_groups": rubric_groups,
+                "preferred_model": preferred_model,
+                "grade_cache": (
+                    name in grade_cache_config
+                    and (grade_cache_config[name] is None or qtag in grade_cache_config[name])
+                ),
+            }
+
+            unit_dict[qtag] = question_dict
+
+        required_fields = [
+            "qtag",
+            "question_text",
+            "solution",
+            "grading_notes",
+            "parts",
+            "required",
+        ]
+
+        valid_questions = {}
+        for qtag, qdict in unit_dict.items():
+            missing_fields = [field for field in required_fields if field not in qdict]
+            if missing_fields:
+                log.write(
+                    f"Skipping question {qtag} in unit {name}: missing required fields: {missing_fields}\n"
+                )
+                continue
+            valid_questions[qtag] = qdict
+
+        unit_dict = valid_questions
+
+        if len(unit_dict) == 0:
+            log.write(f"Skipping unit {name}: no valid questions found\n")
+            return None, metadata, validation_errors
+
+        log.write(f"Unit {name} successfully loaded with questions:\n")
+        for qtag in unit_dict:
+            log.write(f"  qtag={qtag} \n")
+
+
+        return unit_dict, metadata, validation_errors
+
+    def parse(self, previous: UnitPackageData | None = None) -> UnitPackageData:
+        """
+        Load the solution package.
+
+        Units whose XML file and referenced images are unchanged since
+        ``previous`` (the package returned by an earlier parse with the same
+        options) are reused rather than parsed again.  With a snapshot, an
+        unchanged package is loaded from it without parsing, and a stale
+        snapshot serves as ``previous``.
+        """
         soln_pkg_path = self._resolve_solution_package_path()
+        if self.snapshot is None:
+            return self._parse_package(soln_pkg_path, previous, None)
+
+        package_fields, manifest, up_to_date = self.snapshot.load(soln_pkg_path, self.supported_tools)
+        snapshot_package = None
+        if package_fields is not None:
+            try:
+                snapshot_package = UnitPackageData(**package_fields)
+            except TypeError:
+                snapshot_package = None
+        if snapshot_package is not None and up_to_date:
+            with open(os.path.join(self.scratch_dir, "load_unit_pkg_log.txt"), "w", encoding="utf-8") as log:
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                log.write(f"Loading unit package at {now}\n")
+                log.write(f"Loaded {soln_pkg_path} from snapshot {self.snapshot.snapshot_path}\n")
+            return snapshot_package
+
+        package = self._parse_package(soln_pkg_path, previous or snapshot_package, manifest)
+        if not any(error.startswith(self.PARSE_EXCEPTION_PREFIX) for error in package.validation_errors):
+            self.snapshot.save(package, manifest, self.supported_tools)
+        return package
+
+    @staticmethod
+    def workers_from_env() -> int:
+        """
+        Unit parsing processes from ``LLMGRADER_PARSE_WORKERS`` (default 1,
+        i.e. parse in the calling process; 0 for one per CPU core).
+        """
+        try:
+            return int(os.environ.get("LLMGRADER_PARSE_WORKERS") or 1)
+        except ValueError:
+            return 1
+
+    @staticmethod
+    def _run_unit_jobs(func, jobs: list, workers: int) -> list:
+        """
+        ``[func(job) for job in jobs]``, spread across a process pool when
+        ``workers`` > 1 and there is more than one job.  Results are in the
+        order of ``jobs`` however the pool schedules them.
+        """
+        workers = min(workers, len(jobs))
+        if workers > 1:
+            # Forked workers inherit the compiled schemas, but forking a process
+            # that runs threads (the web server) is unsafe; spawn there instead.
+            start_method = "spawn"
+            if threading.active_count() == 1 and "fork" in multiprocessing.get_all_start_methods():
+                start_method = "fork"
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context(start_method),
+                ) as pool:
+                    chunksize = max(1, len(jobs) // (workers * 4))
+                    return list(pool.map(func, jobs, chunksize=chunksize))
+            except (OSError, BrokenProcessPool) as exc:
+                print(f"[UnitParser] Process pool unavailable, parsing units in this process: {exc}")
+        return [func(job) for job in jobs]
+
+    @staticmethod
+    def _reusable_unit_source(
+        previous: UnitPackageData | None,
+        soln_pkg_path: str,
+        destination: str,
+        name: str,
+        cache_setting,
+        manifest: dict | None,
+    ) -> dict | None:
+        """
+        The ``unit_sources`` entry of ``previous`` for ``destination`` if the
+        unit can be reused: same name and grade cache setting, and the same
+        content in every file it was parsed from.  ``previous`` may have been
+        parsed from another directory (an earlier upload of the package).
+        """
+        if previous is None:
+            return None
+        source = previous.unit_sources.get(destination)
+        if not source or source.get("name") != name or source.get("grade_cache") != cache_setting:
+            return None
+        if source.get("loaded") and name not in previous.units:
+            return None
+        files = source.get("files") or {}
+        if source_hashes(soln_pkg_path, list(files), manifest) != files:
+            return None
+        return source
+
+    def _parse_package(
+        self,
+        soln_pkg_path: str,
+        previous: UnitPackageData | None,
+        manifest: dict | None,
+    ) -> UnitPackageData:
         log_path = os.path.join(self.scratch_dir, "load_unit_pkg_log.txt")
         validation_errors: list[str] = []
 
@@ -1018,7 +1451,7 @@ class UnitParser:
                     package.validation_alert = self._build_validation_alert(package.validation_errors)
                     return package
 
-                config_validation_errors = self.validate_config_file(llmgrader_config_path)
+                config_root, config_validation_errors = self._load_xml(llmgrader_config_path, "llmgrader_config.xsd")
                 if config_validation_errors:
                     log.write("[ERROR] llmgrader_config.xml failed schema validation.\n")
                     validation_errors.extend(config_validation_errors)
@@ -1029,16 +1462,7 @@ class UnitParser:
                     package.validation_alert = self._build_validation_alert(validation_errors)
                     return package
 
-                try:
-                    config_tree = ET.parse(llmgrader_config_path)
-                    config_root = config_tree.getroot()
-                    log.write("Successfully parsed llmgrader_config.xml\n")
-                except Exception as exc:
-                    log.write(f"Failed to parse llmgrader_config.xml: {exc}\n")
-                    package = self._empty_package(soln_pkg_path)
-                    package.validation_errors = [f"{llmgrader_config_path}: /: Failed to parse XML: {exc}"]
-                    package.validation_alert = self._build_validation_alert(package.validation_errors)
-                    return package
+                log.write("Successfully parsed llmgrader_config.xml\n")
 
                 units_elem = config_root.find("units")
                 if units_elem is None:
@@ -1051,6 +1475,7 @@ class UnitParser:
                 units_order: list[dict] = []
                 units_list: list[str] = []
                 xml_path_list: list[str] = []
+                grade_cache_config: dict[str, set[str] | None] = {}
 
                 for child in units_elem:
                     if child.tag == "section":
@@ -1068,219 +1493,81 @@ class UnitParser:
                         xml_path_list.append(destination)
                         log.write(f"Found unit in config: {name} -> {destination}\n")
 
+                        cache_qtags = self._parse_grade_cache(child)
+                        if cache_qtags is not False:
+                            grade_cache_config[name] = cache_qtags
+                            log.write(
+                                f"  Grade cache enabled for "
+                                f"{'all questions' if cache_qtags is None else ', '.join(sorted(cache_qtags))}\n"
+                            )
+
                 if not units_list:
                     log.write("No <unit> elements found in llmgrader_config.xml\n")
                     return self._empty_package(soln_pkg_path)
 
                 units = {}
                 unit_metadata: dict[str, dict] = {}
-
-                for name, xml_path in zip(units_list, xml_path_list):
-                    xml_path = os.path.normpath(xml_path)
-                    xml_path = os.path.join(soln_pkg_path, xml_path)
-
-                    log.write(f"Processing unit: {name}\n")
-                    log.write(f"  XML file: {xml_path}\n")
-
-                    if not os.path.exists(xml_path):
-                        error = f"{xml_path}: /: File does not exist."
-                        validation_errors.append(error)
-                        log.write(f"Validation error: {error}\n")
-                        continue
-
-                    unit_validation_errors = self.validate_unit_file(xml_path)
-                    if unit_validation_errors:
-                        validation_errors.extend(unit_validation_errors)
-                        log.write(f"Skipping unit {name}: XML schema validation failed.\n")
-                        for error in unit_validation_errors:
-                            log.write(f"Validation error: {error}\n")
-                        continue
-
-                    try:
-                        tree = ET.parse(xml_path)
-                        root = tree.getroot()
-                    except Exception as exc:
-                        error = f"{xml_path}: /: Failed to parse XML: {exc}"
-                        validation_errors.append(error)
-                        log.write(f"Validation error: {error}\n")
-                        continue
-
-                    digitalsign_elem = root.find("digitalsign")
-                    digitalsign = (
-                        digitalsign_elem is not None
-                        and (digitalsign_elem.text or "").strip().lower() == "true"
+                unit_sources: dict[str, dict] = {}
+                reparsed = 0
+
+                # Reuse unchanged units; parse the others, across processes if enabled.
+                unit_entries = []
+                parse_jobs = []
+                for name, destination in zip(units_list, xml_path_list):
+                    xml_path = os.path.join(soln_pkg_path, os.path.normpath(destination))
+                    cache_setting = grade_cache_config.get(name, False)
+                    if isinstance(cache_setting, set):
+                        cache_setting = sorted(cache_setting)
+
+                    source = self._reusable_unit_source(
+                        previous, soln_pkg_path, destination, name, cache_setting, manifest
                     )
-                    unit_metadata[name] = {"digitalsign": digitalsign}
-
-                    unit_dict = {}
-
-                    for question in root.findall("question"):
-                        qtag = question.get("qtag")
-                        if not qtag:
-                            log.write(f"Skipping question in unit {name}: missing qtag attribute\n")
-                            continue
-
-                        preferred_model = question.get("preferred_model", "")
-
-                        question_text_elem = question.find("question_text")
-                        question_text = clean_cdata(question_text_elem.text if question_text_elem is not None else "")
-
-                        solution_elem = question.find("solution")
-                        solution = clean_cdata(solution_elem.text if solution_elem is not None else "")
-                        solution_images = self._extract_solution_images(solution, soln_pkg_path, xml_path, log)
-
-                        grading_notes_elem = question.find("grading_notes")
-                        grading_notes = clean_cdata(grading_notes_elem.text if grading_notes_elem is not None else "")
-
-                        required_elem = question.find("required")
-                        if required_elem is None:
-                            required_elem = question.find("grade")
-                        if required_elem is not None and required_elem.text:
-                            required = required_elem.text.strip().lower() == "true"
-                        else:
-                            required = True
-
-                        partial_credit_elem = question.find("partial_credit")
-                        if partial_credit_elem is not None and partial_credit_elem.text:
-                            partial_credit = partial_credit_elem.text.strip().lower() == "true"
-                        else:
-                            partial_credit = False
-
-                        tools = []
-                        for tool_elem in question.findall("tool"):
-                            if tool_elem.text is None:
-                                continue
-                            tool_name = tool_elem.text.strip()
-                            if not tool_name:
-                                continue
-                            if tool_name not in self.supported_tools:
-                                log.write(
-                                    f"Warning: question {qtag} in unit {name} requested unsupported tool '{tool_name}'; ignoring.\n"
-                                )
-                                continue
-                            tools.append(tool_name)
-
-                        rubrics = {}
-                        rubric_groups = []
-                        rubrics_elem = question.find("rubrics")
-                        if rubrics_elem is not None:
-                            for child in rubrics_elem:
-                                if child.tag not in {"item", "group"}:
-                                    self._log_question_warning(
-                                        log,
-                                        name,
-                                        qtag,
-                                        f"has unexpected element <{child.tag}> inside <rubrics>; ignoring it.",
-                                    )
-
-                            for rubric_item in rubrics_elem.findall("item"):
-                                item_id, rubric_data = self._parse_rubric_item(
-                                    rubric_item,
-                                    partial_credit=partial_credit,
-                                    unit_name=name,
-                                    qtag=qtag,
-                                    log=log,
-                                )
-                                if item_id is None or rubric_data is None:
-                                    continue
-                                rubrics[item_id] = rubric_data
-
-                            rubric_groups = self._parse_rubric_groups(
-                                rubrics_elem,
-                                set(rubrics.keys()),
-                                unit_name=name,
-                                qtag=qtag,
-                                log=log,
-                            )
-
-                        rubric_total = self._parse_rubric_total(
-                            question,
-                            partial_credit=partial_credit,
-                            has_rubrics=bool(rubrics),
-                            unit_name=name,
-                            qtag=qtag,
-                            log=log,
+                    if source is None:
+                        unit_cache_config = {name: grade_cache_config[name]} if name in grade_cache_config else {}
+                        parse_jobs.append(
+                            (self.scratch_dir, self.supported_tools, name, xml_path, soln_pkg_path, unit_cache_config)
                         )
-
-                        parts = []
-                        parts_elem = question.find("parts")
-                        if parts_elem is not None:
-                            for part in parts_elem.findall("part"):
-                                part_id = part.get("id")
-                                part_label_elem = part.find("part_label")
-                                points_elem = part.find("points")
-
-                                if part_label_elem is not None and part_label_elem.text:
-                                    part_label = part_label_elem.text.strip()
-                                elif part_id:
-                                    part_label = part_id
-                                else:
-                                    part_label = "all"
-
-                                if points_elem is not None and points_elem.text:
-                                    try:
-                                        points = float(points_elem.text.strip())
-                                    except ValueError:
-                                        points = 0.0
-                                elif part.get("points"):
-                                    try:
-                                        points = float(part.get("points"))
-                                    except ValueError:
-                                        points = 0.0
-                                else:
-                                    points = 0.0
-
-                                parts.append({"part_label": part_label, "points": points})
-
-                        question_dict = {
-                            "qtag": qtag,
-                            "question_text": question_text,
-                            "solution": solution,
-                            "solution_images": solution_images,
-                            "grading_notes": grading_notes,
-                            "parts": parts,
-                            "required": required,
-                            "partial_credit": partial_credit,
-                            "tools": tools,
-                            "rubrics": rubrics,
-                            "rubric_total": rubric_total,
-                            "rubric_groups": rubric_groups,
-                            "preferred_model": preferred_model,
+                    unit_entries.append((name, destination, xml_path, cache_setting, source))
+
+                parse_results = iter(self._run_unit_jobs(_parse_unit_job, parse_jobs, self.workers))
+
+                # Merge in llmgrader_config.xml order, wherever each unit was parsed.
+                for name, destination, xml_path, cache_setting, source in unit_entries:
+                    if source is not None:
+                        log.write(f"Unit {name} unchanged ({xml_path}); reusing previous parse\n")
+                        unit_dict = previous.units[name] if source["loaded"] else None
+                        metadata = source["metadata"]
+                        if previous.soln_pkg_path != soln_pkg_path:
+                            # Errors name the files; point them at this package directory.
+                            source = {
+                                **source,
+                                "errors": [
+                                    error.replace(previous.soln_pkg_path + os.sep, soln_pkg_path + os.sep)
+                                    for error in source["errors"]
+                                ],
+                            }
+                        unit_validation_errors = source["errors"]
+                    else:
+                        unit_dict, metadata, unit_validation_errors, image_paths, unit_log = next(parse_results)
+                        log.write(unit_log)
+                        source = {
+                            "name": name,
+                            "grade_cache": cache_setting,
+                            "files": source_hashes(soln_pkg_path, [xml_path, *image_paths], manifest),
+                            "loaded": unit_dict is not None,
+                            "metadata": metadata,
+                            "errors": unit_validation_errors,
                         }
+                        reparsed += 1
 
-                        unit_dict[qtag] = question_dict
-
-                    required_fields = [
-                        "qtag",
-                        "question_text",
-                        "solution",
-                        "grading_notes",
-                        "parts",
-                        "required",
-                    ]
-
-                    valid_questions = {}
-                    for qtag, qdict in unit_dict.items():
-                        missing_fields = [field for field in required_fields if field not in qdict]
-                        if missing_fields:
-                            log.write(
-                                f"Skipping question {qtag} in unit {name}: missing required fields: {missing_fields}\n"
-                            )
-                            continue
-                        valid_questions[qtag] = qdict
-
-                    unit_dict = valid_questions
-
-                    if len(unit_dict) == 0:
-                        log.write(f"Skipping unit {name}: no valid questions found\n")
-                        continue
-
-                    log.write(f"Unit {name} successfully loaded with questions:\n")
-                    for qtag in unit_dict:
-                        log.write(f"  qtag={qtag} \n")
-
-                    units[name] = unit_dict
+                    unit_sources[destination] = source
+                    validation_errors.extend(unit_validation_errors)
+                    if metadata is not None:
+                        unit_metadata[name] = metadata
+                    if unit_dict is not None:
+                        units[name] = unit_dict
 
+                log.write(f"Parsed {reparsed} of {len(units_list)} unit(s); reused the rest\n")
                 if len(units) == 0:
                     log.write("No valid directories units found.\n")
 
@@ -1302,10 +1589,41 @@ class UnitParser:
                     validation_errors=validation_errors,
                     validation_alert=self._build_validation_alert(validation_errors),
                     unit_metadata=unit_metadata,
+                    unit_sources=unit_sources,
                 )
             except Exception as exc:
                 log.write(f"[ERROR] Exception during unit parsing: {exc}\n")
                 package = self._empty_package(soln_pkg_path)
-                package.validation_errors = [f"Exception during unit parsing: {exc}"]
+                package.validation_errors = [f"{self.PARSE_EXCEPTION_PREFIX}: {exc}"]
                 package.validation_alert = self._build_validation_alert(package.validation_errors)
                 return package
+
+
+def parse_worker_count(workers: int | None) -> int:
+    """
+    Number of unit parsing processes: ``workers``, or one per available
+    CPU core if it is None or less than 1.
+    """
+    if workers is None or workers < 1:
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+    return workers
+
+
+def _parse_unit_job(job: tuple) -> tuple:
+    # Process pool entry point of UnitParser._parse_unit; the log is returned
+    # as text so the caller can write it in config order.
+    scratch_dir, supported_tools, name, xml_path, soln_pkg_path, grade_cache_config = job
+    parser = UnitParser(scratch_dir=scratch_dir, supported_tools=supported_tools)
+    log = io.StringIO()
+    image_paths: list[str] = []
+    unit_dict, metadata, validation_errors = parser._parse_unit(
+        name, xml_path, soln_pkg_path, grade_cache_config, log, image_paths
+    )
+    return unit_dict, metadata, validation_errors, image_paths, log.getvalue()
+
+
+def _validate_unit_job(unit_path: str) -> list[str]:
+    return UnitParser.validate_unit_file(unit_path)
@@ -153,6 +153,56 @@ function renderAdminModelList(allowedModels) {
     });
 }
 
+let adminRateLimits = [];
+
+function renderAdminRateLimitList(rateLimits) {
+    const container = document.getElementById("admin-rate-limit-list");
+    if (!container) return;
+    container.innerHTML = "";
+
+    Object.keys(MODEL_PROVIDER).forEach(modelName => {
+        const provider = MODEL_PROVIDER[modelName];
+        const current = rateLimits.find(entry => entry.model === modelName && (entry.provider || "openai") === provider) || {};
+
+        const row = document.createElement("div");
+        row.className = "rate-limit-row";
+        row.dataset.model = modelName;
+        row.dataset.provider = provider;
+        row.style.cssText = "display:flex; align-items:center; gap:8px; margin:4px 0;";
+
+        const lbl = document.createElement("label");
+        lbl.textContent = modelName;
+        lbl.style.cssText = "font-weight:normal; flex:1;";
+        row.appendChild(lbl);
+
+        [["rpm", "RPM"], ["tpm", "TPM"]].forEach(([field, placeholder]) => {
+            const input = document.createElement("input");
+            input.type = "number";
+            input.min = "0";
+            input.className = `rate-limit-${field}`;
+            input.placeholder = placeholder;
+            input.title = placeholder === "RPM" ? "Requests per minute" : "Tokens per minute";
+            input.style.width = "90px";
+            input.value = current[field] ?? "";
+            row.appendChild(input);
+        });
+
+        container.appendChild(row);
+    });
+}
+
+function collectAdminRateLimits() {
+    const rows = document.querySelectorAll("#admin-rate-limit-list .rate-limit-row");
+    return Array.from(rows)
+        .map(row => ({
+            provider: row.dataset.provider,
+            model:    row.dataset.model,
+            rpm:      Number(row.querySelector(".rate-limit-rpm")?.value || 0),
+            tpm:      Number(row.querySelector(".rate-limit-tpm")?.value || 0)
+        }))
+        .filter(entry => entry.rpm > 0 || entry.tpm > 0);
+}
+
 // ── Admin Preferences Modal ───────────────────────────────────────────────────
 
 async function saveAdminPreferences(closeModal) {
@@ -174,7 +224,8 @@ async function saveAdminPreferences(closeModal) {
         tokenLimit: {
             limit:  limitRaw !== undefined && limitRaw !== "" ? Number(limitRaw) : 0,
             period: period
-        }
+        },
+        rateLimits: collectAdminRateLimits()
     };
 
     await fetch("/api/admin/preferences", {
@@ -269,13 +320,16 @@ function initializeAdminPreferencesModal() {
             if (periodSelect) periodSelect.value = prefs.tokenLimit?.period ?? "per_hour";
 
             adminAllowedModels = Array.isArray(prefs.allowedModels) ? prefs.allowedModels : [];
+            adminRateLimits = Array.isArray(prefs.rateLimits) ? prefs.rateLimits : [];
             await loadAdminUsers();
         } catch (e) {
             adminAllowedModels = [];
+            adminRateLimits = [];
             renderAdminUsers([]);
         }
 
         renderAdminModelList(adminAllowedModels);
+        renderAdminRateLimitList(adminRateLimits);
         adminPreferencesModal.style.display = "flex";
     });
 
@@ -324,3 +378,51 @@ function initializeAdminPreferencesModal() {
 }
 
 window.initializeAdminPreferencesModal = initializeAdminPreferencesModal;
+
+async function postArchiveRequest(body) {
+    const resp = await fetch("/api/admin/archive", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(body)
+    });
+    const payload = await resp.json().catch(() => ({}));
+    if (!resp.ok) {
+        throw new Error(payload.error || "Archive request failed");
+    }
+    return payload;
+}
+
+async function archiveSubmissions() {
+    const answer = (prompt(
+        "Archive submissions before a date (YYYY-MM-DD) or from a finished term (e.g. 2026-spring):"
+    ) || "").trim();
+    if (!answer) return;
+
+    const body = /^\d{4}-(spring|summer|fall)$/i.test(answer) ? { term: answer } : { before: answer };
+    try {
+        const preview = await postArchiveRequest({ ...body, dry_run: true });
+        if (!preview.rows) {
+            alert("No submissions match.");
+            return;
+        }
+        const partitions = preview.partitions.map((p) => `${p.term} / ${p.unit}: ${p.rows}`).join("\n");
+        if (!confirm(`Move ${preview.rows} submissions to the archive?\n\n${partitions}`)) {
+            return;
+        }
+        const result = await postArchiveRequest(body);
+        alert(`Archived ${result.rows} submissions. Query them in Analytics as archived_submissions or all_submissions.`);
+    } catch (err) {
+        alert(err.message || "Archive request failed");
+    }
+}
+
+function initializeArchiveMenuItem() {
+    const archiveMenuItem = document.getElementById("admin-archive-menu-item");
+    if (!archiveMenuItem || archiveMenuItem.dataset.initialized === "true") {
+        return;
+    }
+    archiveMenuItem.addEventListener("click", archiveSubmissions);
+    archiveMenuItem.dataset.initialized = "true";
+}
+
+window.initializeArchiveMenuItem = initializeArchiveMenuItem;
@@ -7,18 +7,26 @@ const analyticsState = {
     initializedOnce: false,  // if false, we'll run a default query on first load. Set to true after that.
     sqlText: "",  // last SQL query text that was run
     tableHTML: "",  // innerHTML of the results table, so we can restore it if we navigate away and back
-    csvEnabled: false // whether the "Download CSV" link should be shown/enabled
+    csvEnabled: false, // whether the "Download CSV" link should be shown/enabled
+    queriedSql: "",  // SQL of the rows currently shown (the text box may have been edited since)
+    nextPageToken: null  // token for the next page of results, or null if all rows are shown
 };
 
+// Rows fetched per request; "Load more rows" fetches the next page.
+const ANALYTICS_PAGE_SIZE = 50;
+
 function initializeAnalyticsView() {
     const sqlInput = document.getElementById("analytics-sql-input");
     const runBtn = document.getElementById("analytics-run-btn");
     const downloadLink = document.getElementById("analytics-download-link");
     const table = document.getElementById("analytics-results-table");
+    const moreBtn = document.getElementById("analytics-more-btn");
 
     // Always rebind buttons
     runBtn.onclick = runAnalyticsQuery;
     downloadLink.onclick = downloadAnalyticsCSV;
+    moreBtn.onclick = loadMoreAnalyticsRows;
+    document.getElementById("analytics-explain-btn").onclick = explainAnalyticsQuery;
 
     console.log("Analytics view initialized");
 
@@ -26,6 +34,7 @@ function initializeAnalyticsView() {
     if (analyticsState.initializedOnce) {
         sqlInput.value = analyticsState.sqlText;
         table.innerHTML = analyticsState.tableHTML;
+        setAnalyticsNextPage(analyticsState.nextPageToken);
 
         if (analyticsState.csvEnabled) {
             enableAnalyticsDownload();
@@ -107,12 +116,14 @@ async function runAnalyticsQuery() {
     errorBox.style.display = "none";
     noResults.style.display = "none";
     disableAnalyticsDownload();  // Hide download until we know if there are results
+    setAnalyticsNextPage(null);
+    showAnalyticsNotice("");
 
     try {
         const response = await fetch("/admin/dbviewer", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ sql_query: sql })
+            body: JSON.stringify({ sql_query: sql, page_size: ANALYTICS_PAGE_SIZE })
         });
 
         const data = await response.json();
@@ -124,6 +135,9 @@ async function runAnalyticsQuery() {
         }
 
         renderAnalyticsResults(data.columns, data.rows);
+        analyticsState.queriedSql = sql;
+        setAnalyticsNextPage(data.next_page_token);
+        showAnalyticsNotice(analyticsResultNotice(data));
 
         // Enable download if there are results 
         if (data.rows && data.rows.length > 0) {
@@ -166,6 +180,12 @@ function renderAnalyticsResults(columns, rows) {
 
     thead.appendChild(headerRow);
 
+    appendAnalyticsRows(rows);
+}
+
+function appendAnalyticsRows(rows) {
+    const tbody = document.getElementById("analytics-results-table").querySelector("tbody");
+
     rows.forEach(row => {
         const tr = document.createElement("tr");
 
@@ -196,6 +216,95 @@ function renderAnalyticsResults(columns, rows) {
     });
 }
 
+async function loadMoreAnalyticsRows() {
+    const errorBox = document.getElementById("analytics-error");
+    const token = analyticsState.nextPageToken;
+    if (!token) return;
+
+    setAnalyticsNextPage(null);
+    try {
+        const response = await fetch("/admin/dbviewer", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({
+                sql_query: analyticsState.queriedSql,
+                page_size: ANALYTICS_PAGE_SIZE,
+                page_token: token
+            })
+        });
+        const data = await response.json();
+
+        if (data.error) {
+            errorBox.textContent = data.error;
+            errorBox.style.display = "block";
+            return;
+        }
+
+        appendAnalyticsRows(data.rows || []);
+        setAnalyticsNextPage(data.next_page_token);
+        showAnalyticsNotice(analyticsResultNotice(data));
+    } catch (err) {
+        console.log("Error loading more analytics rows:", err);
+        errorBox.textContent = "Failed to load more rows.";
+        errorBox.style.display = "block";
+        setAnalyticsNextPage(token);
+    }
+
+    saveAnalyticsState();
+}
+
+async function explainAnalyticsQuery() {
+    const sql = document.getElementById("analytics-sql-input").value;
+    const errorBox = document.getElementById("analytics-error");
+    errorBox.style.display = "none";
+
+    try {
+        const response = await fetch("/admin/dbviewer", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ sql_query: sql, explain: true })
+        });
+        const data = await response.json();
+
+        if (data.error) {
+            errorBox.textContent = data.error;
+            errorBox.style.display = "block";
+            return;
+        }
+
+        const lines = ["Query plan:", ...(data.plan || []).map(step => `  ${step}`)];
+        (data.warnings || []).forEach(warning => lines.push(`Warning: ${warning}`));
+        showAnalyticsNotice(lines.join("\n"));
+    } catch (err) {
+        console.log("Error explaining analytics query:", err);
+        errorBox.textContent = "Failed to explain query.";
+        errorBox.style.display = "block";
+    }
+}
+
+function analyticsResultNotice(data) {
+    let notice = data.elapsed_ms !== undefined ? `Query took ${data.elapsed_ms} ms.` : "";
+    if (data.truncated) {
+        notice += ` Results are limited to ${data.max_rows} rows.`;
+    }
+    return notice.trim();
+}
+
+function showAnalyticsNotice(text) {
+    const notice = document.getElementById("analytics-notice");
+    if (!notice) return;
+    notice.textContent = text || "";
+    notice.style.display = text ? "block" : "none";
+}
+
+function setAnalyticsNextPage(token) {
+    analyticsState.nextPageToken = token || null;
+    const moreBtn = document.getElementById("analytics-more-btn");
+    if (moreBtn) {
+        moreBtn.style.display = analyticsState.nextPageToken ? "inline-block" : "none";
+    }
+}
+
 function downloadAnalyticsCSV() {
     window.location.href = "/admin/dbviewer/download";
 }
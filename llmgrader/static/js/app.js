@@ -37,6 +37,8 @@ const MODEL_PROVIDER = {
 const DEFAULT_MODEL = "gpt-4.1-mini";
 const GRADE_POLL_INTERVAL_MS = 1000;
 const GRADE_MAX_POLL_DURATION_SECONDS = 300;
+// Failed event-stream reconnects in a row before falling back to polling
+const GRADE_EVENTS_MAX_RECONNECTS = 3;
 
 function populateModelSelect() {
     const modelSelect = document.getElementById("model-select");
@@ -85,6 +87,7 @@ document.addEventListener("DOMContentLoaded", () => {
     populateModelSelect();
     initializeModelSelection();
     initializeAdminPreferencesModal();
+    initializeArchiveMenuItem();
     initializeApiKeyWizard();
     loadView("grade");   // or whatever your default view is
 });
@@ -1484,6 +1487,154 @@ function initSolutionImageAttach() {
 // ---------------------------
 //  GRADE CURRENT QUESTION
 // ---------------------------
+function isActiveGradeJobStatus(status) {
+    return status === "queued" || status === "running";
+}
+
+// Grading job the page is currently waiting for, if any, and a callback that
+// stops waiting for it locally (used when the job keeps running for other students).
+let activeGradeJobId = null;
+let stopWaitingForGradeJob = null;
+
+function setActiveGradeJob(jobId) {
+    activeGradeJobId = jobId;
+    const cancelBtn = document.getElementById("grade-cancel-button");
+    if (cancelBtn) {
+        cancelBtn.style.display = jobId ? "" : "none";
+        cancelBtn.disabled = false;
+    }
+}
+
+async function cancelCurrentGradeJob() {
+    if (!activeGradeJobId) return;
+    const cancelBtn = document.getElementById("grade-cancel-button");
+    if (cancelBtn) cancelBtn.disabled = true;
+    try {
+        const resp = await fetch(`/grade/jobs/${encodeURIComponent(activeGradeJobId)}`, { method: "DELETE" });
+        const payload = await resp.json().catch(() => ({}));
+        if (!resp.ok && resp.status !== 409) {
+            throw new Error(payload.error || "Failed to cancel grading job.");
+        }
+        // A detached job keeps running for identical requests; the server will not
+        // report it as cancelled, so stop waiting here.
+        if (payload.detached && stopWaitingForGradeJob) {
+            stopWaitingForGradeJob({ status: "cancelled" });
+        }
+    } catch (err) {
+        console.error("Cancel request failed:", err);
+        if (cancelBtn) cancelBtn.disabled = false;
+    }
+}
+
+function describeGradeJobProgress(statusData, elapsedSeconds) {
+    if (statusData.status === "queued") {
+        if (statusData.rate_limited) {
+            return `Waiting for rate limit (about ${statusData.rate_limit_wait_seconds}s)... ${elapsedSeconds}s elapsed.`;
+        }
+        const position = statusData.queue_position;
+        return position
+            ? `Queued (position ${position})... ${elapsedSeconds}s elapsed.`
+            : `Queued... ${elapsedSeconds}s elapsed.`;
+    }
+    return `Thinking... ${elapsedSeconds}s elapsed.`;
+}
+
+// Follow a grading job over Server-Sent Events.
+// Resolves with the final job status, or null if the stream is unavailable
+// or does not finish within timeoutMs (the caller then falls back to polling).
+// The server ends each stream after a few seconds; the browser then
+// reconnects on its own, sending the id of the last status it received.
+function streamGradeJob(jobId, onStatus, timeoutMs) {
+    return new Promise(resolve => {
+        const source = new EventSource(`/grade/jobs/${encodeURIComponent(jobId)}/events`);
+        let settled = false;
+        let failedReconnects = 0;
+        const finish = value => {
+            if (settled) return;
+            settled = true;
+            clearTimeout(timer);
+            source.close();
+            resolve(value);
+        };
+        const timer = setTimeout(() => finish(null), timeoutMs);
+
+        source.addEventListener("status", event => {
+            const statusData = JSON.parse(event.data);
+            if (isActiveGradeJobStatus(statusData.status)) {
+                onStatus(statusData);
+            } else {
+                finish(statusData);
+            }
+        });
+        source.onopen = () => { failedReconnects = 0; };
+        source.onerror = () => {
+            // CONNECTING: the stream ended and the browser is reconnecting.
+            // CLOSED (e.g. an error status) or repeated failures: poll instead.
+            failedReconnects += 1;
+            if (source.readyState === EventSource.CLOSED || failedReconnects > GRADE_EVENTS_MAX_RECONNECTS) {
+                finish(null);
+            }
+        };
+    });
+}
+
+async function pollGradeJob(jobId, onStatus, getElapsedSeconds) {
+    while (true) {
+        const statusResp = await fetch(`/grade/jobs/${encodeURIComponent(jobId)}`);
+        const statusData = await statusResp.json();
+
+        if (!statusResp.ok) {
+            throw new Error(statusData.error || "Failed to read grading job status.");
+        }
+        if (!isActiveGradeJobStatus(statusData.status)) {
+            return statusData;
+        }
+        if (getElapsedSeconds() > GRADE_MAX_POLL_DURATION_SECONDS) {
+            throw new Error("Grading is taking too long to complete. Please retry.");
+        }
+
+        onStatus(statusData);
+        await new Promise(resolve => setTimeout(resolve, GRADE_POLL_INTERVAL_MS));
+    }
+}
+
+// Wait for a grading job to finish, reporting progress as (statusData, elapsedSeconds).
+// Uses the event stream when the browser supports it and polls otherwise.
+async function waitForGradeJob(jobId, onProgress) {
+    const startedAt = Date.now();
+    const getElapsedSeconds = () => Math.max(0, Math.floor((Date.now() - startedAt) / 1000));
+
+    let latestStatus = null;
+    const onStatus = statusData => {
+        latestStatus = statusData;
+        onProgress(statusData, getElapsedSeconds());
+    };
+    // The server only sends events on changes; keep the elapsed counter ticking.
+    const ticker = setInterval(() => {
+        if (latestStatus) onProgress(latestStatus, getElapsedSeconds());
+    }, 1000);
+
+    const stopped = new Promise(resolve => { stopWaitingForGradeJob = resolve; });
+    const followJob = async () => {
+        let statusData = null;
+        if (typeof EventSource !== "undefined") {
+            statusData = await streamGradeJob(jobId, onStatus, GRADE_MAX_POLL_DURATION_SECONDS * 1000);
+        }
+        if (!statusData) {
+            statusData = await pollGradeJob(jobId, onStatus, getElapsedSeconds);
+        }
+        return statusData;
+    };
+
+    try {
+        const statusData = await Promise.race([followJob(), stopped]);
+        return { statusData, elapsedSeconds: getElapsedSeconds() };
+    } finally {
+        stopWaitingForGradeJob = null;
+        clearInterval(ticker);
+    }
+}
+
 async function gradeCurrentQuestion() {
     const dropdown = document.getElementById("question-number");
     const qtag = dropdown.value;
@@ -1533,8 +1684,13 @@ async function gradeCurrentQuestion() {
         });
 
         const startData = await startResp.json();
+        if (startResp.status === 503) {
+            throw new Error(startData.error || "The grading queue is full. Please try again shortly.");
+        }
         if (startResp.status === 409 && liveStatus) {
             liveStatus.textContent = "Grading is already in progress. Waiting for the active job...";
+        } else if (startData.coalesced && liveStatus) {
+            liveStatus.textContent = "An identical grading request is already in progress. Waiting for its result...";
         } else if (!startResp.ok) {
             throw new Error(startData.error || "Failed to start grading job.");
         }
@@ -1554,95 +1710,78 @@ async function gradeCurrentQuestion() {
             return;
         }
 
-        const startedAt = Date.now();
-        while (true) {
-            const statusResp = await fetch(`/grade/jobs/${encodeURIComponent(jobId)}`);
-            const statusData = await statusResp.json();
-
-            if (!statusResp.ok) {
-                throw new Error(statusData.error || "Failed to read grading job status.");
+        setActiveGradeJob(jobId);
+        const { statusData, elapsedSeconds } = await waitForGradeJob(jobId, (progressData, seconds) => {
+            if (liveStatus) {
+                liveStatus.textContent = describeGradeJobProgress(progressData, seconds);
             }
+        });
 
-            const elapsedSeconds = Math.max(0, Math.floor((Date.now() - startedAt) / 1000));
-            if (elapsedSeconds > GRADE_MAX_POLL_DURATION_SECONDS) {
-                throw new Error("Grading is taking too long to complete. Please retry.");
-            }
-            if (statusData.status === "queued") {
-                if (liveStatus) {
-                    liveStatus.textContent = `Queued... ${elapsedSeconds}s elapsed.`;
-                }
-                await new Promise(resolve => setTimeout(resolve, GRADE_POLL_INTERVAL_MS));
-                continue;
+        if (statusData.status === "cancelled") {
+            if (liveStatus) {
+                liveStatus.textContent = "Grading cancelled.";
             }
+            return;
+        }
 
-            if (statusData.status === "running") {
-                if (liveStatus) {
-                    liveStatus.textContent = `Thinking... ${elapsedSeconds}s elapsed.`;
-                }
-                await new Promise(resolve => setTimeout(resolve, GRADE_POLL_INTERVAL_MS));
-                continue;
-            }
+        if (statusData.status === "timed_out") {
+            throw new Error(statusData.error || "Grading timed out.");
+        }
 
-            if (statusData.status === "timed_out") {
-                throw new Error(statusData.error || "Grading timed out.");
-            }
+        if (statusData.status === "error") {
+            throw new Error(statusData.error || "Grading failed.");
+        }
 
-            if (statusData.status === "error") {
-                throw new Error(statusData.error || "Grading failed.");
-            }
+        if (statusData.status !== "done") {
+            throw new Error(`Unexpected grading job state: ${statusData.status}`);
+        }
 
-            if (statusData.status !== "done") {
-                throw new Error(`Unexpected grading job state: ${statusData.status}`);
+        // If the backend signals that the user needs an API key, launch the wizard
+        if (statusData.full_explanation === "__START_API_KEY_WALKTHROUGH__") {
+            if (typeof openApiKeyWizard === "function") openApiKeyWizard(statusData.feedback || "");
+            if (liveStatus) {
+                liveStatus.textContent = "";
             }
+            return;
+        }
 
-            // If the backend signals that the user needs an API key, launch the wizard
-            if (statusData.full_explanation === "__START_API_KEY_WALKTHROUGH__") {
-                if (typeof openApiKeyWizard === "function") openApiKeyWizard(statusData.feedback || "");
-                if (liveStatus) {
-                    liveStatus.textContent = "";
-                }
-                return;
-            }
+        setGradeSummaryDisplay({
+            result: statusData.result || "",
+            points: statusData.points ?? null,
+            maxPoints: statusData.max_points ?? getQuestionMaxPoints(currentUnitItems[qtag], selectedPart),
+            requiredLabel: currentUnitItems[qtag]?.required === false ? "optional" : "required"
+        });
+        renderMarkdownInto(document.getElementById("feedback-box"), statusData.feedback);
+        renderMarkdownInto(document.getElementById("full-explanation-box"), statusData.full_explanation);
 
-            setGradeSummaryDisplay({
-                result: statusData.result || "",
-                points: statusData.points ?? null,
-                maxPoints: statusData.max_points ?? getQuestionMaxPoints(currentUnitItems[qtag], selectedPart),
-                requiredLabel: currentUnitItems[qtag]?.required === false ? "optional" : "required"
-            });
-            renderMarkdownInto(document.getElementById("feedback-box"), statusData.feedback);
-            renderMarkdownInto(document.getElementById("full-explanation-box"), statusData.full_explanation);
-
-            // Save student solution at qtag level
-            updateSessionData(currentUnitName, qtag, {
-                student_solution: studentSolution,
-                selected_part: selectedPart,
-                required: currentUnitItems[qtag]?.required !== false,
-                partial_credit: currentUnitItems[qtag]?.partial_credit === true
-            });
-
-            // Save grading results per part
-            const partToSave = selectedPart === "all" ? "all" : selectedPart;
-            updateSessionData(currentUnitName, qtag, {
-                result: statusData.result || "",
-                points: statusData.points ?? null,
-                max_points: statusData.max_points ?? null,
-                point_parts: statusData.point_parts ?? null,
-                max_point_parts: statusData.max_point_parts ?? null,
-                result_parts: statusData.result_parts ?? null,
-                feedback: statusData.feedback || "",
-                full_explanation: statusData.full_explanation || ""
-            }, partToSave);
+        // Save student solution at qtag level
+        updateSessionData(currentUnitName, qtag, {
+            student_solution: studentSolution,
+            selected_part: selectedPart,
+            required: currentUnitItems[qtag]?.required !== false,
+            partial_credit: currentUnitItems[qtag]?.partial_credit === true
+        });
 
-            if (liveStatus) {
-                liveStatus.textContent = `Done in ${elapsedSeconds}s.`;
-                setTimeout(() => {
-                    if (liveStatus.textContent.startsWith("Done in")) {
-                        liveStatus.textContent = "";
-                    }
-                }, 4000);
-            }
-            return;
+        // Save grading results per part
+        const partToSave = selectedPart === "all" ? "all" : selectedPart;
+        updateSessionData(currentUnitName, qtag, {
+            result: statusData.result || "",
+            points: statusData.points ?? null,
+            max_points: statusData.max_points ?? null,
+            point_parts: statusData.point_parts ?? null,
+            max_point_parts: statusData.max_point_parts ?? null,
+            result_parts: statusData.result_parts ?? null,
+            feedback: statusData.feedback || "",
+            full_explanation: statusData.full_explanation || ""
+        }, partToSave);
+
+        if (liveStatus) {
+            liveStatus.textContent = `Done in ${elapsedSeconds}s.`;
+            setTimeout(() => {
+                if (liveStatus.textContent.startsWith("Done in")) {
+                    liveStatus.textContent = "";
+                }
+            }, 4000);
         }
     } catch (err) {
         console.error("Grade request failed:", err);
@@ -1651,6 +1790,7 @@ async function gradeCurrentQuestion() {
             liveStatus.textContent = err.message || "Grading failed.";
         }
     } finally {
+        setActiveGradeJob(null);
         gradeBtn.disabled = false;
         gradeBtn.textContent = "Grade";
     }
@@ -1668,7 +1808,7 @@ async function reloadUnitData() {
     const data = await res.json();
 
     if (data.status === "ok") {
-        console.log("Units reloaded.");
+        console.log("Units reloaded.", data.changes);
 
         await loadUnits();
 
@@ -557,6 +557,22 @@ function initializeMenuSystem() {
                     throw new Error(errorData.error || 'Upload failed');
                 }
 
+                // The package is parsed in the background; students keep the
+                // current package until it has loaded.
+                var result = await response.json();
+                while (result.status === 'staging') {
+                    await new Promise(function (resolve) { setTimeout(resolve, 500); });
+                    var statusResponse = await fetch('/admin/upload/' + encodeURIComponent(result.upload_id));
+                    result = await statusResponse.json();
+                    if (!statusResponse.ok) {
+                        throw new Error(result.error || 'Upload failed');
+                    }
+                }
+                if (result.status !== 'ok') {
+                    throw new Error(result.error || 'Upload failed');
+                }
+                console.log('Course package loaded.', result.changes);
+
                 closeLoadCourseModal();
                 
                 // Refresh the unit list by calling the existing loadUnits function
@@ -0,0 +1,114 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from llmgrader.services import migrations
+from llmgrader.services.admin_usage import AdminUsageLedger
+from llmgrader.services.db import get_database
+from llmgrader.services.grader import Grader
+
+
+def _ledger(tmp_path, rows=()) -> AdminUsageLedger:
+    db_path = str(tmp_path / "llmgrader.db")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("CREATE TABLE submissions (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL)")
+        migrations.migrate(conn, migrations.MIGRATIONS[:1])
+        conn.executemany(
+            "INSERT INTO submissions (timestamp, tokens_in, tokens_out, used_admin_key) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        migrations.migrate(conn)
+    finally:
+        conn.close()
+    return AdminUsageLedger(db_path)
+
+
+def test_reservations_prevent_concurrent_overshoot(tmp_path) -> None:
+    ledger = _ledger(tmp_path)
+    day = AdminUsageLedger.PERIOD_SECONDS["per_day"]
+
+    assert ledger.reserve("a", 3000, limit=5000, window_seconds=day)
+    # A concurrent request that would push used + reserved past the limit is refused.
+    assert not ledger.reserve("b", 3000, limit=5000, window_seconds=day)
+
+    with get_database(ledger.db_path).connection() as conn:
+        ledger.record(conn, 2500, reservation_id="a")
+    assert ledger.usage(day) == {"used": 2500, "reserved": 0}
+    assert ledger.reserve("b", 2500, limit=5000, window_seconds=day)
+    assert not ledger.reserve("c", 1, limit=5000, window_seconds=day)
+
+    # Reservations from grades that never finished expire.
+    assert ledger.reserve("d", 10, limit=10**6, window_seconds=day, ttl=-1)
+    assert ledger.usage(day)["reserved"] == 2500
+
+    # Hour buckets older than the window no longer count.
+    assert ledger.usage(3600, now_ts=time.time() + 3 * 3600)["used"] == 0
+
+
+def test_migration_backfills_recent_admin_key_usage(tmp_path) -> None:
+    now = datetime.now(timezone.utc)
+    ledger = _ledger(tmp_path, rows=[
+        ((now - timedelta(minutes=5)).isoformat(), 100, 20, 1),
+        ((now - timedelta(hours=5)).isoformat(), 1000, 200, 1),
+        ((now - timedelta(hours=5)).isoformat(), 9999, 0, 0),
+        ((now - timedelta(days=40)).isoformat(), 5000, 0, 1),
+    ])
+
+    assert ledger.usage(AdminUsageLedger.PERIOD_SECONDS["per_hour"])["used"] == 120
+    assert ledger.usage(AdminUsageLedger.PERIOD_SECONDS["per_day"])["used"] == 1320
+    assert ledger.usage(AdminUsageLedger.PERIOD_SECONDS["per_month"])["used"] == 1320
+
+
+def test_admin_key_submissions_update_the_ledger(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    monkeypatch.setattr(grader, "load_admin_preferences", lambda: {
+        "openaiApiKey": "sk-admin",
+        "allowedModels": ["gpt-4.1-mini"],
+        "tokenLimit": {"limit": 1000, "period": "per_day"},
+    })
+
+    assert grader.get_admin_key("gpt-4.1-mini", estimated_tokens=600, reservation_id="r1") == ("sk-admin", None)
+    key, reason = grader.get_admin_key("gpt-4.1-mini", estimated_tokens=600, reservation_id="r2")
+    assert key is None and "token limit for this day" in reason
+
+    grader.insert_submission(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        tokens_in=300,
+        tokens_out=100,
+        used_admin_key=True,
+        admin_reservation_id="r1",
+    )
+    assert grader.admin_usage.usage(86400) == {"used": 400, "reserved": 0}
+    assert grader.get_admin_key("gpt-4.1-mini", estimated_tokens=600, reservation_id="r2")[0] == "sk-admin"
+
+
+def test_admin_reservation_is_released_when_grading_raises(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    monkeypatch.setattr(grader, "load_admin_preferences", lambda: {
+        "openaiApiKey": "sk-admin",
+        "allowedModels": ["gpt-4.1-mini"],
+        "tokenLimit": {"limit": 10**6, "period": "per_day"},
+    })
+    reserved = []
+
+    def failing_policy(ctx, deadline_ts, cancel_event=None):
+        reserved.append(grader.admin_usage.usage(86400)["reserved"])
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(grader, "make_llm_call_policy", failing_policy)
+
+    with pytest.raises(RuntimeError):
+        grader.grade(
+            question_dict={"question_text": "Q", "solution": "S", "grading_notes": "N", "tools": []},
+            student_soln="answer",
+        )
+
+    assert reserved[0] > 0
+    assert grader.admin_usage.usage(86400) == {"used": 0, "reserved": 0}
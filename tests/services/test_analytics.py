@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+from llmgrader.services.analytics import AnalyticsGuard, QueryTimeout
+from llmgrader.services.grader import Grader
+
+
+RUNAWAY_SQL = (
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+    "SELECT COUNT(*) FROM n a, n b"
+)
+
+
+@pytest.fixture()
+def grader(tmp_path, monkeypatch) -> Grader:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    return Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+
+def test_runaway_query_is_interrupted(grader) -> None:
+    guard = AnalyticsGuard(timeout_seconds=0.2)
+
+    with grader.db.connection(read_only=True) as conn:
+        with pytest.raises(QueryTimeout) as excinfo:
+            with guard.guard(conn):
+                conn.execute(RUNAWAY_SQL).fetchall()
+        assert 0.2 <= excinfo.value.elapsed < 5
+        assert "time limit" in str(excinfo.value)
+
+        # The connection is usable afterwards.
+        with guard.guard(conn):
+            assert conn.execute("SELECT COUNT(*) FROM submissions").fetchone() == (0,)
+
+
+def test_read_only_connection_refuses_writes(grader) -> None:
+    with grader.db.connection(read_only=True) as conn:
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute("DELETE FROM submission_rows")
+        # llmgrader_text() is registered here too.
+        assert conn.execute("SELECT llmgrader_text('x')").fetchone() == ("x",)
+
+
+def test_explain_warns_about_full_scans(grader) -> None:
+    with grader.db.connection(read_only=True) as conn:
+        scan = AnalyticsGuard.explain(conn, "SELECT * FROM submissions WHERE result = 'pass'")
+        search = AnalyticsGuard.explain(
+            conn, "SELECT id FROM submissions WHERE unit_name = 'u1' AND qtag = 'q1'"
+        )
+    assert scan["warnings"] and "Full scan" in scan["warnings"][0]
+    assert any("idx_submissions_unit_qtag_ts" in step for step in search["plan"])
+    assert search["warnings"] == []
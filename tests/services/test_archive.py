@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from llmgrader.services.archive import SubmissionArchive, term_for, term_range
+from llmgrader.services.grader import Grader
+
+
+def _grader(tmp_path, monkeypatch) -> Grader:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    grader.insert_submissions([
+        {"timestamp": "2026-02-01T10:00:00", "unit_name": "unit1", "qtag": "q1", "question_text": "Q1", "result": "pass"},
+        {"timestamp": "2026-03-01T10:00:00", "unit_name": "unit2", "qtag": "q1", "question_text": "Q2", "result": "fail"},
+        {"timestamp": "2026-09-01T10:00:00", "unit_name": "unit1", "qtag": "q1", "question_text": "Q1", "result": "pass"},
+    ])
+    return grader
+
+
+def test_terms() -> None:
+    assert term_for("2026-02-01T10:00:00") == "2026-spring"
+    assert term_for("2026-07-01T10:00:00") == "2026-summer"
+    assert term_for("2026-12-31T23:59:59") == "2026-fall"
+    assert term_range("2026-fall") == ("2026-08-01", "2027-01-01")
+    with pytest.raises(ValueError):
+        term_range("fall")
+
+
+def test_dry_run_counts_partitions_without_pyarrow(tmp_path, monkeypatch) -> None:
+    grader = _grader(tmp_path, monkeypatch)
+
+    summary = grader.archive.archive(term="2026-spring", dry_run=True)
+
+    assert summary["rows"] == 2
+    assert [(p["term"], p["unit"], p["rows"]) for p in summary["partitions"]] == [
+        ("2026-spring", "unit1", 1),
+        ("2026-spring", "unit2", 1),
+    ]
+    with grader.db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM submissions").fetchone() == (3,)
+        # With no archive yet, the union names still resolve.
+        grader.archive.attach(conn)
+        assert conn.execute("SELECT COUNT(*) FROM all_submissions").fetchone() == (3,)
+    with pytest.raises(ValueError):
+        grader.archive.archive()
+
+
+def test_archive_moves_rows_to_parquet_partitions(tmp_path, monkeypatch) -> None:
+    pytest.importorskip("pyarrow")
+    grader = _grader(tmp_path, monkeypatch)
+
+    summary = grader.archive.archive(before="2026-06-01")
+
+    assert summary["rows"] == 2 and summary["vacuumed"]
+    files = grader.archive.partition_files()
+    assert [os.path.relpath(path, grader.get_archive_path()).split(os.sep)[:2] for path in files] == [
+        ["term=2026-spring", "unit=unit1"],
+        ["term=2026-spring", "unit=unit2"],
+    ]
+    with grader.db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM submissions").fetchone() == (1,)
+        # Q2 is only referenced by an archived row.
+        assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone() == (1,)
+        grader.archive.attach(conn)
+        assert conn.execute(
+            "SELECT unit_name, question_text, result FROM archived_submissions ORDER BY id"
+        ).fetchall() == [("unit1", "Q1", "pass"), ("unit2", "Q2", "fail")]
+        assert conn.execute("SELECT COUNT(*) FROM all_submissions WHERE qtag = 'q1'").fetchone() == (3,)
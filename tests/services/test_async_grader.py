@@ -0,0 +1,176 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+import httpx
+
+from llmgrader.services.async_grader import AsyncGrader
+from llmgrader.services.grader import Grader
+
+
+QUESTION = {
+    "question_text": "Question",
+    "solution": "Solution",
+    "grading_notes": "Notes",
+    "required": True,
+    "partial_credit": False,
+    "tools": [],
+}
+
+
+class _FakeUsage:
+    input_tokens = 12
+    output_tokens = 5
+
+
+class _FakeResponse:
+    def __init__(self) -> None:
+        self.output_text = '{"result":"pass","full_explanation":"ok","feedback":"fine"}'
+        self.usage = _FakeUsage()
+        self.output = []
+
+
+class _FakeAsyncResponses:
+    delay = 0.0
+    in_flight = 0
+    max_in_flight = 0
+    calls = []
+
+    async def create(self, **kwargs):
+        cls = _FakeAsyncResponses
+        cls.calls.append(kwargs)
+        cls.in_flight += 1
+        cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            await asyncio.sleep(cls.delay)
+        finally:
+            cls.in_flight -= 1
+        return _FakeResponse()
+
+
+class _FakeAsyncOpenAI:
+    instances = []
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.kwargs = kwargs
+        self.responses = _FakeAsyncResponses()
+        _FakeAsyncOpenAI.instances.append(self)
+
+
+def _grader(tmp_path, monkeypatch) -> Grader:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    monkeypatch.setattr("llmgrader.services.async_grader.AsyncOpenAI", _FakeAsyncOpenAI)
+    _FakeAsyncResponses.delay = 0.0
+    _FakeAsyncResponses.in_flight = 0
+    _FakeAsyncResponses.max_in_flight = 0
+    _FakeAsyncResponses.calls = []
+    _FakeAsyncOpenAI.instances = []
+    return Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+
+def test_async_grade_logs_submission_like_sync_grade(tmp_path, monkeypatch) -> None:
+    grader = _grader(tmp_path, monkeypatch)
+    async_grader = AsyncGrader(grader)
+    try:
+        grade = async_grader.grade(
+            question_dict=QUESTION,
+            student_soln="My answer",
+            unit_name="unit1",
+            qtag="q1",
+            model="gpt-4.1-mini",
+            api_key="test-key",
+            session_id="a1b2c3d4",
+        )
+    finally:
+        async_grader.close()
+
+    assert grade["result"] == "pass"
+    assert grade["feedback"].startswith("fine")
+
+    # All clients share the grader's single connection pool.
+    http_client = _FakeAsyncOpenAI.instances[0].kwargs["http_client"]
+    assert isinstance(http_client, httpx.AsyncClient)
+    assert _FakeAsyncOpenAI.instances[0].kwargs["api_key"] == "test-key"
+    assert _FakeAsyncResponses.calls[0]["text"] == {"format": {"type": "json_object"}}
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        row = conn.execute(
+            "SELECT client_id, unit_name, qtag, result, tokens_in, tokens_out, timed_out FROM submissions"
+        ).fetchone()
+    finally:
+        conn.close()
+    assert row == ("a1b2c3d4", "unit1", "q1", "pass", 12, 5, 0)
+
+
+def test_async_grader_runs_many_requests_concurrently(tmp_path, monkeypatch) -> None:
+    grader = _grader(tmp_path, monkeypatch)
+    _FakeAsyncResponses.delay = 0.3
+    async_grader = AsyncGrader(grader)
+    try:
+        started = time.time()
+        futures = [
+            async_grader.submit(async_grader.grade_async(
+                question_dict=QUESTION,
+                student_soln=f"Answer {index}",
+                api_key="test-key",
+            ))
+            for index in range(100)
+        ]
+        results = [future.result(timeout=10) for future in futures]
+        elapsed = time.time() - started
+    finally:
+        async_grader.close()
+
+    assert all(result["result"] == "pass" for result in results)
+    assert _FakeAsyncResponses.max_in_flight == 100
+    assert elapsed < 5.0
+
+
+def test_async_grader_timeout_matches_sync_error_grade(tmp_path, monkeypatch) -> None:
+    grader = _grader(tmp_path, monkeypatch)
+    monkeypatch.setattr(Grader, "LLM_EXTRA_TIMEOUT_SECONDS", 0.0)
+    _FakeAsyncResponses.delay = 2.0
+    async_grader = AsyncGrader(grader)
+    try:
+        grade = async_grader.grade(question_dict=QUESTION, student_soln="x", api_key="test-key", timeout=0.1)
+    finally:
+        async_grader.close()
+
+    assert grade["result"] == "error"
+    assert "did not respond within" in grade["full_explanation"]
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        assert conn.execute("SELECT timed_out FROM submissions").fetchone() == (1,)
+    finally:
+        conn.close()
+
+
+def test_async_grader_calls_hf_router_over_shared_http_client(tmp_path, monkeypatch) -> None:
+    grader = _grader(tmp_path, monkeypatch)
+    requests_seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_seen.append(request)
+        content = '{"result":"fail","full_explanation":"no","feedback":"retry"}'
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    async_grader = AsyncGrader(grader, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    try:
+        grade = async_grader.grade(
+            question_dict=QUESTION,
+            student_soln="x",
+            provider="hf",
+            model="hf:org/model",
+            api_key="hf-token",
+        )
+    finally:
+        async_grader.close()
+
+    assert grade["result"] == "fail"
+    assert str(requests_seen[0].url) == "https://router.huggingface.co/models/org/model/v1/chat/completions"
+    assert requests_seen[0].headers["Authorization"] == "Bearer hf-token"
+    assert json.loads(requests_seen[0].content)["model"] == "org/model"
@@ -1,3 +1,5 @@
+import gzip
+import json
 import sqlite3
 import threading
 import time
@@ -79,6 +81,21 @@ def test_dev_open_mode_allows_admin_routes_without_login(app_factory):
         assert resp.status_code == 200
 
 
+def test_admin_grading_stats_reports_scheduler_and_llm_client_pool(app_factory):
+    create, _ = app_factory
+    app = create(LLMGRADER_AUTH_MODE="dev-open", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
+
+    with app.test_client() as client:
+        resp = client.get("/api/admin/grading/stats")
+
+    assert resp.status_code == 200
+    payload = resp.get_json()
+    assert payload["queue_depth"] == 0
+    assert payload["scheduler"]["running"] == 0
+    assert payload["llm_clients"]["hits"] == 0
+    assert payload["llm_clients"]["misses"] == 0
+
+
 def test_google_callback_persists_user_and_non_admin_role(app_factory, monkeypatch):
     create, db_path = app_factory
     app = create(LLMGRADER_AUTH_MODE="normal", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
@@ -155,6 +172,88 @@ def test_dbviewer_rejects_non_readonly_sql(app_factory):
         assert allowed.status_code == 200
         assert allowed.get_json()["error"] is None
 
+        # Only the submissions tables and views can be read.
+        for sql in ("SELECT api_key FROM grade_jobs", "SELECT COUNT(*) FROM users", "SELECT name FROM sqlite_master"):
+            denied = client.post("/admin/dbviewer", json={"sql_query": sql}).get_json()
+            assert "may only read the submissions tables" in denied["error"]
+
+
+def test_dbviewer_pages_results_and_streams_csv(app_factory, monkeypatch):
+    create, db_path = app_factory
+    app = create(LLMGRADER_AUTH_MODE="dev-open", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
+    monkeypatch.setattr(APIController, "CSV_CHUNK_ROWS", 7)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO submission_rows (timestamp, qtag) VALUES ('2026-01-01T00:00:00', ?)",
+            [(f"q{i}",) for i in range(25)],
+        )
+    conn.close()
+    sql = "SELECT id, qtag FROM submissions ORDER BY id"
+    client = app.test_client()
+
+    seen = []
+    tokens = []
+    token = None
+    while True:
+        payload = client.post(
+            "/admin/dbviewer", json={"sql_query": sql, "page_size": 10, "page_token": token}
+        ).get_json()
+        assert payload["error"] is None
+        seen.extend(row[1] for row in payload["rows"])
+        token = payload["next_page_token"]
+        if token is None:
+            break
+        tokens.append(token)
+    assert seen == [f"q{i}" for i in range(25)]
+    assert len(tokens) == 2
+
+    # A token only continues the query it came from.
+    other = client.post("/admin/dbviewer", json={"sql_query": "SELECT 1", "page_token": tokens[0]})
+    assert "does not match" in other.get_json()["error"]
+
+    csv_resp = client.get("/admin/dbviewer/download")
+    assert csv_resp.is_streamed
+    assert csv_resp.get_data(as_text=True).splitlines() == ["id,qtag"] + [f"{i + 1},q{i}" for i in range(25)]
+
+    gz_resp = client.get("/admin/dbviewer/download?gzip=1")
+    assert gz_resp.mimetype == "application/gzip"
+    assert gzip.decompress(gz_resp.get_data()).decode("utf-8") == csv_resp.get_data(as_text=True)
+
+
+def test_dbviewer_caps_rows_and_cancels_slow_queries(app_factory):
+    create, db_path = app_factory
+    app = create(
+        LLMGRADER_AUTH_MODE="dev-open",
+        LLMGRADER_INITIAL_ADMIN_EMAIL=None,
+        LLMGRADER_ANALYTICS_MAX_ROWS="5",
+        LLMGRADER_ANALYTICS_TIMEOUT_SECONDS="0.2",
+    )
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO submission_rows (timestamp, qtag) VALUES ('2026-01-01T00:00:00', ?)",
+            [(f"q{i}",) for i in range(8)],
+        )
+    conn.close()
+    client = app.test_client()
+
+    payload = client.post(
+        "/admin/dbviewer", json={"sql_query": "SELECT qtag FROM submissions", "page_size": 10}
+    ).get_json()
+    assert len(payload["rows"]) == 5
+    assert payload["truncated"] is True and payload["next_page_token"] is None
+    assert client.get("/admin/dbviewer/download").get_data(as_text=True).splitlines()[-1].startswith(
+        "# Export truncated at 5 rows"
+    )
+
+    slow = client.post(
+        "/admin/dbviewer",
+        json={"sql_query": "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"},
+    ).get_json()
+    assert slow["error"].startswith("Query cancelled after")
+    assert slow["elapsed_ms"] >= 200
+
 
 @pytest.mark.parametrize("signed_in_email", ["student@example.com", None])
 def test_grade_route_passes_session_id(app_factory, monkeypatch, signed_in_email):
@@ -330,3 +429,346 @@ def test_grade_job_status_marks_stale_running_job_timed_out(app_factory, monkeyp
         assert "timed out" in status_payload["error"]
 
         release_job.set()
+
+
+def test_grade_jobs_from_different_sessions_share_worker_pool(app_factory, monkeypatch):
+    create, _ = app_factory
+    monkeypatch.setenv("LLMGRADER_GRADE_WORKERS", "1")
+    release_jobs = threading.Event()
+    first_job_started = threading.Event()
+
+    def fake_load_unit_pkg(self):
+        self.units = {
+            "unit1": {
+                "q1": {
+                    "question_text": "Question",
+                    "solution": "Solution",
+                    "grading_notes": "Notes",
+                }
+            }
+        }
+        self.units_order = []
+
+    def fake_grade(self, **kwargs):
+        first_job_started.set()
+        release_jobs.wait(timeout=2)
+        return {"result": "pass", "full_explanation": "ok", "feedback": "ok"}
+
+    monkeypatch.setattr(Grader, "load_unit_pkg", fake_load_unit_pkg)
+    monkeypatch.setattr(Grader, "grade", fake_grade)
+
+    app = create(LLMGRADER_AUTH_MODE="dev-open", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
+    request_body = {
+        "unit": "unit1",
+        "qtag": "q1",
+        "student_solution": "My answer",
+        "provider": "openai",
+        "api_key": "test-key",
+    }
+
+    try:
+        with app.test_client() as first_client, app.test_client() as second_client:
+            first_resp = first_client.post("/grade/jobs", json=request_body)
+            assert first_resp.status_code == 202
+            assert first_job_started.wait(timeout=1.0)
+
+            second_resp = second_client.post(
+                "/grade/jobs",
+                json={**request_body, "student_solution": "Another answer"},
+            )
+            assert second_resp.status_code == 202
+            second_job_id = second_resp.get_json()["job_id"]
+
+            status_payload = second_client.get(f"/grade/jobs/{second_job_id}").get_json()
+            assert status_payload["status"] == "queued"
+            assert status_payload["queue_position"] == 1
+
+            release_jobs.set()
+            deadline = time.time() + 2.0
+            while time.time() < deadline:
+                status_payload = second_client.get(f"/grade/jobs/{second_job_id}").get_json()
+                if status_payload["status"] == "done":
+                    break
+                time.sleep(0.01)
+            assert status_payload["status"] == "done"
+    finally:
+        release_jobs.set()
+
+
+def test_identical_grade_requests_coalesce_into_one_job(app_factory, monkeypatch):
+    create, _ = app_factory
+    release_job = threading.Event()
+    job_started = threading.Event()
+    grade_calls = []
+
+    def fake_load_unit_pkg(self):
+        self.units = {
+            "unit1": {
+                "q1": {
+                    "question_text": "Question",
+                    "solution": "Solution",
+                    "grading_notes": "Notes",
+                }
+            }
+        }
+        self.units_order = []
+
+    def fake_grade(self, **kwargs):
+        grade_calls.append(kwargs)
+        job_started.set()
+        release_job.wait(timeout=2)
+        return {"result": "pass", "full_explanation": "ok", "feedback": "ok"}
+
+    monkeypatch.setattr(Grader, "load_unit_pkg", fake_load_unit_pkg)
+    monkeypatch.setattr(Grader, "grade", fake_grade)
+
+    app = create(LLMGRADER_AUTH_MODE="dev-open", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
+    request_body = {
+        "unit": "unit1",
+        "qtag": "q1",
+        "student_solution": "My answer",
+        "provider": "openai",
+        "api_key": "test-key",
+    }
+
+    try:
+        with app.test_client() as first_tab, app.test_client() as second_tab:
+            first_resp = first_tab.post("/grade/jobs", json=request_body)
+            assert first_resp.status_code == 202
+            job_id = first_resp.get_json()["job_id"]
+            assert job_started.wait(timeout=1.0)
+
+            # Double click in the same tab and the same answer from another tab.
+            for client in (first_tab, second_tab):
+                resp = client.post("/grade/jobs", json=request_body)
+                assert resp.status_code == 202
+                assert resp.get_json()["job_id"] == job_id
+                assert resp.get_json()["coalesced"] is True
+
+            # A session attached to a job has an active job of its own.
+            busy_resp = second_tab.post("/grade/jobs", json={**request_body, "student_solution": "Other"})
+            assert busy_resp.status_code == 409
+
+            # A different API key never shares a job.
+            other_key_resp = app.test_client().post("/grade/jobs", json={**request_body, "api_key": "other-key"})
+            assert other_key_resp.get_json()["job_id"] != job_id
+
+            release_job.set()
+            deadline = time.time() + 2.0
+            while time.time() < deadline:
+                status_payload = second_tab.get(f"/grade/jobs/{job_id}").get_json()
+                if status_payload["status"] == "done":
+                    break
+                time.sleep(0.01)
+    finally:
+        release_job.set()
+
+    assert status_payload["status"] == "done"
+    assert status_payload["result"] == "pass"
+    # The double click is not another requester; the second tab is.
+    assert status_payload["coalesced_count"] == 1
+    assert _wait_for_calls(grade_calls, 2)
+
+
+def _wait_for_calls(calls: list, expected: int, timeout: float = 2.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if len(calls) == expected:
+            return True
+        time.sleep(0.01)
+    return len(calls) == expected
+
+
+def test_grade_job_events_stream_status_until_done(app_factory, monkeypatch):
+    create, _ = app_factory
+    release = threading.Event()
+
+    def fake_load_unit_pkg(self):
+        self.units = {
+            "unit1": {
+                "q1": {
+                    "question_text": "Question",
+                    "solution": "Solution",
+                    "grading_notes": "Notes",
+                }
+            }
+        }
+        self.units_order = []
+
+    def fake_grade(self, **kwargs):
+        release.wait(timeout=2)
+        return {"result": "pass", "full_explanation": "ok", "feedback": "ok"}
+
+    monkeypatch.setattr(Grader, "load_unit_pkg", fake_load_unit_pkg)
+    monkeypatch.setattr(Grader, "grade", fake_grade)
+
+    app = create(LLMGRADER_AUTH_MODE="dev-open", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
+
+    with app.test_client() as client:
+        assert client.get("/grade/jobs/missing/events").status_code == 404
+
+        start_resp = client.post(
+            "/grade/jobs",
+            json={"unit": "unit1", "qtag": "q1", "student_solution": "My answer", "provider": "openai"},
+        )
+        assert start_resp.status_code == 202
+        job_id = start_resp.get_json()["job_id"]
+
+        events_resp = client.get(f"/grade/jobs/{job_id}/events", buffered=False)
+        assert events_resp.status_code == 200
+        assert events_resp.mimetype == "text/event-stream"
+
+        threading.Timer(0.2, release.set).start()
+        body = events_resp.get_data(as_text=True)
+
+    statuses = [
+        json.loads(line[len("data: "):])
+        for line in body.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert [payload["status"] for payload in statuses][-1] == "done"
+    assert statuses[-1]["result"] == "pass"
+    assert "running" in [payload["status"] for payload in statuses]
+
+
+def test_grade_job_event_stream_ends_early_and_resumes_from_last_event(app_factory, monkeypatch):
+    create, _ = app_factory
+    release = threading.Event()
+
+    def fake_load_unit_pkg(self):
+        self.units = {"unit1": {"q1": {"question_text": "Question", "solution": "Solution"}}}
+        self.units_order = []
+
+    def fake_grade(self, **kwargs):
+        release.wait(timeout=5)
+        return {"result": "pass", "full_explanation": "ok", "feedback": "ok"}
+
+    monkeypatch.setattr(Grader, "load_unit_pkg", fake_load_unit_pkg)
+    monkeypatch.setattr(Grader, "grade", fake_grade)
+    monkeypatch.setattr(APIController, "GRADE_JOB_EVENTS_MAX_SECONDS", 0.3)
+    app = create(LLMGRADER_AUTH_MODE="dev-open", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
+
+    def events(body):
+        return [line[len("id: "):] for line in body.splitlines() if line.startswith("id: ")]
+
+    try:
+        with app.test_client() as client:
+            job_id = client.post(
+                "/grade/jobs",
+                json={"unit": "unit1", "qtag": "q1", "student_solution": "My answer", "provider": "openai"},
+            ).get_json()["job_id"]
+            deadline = time.time() + 5
+            while client.get(f"/grade/jobs/{job_id}").get_json()["status"] != "running" and time.time() < deadline:
+                time.sleep(0.01)
+
+            # The stream ends while the job is still running.
+            first = client.get(f"/grade/jobs/{job_id}/events").get_data(as_text=True)
+            assert first.startswith("retry: ")
+            ids = events(first)
+            assert len(ids) == 1
+
+            # A reconnect with the last id gets no repeated status...
+            again = client.get(f"/grade/jobs/{job_id}/events", headers={"Last-Event-ID": ids[-1]})
+            assert events(again.get_data(as_text=True)) == []
+
+            # ...and the next change is sent as usual.
+            release.set()
+            final = client.get(f"/grade/jobs/{job_id}/events", headers={"Last-Event-ID": ids[-1]})
+            assert '"status": "done"' in final.get_data(as_text=True)
+    finally:
+        release.set()
+
+
+def test_cancel_grade_job_frees_worker_slot(app_factory, monkeypatch):
+    create, _ = app_factory
+    monkeypatch.setenv("LLMGRADER_GRADE_WORKERS", "1")
+    first_job_started = threading.Event()
+    cancel_events = []
+
+    def fake_load_unit_pkg(self):
+        self.units = {
+            "unit1": {
+                "q1": {
+                    "question_text": "Question",
+                    "solution": "Solution",
+                    "grading_notes": "Notes",
+                }
+            }
+        }
+        self.units_order = []
+
+    def fake_grade(self, **kwargs):
+        cancel_events.append(kwargs["cancel_event"])
+        if kwargs["student_soln"] == "Slow answer":
+            first_job_started.set()
+            kwargs["cancel_event"].wait(timeout=5)
+        return {"result": "pass", "full_explanation": "ok", "feedback": "ok"}
+
+    monkeypatch.setattr(Grader, "load_unit_pkg", fake_load_unit_pkg)
+    monkeypatch.setattr(Grader, "grade", fake_grade)
+
+    app = create(LLMGRADER_AUTH_MODE="normal", LLMGRADER_INITIAL_ADMIN_EMAIL=None)
+    request_body = {"unit": "unit1", "qtag": "q1", "provider": "openai", "api_key": "test-key"}
+
+    owner, other = app.test_client(), app.test_client()
+    start_resp = owner.post("/grade/jobs", json={**request_body, "student_solution": "Slow answer"})
+    assert start_resp.status_code == 202
+    job_id = start_resp.get_json()["job_id"]
+    assert first_job_started.wait(timeout=1.0)
+
+    second_resp = other.post("/grade/jobs", json={**request_body, "student_solution": "Fast answer"})
+    second_job_id = second_resp.get_json()["job_id"]
+
+    assert owner.delete("/grade/jobs/missing").status_code == 404
+    assert other.delete(f"/grade/jobs/{job_id}").status_code == 403
+
+    cancel_resp = owner.delete(f"/grade/jobs/{job_id}")
+    assert cancel_resp.status_code == 200
+    assert cancel_resp.get_json()["status"] == "cancelled"
+    assert cancel_events[0].is_set()
+    assert owner.delete(f"/grade/jobs/{job_id}").status_code == 409
+
+    assert owner.get(f"/grade/jobs/{job_id}").get_json()["status"] == "cancelled"
+
+    # The single worker slot is free again, so the queued job runs.
+    deadline = time.time() + 2.0
+    while time.time() < deadline:
+        status_payload = other.get(f"/grade/jobs/{second_job_id}").get_json()
+        if status_payload["status"] == "done":
+            break
+        time.sleep(0.01)
+    assert status_payload["status"] == "done"
+
+
+def test_admin_users_and_preferences_are_cached(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setenv("LLMGRADER_AUTH_MODE", "normal")
+    monkeypatch.setenv("LLMGRADER_INITIAL_ADMIN_EMAIL", "admin@example.com")
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    controller = APIController(grader)
+    controller.ensure_auth_tables()
+
+    assert controller.is_admin_email("Admin@example.com")
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        conn.execute("DELETE FROM admin_users")
+        conn.commit()
+    finally:
+        conn.close()
+    # Served from memory until invalidated (or the TTL expires).
+    assert controller.is_admin_email("admin@example.com")
+    controller.invalidate_admin_emails()
+    assert not controller.is_admin_email("admin@example.com")
+
+    assert grader.load_admin_preferences()["allowedModels"] == []
+    grader.save_admin_preferences({"allowedModels": ["gpt-4.1-mini"]})
+    prefs = grader.load_admin_preferences()
+    assert prefs == {"allowedModels": ["gpt-4.1-mini"]}
+    prefs["allowedModels"].append("mutated")
+    assert grader.load_admin_preferences() == {"allowedModels": ["gpt-4.1-mini"]}
+
+    # Edits by another process are picked up once the TTL has passed.
+    monkeypatch.setattr(Grader, "ADMIN_PREFS_CACHE_SECONDS", 0.0)
+    Path(grader.get_admin_pref_path()).write_text(json.dumps({"allowedModels": ["gpt-5-mini", "gpt-5.4"]}))
+    assert grader.load_admin_preferences() == {"allowedModels": ["gpt-5-mini", "gpt-5.4"]}
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from llmgrader.services import compression
+from llmgrader.services.compression import ColumnCompressor
+from llmgrader.services.grader import Grader
+
+
+LONG_TEXT = "module full_adder(input a, b, cin, output s, cout);\n" * 40
+
+
+def test_compressed_values_round_trip_with_marker() -> None:
+    compressor = ColumnCompressor(["student_soln", "raw_prompt"])
+
+    stored = compressor.compress("student_soln", LONG_TEXT)
+    assert isinstance(stored, bytes) and stored.startswith(compression.MARKERS["zlib"])
+    assert len(stored) * 4 < len(LONG_TEXT)
+    assert compression.decompress(stored) == LONG_TEXT
+
+    # Short text, other columns and plain values pass through unchanged.
+    assert compressor.compress("student_soln", "x = 1") == "x = 1"
+    assert compressor.compress("feedback", LONG_TEXT) == LONG_TEXT
+    assert compression.decompress_row((1, "plain", None, stored)) == (1, "plain", None, LONG_TEXT)
+
+    with pytest.raises(ValueError):
+        ColumnCompressor(["timestamp"])
+
+
+def test_grader_compresses_configured_columns(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setenv("LLMGRADER_COMPRESS_COLUMNS", "raw_prompt,student_soln,feedback")
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+    grader.insert_submission(
+        timestamp="2026-01-02T00:00:00",
+        qtag="q1",
+        raw_prompt=LONG_TEXT,
+        student_soln=LONG_TEXT,
+        feedback="Looks good.",
+    )
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        raw_prompt, student_soln, feedback = conn.execute(
+            "SELECT raw_prompt, student_soln, feedback FROM submissions"
+        ).fetchone()
+    finally:
+        conn.close()
+    assert compression.is_compressed(raw_prompt) and compression.is_compressed(student_soln)
+    assert feedback == "Looks good."
+
+    # Connections from db.py can filter on the decoded text in SQL.
+    with grader.db.connection() as conn:
+        assert conn.execute(
+            "SELECT COUNT(*) FROM submissions WHERE llmgrader_text(student_soln) LIKE '%full_adder%'"
+        ).fetchone() == (1,)
@@ -0,0 +1,56 @@
+import sqlite3
+import threading
+
+import pytest
+
+from llmgrader.services.db import Database, get_database
+
+
+def test_connections_are_per_thread_and_use_wal(tmp_path) -> None:
+    database = get_database(str(tmp_path / "llmgrader.db"))
+    assert get_database(str(tmp_path / "llmgrader.db")) is database
+
+    with database.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == Database.BUSY_TIMEOUT_MS
+        first = conn
+    with database.connection() as conn:
+        assert conn is first
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(database._thread_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_blocks_commit_or_roll_back_and_readers_do_not_block_writers(tmp_path) -> None:
+    database = Database(str(tmp_path / "llmgrader.db"))
+    with database.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+
+    with pytest.raises(RuntimeError):
+        with database.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise RuntimeError("boom")
+
+    with database.connection() as conn:
+        conn.execute("INSERT INTO t VALUES (2)")
+        # Nested blocks share the outer transaction.
+        with database.connection(row_factory=sqlite3.Row) as inner:
+            assert inner is conn
+            assert inner.execute("SELECT COUNT(*) AS n FROM t").fetchone()["n"] == 1
+        assert conn.in_transaction
+
+    # An open read transaction on another connection does not block the insert.
+    reader = sqlite3.connect(database.db_path)
+    try:
+        reader.execute("BEGIN")
+        assert reader.execute("SELECT x FROM t").fetchall() == [(2,)]
+        with database.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (3)")
+        reader.execute("COMMIT")
+        assert reader.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 2
+    finally:
+        reader.close()
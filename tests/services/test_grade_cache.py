@@ -0,0 +1,139 @@
+import sqlite3
+import time
+
+from llmgrader.services.grade_cache import GradeCache
+from llmgrader.services.grader import Grader
+
+
+class _FakeRawResponse:
+    def model_dump(self):
+        return {"result": "pass", "full_explanation": "ok", "feedback": "ok"}
+
+
+QUESTION = {
+    "question_text": "Question",
+    "solution": "Solution",
+    "grading_notes": "Notes",
+    "required": True,
+    "partial_credit": False,
+    "tools": [],
+    "grade_cache": True,
+}
+
+
+def _cache(tmp_path, **kwargs) -> GradeCache:
+    cache = GradeCache(str(tmp_path / "llmgrader.db"), **kwargs)
+    cache.init_db()
+    return cache
+
+
+def test_cache_key_covers_prompt_model_tools_and_images() -> None:
+    base = {"task": "prompt", "provider": "openai", "model": "gpt-4.1-mini", "tools": [], "image_uris": []}
+    key = GradeCache.make_key(**base)
+
+    assert GradeCache.make_key(**base) == key
+    assert GradeCache.make_key(**{**base, "task": "prompt 2"}) != key
+    assert GradeCache.make_key(**{**base, "model": "gpt-5.4"}) != key
+    assert GradeCache.make_key(**{**base, "tools": ["web_search"]}) != key
+    assert GradeCache.make_key(**{**base, "image_uris": ["data:image/png;base64,AA"]}) != key
+
+
+def test_cache_expires_entries_and_evicts_least_recently_used(tmp_path) -> None:
+    cache = _cache(tmp_path, max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, model="m", grade={"result": key}, tool_call_summary=None, tokens_in=1, tokens_out=1)
+        time.sleep(0.01)
+    assert cache.get("a")["grade"] == {"result": "a"}  # "a" is now the most recently used
+
+    cache.put("c", model="m", grade={"result": "c"}, tool_call_summary=None, tokens_in=1, tokens_out=1)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+    expiring = GradeCache(str(tmp_path / "expiring.db"), ttl_seconds=0.05)
+    expiring.init_db()
+    expiring.put("x", model="m", grade={"result": "x"}, tool_call_summary=None, tokens_in=1, tokens_out=1)
+    time.sleep(0.1)
+    assert expiring.get("x") is None
+
+
+def test_grade_uses_cache_only_for_enabled_questions(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    calls = []
+
+    def fake_make_llm_caller(self, *args, **kwargs):
+        def call():
+            calls.append(1)
+            return _FakeRawResponse(), 11, 7, ""
+        return call
+
+    monkeypatch.setattr(Grader, "_make_llm_caller", fake_make_llm_caller)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+    first = grader.grade(question_dict=QUESTION, student_soln="Same answer", api_key="k")
+    second = grader.grade(question_dict=QUESTION, student_soln="Same answer", api_key="other-key")
+    grader.grade(question_dict=QUESTION, student_soln="Different answer", api_key="k")
+    grader.grade(question_dict={**QUESTION, "grade_cache": False}, student_soln="Same answer", api_key="k")
+
+    assert len(calls) == 3
+    assert second == first
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        rows = conn.execute(
+            "SELECT student_soln, cache_hit, tokens_in, tokens_out FROM submissions ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    assert rows == [
+        ("Same answer", 0, 11, 7),
+        ("Same answer", 1, 0, 0),
+        ("Different answer", 0, 11, 7),
+        ("Same answer", 0, 11, 7),
+    ]
+    assert grader.grade_cache.stats()["hits"] == 1
+
+
+def test_grade_does_not_cache_errors(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+
+    def failing_caller(self, *args, **kwargs):
+        def call():
+            raise RuntimeError("boom")
+        return call
+
+    monkeypatch.setattr(Grader, "_make_llm_caller", failing_caller)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+    grader.grade(question_dict=QUESTION, student_soln="Answer", api_key="k")
+    assert grader.grade_cache.stats()["entries"] == 0
+
+
+def test_cache_hit_is_served_without_admin_budget(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    monkeypatch.setattr(
+        Grader, "_make_llm_caller", lambda self, *args, **kwargs: lambda: (_FakeRawResponse(), 11, 7, "")
+    )
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    # The admin key's budget cannot cover another request.
+    monkeypatch.setattr(grader, "load_admin_preferences", lambda: {
+        "openaiApiKey": "sk-admin",
+        "allowedModels": ["gpt-4.1-mini"],
+        "tokenLimit": {"limit": 1, "period": "per_day"},
+    })
+
+    first = grader.grade(question_dict=QUESTION, student_soln="Same answer", api_key="k")
+    assert grader.grade(question_dict=QUESTION, student_soln="Same answer") == first
+    refused = grader.grade(question_dict=QUESTION, student_soln="Different answer")
+    assert refused["result"] == "error"
+
+    assert grader.admin_usage.usage(86400) == {"used": 0, "reserved": 0}
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        rows = conn.execute("SELECT student_soln, cache_hit, used_admin_key FROM submissions ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    assert rows == [("Same answer", 0, 0), ("Same answer", 1, 0)]
@@ -0,0 +1,415 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from llmgrader.services.grade_jobs import GradeJobRunner, GradeJobStore
+from llmgrader.services.grader import Grader
+
+
+def _job(job_id: str, *, session_id: str | None = None, timeout: float = 20.0) -> dict:
+    return {
+        "job_id": job_id,
+        "session_id": session_id,
+        "unit": "unit1",
+        "qtag": "q1",
+        "part_label": "all",
+        "provider": "openai",
+        "model": "gpt-4.1-mini",
+        "api_key": "sk-test",
+        "timeout": timeout,
+        "question_dict": {"question_text": "Question"},
+        "student_soln": f"Answer {job_id}",
+        "solution_images": [],
+        "tools": [],
+        "deadline_ts": time.time() + 120,
+    }
+
+
+def _store(tmp_path) -> GradeJobStore:
+    store = GradeJobStore(str(tmp_path / "llmgrader.db"))
+    store.init_db()
+    return store
+
+
+def test_enqueue_enforces_one_active_job_per_session_and_queue_depth(tmp_path) -> None:
+    store = _store(tmp_path)
+
+    assert store.enqueue_job(_job("a", session_id="s1"), max_queue_depth=2)[0] == "queued"
+    outcome, active_job = store.enqueue_job(_job("b", session_id="s1"), max_queue_depth=2)
+    assert outcome == "already_running"
+    assert active_job["job_id"] == "a"
+
+    assert store.enqueue_job(_job("c", session_id="s2"), max_queue_depth=2)[0] == "queued"
+    assert store.enqueue_job(_job("d", session_id="s3"), max_queue_depth=2) == ("queue_full", None)
+
+    assert store.queue_position("a") == 1
+    assert store.queue_position("c") == 2
+    assert store.queue_depth() == 2
+
+
+def test_claim_is_fifo_and_finish_drops_request_secrets(tmp_path) -> None:
+    store = _store(tmp_path)
+    store.enqueue_job(_job("a", session_id="s1"))
+    store.enqueue_job(_job("b", session_id="s2"))
+
+    claimed = store.claim_next_job("worker-1", timeout_grace=5.0)
+    assert claimed["job_id"] == "a"
+    assert claimed["status"] == "running"
+    assert claimed["question_dict"] == {"question_text": "Question"}
+    assert claimed["deadline_ts"] >= claimed["started_at_ts"] + 25.0
+    assert store.queue_position("b") == 1
+
+    assert store.finish_job("a", status="done", message="Grading complete.", result={"result": "pass"})
+    finished = store.get_job("a")
+    assert finished["status"] == "done"
+    assert finished["result"] == {"result": "pass"}
+
+    conn = sqlite3.connect(store.db_path)
+    try:
+        row = conn.execute("SELECT api_key, request_json FROM grade_jobs WHERE job_id = 'a'").fetchone()
+    finally:
+        conn.close()
+    assert row == (None, None)
+
+
+def test_api_keys_are_stored_encrypted(tmp_path) -> None:
+    store = GradeJobStore(str(tmp_path / "llmgrader.db"), secret_key="secret-1")
+    store.init_db()
+    store.enqueue_job(_job("a", session_id="s1"))
+
+    conn = sqlite3.connect(store.db_path)
+    try:
+        (stored,) = conn.execute("SELECT api_key FROM grade_jobs WHERE job_id = 'a'").fetchone()
+    finally:
+        conn.close()
+    assert stored and "sk-test" not in stored
+
+    claimed = store.claim_next_job("worker-1")
+    assert GradeJobRunner(None, store).grade_kwargs(claimed)["api_key"] == "sk-test"
+
+    # A process with another secret cannot read the key, and the job fails.
+    other = GradeJobStore(store.db_path, secret_key="secret-2")
+    grader = SimpleNamespace(scratch_dir=str(tmp_path), grade=lambda **kwargs: {"result": "pass"})
+    GradeJobRunner(grader, other).run(claimed)
+    failed = store.get_job("a")
+    assert failed["status"] == "error"
+    assert "LLMGRADER_SECRET_KEY" in failed["error"]
+
+
+def test_concurrent_claims_never_hand_out_the_same_job(tmp_path) -> None:
+    store = _store(tmp_path)
+    for index in range(20):
+        store.enqueue_job(_job(f"job{index}", session_id=f"s{index}"))
+
+    claimed_ids = []
+    claimed_lock = threading.Lock()
+
+    def claim_all(worker_id: str) -> None:
+        while True:
+            job = store.claim_next_job(worker_id)
+            if job is None:
+                return
+            with claimed_lock:
+                claimed_ids.append(job["job_id"])
+
+    threads = [threading.Thread(target=claim_all, args=(f"w{index}",)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed_ids) == sorted(f"job{index}" for index in range(20))
+
+
+def test_expired_jobs_are_marked_timed_out(tmp_path) -> None:
+    store = _store(tmp_path)
+    stale = _job("stale", session_id="s1")
+    stale["deadline_ts"] = time.time() - 1
+    store.enqueue_job(stale)
+
+    assert store.expire_stale_jobs() == 1
+    job = store.get_job("stale")
+    assert job["status"] == "timed_out"
+    assert job["message"] == "Grading job timed out waiting in the queue."
+    assert not store.finish_job("stale", status="done", message="Grading complete.")
+
+
+def test_state_changes_wake_change_waiters(tmp_path) -> None:
+    store = _store(tmp_path)
+    version = store.change_version()
+
+    assert store.wait_for_change(version, timeout=0.01) == version
+
+    threading.Timer(0.05, lambda: store.enqueue_job(_job("a", session_id="s1"))).start()
+    started = time.time()
+    new_version = store.wait_for_change(version, timeout=2.0)
+    assert new_version != version
+    assert time.time() - started < 1.0
+
+    # A finish that no longer applies does not wake waiters.
+    assert store.finish_job("missing", status="done", message="Grading complete.") is False
+    assert store.change_version() == new_version
+
+
+def test_identical_active_jobs_are_coalesced(tmp_path) -> None:
+    store = _store(tmp_path)
+    twin = {**_job("b", session_id="s2"), "student_soln": "Answer a"}
+
+    assert store.enqueue_job(_job("a", session_id="s1"))[0] == "queued"
+    outcome, attached = store.enqueue_job(twin, max_queue_depth=1)
+    assert outcome == "coalesced"
+    assert attached["job_id"] == "a"
+    assert attached["coalesced_count"] == 1
+    assert store.queue_depth() == 1
+
+    store.claim_next_job("worker-1")
+    store.finish_job("a", status="done", message="Grading complete.", result={"result": "pass"})
+    # Finished jobs are not reused; the next identical request gets a new job.
+    assert store.enqueue_job(twin)[0] == "queued"
+    assert store.enqueue_job({**twin, "job_id": "c", "session_id": "s3"}, coalesce=False)[0] == "queued"
+
+
+def test_coalesced_requesters_each_get_a_submission(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    store = GradeJobStore(grader.db_path)
+    store.init_db()
+    runner = GradeJobRunner(grader, store)
+
+    store.enqueue_job(_job("a", session_id="s1"))
+    # A double click from the owner attaches without counting as a requester.
+    assert store.enqueue_job({**_job("a2", session_id="s1"), "student_soln": "Answer a"})[0] == "coalesced"
+    for job_id, session_id in (("b", "s2"), ("c", "s3")):
+        outcome, attached = store.enqueue_job({**_job(job_id, session_id=session_id), "student_soln": "Answer a"})
+        assert outcome == "coalesced"
+    assert attached["coalesced_count"] == 2
+    assert store.requesters("a") == ["s1", "s2", "s3"]
+
+    claimed = store.claim_next_job("worker-1")
+    runner.record_outcome(claimed, {"result": "pass", "full_explanation": "ok", "feedback": "fine", "points": 1.0})
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        rows = conn.execute(
+            "SELECT client_id, result, cache_hit, coalesced, tokens_in, tokens_out, student_soln "
+            "FROM submissions ORDER BY client_id"
+        ).fetchall()
+    finally:
+        conn.close()
+    # The owner's row is logged by Grader.grade; the runner adds the others.
+    assert rows == [("s2", "pass", 0, 1, 0, 0, "Answer a"), ("s3", "pass", 0, 1, 0, 0, "Answer a")]
+
+
+def test_cancelled_and_abandoned_queued_jobs_log_cancelled_submissions(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    store = GradeJobStore(grader.db_path)
+    store.init_db()
+    GradeJobRunner(grader, store)
+
+    store.enqueue_job(_job("a", session_id="s1"))
+    store.enqueue_job({**_job("b", session_id="s2"), "student_soln": "Answer a"})
+    # An admin cancels the queued job for both students waiting on it.
+    assert store.cancel_job("a", "admin", force=True) == "cancelled"
+
+    store.enqueue_job(_job("c", session_id="s3"))
+    conn = sqlite3.connect(store.db_path)
+    try:
+        conn.execute("UPDATE grade_jobs SET last_seen_at_ts = ? WHERE job_id = 'c'", (time.time() - 120,))
+        conn.commit()
+    finally:
+        conn.close()
+    assert store.expire_stale_jobs(abandon_after=60.0) == 1
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        rows = conn.execute(
+            "SELECT client_id, result, tokens_in, tokens_out, student_soln FROM submissions ORDER BY client_id"
+        ).fetchall()
+    finally:
+        conn.close()
+    assert rows == [
+        ("s1", "cancelled", 0, 0, "Answer a"),
+        ("s2", "cancelled", 0, 0, "Answer a"),
+        ("s3", "cancelled", 0, 0, "Answer c"),
+    ]
+
+
+def test_cancel_detaches_coalesced_requests_and_abandoned_jobs_expire(tmp_path) -> None:
+    store = _store(tmp_path)
+    twin = {**_job("b", session_id="s2"), "student_soln": "Answer a"}
+    store.enqueue_job(_job("a", session_id="s1"))
+    assert store.enqueue_job(twin)[0] == "coalesced"
+
+    # The coalesced requester only detaches; the owner's cancel then stops the job.
+    assert store.cancel_job("a", "s2") == "detached"
+    assert store.cancel_job("a", "s2") == "not_requester"
+    assert store.get_job("a")["status"] == "queued"
+    assert store.cancel_job("a", "s1") == "cancelled"
+    job = store.get_job("a")
+    assert job["status"] == "cancelled"
+    assert job["api_key"] is None
+    assert store.cancel_job("a", "s1") == "not_active"
+    assert store.cancel_job("missing", "s1") == "unknown"
+
+    store.enqueue_job(_job("c", session_id="s3"))
+    store.claim_next_job("worker-1")
+    assert store.inactive_job_ids(["a", "c"]) == {"a"}
+    assert store.expire_stale_jobs(abandon_after=60.0) == 0
+
+    conn = sqlite3.connect(store.db_path)
+    try:
+        conn.execute("UPDATE grade_jobs SET last_seen_at_ts = ? WHERE job_id = 'c'", (time.time() - 120,))
+        conn.commit()
+    finally:
+        conn.close()
+    assert store.expire_stale_jobs(abandon_after=60.0) == 1
+    assert store.get_job("c")["status"] == "cancelled"
+    assert not store.finish_job("c", status="done", message="Grading complete.")
+
+
+def test_owner_cancel_after_double_submit_cancels_or_hands_over_the_job(tmp_path) -> None:
+    store = _store(tmp_path)
+    double_click = {**_job("a2", session_id="s1"), "student_soln": "Answer a"}
+
+    store.enqueue_job(_job("a", session_id="s1"))
+    assert store.enqueue_job(double_click)[0] == "coalesced"
+    # The owner is the only requester, so the job is cancelled outright.
+    assert store.cancel_job("a", "s1") == "cancelled"
+    assert store.get_job("a")["status"] == "cancelled"
+    assert store.enqueue_job(_job("b", session_id="s1"))[0] == "queued"
+
+    # With another student attached, the owner's cancel hands the job over.
+    assert store.enqueue_job({**_job("c", session_id="s2"), "student_soln": "Answer b"})[0] == "coalesced"
+    assert store.enqueue_job({**double_click, "student_soln": "Answer b"})[0] == "coalesced"
+    assert store.cancel_job("b", "s1") == "detached"
+    job = store.get_job("b")
+    assert (job["status"], job["session_id"], job["coalesced_count"]) == ("queued", "s2", 0)
+    assert store.enqueue_job(_job("d", session_id="s1"))[0] == "queued"
+    assert store.cancel_job("b", "s1") == "not_requester"
+    assert store.cancel_job("b", "s2") == "cancelled"
+
+    # Admins may cancel any job.
+    assert store.cancel_job("d", "admin", force=True) == "cancelled"
+
+
+def test_cancel_aborts_an_in_flight_blocking_llm_call(tmp_path, monkeypatch) -> None:
+    # An OpenAI endpoint that accepts the request and never answers.
+    server = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+
+    def accept():
+        conn, _ = server.accept()
+        accepted.append(conn)
+        conn.recv(65536)
+
+    threading.Thread(target=accept, daemon=True).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.getsockname()[1]}/v1")
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    store = GradeJobStore(grader.db_path)
+    store.init_db()
+    runner = GradeJobRunner(grader, store)
+
+    store.enqueue_job({**_job("a", session_id="s1"), "question_dict": {"question_text": "Q", "solution": "S"}})
+    worker = threading.Thread(target=runner.run, args=(store.claim_next_job("worker-1"),))
+    worker.start()
+    try:
+        deadline = time.time() + 5.0
+        while not accepted and time.time() < deadline:
+            time.sleep(0.01)
+        assert accepted
+
+        t0 = time.time()
+        assert store.cancel_job("a", "s1") == "cancelled"
+        assert runner.cancel("a")
+        worker.join(timeout=3.0)
+        assert not worker.is_alive()
+        assert time.time() - t0 < 2.0
+
+        # The provider sees the connection closed rather than left open.
+        accepted[0].settimeout(2.0)
+        while accepted[0].recv(65536):
+            pass
+    finally:
+        server.close()
+        for conn in accepted:
+            conn.close()
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        assert conn.execute("SELECT result FROM submissions").fetchall() == [("cancelled",)]
+    finally:
+        conn.close()
+
+
+class _ResponsesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = []
+
+    def setup(self):
+        super().setup()
+        _ResponsesHandler.connections.append(self.client_address)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({
+            "id": "resp_1",
+            "object": "response",
+            "created_at": 0,
+            "model": "gpt-4.1-mini",
+            "output": [{
+                "type": "message",
+                "id": "msg_1",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{
+                    "type": "output_text",
+                    "text": '{"result":"pass","full_explanation":"ok","feedback":"fine"}',
+                    "annotations": [],
+                }],
+            }],
+            "usage": {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_runner_jobs_share_pooled_llm_clients(tmp_path, monkeypatch) -> None:
+    _ResponsesHandler.connections = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ResponsesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    store = GradeJobStore(grader.db_path)
+    store.init_db()
+    runner = GradeJobRunner(grader, store)
+
+    try:
+        for job_id, session_id in (("a", "s1"), ("b", "s2")):
+            store.enqueue_job({**_job(job_id, session_id=session_id), "question_dict": {"question_text": "Q", "solution": "S"}})
+            runner.run(store.claim_next_job("worker-1"))
+            assert store.get_job(job_id)["status"] == "done"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Both jobs were cancellable, yet they shared one client and one keep-alive connection.
+    stats = grader.llm_clients.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 1)
+    assert len(_ResponsesHandler.connections) == 1
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from llmgrader.services.grade_scheduler import GradeScheduler
+
+
+def _wait_for(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_scheduler_workers_pull_jobs_in_fifo_order() -> None:
+    queue = deque([{"job_id": "a"}, {"job_id": "b"}, {"job_id": "c"}])
+    queue_lock = threading.Lock()
+    release = threading.Event()
+    started = []
+
+    def claim_job(worker_id: str):
+        with queue_lock:
+            return queue.popleft() if queue else None
+
+    def run_job(job: dict) -> None:
+        started.append(job["job_id"])
+        release.wait(timeout=2)
+
+    scheduler = GradeScheduler(claim_job, run_job, max_workers=1, poll_interval=0.05)
+    try:
+        scheduler.notify()
+        assert _wait_for(lambda: started == ["a"])
+        assert scheduler.stats() == {"max_workers": 1, "running": 1}
+
+        release.set()
+        assert _wait_for(lambda: started == ["a", "b", "c"])
+    finally:
+        release.set()
+        scheduler.shutdown()
+
+
+def test_scheduler_polls_for_jobs_enqueued_elsewhere() -> None:
+    queue = deque()
+    ran = threading.Event()
+
+    def claim_job(worker_id: str):
+        return queue.popleft() if queue else None
+
+    scheduler = GradeScheduler(claim_job, lambda job: ran.set(), max_workers=1, poll_interval=0.05)
+    try:
+        scheduler.start()
+        # No notify(): the idle worker must find the job on its next poll.
+        queue.append({"job_id": "remote"})
+        assert ran.wait(timeout=1.0)
+    finally:
+        scheduler.shutdown()
+
+
+def test_scheduler_reads_pool_size_from_env(monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_GRADE_WORKERS", "8")
+    monkeypatch.setenv("LLMGRADER_GRADE_QUEUE_DEPTH", "250")
+
+    assert GradeScheduler.max_workers_from_env() == 8
+    assert GradeScheduler.max_queue_depth_from_env() == 250
+
+
+def test_asynchronous_scheduler_keeps_max_workers_jobs_in_flight() -> None:
+    queue = deque({"job_id": str(index)} for index in range(5))
+    futures = []
+
+    def claim_job(worker_id: str):
+        return queue.popleft() if queue else None
+
+    def submit_job(job: dict) -> Future:
+        future = Future()
+        futures.append(future)
+        return future
+
+    scheduler = GradeScheduler(claim_job, submit_job, max_workers=3, poll_interval=0.05, asynchronous=True)
+    try:
+        scheduler.notify()
+        assert _wait_for(lambda: len(futures) == 3)
+        time.sleep(0.1)
+        # One dispatcher thread, no more than max_workers jobs in flight.
+        assert len(futures) == 3
+        assert scheduler.stats() == {"max_workers": 3, "running": 3}
+
+        futures[0].set_result(None)
+        assert _wait_for(lambda: len(futures) == 4)
+        for future in list(futures):
+            if not future.done():
+                future.set_result(None)
+        assert _wait_for(lambda: len(futures) == 5)
+        futures[4].set_result(None)
+        assert _wait_for(lambda: scheduler.stats()["running"] == 0)
+    finally:
+        scheduler.shutdown()
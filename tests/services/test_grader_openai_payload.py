@@ -78,4 +78,25 @@ def test_openai_multimodal_payload_wraps_content_in_user_message(tmp_path, monke
     ]
     assert request_kwargs["model"] == "gpt-5.4-mini"
     assert request_kwargs["timeout"] == 20
-    assert request_kwargs["text"] == {"format": {"type": "json_object"}}
\ No newline at end of file
+    assert request_kwargs["text"] == {"format": {"type": "json_object"}}
+
+def test_openai_client_is_reused_across_calls(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr("llmgrader.services.grader.OpenAI", _FakeOpenAI)
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+    for _ in range(3):
+        grader._make_llm_caller(
+            provider="openai",
+            model="gpt-5.4-mini",
+            api_key="test-key",
+            task="Grade this solution.",
+            timeout=20,
+        )()
+
+    assert len(_FakeOpenAI.last_instance.responses.calls) == 3
+    stats = grader.llm_clients.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
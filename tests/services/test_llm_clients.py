@@ -0,0 +1,159 @@
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+
+from llmgrader.services.llm_clients import AbortScope, LLMClientRegistry, make_http_client
+
+
+class _FakeClient:
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_registry_reuses_clients_per_provider_and_key() -> None:
+    registry = LLMClientRegistry({"openai": _FakeClient, "hf": _FakeClient})
+
+    with registry.lease("openai", "key-a") as first:
+        pass
+    with registry.lease("openai", "key-a") as second:
+        pass
+    with registry.lease("openai", "key-b") as other_key:
+        pass
+    with registry.lease("hf", "key-a") as other_provider:
+        pass
+
+    assert first is second
+    assert other_key is not first
+    assert other_provider is not first
+    stats = registry.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["clients"] == 3
+    assert stats["hit_rate"] == 0.25
+
+    # Only a hash of the key is used for lookup.
+    assert all("key-a" not in part for key in registry._entries for part in key)
+
+    with pytest.raises(ValueError):
+        with registry.lease("unknown", "key-a"):
+            pass
+
+
+def test_registry_evicts_least_recently_used_and_closes_idle_clients() -> None:
+    registry = LLMClientRegistry({"openai": _FakeClient}, max_clients=2)
+
+    with registry.lease("openai", "a") as client_a:
+        pass
+    with registry.lease("openai", "b") as client_b:
+        pass
+    with registry.lease("openai", "a"):
+        pass
+    with registry.lease("openai", "c"):
+        pass
+
+    assert client_b.closed
+    assert not client_a.closed
+    assert registry.stats()["evictions"] == 1
+
+
+def test_registry_closes_leased_client_only_after_release() -> None:
+    registry = LLMClientRegistry({"openai": _FakeClient}, max_clients=1)
+
+    with registry.lease("openai", "a") as client_a:
+        with registry.lease("openai", "b"):
+            # client_a was evicted but is still in use.
+            assert not client_a.closed
+        assert not client_a.closed
+    assert client_a.closed
+
+
+def test_registry_evicts_clients_idle_longer_than_timeout() -> None:
+    registry = LLMClientRegistry({"openai": _FakeClient}, idle_timeout=0.05)
+
+    with registry.lease("openai", "a") as client_a:
+        pass
+    time.sleep(0.1)
+    with registry.lease("openai", "b"):
+        pass
+
+    assert client_a.closed
+    assert registry.stats()["clients"] == 1
+
+
+def test_abort_scope_aborts_only_its_own_request_on_a_shared_client() -> None:
+    # "/wait" is answered once released, "/never" is not answered at all.
+    server = socket.create_server(("127.0.0.1", 0))
+    release = threading.Event()
+    connections = []
+
+    def serve(conn):
+        while True:
+            try:
+                data = conn.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            if data.startswith(b"GET /wait") and release.wait(5):
+                conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            connections.append(conn)
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    url = f"http://127.0.0.1:{server.getsockname()[1]}"
+    client = make_http_client()
+    results = {}
+
+    def request(name, scope, path):
+        try:
+            with scope.active():
+                results[name] = client.get(url + path).text
+        except httpx.TransportError as exc:
+            results[name] = exc
+
+    kept, blocked = AbortScope(), AbortScope()
+    threads = [
+        threading.Thread(target=request, args=("kept", kept, "/wait")),
+        threading.Thread(target=request, args=("blocked", blocked, "/never")),
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 5.0
+        while len(connections) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+        t0 = time.time()
+        blocked.abort()
+        threads[1].join(timeout=2.0)
+        assert time.time() - t0 < 1.0
+        assert isinstance(results["blocked"], httpx.TransportError)
+
+        # The other job's request on the same client is untouched, and its
+        # connection goes back to the pool.
+        release.set()
+        threads[0].join(timeout=2.0)
+        request("again", AbortScope(), "/wait")
+        assert results["kept"] == results["again"] == "ok"
+        assert len(connections) == 2
+    finally:
+        release.set()
+        client.close()
+        server.close()
+        for conn in connections:
+            conn.close()
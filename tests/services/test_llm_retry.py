@@ -0,0 +1,223 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import httpx
+
+from llmgrader.services.grader import Grader
+from llmgrader.services.llm_retry import LatencyTracker, LLMCaller, RetryPolicy
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def _caller(policy: RetryPolicy, *, deadline_in: float = 30.0, latency: LatencyTracker | None = None) -> LLMCaller:
+    return LLMCaller(
+        policy,
+        timeout=10.0,
+        deadline_ts=time.time() + deadline_in,
+        extra_timeout=0.0,
+        latency=latency,
+        latency_key=("openai", "gpt-4.1-mini"),
+    )
+
+
+def test_transient_errors_are_retried_until_success() -> None:
+    outcomes = [_status_error(503), _status_error(429), "ok"]
+    timeouts = []
+
+    def make_request(attempt_timeout: float):
+        timeouts.append(attempt_timeout)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    result = _caller(RetryPolicy(max_attempts=3, base_delay=0.0)).call(make_request)
+
+    assert result.value == "ok"
+    assert (result.attempts, result.winning_attempt) == (3, 3)
+    assert all(0 < t <= 10.0 for t in timeouts)
+
+
+def test_permanent_errors_and_exhausted_deadline_are_not_retried() -> None:
+    calls = []
+
+    def bad_request(attempt_timeout: float):
+        calls.append(attempt_timeout)
+        raise _status_error(400)
+
+    result = _caller(RetryPolicy(max_attempts=3, base_delay=0.0)).call(bad_request)
+    assert result.attempts == 1 and len(calls) == 1
+    assert result.error.response.status_code == 400
+
+    def unavailable(attempt_timeout: float):
+        raise _status_error(503)
+
+    # Less than MIN_ATTEMPT_SECONDS left after the first failure: give up.
+    result = _caller(RetryPolicy(max_attempts=3, base_delay=0.0), deadline_in=1.0).call(unavailable)
+    assert result.attempts == 1
+    assert result.error.response.status_code == 503
+
+
+def test_retries_wait_for_rate_limit_budget_and_note_each_failure_once() -> None:
+    failures = []
+    budget_waits = [0.05, 0.05, 0.0]
+    outcomes = [_status_error(429), "ok"]
+
+    def make_request(attempt_timeout: float):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    caller = _caller(RetryPolicy(max_attempts=3, base_delay=0.0))
+    caller.on_failure = lambda exc: failures.append(exc) or 0.01
+    caller.acquire_budget = lambda: budget_waits.pop(0)
+    result = caller.call(make_request)
+
+    # The retry was only sent once the limiter reserved budget for it.
+    assert result.value == "ok" and result.attempts == 2
+    assert budget_waits == [] and len(failures) == 1
+
+    # No budget before the deadline: give up and report the provider's wait.
+    caller = _caller(RetryPolicy(max_attempts=3, base_delay=0.0), deadline_in=5.0)
+    caller.on_failure = lambda exc: failures.append(exc) or 0.01
+    caller.acquire_budget = lambda: 60.0
+    result = caller.call(lambda attempt_timeout: (_ for _ in ()).throw(_status_error(429)))
+    assert result.attempts == 1 and len(failures) == 2
+    assert result.retry_after == 0.01
+
+
+def test_hedged_request_wins_and_slow_request_is_cancelled() -> None:
+    latency = LatencyTracker()
+    for _ in range(LatencyTracker.MIN_SAMPLES):
+        latency.record(("openai", "gpt-4.1-mini"), 0.05)
+    cancelled = []
+    started = []
+
+    async def make_request(attempt_timeout: float):
+        started.append(attempt_timeout)
+        if len(started) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        return "hedged"
+
+    policy = RetryPolicy(max_attempts=2, hedge=True, hedge_min_delay=0.0)
+    t0 = time.time()
+    result = asyncio.run(_caller(policy, latency=latency).call_async(make_request))
+
+    assert result.value == "hedged"
+    assert (result.attempts, result.winning_attempt) == (2, 2)
+    assert cancelled == [True]
+    assert time.time() - t0 < 2.0
+
+
+class _FakeUsage:
+    input_tokens = 12
+    output_tokens = 5
+
+
+class _FakeResponse:
+    def __init__(self, output_text: str) -> None:
+        self.output_text = output_text
+        self.usage = _FakeUsage()
+        self.output = []
+
+
+class _FlakyResponses:
+    outputs = []
+
+    def create(self, **kwargs):
+        return _FakeResponse(_FlakyResponses.outputs.pop(0))
+
+
+class _FakeOpenAI:
+    def __init__(self, *args, **kwargs) -> None:
+        self.responses = _FlakyResponses()
+
+
+def test_grade_retries_malformed_json_and_logs_attempts(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr("llmgrader.services.grader.OpenAI", _FakeOpenAI)
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    _FlakyResponses.outputs = [
+        "Sure! Here is the grade:",
+        '{"result":"pass","full_explanation":"ok","feedback":"fine"}',
+    ]
+
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    grade = grader.grade(
+        question_dict={"question_text": "Q", "solution": "S", "grading_notes": "N", "tools": []},
+        student_soln="answer",
+        api_key="test-key",
+    )
+
+    assert grade["result"] == "pass"
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        row = conn.execute("SELECT llm_attempts, llm_winning_attempt FROM submissions").fetchone()
+    finally:
+        conn.close()
+    assert row == (2, 2)
+
+
+def test_cancelled_grade_is_logged_without_calling_the_llm(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr("llmgrader.services.grader.OpenAI", _FakeOpenAI)
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    _FlakyResponses.outputs = ['{"result":"pass","full_explanation":"ok","feedback":"fine"}']
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    grade = grader.grade(
+        question_dict={"question_text": "Q", "solution": "S", "grading_notes": "N", "tools": []},
+        student_soln="answer",
+        api_key="test-key",
+        cancel_event=cancel_event,
+    )
+
+    assert grade["result"] == "cancelled"
+    assert len(_FlakyResponses.outputs) == 1
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        row = conn.execute("SELECT result FROM submissions").fetchone()
+    finally:
+        conn.close()
+    assert row == ("cancelled",)
+
+
+def test_llm_client_init_failure_is_reported_without_retrying(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    builds = []
+
+    def broken_caller(self, *args, **kwargs):
+        builds.append(args)
+        raise RuntimeError("bad client config")
+
+    monkeypatch.setattr(Grader, "_make_llm_caller", broken_caller)
+
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    grade = grader.grade(
+        question_dict={"question_text": "Q", "solution": "S", "grading_notes": "N", "tools": []},
+        student_soln="answer",
+        api_key="test-key",
+    )
+
+    assert grade["result"] == "error"
+    assert grade["full_explanation"].startswith("Failed to initialize LLM client: bad client config")
+    assert len(builds) == 1
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        row = conn.execute("SELECT llm_attempts FROM submissions").fetchone()
+    finally:
+        conn.close()
+    assert row == (0,)
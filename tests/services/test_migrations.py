@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+from llmgrader.services import migrations
+from llmgrader.services.grader import Grader
+
+
+def _old_db(tmp_path) -> sqlite3.Connection:
+    conn = sqlite3.connect(tmp_path / "llmgrader.db", isolation_level=None)
+    conn.execute(
+        """
+        CREATE TABLE submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            unit_name TEXT,
+            qtag TEXT,
+            tokens_in INTEGER,
+            tokens_out INTEGER,
+            used_admin_key INTEGER,
+            user_email TEXT
+        )
+        """
+    )
+    conn.execute(
+        "INSERT INTO submissions (timestamp, user_email) VALUES ('2026-01-01T00:00:00', 'student@example.com')"
+    )
+    return conn
+
+
+def test_migrations_run_once_and_index_hot_queries(tmp_path) -> None:
+    conn = _old_db(tmp_path)
+    try:
+        assert migrations.migrate(conn) == list(range(1, migrations.SCHEMA_VERSION + 1))
+        assert migrations.schema_version(conn) == migrations.SCHEMA_VERSION
+        assert migrations.migrate(conn) == []
+
+        columns = migrations.table_columns(conn, "submissions")
+        assert {"client_id", "llm_attempts", "solution_image_paths_json"} <= set(columns)
+        assert conn.execute("SELECT user_email FROM submissions").fetchone() == (None,)
+
+        plan = " ".join(
+            row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT SUM(tokens_in + tokens_out) FROM submissions "
+                "WHERE used_admin_key = 1 AND timestamp >= ?",
+                ("2026-01-01",),
+            )
+        )
+        assert "idx_submissions_admin_key_ts" in plan
+    finally:
+        conn.close()
+
+
+def test_failed_migration_is_rolled_back(tmp_path) -> None:
+    conn = _old_db(tmp_path)
+
+    def broken(conn):
+        conn.execute("CREATE INDEX idx_partial ON submissions (qtag)")
+        raise RuntimeError("boom")
+
+    try:
+        steps = migrations.MIGRATIONS[:1] + [migrations.Migration(2, "broken", broken)]
+        with pytest.raises(RuntimeError):
+            migrations.migrate(conn, steps)
+        assert migrations.schema_version(conn) == 1
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_partial'").fetchone() is None
+    finally:
+        conn.close()
+
+
+def test_grader_migrates_new_database(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        assert migrations.schema_version(conn) == migrations.SCHEMA_VERSION
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(submission_rows)")}
+    finally:
+        conn.close()
+    assert {"idx_submissions_unit_qtag_ts", "idx_submissions_client_ts"} <= indexes
+
+
+def test_blob_migration_compacts_repeated_text(tmp_path) -> None:
+    conn = _old_db(tmp_path)
+    try:
+        migrations.migrate(conn, migrations.MIGRATIONS[:1])
+        conn.executemany(
+            "INSERT INTO submissions (timestamp, qtag, question_text, ref_soln, student_soln) VALUES (?, ?, ?, ?, ?)",
+            [("2026-01-02T00:00:00", "q1", "Design a full adder.", "Use two XORs.", f"answer {i}") for i in range(5)],
+        )
+        conn.execute("DELETE FROM submissions WHERE id = 6")
+        migrations.migrate(conn)
+
+        assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone() == (2,)
+        assert conn.execute(
+            "SELECT id, question_text, ref_soln, grading_notes, student_soln FROM submissions WHERE qtag = 'q1' ORDER BY id"
+        ).fetchall() == [
+            (i, "Design a full adder.", "Use two XORs.", None, f"answer {i - 2}") for i in range(2, 6)
+        ]
+        assert migrations.table_columns(conn, "submissions")[:3] == ["id", "timestamp", "unit_name"]
+        # Deleted ids are not reused.
+        conn.execute("INSERT INTO submission_rows (timestamp) VALUES ('2026-01-03T00:00:00')")
+        assert conn.execute("SELECT MAX(id) FROM submissions").fetchone() == (7,)
+    finally:
+        conn.close()
+
+
+def test_grader_stores_question_text_once(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+
+    grader.insert_submissions([
+        {"timestamp": "2026-01-02T00:00:00", "question_text": "Q", "raw_prompt": "prompt", "student_soln": str(i)}
+        for i in range(3)
+    ])
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone() == (2,)
+        assert conn.execute("SELECT DISTINCT question_text, raw_prompt FROM submissions").fetchall() == [("Q", "prompt")]
+    finally:
+        conn.close()
@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+from llmgrader.services.package_snapshot import PackageSnapshot
+from llmgrader.services.unit_parser import UnitParser
+
+
+RESOURCE_DIR = Path(__file__).resolve().parents[1] / "fixtures" / "unit_parser"
+
+
+def _stage_image_package(pkg_dir: Path) -> None:
+    pkg_dir.mkdir()
+    shutil.copy2(RESOURCE_DIR / "config_image_unit.xml", pkg_dir / "llmgrader_config.xml")
+    shutil.copy2(RESOURCE_DIR / "unit_with_image.xml", pkg_dir / "unit_with_image.xml")
+    shutil.copy2(RESOURCE_DIR / "soln_img.png", pkg_dir / "soln_img.png")
+    (pkg_dir / "unit_images").mkdir()
+    shutil.copy2(RESOURCE_DIR / "soln_img.png", pkg_dir / "unit_images" / "soln_img.png")
+
+
+def _make_parser(tmp_path: Path, snapshot: PackageSnapshot) -> UnitParser:
+    scratch_dir = tmp_path / "scratch"
+    scratch_dir.mkdir(exist_ok=True)
+    return UnitParser(scratch_dir=str(scratch_dir), soln_pkg=str(tmp_path / "pkg"), snapshot=snapshot)
+
+
+def test_snapshot_is_reused_until_a_package_file_changes(tmp_path: Path, monkeypatch) -> None:
+    pkg_dir = tmp_path / "pkg"
+    _stage_image_package(pkg_dir)
+    snapshot = PackageSnapshot(str(tmp_path / "snapshots" / "unit_package.json"))
+
+    parsed = _make_parser(tmp_path, snapshot).parse()
+    stored = json.loads(Path(snapshot.snapshot_path).read_text(encoding="utf-8"))
+    assert sorted(stored["manifest"]) == [
+        "llmgrader_config.xml",
+        "soln_img.png",
+        "unit_images/soln_img.png",
+        "unit_with_image.xml",
+    ]
+
+    parse_calls = []
+    original_parse = UnitParser._parse_package
+    monkeypatch.setattr(
+        UnitParser,
+        "_parse_package",
+        lambda self, path, *args: parse_calls.append(path) or original_parse(self, path, *args),
+    )
+
+    # Unchanged files, and files rewritten with the same content, load the snapshot.
+    assert _make_parser(tmp_path, snapshot).parse() == parsed
+    os.utime(pkg_dir / "soln_img.png", ns=(0, 0))
+    assert _make_parser(tmp_path, snapshot).parse() == parsed
+    assert parse_calls == []
+
+    # A changed image is re-encoded.
+    (pkg_dir / "soln_img.png").write_bytes(b"not really a png")
+    reparsed = _make_parser(tmp_path, snapshot).parse()
+    assert len(parse_calls) == 1
+    assert reparsed.units != parsed.units
+
+
+def test_snapshot_is_ignored_for_other_parser_options(tmp_path: Path) -> None:
+    pkg_dir = tmp_path / "pkg"
+    _stage_image_package(pkg_dir)
+    snapshot = PackageSnapshot(str(tmp_path / "snapshots" / "unit_package.json"))
+    _make_parser(tmp_path, snapshot).parse()
+
+    package_fields, manifest, up_to_date = snapshot.load(str(pkg_dir), ["web_search"])
+
+    assert package_fields is None
+    assert not up_to_date
+    assert "unit_with_image.xml" in manifest
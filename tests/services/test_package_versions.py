@@ -0,0 +1,84 @@
+import os
+import threading
+import zipfile
+from pathlib import Path
+
+from llmgrader.services.grader import Grader
+
+
+RESOURCE_DIR = Path(__file__).resolve().parents[1] / "fixtures" / "unit_parser"
+
+
+def _package_zip(tmp_path: Path, name: str, unit_name: str = "unit_good.xml") -> str:
+    zip_path = tmp_path / name
+    with zipfile.ZipFile(zip_path, "w") as z:
+        z.write(RESOURCE_DIR / "config_good.xml", "llmgrader_config.xml")
+        z.write(RESOURCE_DIR / unit_name, "unit_good.xml")
+    return str(zip_path)
+
+
+def test_upload_swaps_in_new_package_version_and_keeps_previous(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"))
+    assert grader.units == {}
+
+    first = grader.stage_package(_package_zip(tmp_path, "first.zip"))
+    assert first["status"] == "ok"
+    first_path = grader.soln_pkg
+    first_package = grader.unit_package
+    assert grader.package_versions.current() == first_path
+    assert list(first["changes"]["added"]) == ["Fixture Good Unit"]
+
+    # A package without valid units is discarded; the current one stays loaded.
+    broken = grader.stage_package(_package_zip(tmp_path, "broken.zip", "unit_broken.xml"))
+    assert broken["status"] == "error"
+    assert grader.unit_package is first_package
+    assert grader.package_versions.versions() == [os.path.basename(first_path)]
+
+    second = grader.stage_package(_package_zip(tmp_path, "second.zip"))
+    third = grader.stage_package(_package_zip(tmp_path, "third.zip"))
+    assert second["status"] == third["status"] == "ok"
+    assert third["changes"] == {"added": {}, "changed": {}, "removed": {}}
+
+    # The current and the previous version are kept.
+    versions = grader.package_versions.versions()
+    assert len(versions) == 2
+    assert os.path.basename(first_path) not in versions
+    assert os.path.join(grader.package_versions.root, versions[-1]) == grader.soln_pkg
+    # The first package object is unchanged by the later swaps.
+    assert first_package.soln_pkg_path == first_path
+
+    # A restart loads the current version.
+    restarted = Grader(scratch_dir=str(tmp_path / "scratch"))
+    assert restarted.soln_pkg == grader.soln_pkg
+    assert restarted.units == grader.units
+
+
+def test_upload_route_reports_staging_then_result(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"))
+
+    class Upload:
+        filename = "pkg.zip"
+
+        def save(self, path):
+            Path(path).write_bytes(Path(_package_zip(tmp_path, "pkg.zip")).read_bytes())
+
+    payload, status_code = grader.save_uploaded_file(Upload())
+    assert status_code == 202
+    assert payload["status"] == "staging"
+
+    for thread in threading.enumerate():
+        if thread.name.startswith("llmgrader-upload-"):
+            thread.join(timeout=30)
+
+    result = grader.get_package_upload(payload["upload_id"])
+    assert result["status"] == "ok"
+    assert "Fixture Good Unit" in grader.units
+
+    class NotAZip(Upload):
+        def save(self, path):
+            Path(path).write_bytes(b"not a zip")
+
+    payload, status_code = grader.save_uploaded_file(NotAZip())
+    assert status_code == 400
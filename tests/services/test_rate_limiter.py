@@ -0,0 +1,93 @@
+import time
+
+import httpx
+
+from llmgrader.services.grade_jobs import GradeJobStore
+from llmgrader.services.rate_limiter import RateLimiter
+
+
+def _limiter(tmp_path, limits: list[dict]) -> RateLimiter:
+    limiter = RateLimiter(str(tmp_path / "llmgrader.db"), load_limits=lambda: limits)
+    limiter.init_db()
+    return limiter
+
+
+def _job(job_id: str, model: str, estimated_tokens: int = 100) -> dict:
+    return {
+        "job_id": job_id,
+        "unit": "unit1",
+        "qtag": "q1",
+        "part_label": "all",
+        "provider": "openai",
+        "model": model,
+        "timeout": 20.0,
+        "question_dict": {},
+        "student_soln": f"Answer {job_id}",
+        "solution_images": [],
+        "tools": [],
+        "estimated_tokens": estimated_tokens,
+        "deadline_ts": time.time() + 120,
+    }
+
+
+def test_buckets_limit_requests_and_tokens_per_minute(tmp_path) -> None:
+    limiter = _limiter(tmp_path, [{"provider": "openai", "model": "gpt-4.1-mini", "rpm": 2, "tpm": 60000}])
+
+    assert limiter.acquire("openai", "gpt-4.1-mini", 1000) == 0.0
+    assert limiter.acquire("openai", "gpt-4.1-mini", 1000) == 0.0
+    # Third request in the same minute waits for one request to refill (30s at 2 RPM).
+    assert 25.0 < limiter.acquire("openai", "gpt-4.1-mini", 1000) <= 30.0
+
+    # Tokens: 60000 TPM refills 1000 tokens per second.
+    tpm_limiter = _limiter(tmp_path, [{"model": "gpt-5-mini", "tpm": 60000}])
+    assert tpm_limiter.acquire(None, "gpt-5-mini", 50000) == 0.0
+    assert 19.0 < tpm_limiter.acquire(None, "gpt-5-mini", 30000) <= 20.0
+    # Models without limits are never held.
+    assert tpm_limiter.acquire("openai", "gpt-5.4", 10**9) == 0.0
+
+
+def test_claim_holds_rate_limited_jobs_and_runs_other_models(tmp_path) -> None:
+    limiter = _limiter(tmp_path, [{"provider": "openai", "model": "gpt-4.1-mini", "rpm": 1}])
+    store = GradeJobStore(limiter.db_path)
+    store.init_db()
+    for job in (_job("a", "gpt-4.1-mini"), _job("b", "gpt-4.1-mini"), _job("c", "gpt-5-mini")):
+        assert store.enqueue_job(job)[0] == "queued"
+
+    assert store.claim_next_job("w1", rate_limiter=limiter)["job_id"] == "a"
+    # "b" has no budget left this minute, so the next job for another model runs.
+    assert store.claim_next_job("w1", rate_limiter=limiter)["job_id"] == "c"
+    assert store.claim_next_job("w1", rate_limiter=limiter) is None
+
+    held = store.get_job("b")
+    assert held["status"] == "queued"
+    assert held["rate_limited_until_ts"] > time.time() + 50
+
+
+def test_retry_after_headers_are_parsed() -> None:
+    assert RateLimiter.retry_after_from_headers({"retry-after": "7"}) == 7.0
+    assert RateLimiter.retry_after_from_headers({"retry-after-ms": "250"}) == 0.25
+    headers = {
+        "x-ratelimit-remaining-requests": "10",
+        "x-ratelimit-reset-requests": "1s",
+        "x-ratelimit-remaining-tokens": "0",
+        "x-ratelimit-reset-tokens": "6m0s",
+    }
+    assert RateLimiter.retry_after_from_headers(headers) == 360.0
+    assert RateLimiter.retry_after_from_headers({"x-ratelimit-reset-tokens": "20ms"}) == 0.02
+    assert RateLimiter.retry_after_from_headers({}) is None
+
+
+def test_provider_429_blocks_the_bucket(tmp_path) -> None:
+    limiter = _limiter(tmp_path, [])
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    response = httpx.Response(429, headers={"retry-after": "30"}, request=request)
+    exc = httpx.HTTPStatusError("Too Many Requests", request=request, response=response)
+
+    assert limiter.note_failure("openai", "gpt-4.1-mini", exc) == 30.0
+    assert 29.0 < limiter.acquire("openai", "gpt-4.1-mini", 100) <= 30.0
+
+    server_error = httpx.HTTPStatusError(
+        "Bad Gateway", request=request, response=httpx.Response(502, request=request)
+    )
+    assert limiter.note_failure("openai", "gpt-5-mini", server_error) is None
+    assert limiter.acquire("openai", "gpt-5-mini", 100) == 0.0
@@ -0,0 +1,61 @@
+import sqlite3
+import threading
+import time
+
+from llmgrader.services.grader import Grader
+from llmgrader.services.submission_writer import SubmissionWriter
+
+
+def test_writer_batches_and_flushes(tmp_path) -> None:
+    batches = []
+    gate = threading.Event()
+
+    def write_batch(records):
+        gate.wait(timeout=2)
+        batches.append([record["n"] for record in records])
+
+    writer = SubmissionWriter(write_batch, max_queue=3, batch_size=10)
+    writer.submit({"n": 0})
+    deadline = time.time() + 2
+    while writer.backlog() and time.time() < deadline:
+        time.sleep(0.01)
+    # While the writer is blocked on the first batch, the next ones queue up.
+    prepared = []
+    for n in range(1, 4):
+        writer.submit({"n": n}, prepare=lambda record: prepared.append(record["n"]))
+    assert writer.backlog() == 3
+
+    gate.set()
+    assert writer.flush(timeout=2)
+    assert writer.backlog() == 0
+    assert sorted(n for batch in batches for n in batch) == [0, 1, 2, 3]
+    assert prepared == [1, 2, 3]
+    assert len(batches) < 4
+    assert writer.stats()["written"] == 4
+
+    writer.close()
+    writer.submit({"n": 4})
+    assert batches[-1] == [4]
+    assert writer.stats()["written_inline"] >= 1
+
+
+def test_grader_logs_submissions_in_background(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("LLMGRADER_STORAGE_PATH", str(tmp_path / "storage"))
+    monkeypatch.setattr(Grader, "load_unit_pkg", lambda self: None)
+    grader = Grader(scratch_dir=str(tmp_path / "scratch"), soln_pkg=str(tmp_path / "pkg"))
+    writer = grader.enable_submission_writer()
+
+    records = [
+        {"timestamp": f"2026-01-01T00:00:0{i}", "unit_name": "unit1", "qtag": "q1", "result": "pass"}
+        for i in range(5)
+    ]
+    for record in records:
+        writer.submit(record)
+    assert writer.flush(timeout=2)
+    writer.close()
+
+    conn = sqlite3.connect(grader.db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM submissions WHERE qtag = 'q1'").fetchone()[0] == 5
+    finally:
+        conn.close()
@@ -3,7 +3,7 @@ import json
 import shutil
 from pathlib import Path
 
-from llmgrader.services.unit_parser import UnitParser
+from llmgrader.services.unit_parser import UnitParser, diff_units
 
 
 RESOURCE_DIR = Path(__file__).resolve().parents[1] / "fixtures" / "unit_parser"
@@ -125,6 +125,119 @@ def test_parse_skips_semantically_invalid_rubric_units_and_sets_alert(tmp_path:
     assert any("requires positive rubric items" in error for error in package.validation_errors)
 
 
+def test_parse_compiles_schemas_once_and_reads_each_unit_once(tmp_path: Path, monkeypatch) -> None:
+    _stage_package(tmp_path, "config_broken_unit.xml")
+    UnitParser._load_schema("llmgrader_config.xsd")
+    UnitParser._load_schema("unit.xsd")
+
+    compiled = []
+    line_lookups = []
+    original_lookup = UnitParser._build_xml_line_lookup.__func__
+    monkeypatch.setattr(
+        "llmgrader.services.unit_parser.xmlschema.XMLSchema",
+        lambda *args, **kwargs: compiled.append(args),
+    )
+    monkeypatch.setattr(
+        UnitParser,
+        "_build_xml_line_lookup",
+        classmethod(lambda cls, xml_path, xml_data=None: line_lookups.append(xml_path) or original_lookup(cls, xml_path, xml_data)),
+    )
+
+    parser = _make_parser(tmp_path)
+    parser.parse()
+    package = parser.parse()
+
+    assert compiled == []
+    assert sorted(package.units.keys()) == ["Fixture Good Unit"]
+    # Only the file with schema errors is scanned for line numbers.
+    assert [Path(path).name for path in line_lookups] == ["unit_broken.xml", "unit_broken.xml"]
+    assert "line 6" in package.validation_errors[0]
+
+
+def test_validate_unit_file_reports_malformed_xml(tmp_path: Path) -> None:
+    unit_path = tmp_path / "unit_malformed.xml"
+    unit_path.write_text("<unit id=\"fixture_malformed\">\n  <question qtag=\"q1\">\n", encoding="utf-8")
+
+    errors = UnitParser.validate_unit_file(str(unit_path))
+
+    assert len(errors) == 1
+    assert "Failed to parse XML" in errors[0]
+
+
+def test_parse_with_previous_reparses_only_changed_units(tmp_path: Path, monkeypatch) -> None:
+    _stage_image_package(tmp_path)
+    config_path = tmp_path / "llmgrader_config.xml"
+    config_path.write_text(
+        config_path.read_text(encoding="utf-8").replace(
+            "</units>",
+            "<unit><name>Fixture Good Unit</name><source>unit_good.xml</source>"
+            "<destination>unit_good.xml</destination></unit></units>",
+        ),
+        encoding="utf-8",
+    )
+    shutil.copy2(RESOURCE_DIR / "unit_good.xml", tmp_path / "unit_good.xml")
+    parser = _make_parser(tmp_path)
+    first = parser.parse()
+    assert sorted(first.units) == ["Fixture Good Unit", "Fixture Image Unit"]
+
+    parsed_units = []
+    original_parse_unit = UnitParser._parse_unit
+    monkeypatch.setattr(
+        UnitParser,
+        "_parse_unit",
+        lambda self, name, *args: parsed_units.append(name) or original_parse_unit(self, name, *args),
+    )
+
+    assert parser.parse(previous=first) == first
+    assert parsed_units == []
+
+    # Changing a referenced image reparses only the unit that shows it.
+    (tmp_path / "unit_images" / "soln_img.png").write_bytes(b"new image")
+    second = parser.parse(previous=first)
+    assert parsed_units == ["Fixture Image Unit"]
+    assert second.units["Fixture Good Unit"] is first.units["Fixture Good Unit"]
+    assert diff_units(first.units, second.units) == {
+        "added": {},
+        "changed": {"Fixture Image Unit": ["q_pkg_assets_image"]},
+        "removed": {},
+    }
+
+
+def test_parse_across_processes_matches_serial_parse(tmp_path: Path) -> None:
+    _stage_package(tmp_path, "config_semantic_broken_unit.xml")
+    config_path = tmp_path / "llmgrader_config.xml"
+    config_path.write_text(
+        config_path.read_text(encoding="utf-8").replace(
+            "</units>",
+            "<unit><name>Fixture Broken Unit</name><source>unit_broken.xml</source>"
+            "<destination>unit_broken.xml</destination></unit></units>",
+        ),
+        encoding="utf-8",
+    )
+    scratch_dir = tmp_path / "scratch"
+    scratch_dir.mkdir()
+
+    serial = UnitParser(scratch_dir=str(scratch_dir), soln_pkg=str(tmp_path), workers=1).parse()
+    pooled = UnitParser(scratch_dir=str(scratch_dir), soln_pkg=str(tmp_path), workers=2).parse()
+
+    assert pooled == serial
+    assert len(serial.validation_errors) > 1
+    assert UnitParser.validate_course_package_config(str(config_path), workers=2) == (
+        UnitParser.validate_course_package_config(str(config_path))
+    )
+
+
+def test_diff_units_reports_added_changed_and_removed_questions() -> None:
+    old_units = {"u1": {"q1": {"solution": "a"}, "q2": {"solution": "b"}}, "u2": {"q1": {}}}
+    new_units = {"u1": {"q1": {"solution": "A"}, "q3": {"solution": "c"}}, "u3": {"q1": {}}}
+
+    assert diff_units(old_units, new_units) == {
+        "added": {"u1": ["q3"], "u3": ["q1"]},
+        "changed": {"u1": ["q1"]},
+        "removed": {"u1": ["q2"], "u2": ["q1"]},
+    }
+
+
 def _stage_image_package(tmp_path: Path) -> Path:
     """Stage the image-unit test package, including the PNG fixture."""
     shutil.copy2(RESOURCE_DIR / "config_image_unit.xml", tmp_path / "llmgrader_config.xml")
@@ -186,4 +299,32 @@ def test_solution_images_skips_missing_file(tmp_path: Path) -> None:
     unit = package.units["Fixture Image Unit"]
 
     # Relative-src question: image file is gone → empty list.
-    assert unit["q_with_image"]["solution_images"] == []
\ No newline at end of file
+    assert unit["q_with_image"]["solution_images"] == []
+
+def test_grade_cache_is_enabled_per_unit_or_per_question(tmp_path: Path) -> None:
+    _stage_package(tmp_path, "config_good.xml")
+    config_path = tmp_path / "llmgrader_config.xml"
+    config = config_path.read_text(encoding="utf-8")
+
+    config_path.write_text(
+        config.replace(
+            "<destination>unit_good.xml</destination>",
+            "<destination>unit_good.xml</destination>\n      <grade_cache><qtag>q_binary</qtag></grade_cache>",
+        ),
+        encoding="utf-8",
+    )
+    package = _make_parser(tmp_path).parse()
+    assert package.validation_errors == []
+    unit = package.units["Fixture Good Unit"]
+    assert unit["q_binary"]["grade_cache"] is True
+    assert all(q["grade_cache"] is False for qtag, q in unit.items() if qtag != "q_binary")
+
+    config_path.write_text(
+        config.replace(
+            "<destination>unit_good.xml</destination>",
+            "<destination>unit_good.xml</destination>\n      <grade_cache/>",
+        ),
+        encoding="utf-8",
+    )
+    package = _make_parser(tmp_path).parse()
+    assert all(q["grade_cache"] is True for q in package.units["Fixture Good Unit"].values())